@@ -0,0 +1,144 @@
+"""
+Benchmark for the Two-Stage Matching Cascade
+Compares match_scoring.cascade_similarities (candidate images encoded only for
+the rerank_size best candidates by text terms) against exhaustive scoring of
+every image: recall@k of the top-k, images encoded, estimate error and how
+many estimates fall outside their estimated bound (the bounds assume unseen
+terms in UNSEEN_SIMILARITY_RANGE).
+
+By default the embeddings are synthetic CLIP-like vectors: items of the same
+object share a latent direction, and text and image embeddings of one item
+are correlated. With an items file (JSON list of items with title, category,
+description, location and images), the items are encoded once with
+MultimodalMatchingService and each of the first num_queries items is
+matched against all the others.
+
+Usage: python benchmark_matching_cascade.py [num_candidates] [num_queries] [items.json]
+"""
+
+import sys
+import json
+import time
+import numpy as np
+from typing import Dict, List, Tuple
+
+from match_scoring import combine_similarities, cascade_similarities
+
+RERANK_SIZES = (10, 25, 50, 100)
+TOP_K = (5, 10)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def generate_items(num_items: int, dim: int = 128, seed: int = 42) -> Tuple[List[Dict], Dict[str, np.ndarray]]:
+    """Synthetic items with encode_items-style embeddings"""
+    rng = np.random.default_rng(seed)
+    num_objects = max(num_items // 8, 2)
+    objects = rng.normal(size=(num_objects, dim))
+    shared = rng.normal(size=dim) * 1.5  # CLIP embeddings share a common direction
+    owner = rng.integers(0, num_objects, num_items)
+    categories = ['Wallet', 'Mobile', 'Bag', 'Documents', 'Electronics']
+
+    text_emb = _normalize(shared + objects[owner] + rng.normal(size=(num_items, dim)) * 1.2)
+    image_emb = _normalize(shared + objects[owner] + rng.normal(size=(num_items, dim)) * 1.0)
+    declares_image = rng.random(num_items) < 0.7
+    loads = declares_image & (rng.random(num_items) < 0.95)  # Some image URLs fail
+
+    items = [{'id': f'item{i}', 'category': categories[owner[i] % len(categories)],
+              'images': ['url'] if declares_image[i] else []} for i in range(num_items)]
+    return items, {
+        'text_emb': text_emb,
+        'has_text': np.ones(num_items, dtype=bool),
+        'image_emb': np.where(loads[:, None], image_emb, 0.0).astype(np.float32),
+        'has_image': loads
+    }
+
+
+def encode_file(path: str) -> Tuple[List[Dict], Dict[str, np.ndarray]]:
+    from multimodal_matching_service import MultimodalMatchingService
+    with open(path, encoding='utf-8') as f:
+        items = json.load(f)
+    service = MultimodalMatchingService()
+    start = time.perf_counter()
+    encoded = service.encode_items(items)
+    print(f"Encoded {len(items)} items in {time.perf_counter() - start:.1f}s")
+    return items, encoded
+
+
+def _rows(encoded: Dict[str, np.ndarray], rows: np.ndarray) -> Dict[str, np.ndarray]:
+    return {name: values[rows] for name, values in encoded.items()}
+
+
+def main():
+    num_candidates = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    if len(sys.argv) > 3:
+        items, encoded = encode_file(sys.argv[3])
+    else:
+        print(f"Generating {num_candidates + num_queries:,} synthetic items...")
+        items, encoded = generate_items(num_candidates + num_queries)
+    num_queries = min(num_queries, len(items) - 1)
+
+    results = {size: {'recall': {k: [] for k in TOP_K}, 'encoded': [], 'error': [], 'bound': [],
+                      'violations': 0, 'seconds': []} for size in RERANK_SIZES}
+    exhaustive_encoded, exhaustive_seconds = [], []
+
+    for q in range(num_queries):
+        # Every other item is a candidate
+        rows = np.array([i for i in range(len(items)) if i != q][:num_candidates])
+        candidate_items = [items[i] for i in rows]
+        query = _rows(encoded, np.array([q]))
+        candidates = _rows(encoded, rows)
+        declares_image = np.array([bool(item.get('images')) for item in candidate_items], dtype=bool)
+
+        start = time.perf_counter()
+        exact = combine_similarities(items[q], candidate_items, query, candidates)['combined_sim']
+        exhaustive_seconds.append(time.perf_counter() - start)
+        exhaustive_encoded.append(int(declares_image.sum()))
+        exact_order = np.lexsort((np.arange(len(exact)), -exact))
+
+        for size in RERANK_SIZES:
+            requested = []
+
+            def encode_images(positions):
+                requested.append(len(positions))
+                return candidates['image_emb'][positions], candidates['has_image'][positions]
+
+            start = time.perf_counter()
+            cascade = cascade_similarities(items[q], candidate_items, query, candidates['text_emb'],
+                                           candidates['has_text'], declares_image, encode_images, size)
+            result = results[size]
+            result['seconds'].append(time.perf_counter() - start)
+            result['encoded'].append(sum(requested))
+
+            order = np.lexsort((np.arange(len(exact)), -cascade['combined_sim']))
+            for k in TOP_K:
+                result['recall'][k].append(len(set(order[:k]) & set(exact_order[:k])) / k)
+            estimated = cascade['estimated']
+            error = np.abs(cascade['combined_sim'] - exact)
+            result['error'].append(float(error[estimated].mean()) if estimated.any() else 0.0)
+            result['bound'].append(float(cascade['similarity_error'][estimated].mean()) if estimated.any() else 0.0)
+            result['violations'] += int(np.sum(error > cascade['similarity_error'] + 1e-9))
+
+    print(f"\n{num_queries} queries x {min(num_candidates, len(items) - 1):,} candidates; "
+          f"exhaustive scoring encodes {np.mean(exhaustive_encoded):.0f} images per query")
+    header = f"{'rerank_size':>12}" + ''.join(f"{f'recall@{k}':>11}" for k in TOP_K)
+    print(header + f"{'images':>9}{'mean error':>12}{'mean bound':>12}{'outside bound':>15}{'scoring ms':>12}")
+    for size in RERANK_SIZES:
+        result = results[size]
+        print(f"{size:>12}" + ''.join(f"{np.mean(result['recall'][k]):>11.3f}" for k in TOP_K) +
+              f"{np.mean(result['encoded']):>9.0f}{np.mean(result['error']):>12.4f}"
+              f"{np.mean(result['bound']):>12.4f}{result['violations']:>15}"
+              f"{np.mean(result['seconds']) * 1000:>12.2f}")
+    print(f"{'exhaustive':>12}" + ''.join(f"{1.0:>11.3f}" for _ in TOP_K) +
+          f"{np.mean(exhaustive_encoded):>9.0f}{0.0:>12.4f}{0.0:>12.4f}{0:>15}"
+          f"{np.mean(exhaustive_seconds) * 1000:>12.2f}")
+    print("\nScoring time excludes image download and CLIP encoding, which the "
+          "'images' column counts.")
+
+
+if __name__ == "__main__":
+    main()
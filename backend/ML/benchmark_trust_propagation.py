@@ -0,0 +1,184 @@
+"""
+Benchmark for Trust Propagation
+Compares the CSR SocialGraph engine against the original dict-of-sets
+structure on a synthetic graph: memory, build time and propagate_ban_penalty
+latency (plus the vectorized array core alone), and checks that both produce
+the same affected users.
+
+Usage: python benchmark_trust_propagation.py [num_edges] [num_bans]
+"""
+
+import sys
+import time
+import tracemalloc
+import numpy as np
+from collections import defaultdict, deque
+from typing import Dict, List
+
+from trust_propagation_service import TrustPropagationService
+
+
+class LegacyTrustGraph:
+    """The original structure: defaultdict(set) adjacency + (user1, user2) weight dict"""
+
+    def __init__(self):
+        self.user_graph = defaultdict(set)
+        self.interaction_weights = {}
+        self.user_trust_scores = {}
+        self.user_content_trust_scores = {}
+
+    def build_social_graph(self, followers: List[Dict], interactions: List[Dict]):
+        for follow in followers:
+            follower_id = follow['follower_id']
+            following_id = follow['following_id']
+            self.user_graph[follower_id].add(following_id)
+            self.user_graph[following_id].add(follower_id)
+            self.interaction_weights[(follower_id, following_id)] = 0.8
+            self.interaction_weights[(following_id, follower_id)] = 0.3
+        for interaction in interactions:
+            user_id = interaction['user_id']
+            target_user_id = interaction.get('target_user_id')
+            if target_user_id:
+                self.user_graph[user_id].add(target_user_id)
+                self.user_graph[target_user_id].add(user_id)
+                key = (user_id, target_user_id)
+                self.interaction_weights[key] = max(self.interaction_weights.get(key, 0), interaction.get('weight', 0.5))
+
+    def propagate_ban_penalty(self, banned_user_id: str, max_hops: int = 2,
+                              base_penalty: float = 0.15) -> Dict[str, Dict]:
+        if banned_user_id not in self.user_graph:
+            return {}
+        affected = {}
+        visited = set()
+        queue = deque([(banned_user_id, 0)])
+        while queue:
+            current, distance = queue.popleft()
+            if current in visited or distance > max_hops:
+                continue
+            visited.add(current)
+            if current != banned_user_id:
+                weight = self.interaction_weights.get((current, banned_user_id), 0.5)
+                penalty = base_penalty * weight / (distance ** 1.5)
+                trust = max(0.1, self.user_trust_scores.get(current, 0.5) - penalty)
+                content = min(0.9, self.user_content_trust_scores.get(current, 0.5) + penalty * 1.5)
+                affected[current] = {
+                    'new_user_trust_score': round(trust, 4),
+                    'new_content_trust_score': round(content, 4),
+                    'penalty_applied': round(penalty, 4),
+                    'distance': distance
+                }
+                self.user_trust_scores[current] = trust
+                self.user_content_trust_scores[current] = content
+            for neighbor in self.user_graph[current]:
+                if neighbor not in visited:
+                    queue.append((neighbor, distance + 1))
+        return affected
+
+
+def generate_graph(num_edges: int, seed: int = 42):
+    """Synthetic social graph with heavy-tailed popularity (a few hub accounts)"""
+    rng = np.random.default_rng(seed)
+    num_users = max(num_edges // 10, 10)
+    num_follows = int(num_edges * 0.7)
+    num_interactions = num_edges - num_follows
+
+    popularity = rng.zipf(1.6, size=num_users).astype(np.float64)
+    popularity /= popularity.sum()
+
+    follower = rng.integers(0, num_users, num_follows)
+    following = rng.choice(num_users, num_follows, p=popularity)
+    followers = [{'follower_id': f'u{a}', 'following_id': f'u{b}'}
+                 for a, b in zip(follower.tolist(), following.tolist()) if a != b]
+
+    actor = rng.integers(0, num_users, num_interactions)
+    target = rng.choice(num_users, num_interactions, p=popularity)
+    weight = rng.uniform(0.1, 1.0, num_interactions).round(2)
+    interactions = [{'user_id': f'u{a}', 'target_user_id': f'u{b}', 'type': 'like', 'weight': w}
+                    for a, b, w in zip(actor.tolist(), target.tolist(), weight.tolist()) if a != b]
+
+    trust_scores = {f'u{i}': float(s) for i, s in enumerate(rng.uniform(0.3, 0.9, num_users).round(3))}
+    return followers, interactions, trust_scores
+
+
+def measure_build(engine, followers, interactions):
+    tracemalloc.start()
+    start = time.perf_counter()
+    engine.build_social_graph(followers, interactions)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return seconds, retained, peak
+
+
+def measure_propagation(engine, banned_ids, trust_scores, max_hops):
+    latencies = []
+    results = []
+    for banned in banned_ids:
+        engine.user_trust_scores = dict(trust_scores)
+        engine.user_content_trust_scores = dict(trust_scores)
+        start = time.perf_counter()
+        results.append(engine.propagate_ban_penalty(banned, max_hops=max_hops))
+        latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+
+def same_results(legacy: Dict, csr: Dict) -> bool:
+    """Same affected users and distances; scores equal up to float32 weight rounding"""
+    if legacy.keys() != csr.keys():
+        return False
+    fields = ('new_user_trust_score', 'new_content_trust_score', 'penalty_applied')
+    return all(legacy[u]['distance'] == csr[u]['distance'] and
+               all(abs(legacy[u][f] - csr[u][f]) <= 1.5e-4 for f in fields)
+               for u in legacy)
+
+
+def main():
+    num_edges = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    num_bans = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(f"Generating synthetic graph with ~{num_edges:,} edges...")
+    followers, interactions, trust_scores = generate_graph(num_edges)
+
+    legacy = LegacyTrustGraph()
+    csr = TrustPropagationService()
+
+    legacy_build, legacy_mem, legacy_peak = measure_build(legacy, followers, interactions)
+    csr_build, csr_mem, csr_peak = measure_build(csr, followers, interactions)
+
+    # Ban a mix of hub and ordinary accounts
+    degrees = csr.graph.degrees()
+    by_degree = np.argsort(-degrees)
+    rng = np.random.default_rng(7)
+    picks = list(by_degree[:max(num_bans // 2, 1)]) + list(rng.choice(csr.graph.num_nodes, num_bans - num_bans // 2))
+    banned_ids = [csr.graph.ids[i] for i in picks]
+
+    print(f"\nGraph: {csr.graph.num_users:,} users, {csr.graph.num_connections:,} connections")
+    print(f"\n{'':24}{'legacy dict':>16}{'CSR':>16}")
+    print(f"{'build time (s)':24}{legacy_build:>16.2f}{csr_build:>16.2f}")
+    print(f"{'retained memory (MB)':24}{legacy_mem / 2**20:>16.1f}{csr_mem / 2**20:>16.1f}")
+    print(f"{'peak build memory (MB)':24}{legacy_peak / 2**20:>16.1f}{csr_peak / 2**20:>16.1f}")
+    print(f"{'bytes per connection':24}{legacy_mem / max(csr.graph.num_connections, 1):>16.1f}"
+          f"{csr_mem / max(csr.graph.num_connections, 1):>16.1f}")
+
+    for max_hops in (1, 2):
+        legacy_lat, legacy_res = measure_propagation(legacy, banned_ids, trust_scores, max_hops)
+        csr_lat, csr_res = measure_propagation(csr, banned_ids, trust_scores, max_hops)
+        matches = all(same_results(a, b) for a, b in zip(legacy_res, csr_res))
+        affected = int(np.mean([len(r) for r in csr_res]))
+        print(f"\npropagate_ban_penalty, max_hops={max_hops} (avg {affected:,} affected users, "
+              f"results {'match' if matches else 'DIFFER'})")
+        print(f"{'  mean latency (ms)':24}{np.mean(legacy_lat) * 1000:>16.1f}{np.mean(csr_lat) * 1000:>16.1f}")
+        print(f"{'  max latency (ms)':24}{np.max(legacy_lat) * 1000:>16.1f}{np.max(csr_lat) * 1000:>16.1f}")
+
+        # Traversal + penalty arrays only, without building the per-user result dicts
+        core_lat = []
+        for idx in picks:
+            start = time.perf_counter()
+            csr.compute_ban_penalties(int(idx), max_hops=max_hops)
+            core_lat.append(time.perf_counter() - start)
+        print(f"{'  array core mean (ms)':24}{'':>16}{np.mean(core_lat) * 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
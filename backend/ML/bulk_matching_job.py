@@ -0,0 +1,299 @@
+"""
+Bulk Matching Job - Match every open found item against every open lost item
+A batch alternative to calling /match once per item, meant to run nightly.
+Both sides are embedded once with MultimodalMatchingService.encode_items (in
+chunks that are checkpointed to disk), then the combined similarity of all
+pairs is computed block by block with float32 matmuls, keeping only the
+top_k lost items per found item (argpartition). Each selected pair is
+rescored exactly like /match and written to a JSON-lines file.
+
+The job resumes from its checkpoint directory: finished embedding chunks are
+loaded instead of re-encoded, and matching continues after the last row block
+written.
+
+Usage: python bulk_matching_job.py found_items.json lost_items.json output.jsonl [options]
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from typing import Callable, Dict, List, Optional
+
+from match_scoring import category_codes, combine_similarities, combined_similarity_matrix
+
+EMBEDDING_FIELDS = ('text_emb', 'has_text', 'image_emb', 'has_image')
+
+
+def print_progress(stage: str, done: int, total: int, started: float):
+    """Default progress callback: one line per step with rate and ETA"""
+    elapsed = time.time() - started
+    rate = done / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) / rate if rate > 0 else 0.0
+    print(f"[{stage}] {done}/{total} ({rate:.1f}/s, ETA {eta:.0f}s)", flush=True)
+
+
+def load_items(path: str) -> List[Dict]:
+    """Items from a JSON list or a JSON-lines file"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def top_k_merge(best_scores: np.ndarray, best_index: np.ndarray, scores: np.ndarray,
+                offset: int, k: int):
+    """
+    Merge a block of scores into the running top_k of each row
+
+    Args:
+        best_scores, best_index: rows x k running best (-inf / -1 when unfilled)
+        scores: rows x block_columns scores of columns offset...
+        offset: Column index of scores[:, 0]
+        k: Number kept per row
+
+    Returns:
+        New (best_scores, best_index)
+    """
+    columns = offset + np.arange(scores.shape[1])
+    merged_scores = np.concatenate([best_scores, scores], axis=1)
+    merged_index = np.concatenate([best_index, np.broadcast_to(columns, scores.shape)], axis=1)
+    if merged_scores.shape[1] > k:
+        keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        merged_scores = np.take_along_axis(merged_scores, keep, axis=1)
+        merged_index = np.take_along_axis(merged_index, keep, axis=1)
+    return merged_scores, merged_index
+
+
+class BulkMatchingJob:
+    """
+    All-pairs found-vs-lost matching with checkpoints
+
+    Files in checkpoint_dir:
+        state.json            parameters, item fingerprints, rows done, output size
+        {side}_{chunk}.npz    encode_items result of each embedding chunk
+    """
+
+    def __init__(self, encoder, found_items: List[Dict], lost_items: List[Dict],
+                 output_path: str, checkpoint_dir: str, top_k: int = 10,
+                 threshold: float = 0.5, block_size: int = 1024, embed_chunk: int = 512,
+                 batch_size: int = 32, dtype: str = 'float32',
+                 progress: Optional[Callable[[str, int, int, float], None]] = None):
+        """
+        Args:
+            encoder: Anything with encode_items(items, batch_size), normally
+                a MultimodalMatchingService
+            found_items, lost_items: Open items of both sides (with an id)
+            output_path: JSON-lines output, one line per found item
+            checkpoint_dir: Where embeddings and progress are checkpointed
+            top_k: Lost items kept per found item
+            threshold: Minimum similarity score written
+            block_size: Rows and columns per similarity block; memory grows
+                with block_size^2
+            embed_chunk: Items per checkpointed embedding chunk
+            batch_size: Items per CLIP forward pass
+            dtype: Storage type of embeddings ('float32', or 'float16' to halve memory)
+            progress: Called with (stage, done, total, started); prints by default
+        """
+        self.encoder = encoder
+        self.found_items = found_items
+        self.lost_items = lost_items
+        self.output_path = output_path
+        self.checkpoint_dir = checkpoint_dir
+        self.top_k = top_k
+        self.threshold = threshold
+        self.block_size = block_size
+        self.embed_chunk = embed_chunk
+        self.batch_size = batch_size
+        self.dtype = np.dtype(dtype)
+        self.progress = progress or print_progress
+
+    def _state_path(self) -> str:
+        return os.path.join(self.checkpoint_dir, 'state.json')
+
+    def _fingerprint(self) -> Dict:
+        """What a checkpoint must match to be resumed"""
+        def digest(items):
+            return hashlib.sha256(json.dumps(items, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return {
+            'found': digest(self.found_items),
+            'lost': digest(self.lost_items),
+            'params': [self.top_k, self.threshold, self.block_size, self.embed_chunk, self.dtype.name]
+        }
+
+    def _load_state(self) -> Dict:
+        fingerprint = self._fingerprint()
+        try:
+            with open(self._state_path(), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if state is None or state.get('fingerprint') != fingerprint:
+            # New job (or different inputs): start over
+            for name in os.listdir(self.checkpoint_dir):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(self.checkpoint_dir, name))
+            state = {'fingerprint': fingerprint, 'rows_done': 0, 'output_bytes': 0}
+        return state
+
+    def _save_state(self, state: Dict):
+        tmp_path = self._state_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._state_path())
+
+    def embed(self, side: str, items: List[Dict]) -> Dict[str, np.ndarray]:
+        """encode_items of all items, chunk by chunk, reusing checkpointed chunks"""
+        chunks = []
+        started = time.time()
+        for chunk, start in enumerate(range(0, len(items), self.embed_chunk)):
+            path = os.path.join(self.checkpoint_dir, f'{side}_{chunk:05d}.npz')
+            if os.path.exists(path):
+                with np.load(path, allow_pickle=False) as saved:
+                    encoded = {name: saved[name] for name in EMBEDDING_FIELDS}
+            else:
+                encoded = self.encoder.encode_items(items[start:start + self.embed_chunk], self.batch_size)
+                encoded = {name: np.asarray(encoded[name]) for name in EMBEDDING_FIELDS}
+                for name in ('text_emb', 'image_emb'):
+                    encoded[name] = encoded[name].astype(self.dtype)
+                tmp_path = path + '.tmp.npz'
+                np.savez(tmp_path, **encoded)
+                os.replace(tmp_path, path)
+            chunks.append(encoded)
+            self.progress(f'embed {side}', min(start + self.embed_chunk, len(items)), len(items), started)
+        if not chunks:
+            return {'text_emb': np.zeros((0, 0), dtype=self.dtype), 'has_text': np.zeros(0, dtype=bool),
+                    'image_emb': np.zeros((0, 0), dtype=self.dtype), 'has_image': np.zeros(0, dtype=bool)}
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in EMBEDDING_FIELDS}
+
+    def _match_rows(self, rows: np.ndarray, found: Dict[str, np.ndarray], lost: Dict[str, np.ndarray],
+                    found_codes: np.ndarray, lost_codes: np.ndarray) -> List[Dict]:
+        """Top lost items of a block of found items"""
+        query = {name: values[rows] for name, values in found.items()}
+        k = min(self.top_k, len(self.lost_items))
+        best_scores = np.full((len(rows), 0), -np.inf, dtype=np.float32)
+        best_index = np.zeros((len(rows), 0), dtype=np.int64)
+        for start in range(0, len(self.lost_items), self.block_size):
+            columns = slice(start, start + self.block_size)
+            block = combined_similarity_matrix(query, {name: values[columns] for name, values in lost.items()},
+                                               found_codes[rows], lost_codes[columns])
+            best_scores, best_index = top_k_merge(best_scores, best_index, block, start, k)
+
+        records = []
+        for row, selected in zip(rows.tolist(), best_index):
+            # Rescore the selected pairs exactly as /match does
+            candidates = [self.lost_items[i] for i in selected.tolist()]
+            similarities = combine_similarities(
+                self.found_items[row], candidates,
+                {name: values[[row]] for name, values in found.items()},
+                {name: values[selected] for name, values in lost.items()}
+            )
+            order = np.lexsort((selected, -similarities['combined_sim']))
+            matches = []
+            for i in order.tolist():
+                score = float(similarities['combined_sim'][i])
+                if score < self.threshold:
+                    break
+                matches.append({
+                    'lost_item_id': candidates[i].get('id'),
+                    'user_id': candidates[i].get('user_id'),
+                    'similarity_score': score,
+                    'match_percentage': round(score * 100, 1),
+                    'details': {
+                        'image_similarity': float(similarities['image_sim'][i]),
+                        'text_similarity': float(similarities['text_sim'][i]),
+                        'cross_modal_similarity': float(similarities['cross_modal_sim'][i])
+                    }
+                })
+            records.append({'found_item_id': self.found_items[row].get('id'), 'matches': matches})
+        return records
+
+    def run(self) -> Dict:
+        """
+        Run (or resume) the job
+
+        Returns:
+            Dict with found_items, lost_items, pairs_written and seconds
+        """
+        started = time.time()
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        state = self._load_state()
+        self._save_state(state)
+
+        found = self.embed('found', self.found_items)
+        lost = self.embed('lost', self.lost_items)
+        vocabulary = {}
+        found_codes = category_codes(self.found_items, vocabulary)
+        lost_codes = category_codes(self.lost_items, vocabulary)
+
+        # Drop output written after the last checkpoint
+        mode = 'r+b' if state['rows_done'] and os.path.exists(self.output_path) else 'wb'
+        pairs_written = state.get('pairs_written', 0)
+        match_started = time.time()
+        with open(self.output_path, mode) as output:
+            output.truncate(state['output_bytes'] if mode == 'r+b' else 0)
+            output.seek(0, os.SEEK_END)
+            for start in range(state['rows_done'], len(self.found_items), self.block_size):
+                rows = np.arange(start, min(start + self.block_size, len(self.found_items)))
+                if len(self.lost_items):
+                    records = self._match_rows(rows, found, lost, found_codes, lost_codes)
+                else:
+                    records = [{'found_item_id': self.found_items[row].get('id'), 'matches': []}
+                               for row in rows.tolist()]
+                for record in records:
+                    output.write((json.dumps(record) + '\n').encode('utf-8'))
+                    pairs_written += len(record['matches'])
+                output.flush()
+                os.fsync(output.fileno())
+
+                state.update(rows_done=int(rows[-1]) + 1, output_bytes=output.tell(), pairs_written=pairs_written)
+                self._save_state(state)
+                self.progress('match', state['rows_done'], len(self.found_items), match_started)
+
+        return {
+            'found_items': len(self.found_items),
+            'lost_items': len(self.lost_items),
+            'pairs_written': pairs_written,
+            'seconds': round(time.time() - started, 2)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match every found item against every lost item")
+    parser.add_argument('found_items', help="JSON list or JSON-lines file of open found items")
+    parser.add_argument('lost_items', help="JSON list or JSON-lines file of open lost items")
+    parser.add_argument('output', help="JSON-lines output, one line per found item")
+    parser.add_argument('--checkpoint-dir', default=None, help="Default: <output>.checkpoint")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--block-size', type=int, default=1024)
+    parser.add_argument('--embed-chunk', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    args = parser.parse_args()
+
+    from multimodal_matching_service import MultimodalMatchingService
+    job = BulkMatchingJob(
+        MultimodalMatchingService(),
+        load_items(args.found_items),
+        load_items(args.lost_items),
+        args.output,
+        args.checkpoint_dir or args.output + '.checkpoint',
+        top_k=args.top_k,
+        threshold=args.threshold,
+        block_size=args.block_size,
+        embed_chunk=args.embed_chunk,
+        batch_size=args.batch_size,
+        dtype=args.dtype
+    )
+    print(json.dumps(job.run()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
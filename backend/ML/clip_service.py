@@ -3,23 +3,29 @@ CLIP Service - Multimodal Embeddings for Lost & Found
 Generates embeddings for both images and text using OpenAI's CLIP model
 """
 
+import os
 import torch
 import numpy as np
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
-from typing import Union, List, Dict
-import requests
+from typing import Union, List, Dict, Optional
 from io import BytesIO
 import base64
+from image_fetcher import ImageFetcher
+
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data', 'image_cache'))
 
 class CLIPService:
-    def __init__(self, model_name='openai/clip-vit-base-patch32'):
-        """Initialize CLIP model and processor"""
+    def __init__(self, model_name='openai/clip-vit-base-patch32', fetcher: Optional[ImageFetcher] = None):
+        """Initialize CLIP model and processor; image URLs are downloaded by fetcher"""
         print(f"Loading CLIP model: {model_name}...")
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model_name = model_name
         self.model = CLIPModel.from_pretrained(model_name).to(self.device)
         self.processor = CLIPProcessor.from_pretrained(model_name)
         self.model.eval()
+        self.embedding_dim = self.model.config.projection_dim
+        self.fetcher = fetcher or ImageFetcher(cache_dir=IMAGE_CACHE_DIR)
         print(f"CLIP model loaded on {self.device}")
     
     def load_image(self, image_input: Union[str, bytes]) -> Image.Image:
@@ -28,8 +34,7 @@ class CLIPService:
             if isinstance(image_input, bytes):
                 return Image.open(BytesIO(image_input)).convert('RGB')
             elif image_input.startswith('http'):
-                response = requests.get(image_input, timeout=10)
-                return Image.open(BytesIO(response.content)).convert('RGB')
+                return Image.open(BytesIO(self.fetcher.fetch(image_input))).convert('RGB')
             elif image_input.startswith('data:image'):
                 # Base64 encoded image
                 header, encoded = image_input.split(',', 1)
@@ -41,6 +46,33 @@ class CLIPService:
             print(f"Error loading image: {e}")
             raise
     
+    def load_images(self, image_inputs: List[Union[str, bytes, Image.Image]]) -> List[Optional[Image.Image]]:
+        """
+        Load several images (PIL images pass through); None where loading fails
+        
+        All URLs are prefetched concurrently first, each distinct URL once.
+        """
+        urls = [image_input for image_input in image_inputs
+                if isinstance(image_input, str) and image_input.startswith('http')]
+        fetched = self.fetcher.fetch_many(urls) if urls else {}
+        
+        loaded = []
+        for image_input in image_inputs:
+            try:
+                if isinstance(image_input, Image.Image):
+                    loaded.append(image_input)
+                elif isinstance(image_input, str) and image_input in fetched:
+                    body = fetched[image_input]
+                    if isinstance(body, Exception):
+                        raise body
+                    loaded.append(Image.open(BytesIO(body)).convert('RGB'))
+                else:
+                    loaded.append(self.load_image(image_input))
+            except Exception as e:
+                print(f"Error loading image: {e}")
+                loaded.append(None)
+        return loaded
+    
     def encode_image(self, image_input: Union[str, bytes, Image.Image]) -> np.ndarray:
         """Generate CLIP embedding for an image"""
         if not isinstance(image_input, Image.Image):
@@ -64,28 +96,32 @@ class CLIPService:
             text_features = text_features / text_features.norm(dim=-1, keepdim=True)
             return text_features.cpu().numpy()[0]
     
-    def encode_batch_images(self, images: List[Union[str, bytes, Image.Image]]) -> np.ndarray:
-        """Generate CLIP embeddings for multiple images"""
-        loaded_images = []
-        for img in images:
-            if not isinstance(img, Image.Image):
-                loaded_images.append(self.load_image(img))
-            else:
-                loaded_images.append(img)
+    def encode_batch_images(self, images: List[Union[str, bytes, Image.Image]],
+                            batch_size: int = 32) -> np.ndarray:
+        """Generate CLIP embeddings for multiple images, batch_size per forward pass"""
+        loaded_images = self.load_images(images)
+        if any(loaded is None for loaded in loaded_images):
+            raise ValueError("Could not load every image")
         
+        batches = [np.zeros((0, self.embedding_dim), dtype=np.float32)]
         with torch.no_grad():
-            inputs = self.processor(images=loaded_images, return_tensors="pt").to(self.device)
-            image_features = self.model.get_image_features(**inputs)
-            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-            return image_features.cpu().numpy()
+            for start in range(0, len(loaded_images), batch_size):
+                inputs = self.processor(images=loaded_images[start:start + batch_size], return_tensors="pt").to(self.device)
+                image_features = self.model.get_image_features(**inputs)
+                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+                batches.append(image_features.cpu().numpy())
+        return np.concatenate(batches)
     
-    def encode_batch_texts(self, texts: List[str]) -> np.ndarray:
-        """Generate CLIP embeddings for multiple texts"""
+    def encode_batch_texts(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Generate CLIP embeddings for multiple texts, batch_size per forward pass"""
+        batches = [np.zeros((0, self.embedding_dim), dtype=np.float32)]
         with torch.no_grad():
-            inputs = self.processor(text=texts, return_tensors="pt", padding=True).to(self.device)
-            text_features = self.model.get_text_features(**inputs)
-            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-            return text_features.cpu().numpy()
+            for start in range(0, len(texts), batch_size):
+                inputs = self.processor(text=texts[start:start + batch_size], return_tensors="pt", padding=True).to(self.device)
+                text_features = self.model.get_text_features(**inputs)
+                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+                batches.append(text_features.cpu().numpy())
+        return np.concatenate(batches)
     
     def compute_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """Compute cosine similarity between two embeddings"""
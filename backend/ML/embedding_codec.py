@@ -0,0 +1,99 @@
+"""
+Embedding Codec - Compact embeddings that clients cache and send back to /match
+An embedding travels as a small JSON object tagged with the model and the
+embedding version that produced it:
+
+    {"model": "all-MiniLM-L6-v2", "version": "1", "dtype": "float16",
+     "data": "<base64 of the little-endian values>"}
+
+dtype is float16 (2 bytes per dimension) or int8 (1 byte per dimension,
+with "scale": the value of one step). The server uses an embedding only if
+its model, version and dimension match its own; anything else is ignored
+and the item is encoded as usual.
+"""
+
+import base64
+import binascii
+import numpy as np
+from typing import Dict, Optional
+
+EMBEDDING_DTYPES = ('float16', 'int8')
+
+# Item fields that may carry a packed embedding
+EMBEDDING_FIELDS = ('embedding', 'image_embedding')
+
+
+def pack_embedding(vector: np.ndarray, model: str, version: str, dtype: str = 'float16') -> Dict:
+    """
+    Tagged, base64-encoded form of one embedding
+
+    Args:
+        vector: Embedding (1-D)
+        model: Name of the model that produced it
+        version: Embedding version of the server that produced it
+        dtype: 'float16' or 'int8'
+
+    Returns:
+        JSON-serializable dict accepted by unpack_embedding
+    """
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    payload = {'model': model, 'version': str(version), 'dtype': dtype}
+    if dtype == 'float16':
+        values = vector.astype('<f2')
+    elif dtype == 'int8':
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        values = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        payload['scale'] = scale
+    else:
+        raise ValueError(f"dtype must be one of {', '.join(EMBEDDING_DTYPES)}")
+    payload['data'] = base64.b64encode(values.tobytes()).decode('ascii')
+    return payload
+
+
+def unpack_embedding(payload, model: str, version: str, dim: int) -> Optional[np.ndarray]:
+    """
+    Unit-length float32 embedding from a pack_embedding payload
+
+    Args:
+        payload: Packed embedding as sent by the client
+        model, version: What the server would encode with
+        dim: Embedding dimension of that model
+
+    Returns:
+        The embedding, or None if the payload is malformed or its model,
+        version or dimension differ (the caller then encodes the item)
+    """
+    if not isinstance(payload, dict):
+        return None
+    if payload.get('model') != model or str(payload.get('version')) != str(version):
+        return None
+    dtype = payload.get('dtype')
+    if dtype not in EMBEDDING_DTYPES or not isinstance(payload.get('data'), str):
+        return None
+
+    try:
+        raw = base64.b64decode(payload['data'], validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    values_dtype = np.dtype('<f2' if dtype == 'float16' else np.int8)
+    if len(raw) != dim * values_dtype.itemsize:
+        return None  # Also rejects an odd byte count, which frombuffer cannot read as float16
+    values = np.frombuffer(raw, dtype=values_dtype)
+
+    vector = values.astype(np.float32)
+    if dtype == 'int8':
+        scale = payload.get('scale', 1.0)
+        if not isinstance(scale, (int, float)) or not scale > 0:
+            return None
+        vector *= scale
+    norm = np.linalg.norm(vector)
+    if not np.isfinite(norm) or norm == 0:
+        return None
+    return vector / norm
+
+
+def strip_embeddings(item: Dict) -> Dict:
+    """Item without its packed embeddings (not worth storing or echoing back)"""
+    if not any(field in item for field in EMBEDDING_FIELDS):
+        return item
+    return {key: value for key, value in item.items() if key not in EMBEDDING_FIELDS}
@@ -144,6 +144,7 @@ class CommunityGNNService:
         edge_weights = []
         
         # User -> Post edges (posted, liked, commented, reported)
+        # Weights arrive already windowed/decayed by CommunityGraphBuilder
         for interaction in interactions:
             user_id = interaction.get('user_id')
             post_id = interaction.get('post_id')
@@ -185,6 +186,73 @@ class CommunityGNNService:
         
         return self.graph_data
     
+    def build_graph_from_columns(self, columns: Dict) -> Data:
+        """
+        Build graph from columnar community data (CommunityGraphBuilder.build_graph_columns)
+        
+        Same node features and edges as build_graph, computed with array
+        operations instead of per-record dict access.
+        """
+        user_ids = columns['user_ids']
+        post_ids = columns['post_ids']
+        users = columns['user_features']
+        posts = columns['post_features']
+        edges = columns['edges']
+        num_users = len(user_ids)
+        
+        # Users first, then posts
+        node_names = [f"user_{user_id}" for user_id in user_ids] + [f"post_{post_id}" for post_id in post_ids]
+        self.node_mapping = {name: idx for idx, name in enumerate(node_names)}
+        self.reverse_mapping = dict(enumerate(node_names))
+        num_nodes = len(node_names)
+        
+        # Same feature layout and normalization as build_graph
+        user_x = np.stack([
+            users['posts_count'] / 100.0,
+            users['harmful_posts'] / 10.0,
+            users['reports_received'] / 10.0,
+            users['reports_made'] / 10.0,
+            users['account_age_days'] / 365.0,
+            users['trust_ratio'],
+            np.ones(num_users)
+        ], axis=1)
+        post_x = np.stack([
+            posts['likes_count'] / 50.0,
+            posts['comments_count'] / 20.0,
+            posts['reports_count'] / 5.0,
+            posts['is_flagged'].astype(np.float64),
+            posts['age_days'] / 30.0,
+            posts['engagement_score'] / 100.0,
+            np.zeros(len(post_ids))
+        ], axis=1)
+        x = torch.tensor(np.concatenate([user_x, post_x]), dtype=torch.float)
+        node_types = torch.tensor([0] * num_users + [1] * len(post_ids), dtype=torch.long)
+        
+        # Bidirectional edges, posts offset after users
+        source = edges['source']
+        target = np.where(edges['target_is_user'], edges['target'], edges['target'] + num_users)
+        weight = edges['weight']
+        
+        if len(source) == 0:
+            # Create self-loops if no edges
+            edge_index = np.tile(np.arange(num_nodes), (2, 1))
+            edge_weights = np.ones(num_nodes, dtype=np.float32)
+        else:
+            edge_index = np.stack([
+                np.stack([source, target], axis=1).reshape(-1),
+                np.stack([target, source], axis=1).reshape(-1)
+            ])
+            edge_weights = np.repeat(weight, 2)
+        
+        self.graph_data = Data(
+            x=x,
+            edge_index=torch.tensor(edge_index, dtype=torch.long).contiguous(),
+            edge_attr=torch.tensor(edge_weights, dtype=torch.float).unsqueeze(1),
+            node_types=node_types
+        )
+        
+        return self.graph_data
+    
     def initialize_model(self, input_dim: int):
         """Initialize the GNN model"""
         self.model = CommunityTrustGNN(
@@ -2,19 +2,221 @@
 Graph Builder - Constructs user-post interaction graphs for GNN
 """
 
-from typing import List, Dict, Tuple
+import numpy as np
+from array import array
+from typing import List, Dict, Tuple, Optional
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import deque
+
+USER_SCHEMA = {
+    'posts_count': np.int32,
+    'harmful_posts': np.int32,
+    'reports_received': np.int32,
+    'reports_made': np.int32,
+    'account_age_days': np.int32,
+    'trust_ratio': np.float64  # Kept exact so build_graph_data round-trips
+}
+
+# Rows released once all their edges left the window are compacted away when
+# they exceed the larger of RELEASE_MIN_ROWS and RELEASE_FRACTION of the table
+RELEASE_MIN_ROWS = 1000
+RELEASE_FRACTION = 0.25
+
+POST_SCHEMA = {
+    'user_row': np.int32,  # Row of the author in the user table
+    'likes_count': np.int32,
+    'comments_count': np.int32,
+    'reports_count': np.int32,
+    'is_flagged': np.bool_,
+    'age_days': np.int32,
+    'engagement_score': np.int32
+}
+
+
+class FeatureTable:
+    """
+    Typed, array-backed feature columns with an id -> row index
+    
+    Rows are reserved the first time an id is seen (possibly on an edge,
+    before its features arrive); `present` marks rows whose features are set
+    and `last_active` holds the newest edge timestamp of each row (NaN if it
+    has no edge yet).
+    """
+    
+    def __init__(self, schema: Dict[str, type], capacity: int = 64):
+        self.schema = schema
+        self.index = {}  # id -> row
+        self.ids = []
+        self.present = np.zeros(capacity, dtype=np.bool_)
+        self.last_active = np.full(capacity, np.nan)  # POSIX seconds
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in schema.items()}
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def _grow(self, min_capacity: int):
+        capacity = max(min_capacity, 2 * len(self.present))
+        self.present = self._resized(self.present, capacity)
+        self.last_active = self._resized(self.last_active, capacity, np.nan)
+        for name, column in self.columns.items():
+            self.columns[name] = self._resized(column, capacity)
+    
+    @staticmethod
+    def _resized(column: np.ndarray, capacity: int, fill=0) -> np.ndarray:
+        resized = np.full(capacity, fill, dtype=column.dtype)
+        count = min(len(column), capacity)
+        resized[:count] = column[:count]
+        return resized
+    
+    def row(self, record_id: str) -> int:
+        """Get the row for an id, reserving one if the id is new"""
+        row = self.index.get(record_id)
+        if row is None:
+            row = len(self.ids)
+            if row == len(self.present):
+                self._grow(row + 1)
+            self.index[record_id] = row
+            self.ids.append(record_id)
+        return row
+    
+    def rows(self, record_ids: List[str]) -> np.ndarray:
+        """Vector version of row()"""
+        return np.fromiter((self.row(record_id) for record_id in record_ids),
+                           dtype=np.int64, count=len(record_ids))
+    
+    def set(self, record_id: str, **values) -> int:
+        """Set the features of a single row"""
+        row = self.row(record_id)
+        for name, value in values.items():
+            self.columns[name][row] = value
+        self.present[row] = True
+        return row
+    
+    def set_many(self, record_ids: List[str], columns: Dict[str, np.ndarray]):
+        """Set the features of many rows at once"""
+        rows = self.rows(record_ids)
+        for name, values in columns.items():
+            self.columns[name][rows] = values
+        self.present[rows] = True
+    
+    def get(self, record_id: str) -> Optional[Dict]:
+        """Features of a single row as a dict (None if not present)"""
+        row = self.index.get(record_id)
+        if row is None or not self.present[row]:
+            return None
+        record = {'id': record_id}
+        for name, column in self.columns.items():
+            record[name] = column[row].item()
+        return record
+    
+    def present_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.present[:len(self.ids)])
+    
+    def touch(self, rows: np.ndarray, timestamps: np.ndarray):
+        """Record edges at these times on rows (for release_inactive)"""
+        np.fmax.at(self.last_active, rows, timestamps)
+    
+    def inactive_rows(self, cutoff: float) -> np.ndarray:
+        """Mask of rows whose every edge is older than cutoff (rows that never had one stay active)"""
+        return self.last_active[:len(self.ids)] < cutoff
+    
+    def compact(self, keep: np.ndarray) -> np.ndarray:
+        """
+        Drop the rows not in keep, renumbering the rest in order (O(rows))
+        
+        Returns:
+            Old row -> new row (-1 for dropped rows)
+        """
+        kept = np.flatnonzero(keep)
+        remap = np.full(len(self.ids), -1, dtype=np.int64)
+        remap[kept] = np.arange(len(kept))
+        capacity = max(2 * len(kept), 64)
+        
+        self.ids = [self.ids[row] for row in kept.tolist()]
+        self.index = dict(zip(self.ids, range(len(self.ids))))
+        self.present = self._resized(self.present[kept], capacity)
+        self.last_active = self._resized(self.last_active[kept], capacity, np.nan)
+        for name, column in self.columns.items():
+            self.columns[name] = self._resized(column[kept], capacity)
+        return remap
+
+
+class EdgeBlock:
+    """Interactions of one time bucket, stored as typed columns"""
+    
+    __slots__ = ('bucket', 'user_row', 'target_row', 'target_is_user',
+                 'type_code', 'weight', 'timestamp')
+    
+    def __init__(self, bucket: int):
+        self.bucket = bucket
+        self.user_row = array('q')
+        self.target_row = array('q')  # Post row, or user row for user-user edges
+        self.target_is_user = array('b')
+        self.type_code = array('h')
+        self.weight = array('d')
+        self.timestamp = array('d')  # POSIX seconds
+    
+    def __len__(self) -> int:
+        return len(self.user_row)
+    
+    def append(self, user_row: int, target_row: int, target_is_user: bool,
+               type_code: int, weight: float, timestamp: float):
+        self.user_row.append(user_row)
+        self.target_row.append(target_row)
+        self.target_is_user.append(target_is_user)
+        self.type_code.append(type_code)
+        self.weight.append(weight)
+        self.timestamp.append(timestamp)
+    
+    def extend(self, user_rows: np.ndarray, target_rows: np.ndarray, target_is_user: np.ndarray,
+               type_codes: np.ndarray, weights: np.ndarray, timestamps: np.ndarray):
+        self.user_row.frombytes(np.ascontiguousarray(user_rows, dtype=np.int64).tobytes())
+        self.target_row.frombytes(np.ascontiguousarray(target_rows, dtype=np.int64).tobytes())
+        self.target_is_user.frombytes(np.ascontiguousarray(target_is_user, dtype=np.int8).tobytes())
+        self.type_code.frombytes(np.ascontiguousarray(type_codes, dtype=np.int16).tobytes())
+        self.weight.frombytes(np.ascontiguousarray(weights, dtype=np.float64).tobytes())
+        self.timestamp.frombytes(np.ascontiguousarray(timestamps, dtype=np.float64).tobytes())
+
 
 class CommunityGraphBuilder:
-    """Build graph structure from community data"""
+    """
+    Build graph structure from community data
     
-    def __init__(self):
-        self.users = []
-        self.posts = []
-        self.interactions = []
-        self.user_stats = {}
-        self.post_stats = {}
+    Users and posts live in typed column tables indexed by id, so feature
+    lookups are O(1) and a node costs a few dozen bytes instead of a dict.
+    
+    Interaction edges are grouped into time buckets (oldest first). With a
+    sliding window configured, whole buckets that fall behind the horizon are
+    dropped at once, so eviction is amortized O(1) per edge. Users and posts
+    whose every edge has been evicted are released too (in batches, see
+    RELEASE_MIN_ROWS), except users still authoring a kept post, so memory
+    stays bounded on a long-running service. Nodes that never had an edge
+    are kept. A released node must be added again to regain its features.
+    
+    The window and edge decay are measured from the newest interaction seen,
+    so building from a historical dump keeps its last window; pass `now` to
+    measure from another time.
+    """
+    
+    def __init__(self, window: Optional[timedelta] = None,
+                 bucket_size: timedelta = timedelta(hours=1),
+                 decay_half_life: Optional[timedelta] = None):
+        """
+        Args:
+            window: Keep only interactions newer than this horizon (None = keep all)
+            bucket_size: Width of the time buckets used for eviction
+            decay_half_life: If set, edge weights decay exponentially with age
+        """
+        self.user_table = FeatureTable(USER_SCHEMA)
+        self.post_table = FeatureTable(POST_SCHEMA)
+        self.interaction_types = []  # type_code -> interaction type
+        self._type_codes = {}
+        
+        self.window = window
+        self.bucket_size = bucket_size
+        self.decay_half_life = decay_half_life
+        self._edge_blocks = deque()  # EdgeBlock per bucket, oldest first
+        self._latest_timestamp = None  # POSIX seconds
     
     def add_user(self, user_id: str, account_created: datetime, 
                  posts_count: int = 0, harmful_posts: int = 0, 
@@ -22,21 +224,15 @@ class CommunityGraphBuilder:
         """Add user node with features"""
         account_age_days = (datetime.now() - account_created).days
         
-        self.users.append({
-            'id': user_id,
-            'posts_count': posts_count,
-            'harmful_posts': harmful_posts,
-            'reports_received': reports_received,
-            'reports_made': reports_made,
-            'account_age_days': max(account_age_days, 1),
-            'trust_ratio': self._compute_user_trust_ratio(posts_count, harmful_posts, reports_received)
-        })
-        
-        self.user_stats[user_id] = {
-            'posts_count': posts_count,
-            'harmful_posts': harmful_posts,
-            'reports_received': reports_received
-        }
+        self.user_table.set(
+            user_id,
+            posts_count=posts_count,
+            harmful_posts=harmful_posts,
+            reports_received=reports_received,
+            reports_made=reports_made,
+            account_age_days=max(account_age_days, 1),
+            trust_ratio=self._compute_user_trust_ratio(posts_count, harmful_posts, reports_received)
+        )
     
     def add_post(self, post_id: str, user_id: str, created_at: datetime,
                  likes_count: int = 0, comments_count: int = 0, 
@@ -44,48 +240,296 @@ class CommunityGraphBuilder:
         """Add post node with features"""
         post_age_days = (datetime.now() - created_at).days
         
-        self.posts.append({
-            'id': post_id,
-            'user_id': user_id,
-            'likes_count': likes_count,
-            'comments_count': comments_count,
-            'reports_count': reports_count,
-            'is_flagged': is_flagged,
-            'age_days': max(post_age_days, 0),
-            'engagement_score': likes_count + comments_count * 2
-        })
-        
-        self.post_stats[post_id] = {
-            'reports_count': reports_count,
-            'is_flagged': is_flagged
-        }
+        self.post_table.set(
+            post_id,
+            user_row=self.user_table.row(user_id),
+            likes_count=likes_count,
+            comments_count=comments_count,
+            reports_count=reports_count,
+            is_flagged=is_flagged,
+            age_days=max(post_age_days, 0),
+            engagement_score=likes_count + comments_count * 2
+        )
     
     def add_interaction(self, user_id: str, post_id: str, 
-                       interaction_type: str, weight: float = 1.0):
+                       interaction_type: str, weight: float = 1.0,
+                       timestamp: Optional[datetime] = None):
         """
         Add user-post interaction edge
         
         Args:
             interaction_type: 'posted', 'liked', 'commented', 'reported', 'viewed'
             weight: Edge weight (importance)
+            timestamp: When the interaction happened (defaults to now)
         """
-        self.interactions.append({
-            'user_id': user_id,
-            'post_id': post_id,
-            'type': interaction_type,
-            'weight': weight
-        })
+        self._append_edge(self.user_table.row(user_id), self.post_table.row(post_id), False,
+                          interaction_type, weight, timestamp or datetime.now())
     
     def add_user_interaction(self, user_id_1: str, user_id_2: str, 
-                            interaction_type: str = 'follows'):
+                            interaction_type: str = 'follows',
+                            timestamp: Optional[datetime] = None):
         """Add user-user interaction (optional)"""
-        self.interactions.append({
-            'user_id': user_id_1,
-            'user_id_2': user_id_2,
-            'type': interaction_type,
-            'weight': 0.5
+        self._append_edge(self.user_table.row(user_id_1), self.user_table.row(user_id_2), True,
+                          interaction_type, 0.5, timestamp or datetime.now())
+    
+    def add_users_batch(self, user_ids: List[str], account_created: np.ndarray,
+                        posts_count: np.ndarray, harmful_posts: np.ndarray,
+                        reports_received: np.ndarray, reports_made: np.ndarray):
+        """
+        Add many user nodes at once (columnar version of add_user)
+        
+        Args:
+            user_ids: User IDs
+            account_created: Account creation times as POSIX seconds
+            posts_count, harmful_posts, reports_received, reports_made: Count arrays
+        """
+        now = datetime.now().timestamp()
+        posts_count = np.asarray(posts_count, dtype=np.int32)
+        harmful_posts = np.asarray(harmful_posts, dtype=np.int32)
+        reports_received = np.asarray(reports_received, dtype=np.int32)
+        account_age_days = np.floor((now - np.asarray(account_created, dtype=np.float64)) / 86400.0)
+        
+        self.user_table.set_many(user_ids, {
+            'posts_count': posts_count,
+            'harmful_posts': harmful_posts,
+            'reports_received': reports_received,
+            'reports_made': np.asarray(reports_made, dtype=np.int32),
+            'account_age_days': np.maximum(account_age_days, 1),
+            'trust_ratio': self._compute_user_trust_ratios(posts_count, harmful_posts, reports_received)
+        })
+    
+    def add_posts_batch(self, post_ids: List[str], user_ids: List[str], created_at: np.ndarray,
+                        likes_count: np.ndarray, comments_count: np.ndarray,
+                        reports_count: np.ndarray, is_flagged: np.ndarray):
+        """
+        Add many post nodes at once (columnar version of add_post)
+        
+        Args:
+            post_ids: Post IDs
+            user_ids: Author user IDs
+            created_at: Post creation times as POSIX seconds
+            likes_count, comments_count, reports_count, is_flagged: Feature arrays
+        """
+        now = datetime.now().timestamp()
+        likes_count = np.asarray(likes_count, dtype=np.int32)
+        comments_count = np.asarray(comments_count, dtype=np.int32)
+        age_days = np.floor((now - np.asarray(created_at, dtype=np.float64)) / 86400.0)
+        
+        self.post_table.set_many(post_ids, {
+            'user_row': self.user_table.rows(user_ids),
+            'likes_count': likes_count,
+            'comments_count': comments_count,
+            'reports_count': np.asarray(reports_count, dtype=np.int32),
+            'is_flagged': np.asarray(is_flagged, dtype=np.bool_),
+            'age_days': np.maximum(age_days, 0),
+            'engagement_score': likes_count + comments_count * 2
         })
     
+    def add_interactions_batch(self, user_ids: List[str], target_ids: List[str],
+                               interaction_types: List[str], weights: np.ndarray,
+                               timestamps: np.ndarray, target_is_user: bool = False):
+        """
+        Add many interaction edges at once (columnar version of add_interaction)
+        
+        Args:
+            user_ids: Acting user IDs
+            target_ids: Post IDs, or user IDs when target_is_user is True
+            interaction_types: Interaction type per edge
+            weights: Edge weights
+            timestamps: Interaction times as POSIX seconds
+            target_is_user: Whether the targets are users (user-user edges)
+        """
+        if len(user_ids) == 0:
+            return
+        
+        user_rows = self.user_table.rows(user_ids)
+        target_table = self.user_table if target_is_user else self.post_table
+        target_rows = target_table.rows(target_ids)
+        type_codes = np.fromiter((self._type_code(t) for t in interaction_types),
+                                 dtype=np.int16, count=len(interaction_types))
+        weights = np.asarray(weights, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        buckets = (timestamps // self.bucket_size.total_seconds()).astype(np.int64)
+        
+        previous_latest = self._latest_timestamp
+        latest = float(timestamps.max())
+        if previous_latest is None or latest > previous_latest:
+            self._latest_timestamp = latest
+        
+        keep = np.ones(len(buckets), dtype=np.bool_)
+        if self.window is not None:
+            keep = buckets >= self._bucket_index(self._latest_timestamp - self.window.total_seconds())
+        
+        # Group the chunk by bucket and append each group to its block
+        order = np.flatnonzero(keep)
+        order = order[np.argsort(buckets[order], kind='stable')]
+        unique_buckets, starts = np.unique(buckets[order], return_index=True)
+        bounds = list(starts) + [len(order)]
+        for bucket, start, end in zip(unique_buckets, bounds[:-1], bounds[1:]):
+            rows = order[start:end]
+            self._block_for(int(bucket)).extend(
+                user_rows[rows], target_rows[rows], np.full(len(rows), target_is_user),
+                type_codes[rows], weights[rows], timestamps[rows]
+            )
+        if self.window is not None:
+            self.user_table.touch(user_rows[order], timestamps[order])
+            target_table.touch(target_rows[order], timestamps[order])
+        
+        if self.window is not None and self._latest_timestamp != previous_latest:
+            self.evict_expired()
+    
+    @property
+    def users(self) -> List[Dict]:
+        """User records as dicts (materialized from the columns)"""
+        return [self.user_table.get(self.user_table.ids[row]) for row in self.user_table.present_rows()]
+    
+    @property
+    def posts(self) -> List[Dict]:
+        """Post records as dicts (materialized from the columns)"""
+        return [self.get_post_features(self.post_table.ids[row]) for row in self.post_table.present_rows()]
+    
+    @property
+    def interactions(self) -> List[Dict]:
+        """All retained interactions as dicts, oldest bucket first"""
+        user_ids = self.user_table.ids
+        post_ids = self.post_table.ids
+        edges = []
+        for block in self._edge_blocks:
+            for i in range(len(block)):
+                edge = {'user_id': user_ids[block.user_row[i]]}
+                if block.target_is_user[i]:
+                    edge['user_id_2'] = user_ids[block.target_row[i]]
+                else:
+                    edge['post_id'] = post_ids[block.target_row[i]]
+                edge['type'] = self.interaction_types[block.type_code[i]]
+                edge['weight'] = block.weight[i]
+                edge['timestamp'] = datetime.fromtimestamp(block.timestamp[i])
+                edges.append(edge)
+        return edges
+    
+    def _type_code(self, interaction_type: str) -> int:
+        code = self._type_codes.get(interaction_type)
+        if code is None:
+            code = len(self.interaction_types)
+            self._type_codes[interaction_type] = code
+            self.interaction_types.append(interaction_type)
+        return code
+    
+    def _bucket_index(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_size.total_seconds())
+    
+    def _block_for(self, bucket: int) -> EdgeBlock:
+        """Get the block of a bucket, opening a new one if needed"""
+        if not self._edge_blocks or bucket > self._edge_blocks[-1].bucket:
+            block = EdgeBlock(bucket)
+            self._edge_blocks.append(block)
+            return block
+        
+        # Out-of-order edge: find its bucket, scanning from the newest end
+        position = len(self._edge_blocks)
+        while position > 0 and self._edge_blocks[position - 1].bucket > bucket:
+            position -= 1
+        if position > 0 and self._edge_blocks[position - 1].bucket == bucket:
+            return self._edge_blocks[position - 1]
+        block = EdgeBlock(bucket)
+        self._edge_blocks.insert(position, block)
+        return block
+    
+    def _append_edge(self, user_row: int, target_row: int, target_is_user: bool,
+                     interaction_type: str, weight: float, timestamp: datetime):
+        """Append an edge to its time bucket, opening a new bucket if needed"""
+        seconds = timestamp.timestamp()
+        bucket = self._bucket_index(seconds)
+        
+        if self.window is not None and self._latest_timestamp is not None:
+            horizon = self._latest_timestamp - self.window.total_seconds()
+            if bucket < self._bucket_index(horizon):
+                return  # Already behind the horizon
+        
+        block = self._block_for(bucket)
+        block.append(user_row, target_row, target_is_user,
+                     self._type_code(interaction_type), weight, seconds)
+        if self.window is not None:
+            self.user_table.touch(user_row, seconds)
+            (self.user_table if target_is_user else self.post_table).touch(target_row, seconds)
+        
+        if self._latest_timestamp is None or seconds > self._latest_timestamp:
+            opened_bucket = (self._latest_timestamp is None or
+                             bucket > self._bucket_index(self._latest_timestamp))
+            self._latest_timestamp = seconds
+            if opened_bucket and self.window is not None:
+                self.evict_expired(timestamp)
+    
+    def evict_expired(self, now: Optional[datetime] = None) -> int:
+        """
+        Drop every bucket that lies entirely behind the sliding window
+        
+        Args:
+            now: Reference time (defaults to the newest interaction seen)
+        
+        Returns:
+            Number of evicted interactions
+        """
+        if self.window is None:
+            return 0
+        
+        if now is not None:
+            now_seconds = now.timestamp()
+        elif self._latest_timestamp is not None:
+            now_seconds = self._latest_timestamp
+        else:
+            now_seconds = datetime.now().timestamp()
+        cutoff_bucket = self._bucket_index(now_seconds - self.window.total_seconds())
+        
+        evicted = 0
+        while self._edge_blocks and self._edge_blocks[0].bucket < cutoff_bucket:
+            evicted += len(self._edge_blocks.popleft())
+        
+        if evicted:
+            self.release_inactive(cutoff_bucket * self.bucket_size.total_seconds())
+        return evicted
+    
+    def release_inactive(self, cutoff: float, min_rows: Optional[int] = None) -> int:
+        """
+        Drop users and posts whose every edge is older than cutoff
+        
+        Users authoring a kept post stay. Rows are only compacted once more
+        than min_rows (default: the larger of RELEASE_MIN_ROWS and
+        RELEASE_FRACTION of the rows) are inactive, so the O(rows + edges)
+        renumbering is amortized over many evictions.
+        
+        Args:
+            cutoff: POSIX seconds; every kept edge must be at least this recent
+            min_rows: Inactive rows needed before anything is released
+        
+        Returns:
+            Number of released rows
+        """
+        users, posts = self.user_table, self.post_table
+        drop_posts = posts.inactive_rows(cutoff)
+        drop_users = users.inactive_rows(cutoff)
+        authors = posts.columns['user_row'][np.flatnonzero(posts.present[:len(posts)] & ~drop_posts)]
+        drop_users[authors] = False
+        
+        released = int(drop_users.sum() + drop_posts.sum())
+        if min_rows is None:
+            min_rows = max(RELEASE_MIN_ROWS, int(RELEASE_FRACTION * (len(users) + len(posts))))
+        if released == 0 or released <= min_rows:
+            return 0
+        
+        user_remap = users.compact(~drop_users)
+        post_remap = posts.compact(~drop_posts)
+        author = posts.columns['user_row']
+        author[:len(posts)] = np.where(posts.present[:len(posts)], user_remap[author[:len(posts)]], 0)
+        
+        for block in self._edge_blocks:
+            target_is_user = np.frombuffer(block.target_is_user, dtype=np.int8).astype(np.bool_)
+            target = np.frombuffer(block.target_row, dtype=np.int64)
+            target = np.where(target_is_user, user_remap[target], post_remap[target])
+            block.user_row = array('q', user_remap[np.frombuffer(block.user_row, dtype=np.int64)].tobytes())
+            block.target_row = array('q', target.tobytes())
+        return released
+    
     def _compute_user_trust_ratio(self, posts_count: int, harmful_posts: int, 
                                   reports_received: int) -> float:
         """Compute initial trust ratio for user"""
@@ -98,38 +542,162 @@ class CommunityGraphBuilder:
         trust = 1.0 - harmful_ratio - report_penalty
         return max(0.0, min(1.0, trust))
     
-    def build_graph_data(self) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    def _compute_user_trust_ratios(self, posts_count: np.ndarray, harmful_posts: np.ndarray,
+                                   reports_received: np.ndarray) -> np.ndarray:
+        """Vector version of _compute_user_trust_ratio"""
+        harmful_ratio = harmful_posts / np.maximum(posts_count, 1)
+        report_penalty = np.minimum(reports_received * 0.1, 0.5)
+        trust = np.clip(1.0 - harmful_ratio - report_penalty, 0.0, 1.0)
+        return np.where(posts_count == 0, 0.5, trust)
+    
+    def build_graph_columns(self, now: Optional[datetime] = None) -> Dict:
+        """
+        Build columnar graph data for GNN (see CommunityGNNService.build_graph_from_columns)
+        
+        Args:
+            now: Reference time for the window and edge decay (defaults to
+                the newest interaction seen)
+        
+        Returns:
+            Dict with user_ids, user_features, post_ids, post_features and edges.
+            Rows are compacted to present nodes; edge endpoints are rows in
+            those tables and edges touching unknown nodes are dropped.
+        """
+        now = now or self._reference_time()
+        self.evict_expired(now)
+        now_seconds = now.timestamp()
+        
+        user_rows = self.user_table.present_rows()
+        post_rows = self.post_table.present_rows()
+        user_remap = np.full(len(self.user_table), -1, dtype=np.int64)
+        user_remap[user_rows] = np.arange(len(user_rows))
+        post_remap = np.full(len(self.post_table), -1, dtype=np.int64)
+        post_remap[post_rows] = np.arange(len(post_rows))
+        
+        user_features = {name: column[user_rows] for name, column in self.user_table.columns.items()}
+        post_features = {name: column[post_rows] for name, column in self.post_table.columns.items()}
+        post_features['user_row'] = user_remap[post_features['user_row']]
+        
+        source = self._edge_column('user_row', np.int64)
+        target = self._edge_column('target_row', np.int64)
+        target_is_user = self._edge_column('target_is_user', np.int8).astype(np.bool_)
+        weight = self._edge_column('weight', np.float64)
+        timestamp = self._edge_column('timestamp', np.float64)
+        
+        keep = self._in_window(timestamp, now_seconds)
+        if self.decay_half_life is not None:
+            age = np.maximum(now_seconds - timestamp, 0.0)
+            weight = weight * 0.5 ** (age / self.decay_half_life.total_seconds())
+        
+        source = user_remap[source]
+        target = target.copy()
+        target[target_is_user] = user_remap[target[target_is_user]]
+        target[~target_is_user] = post_remap[target[~target_is_user]]
+        keep &= (source >= 0) & (target >= 0)
+        
+        # User-post edges first, then user-user edges
+        order = np.argsort(target_is_user[keep], kind='stable')
+        return {
+            'user_ids': [self.user_table.ids[row] for row in user_rows],
+            'user_features': user_features,
+            'post_ids': [self.post_table.ids[row] for row in post_rows],
+            'post_features': post_features,
+            'edges': {
+                'source': source[keep][order],
+                'target': target[keep][order],
+                'target_is_user': target_is_user[keep][order],
+                'weight': weight[keep][order].astype(np.float32)
+            }
+        }
+    
+    def build_graph_data(self, now: Optional[datetime] = None) -> Tuple[List[Dict], List[Dict], List[Dict]]:
         """
         Build graph data structure for GNN
         
+        Args:
+            now: Reference time for the window and edge decay (defaults to
+                the newest interaction seen)
+        
         Returns:
             (users, posts, interactions) ready for GNN service
         """
-        return self.users, self.posts, self.interactions
+        now = now or self._reference_time()
+        self.evict_expired(now)
+        
+        cutoff = now - self.window if self.window is not None else None
+        interactions = []
+        for edge in self.interactions:
+            # Buckets are coarse; drop stragglers in the boundary bucket exactly
+            if cutoff is not None and edge['timestamp'] < cutoff:
+                continue
+            if self.decay_half_life is not None:
+                edge = dict(edge, weight=edge['weight'] * self._edge_decay(edge['timestamp'], now))
+            interactions.append(edge)
+        
+        return self.users, self.posts, interactions
+    
+    def _edge_column(self, name: str, dtype: type) -> np.ndarray:
+        """One column of every retained edge, oldest bucket first"""
+        if not self._edge_blocks:
+            return np.zeros(0, dtype=dtype)
+        return np.concatenate([np.frombuffer(getattr(b, name), dtype=dtype) for b in self._edge_blocks])
+    
+    def _in_window(self, timestamp: np.ndarray, now_seconds: float) -> np.ndarray:
+        """Mask of edges inside the window (buckets are coarse, so check the boundary bucket exactly)"""
+        if self.window is None:
+            return np.ones(len(timestamp), dtype=np.bool_)
+        return timestamp >= now_seconds - self.window.total_seconds()
+    
+    def _reference_time(self) -> datetime:
+        """Newest interaction seen (now if there is none)"""
+        if self._latest_timestamp is None:
+            return datetime.now()
+        return datetime.fromtimestamp(self._latest_timestamp)
+    
+    def _edge_decay(self, timestamp: datetime, now: datetime) -> float:
+        """Exponential decay factor for an edge of the given age"""
+        if self.decay_half_life is None:
+            return 1.0
+        age = max((now - timestamp).total_seconds(), 0.0)
+        return 0.5 ** (age / self.decay_half_life.total_seconds())
     
     def get_user_features(self, user_id: str) -> Dict:
         """Get features for a specific user"""
-        for user in self.users:
-            if user['id'] == user_id:
-                return user
-        return None
+        return self.user_table.get(user_id)
     
     def get_post_features(self, post_id: str) -> Dict:
         """Get features for a specific post"""
-        for post in self.posts:
-            if post['id'] == post_id:
-                return post
-        return None
+        features = self.post_table.get(post_id)
+        if features is None:
+            return None
+        post = {'id': post_id, 'user_id': self.user_table.ids[features.pop('user_row')]}
+        post.update((name, value) for name, value in features.items() if name != 'id')
+        return post
     
-    def compute_graph_statistics(self) -> Dict:
-        """Compute graph statistics"""
+    def compute_graph_statistics(self, now: Optional[datetime] = None) -> Dict:
+        """
+        Compute graph statistics
+        
+        Args:
+            now: Reference time for the window (defaults to the newest
+                interaction seen); num_interactions counts edges inside it
+        """
+        now = now or self._reference_time()
+        self.evict_expired(now)
+        num_interactions = int(self._in_window(self._edge_column('timestamp', np.float64),
+                                               now.timestamp()).sum())
+        
+        user_rows = self.user_table.present_rows()
+        post_rows = self.post_table.present_rows()
+        num_users = len(user_rows)
+        num_posts = len(post_rows)
         return {
-            'num_users': len(self.users),
-            'num_posts': len(self.posts),
-            'num_interactions': len(self.interactions),
-            'avg_posts_per_user': sum(u['posts_count'] for u in self.users) / max(len(self.users), 1),
-            'avg_reports_per_post': sum(p['reports_count'] for p in self.posts) / max(len(self.posts), 1),
-            'flagged_posts': sum(1 for p in self.posts if p['is_flagged'])
+            'num_users': num_users,
+            'num_posts': num_posts,
+            'num_interactions': num_interactions,
+            'avg_posts_per_user': float(self.user_table.columns['posts_count'][user_rows].sum()) / max(num_users, 1),
+            'avg_reports_per_post': float(self.post_table.columns['reports_count'][post_rows].sum()) / max(num_posts, 1),
+            'flagged_posts': int(self.post_table.columns['is_flagged'][post_rows].sum())
         }
 
 
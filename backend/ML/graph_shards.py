@@ -0,0 +1,759 @@
+"""
+Graph Shards - Community-partitioned pieces of the social graph
+Users are split into shards by label propagation communities, packed greedily
+so shards stay balanced. Each shard holds the CSR rows of the users it owns
+plus ghost nodes: users owned by other shards that its users connect to. A
+shard expands frontier nodes it owns and returns the neighbors grouped by the
+shard that owns them, so a coordinator can run a multi-hop traversal by
+passing frontier sets between shards; ShardCoordinator does that over
+trust_shard_api.py nodes.
+"""
+
+import io
+import math
+import threading
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from social_graph import COMPACT_FRACTION, COMPACT_MIN_SLOTS, sorted_contains, sorted_unique
+
+
+def label_propagation(indptr: np.ndarray, indices: np.ndarray,
+                      max_iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Community label of every node by label propagation
+
+    Each round, a random half of the nodes adopt the label most common among
+    their neighbors (ties go to the smallest label); updating only half
+    avoids the oscillation of fully synchronous rounds.
+
+    Args:
+        indptr, indices: Compacted CSR arrays of the undirected graph
+        max_iterations: Stop after this many rounds even if labels still change
+        seed: Seed for choosing the nodes updated each round
+
+    Returns:
+        int64 array of length num_nodes; nodes with the same label form a community
+    """
+    n = len(indptr) - 1
+    labels = np.arange(n, dtype=np.int64)
+    if len(indices) == 0:
+        return labels
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    rng = np.random.default_rng(seed)
+
+    for _ in range(max_iterations):
+        # Count (row, neighbor label) pairs, then take each row's most common label
+        keys = np.sort(rows * n + labels[indices])
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        pair_rows, pair_labels = keys[starts] // n, keys[starts] % n
+        order = np.lexsort((pair_labels, -counts, pair_rows))
+        first = order[np.r_[True, pair_rows[order][1:] != pair_rows[order][:-1]]]
+        best_rows, best_labels = pair_rows[first], pair_labels[first]
+
+        update = rng.random(len(best_rows)) < 0.5
+        changed = update & (labels[best_rows] != best_labels)
+        if not changed.any():
+            if (labels[best_rows] == best_labels).all():
+                break
+            continue
+        labels[best_rows[changed]] = best_labels[changed]
+    return labels
+
+
+def partition_graph(indptr: np.ndarray, indices: np.ndarray, num_shards: int,
+                    imbalance: float = 0.1, seed: int = 0) -> np.ndarray:
+    """
+    Assign every node to a shard, keeping communities together
+
+    Communities are placed largest first on the least loaded shard. One that
+    does not fit is split across the least loaded shards in index order,
+    each filled to an even share. No shard holds more than (1 + imbalance)
+    times its share of nodes.
+
+    Args:
+        indptr, indices: Compacted CSR arrays of the undirected graph
+        num_shards: Number of shards
+        imbalance: Allowed load above an even split
+        seed: Seed for label_propagation
+
+    Returns:
+        int32 array of length num_nodes: the shard owning each node
+    """
+    n = len(indptr) - 1
+    labels = label_propagation(indptr, indices, seed=seed)
+    share = int(np.ceil(n / num_shards))
+    capacity = max(int(np.ceil(n / num_shards * (1 + imbalance))), 1)
+
+    order = np.argsort(labels, kind='stable')
+    starts = np.flatnonzero(np.r_[True, labels[order][1:] != labels[order][:-1]]) if n else np.zeros(0, dtype=np.int64)
+    sizes = np.diff(np.r_[starts, n])
+    shard_of = np.zeros(n, dtype=np.int32)
+    load = np.zeros(num_shards, dtype=np.int64)
+
+    for community in np.lexsort((starts, -sizes)).tolist():
+        members = order[starts[community]:starts[community] + sizes[community]]
+        while len(members):
+            shard = int(np.argmin(load))
+            # The least loaded shard is below an even share while nodes remain
+            take = len(members) if len(members) <= capacity - load[shard] else share - load[shard]
+            shard_of[members[:take]] = shard
+            load[shard] += take
+            members = members[take:]
+    return shard_of
+
+
+def edge_cut(indptr: np.ndarray, indices: np.ndarray, shard_of: np.ndarray) -> float:
+    """Fraction of connections whose two users are on different shards"""
+    if len(indices) == 0:
+        return 0.0
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    return float(np.mean(shard_of[rows] != shard_of[indices]))
+
+
+class GraphShard:
+    """
+    The rows of one shard's users, with their ghost neighbors
+
+    nodes lists global node indices: the num_owned owned users first (sorted),
+    then the ghosts (sorted). The CSR arrays have a row per owned user and
+    index into nodes, each row ordered by global neighbor index; ghost_shards
+    gives the shard owning each ghost.
+
+    apply_delta never resizes the arrays, like SocialGraph:
+        - weight changes on existing slots are written in place
+        - removed connections are masked out of `alive`
+        - new connections live in `extra`: owned node -> {neighbor: [weight
+          node -> neighbor, weight neighbor -> node]}
+        - users new to the shard are in `added_owners`: node -> owning shard
+    compact() folds the overlay back into fresh arrays once it grows.
+    """
+
+    ARRAYS = ('nodes', 'indptr', 'indices', 'weights', 'reverse_weights', 'ghost_shards')
+
+    def __init__(self, shard_id: int, num_owned: int, nodes: np.ndarray, indptr: np.ndarray,
+                 indices: np.ndarray, weights: np.ndarray, reverse_weights: np.ndarray,
+                 ghost_shards: np.ndarray, version: int = 0):
+        self.shard_id = shard_id
+        self.num_owned = num_owned
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.reverse_weights = reverse_weights
+        self.ghost_shards = ghost_shards
+        self.version = version
+        self._clear_overlay()
+
+    def _clear_overlay(self):
+        self.alive = np.ones(len(self.indices), dtype=bool)
+        self.extra = {}
+        self.added_owners = {}
+        self._num_dead = 0   # Masked-out slots
+        self._num_extra = 0  # Overlay connections
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], shard_of: np.ndarray,
+                    shard_id: int, version: int = 0) -> 'GraphShard':
+        """
+        Cut a shard out of compacted graph arrays
+
+        Args:
+            arrays: SocialGraph.compacted_arrays() of the whole graph
+            shard_of: partition_graph result
+            shard_id: Shard to cut
+            version: Version tag for the coordinator to check against
+        """
+        indptr, indices = arrays['indptr'], arrays['indices']
+        owned = np.flatnonzero(shard_of == shard_id)
+        starts, ends = indptr[owned], indptr[owned + 1]
+        counts = ends - starts
+        slots = np.repeat(starts - np.r_[0, np.cumsum(counts)[:-1]], counts) + np.arange(int(counts.sum()))
+        return cls._from_rows(shard_id, owned, counts, indices[slots].astype(np.int64),
+                              arrays['weights'][slots], arrays['reverse_weights'][slots],
+                              lambda ghosts: shard_of[ghosts], version)
+
+    @classmethod
+    def _from_rows(cls, shard_id: int, owned: np.ndarray, counts: np.ndarray, neighbors: np.ndarray,
+                   weights: np.ndarray, reverse_weights: np.ndarray,
+                   owners: Callable[[np.ndarray], np.ndarray], version: int) -> 'GraphShard':
+        """Shard from the rows of its sorted owned nodes (global neighbors, sorted within rows)"""
+        ghosts = sorted_unique(neighbors[~sorted_contains(owned, neighbors)])
+        nodes = np.concatenate([owned, ghosts]).astype(np.int64)
+        order = np.argsort(nodes)
+        positions = order[np.searchsorted(nodes[order], neighbors)]
+
+        local_indptr = np.zeros(len(owned) + 1, dtype=np.int64)
+        np.cumsum(counts, out=local_indptr[1:])
+        return cls(shard_id, len(owned), nodes, local_indptr, positions.astype(np.int32),
+                   weights, reverse_weights, np.asarray(owners(ghosts), dtype=np.int32), version)
+
+    @property
+    def owned(self) -> np.ndarray:
+        return self.nodes[:self.num_owned]
+
+    @property
+    def ghosts(self) -> np.ndarray:
+        return self.nodes[self.num_owned:]
+
+    def _positions(self, nodes: np.ndarray) -> np.ndarray:
+        """Position of each global node in self.nodes, or -1"""
+        positions = np.full(len(nodes), -1, dtype=np.int64)
+        for offset, part in ((0, self.owned), (self.num_owned, self.ghosts)):
+            if len(part) == 0:
+                continue
+            pos = np.minimum(np.searchsorted(part, nodes), len(part) - 1)
+            found = part[pos] == nodes
+            positions[found] = pos[found] + offset
+        return positions
+
+    def owners(self, nodes: np.ndarray) -> np.ndarray:
+        """Shard owning each global node (-1 if the shard does not know it)"""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        positions = self._positions(nodes)
+        owners = np.full(len(nodes), self.shard_id, dtype=np.int64)
+        ghost = positions >= self.num_owned
+        owners[ghost] = self.ghost_shards[positions[ghost] - self.num_owned]
+        unknown = np.flatnonzero(positions < 0)
+        owners[unknown] = [self.added_owners.get(node, -1) for node in nodes[unknown].tolist()]
+        return owners
+
+    def _rows(self, frontier: np.ndarray) -> np.ndarray:
+        """Row of each owned node in frontier (-1 for owned nodes added by apply_delta)"""
+        rows = self._positions(frontier)
+        rows[rows >= self.num_owned] = -1
+        for i in np.flatnonzero(rows < 0).tolist():
+            if self.added_owners.get(int(frontier[i])) != self.shard_id:
+                raise ValueError(f"Frontier has nodes not owned by shard {self.shard_id}")
+        return rows
+
+    def _row(self, node: int, row: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Live connections of an owned node: global neighbors (sorted), weight out, weight in"""
+        if row >= 0:
+            start, end = self.indptr[row], self.indptr[row + 1]
+            slots = start + np.flatnonzero(self.alive[start:end])
+            neighbors = self.nodes[self.indices[slots]]
+            weight_out = self.weights[slots].astype(np.float64)
+            weight_in = self.reverse_weights[slots].astype(np.float64)
+        else:
+            neighbors, weight_out, weight_in = np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+        extra = self.extra.get(node)
+        if extra:
+            neighbors = np.concatenate([neighbors, np.fromiter(extra, dtype=np.int64, count=len(extra))])
+            added = np.array(list(extra.values()), dtype=np.float64)
+            weight_out = np.concatenate([weight_out, added[:, 0]])
+            weight_in = np.concatenate([weight_in, added[:, 1]])
+            order = np.argsort(neighbors)
+            neighbors, weight_out, weight_in = neighbors[order], weight_out[order], weight_in[order]
+        return neighbors, weight_out, weight_in
+
+    def _slot(self, row: int, neighbor: int) -> Optional[int]:
+        """Slot of the connection to a global neighbor in a base row, live or masked out, or None"""
+        if row < 0:
+            return None
+        start, end = self.indptr[row], self.indptr[row + 1]
+        row_nodes = self.nodes[self.indices[start:end]]
+        pos = int(np.searchsorted(row_nodes, neighbor))
+        if pos < len(row_nodes) and row_nodes[pos] == neighbor:
+            return int(start + pos)
+        return None
+
+    def expand(self, frontier: np.ndarray, max_fanout: Optional[int] = None) -> Tuple[Dict[int, np.ndarray], np.ndarray]:
+        """
+        Neighbors of owned frontier nodes, grouped by the shard that owns them
+
+        Args:
+            frontier: Global indices of owned nodes
+            max_fanout: Expand only the strongest max_fanout connections of
+                larger rows, chosen like SocialGraph.top_neighbors
+
+        Returns:
+            (neighbors, capped): shard id -> sorted unique global indices, and
+            the frontier nodes whose expansion was capped
+        """
+        frontier = np.asarray(frontier, dtype=np.int64)
+        rows = self._rows(frontier)
+        base = np.maximum(rows, 0)
+        counts = np.where(rows >= 0, self.indptr[base + 1] - self.indptr[base], 0)
+        starts = self.indptr[base]
+        slots = np.repeat(starts - np.r_[0, np.cumsum(counts)[:-1]], counts) + np.arange(int(counts.sum()))
+        slot_rows = np.repeat(np.arange(len(rows)), counts)
+        live = self.alive[slots]
+        degree = np.bincount(slot_rows[live], minlength=len(rows))
+        if self.extra:
+            degree += np.array([len(self.extra.get(node, ())) for node in frontier.tolist()], dtype=np.int64)
+        capped = np.zeros(len(rows), dtype=bool) if max_fanout is None else degree > max_fanout
+
+        parts = [self.nodes[self.indices[slots[live & ~capped[slot_rows]]]]]
+        if self.extra:
+            for node in frontier[~capped].tolist():
+                if node in self.extra:
+                    parts.append(np.fromiter(self.extra[node], dtype=np.int64, count=len(self.extra[node])))
+        for i in np.flatnonzero(capped).tolist():
+            neighbors, weight_out, weight_in = self._row(int(frontier[i]), int(rows[i]))
+            strength = np.nan_to_num(np.fmax(weight_out, weight_in), nan=0.0)
+            parts.append(neighbors[np.lexsort((neighbors, -strength))[:max_fanout]])
+
+        reached = sorted_unique(np.concatenate(parts).astype(np.int64))
+        owners = self.owners(reached)
+        neighbors = {}
+        for shard in np.unique(owners).tolist():
+            neighbors[shard] = reached[owners == shard]
+        return neighbors, frontier[capped]
+
+    def incident_weights(self, node: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Connections of an owned node
+
+        Returns:
+            (neighbors, weight_out, weight_in): sorted global neighbor indices
+            and the float64 weights node -> neighbor and neighbor -> node (NaN
+            where that direction has no weight)
+        """
+        row = int(self._rows(np.array([node], dtype=np.int64))[0])
+        return self._row(node, row)
+
+    def apply_delta(self, sources: np.ndarray, targets: np.ndarray, weights_out: np.ndarray,
+                    weights_in: np.ndarray, target_shards: np.ndarray) -> int:
+        """
+        Set the connections of owned users, then bump version (O(delta log degree))
+
+        Each entry gives the final state of the connection source - target:
+        the weights source -> target and target -> source (NaN where that
+        direction has none; both NaN removes the connection) and the shard
+        owning target. A source the shard does not know becomes an owned user.
+
+        Returns:
+            Number of connections changed
+
+        Raises:
+            ValueError: A source is owned by another shard (nothing is applied)
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        owners = self.owners(sources)
+        if np.any((owners != self.shard_id) & (owners != -1)):
+            raise ValueError(f"Delta has sources not owned by shard {self.shard_id}")
+
+        known = self._positions(sources)
+        for i, (source, target, weight_out, weight_in, target_shard) in enumerate(zip(
+                sources.tolist(), np.asarray(targets, dtype=np.int64).tolist(),
+                np.asarray(weights_out, dtype=np.float64).tolist(),
+                np.asarray(weights_in, dtype=np.float64).tolist(),
+                np.asarray(target_shards, dtype=np.int64).tolist())):
+            if known[i] < 0:
+                self.added_owners[source] = self.shard_id
+            remove = math.isnan(weight_out) and math.isnan(weight_in)
+            slot = self._slot(int(known[i]) if known[i] < self.num_owned else -1, target)
+            if slot is not None:
+                if remove == self.alive[slot]:
+                    self.alive[slot] = not remove
+                    self._num_dead += 1 if remove else -1
+                self.weights[slot], self.reverse_weights[slot] = weight_out, weight_in
+                continue
+
+            row = self.extra.get(source, {})
+            if remove:
+                if row.pop(target, None) is not None:
+                    self._num_extra -= 1
+                    if not row:
+                        del self.extra[source]
+                continue
+            if target not in row:
+                self._num_extra += 1
+            self.extra[source] = row
+            row[target] = [weight_out, weight_in]
+            if self._positions(np.array([target]))[0] < 0 and target not in self.added_owners:
+                self.added_owners[target] = target_shard
+
+        self.version += 1
+        self._maybe_compact()
+        return len(sources)
+
+    def _maybe_compact(self):
+        overlay = self._num_extra + self._num_dead
+        if overlay > max(COMPACT_MIN_SLOTS, COMPACT_FRACTION * len(self.indices)):
+            self.compact()
+
+    def compact(self):
+        """Fold the overlay back into fresh arrays (O(shard connections))"""
+        if not self._num_extra and not self._num_dead and not self.added_owners:
+            return
+        added = [node for node, owner in self.added_owners.items() if owner == self.shard_id]
+        owned = sorted_unique(np.concatenate([self.owned, np.array(added, dtype=np.int64)]))
+        rows = [self._row(int(node), int(row)) for node, row in zip(owned.tolist(), self._rows(owned).tolist())]
+        counts = np.array([len(neighbors) for neighbors, _, _ in rows], dtype=np.int64)
+        joined = [np.concatenate([row[part] for row in rows]) if rows else np.zeros(0) for part in range(3)]
+        rebuilt = self._from_rows(self.shard_id, owned, counts, joined[0].astype(np.int64),
+                                  joined[1], joined[2], self.owners, self.version)
+        self.num_owned = rebuilt.num_owned
+        for name in self.ARRAYS:
+            setattr(self, name, getattr(rebuilt, name))
+        self._clear_overlay()
+
+    def to_bytes(self) -> bytes:
+        """Serialize as an uncompressed .npz (no pickled objects), overlay folded in"""
+        self.compact()
+        buffer = io.BytesIO()
+        np.savez(buffer, shard_id=self.shard_id, num_owned=self.num_owned, version=self.version,
+                 **{name: getattr(self, name) for name in self.ARRAYS})
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'GraphShard':
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            return cls(int(archive['shard_id']), int(archive['num_owned']),
+                       version=int(archive['version']), **{name: archive[name] for name in cls.ARRAYS})
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the arrays (excluding the overlay)"""
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS) + self.alive.nbytes
+
+    def stats(self) -> Dict:
+        return {
+            'shard_id': self.shard_id,
+            'version': self.version,
+            'num_owned': self.num_owned + sum(owner == self.shard_id for owner in self.added_owners.values()),
+            'num_ghosts': len(self.nodes) - self.num_owned,
+            'num_slots': len(self.indices) - self._num_dead + self._num_extra,
+            'overlay_slots': self._num_dead + self._num_extra,
+            'memory_bytes': self.memory_bytes()
+        }
+
+
+def split_by_shard(nodes: np.ndarray, shard_of: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+    """(shard, sorted nodes) for each shard owning some of nodes"""
+    nodes = np.asarray(nodes, dtype=np.int64)
+    owners = shard_of[nodes]
+    return [(shard, np.sort(nodes[owners == shard])) for shard in np.unique(owners).tolist()]
+
+
+class ShardCoordinator:
+    """
+    Runs BFS traversals over graph shards held by trust_shard_api.py nodes
+
+    The coordinator holds no graph: only the partition map (the shard owning
+    each node), the shard versions and, during a traversal, the visited nodes
+    and the frontier. rebalance() partitions a snapshot of the caller's graph
+    by community (partition_graph) and uploads a shard to each node. In
+    between the partition stays put: each graph change is staged with the
+    final weights of the connections it touched, and flush() sends those to
+    the shards owning the two users. A new user joins the shard of the user
+    it first connects to. Every delta bumps the version of the shards
+    applying it.
+
+    The caller's graph is only read while it is locked: under `lock` for the
+    rebalance snapshot, and in stage() and detach(), which must be called
+    while holding the caller's write lock.
+    """
+
+    def __init__(self, urls: List[str], lock=None, timeout: float = 30.0):
+        """
+        Args:
+            urls: Base URLs of the shard nodes, one shard each
+            lock: Lock guarding the caller's graph, taken to snapshot it
+                (defaults to a private lock)
+            timeout: Seconds to wait for a shard node
+        """
+        self.urls = [url.rstrip('/') for url in urls]
+        self.lock = lock if lock is not None else threading.RLock()
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=len(self.urls), thread_name_prefix="trust-shard")
+        self._sessions = threading.local()
+        self._lock = threading.Lock()          # Serializes rebalances and flushes
+        self._pending_lock = threading.Lock()
+        self._pending = []                     # (graph version, connections) staged since the last flush
+        self._staging = False                  # Changes are staged from a rebalance until detach() or an error
+        self.generation = 0                    # Bumped by detach() when the caller replaces its graph
+        self._max_version = 0
+        # (generation, graph version, shard versions) the shards hold; None until a rebalance
+        self.synced = None
+        self.shard_of = np.zeros(0, dtype=np.int32)
+        self.added_shards = {}                 # Users interned since the partition -> shard
+        self.loads = np.zeros(len(self.urls), dtype=np.int64)
+        self.stats = {'num_shards': len(self.urls), 'synced': False}
+
+    def _post(self, shard: int, path: str, payload: Dict) -> Dict:
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            session = self._sessions.session = requests.Session()
+        response = session.post(f"{self.urls[shard]}{path}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _put_shard(self, shard: GraphShard) -> Dict:
+        response = requests.put(f"{self.urls[shard.shard_id]}/shard", data=shard.to_bytes(), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['stats']
+
+    def owner(self, node: int) -> Optional[int]:
+        """Shard owning a node, or None if it was interned after the partition and never connected"""
+        if node < len(self.shard_of):
+            return int(self.shard_of[node])
+        return self.added_shards.get(node)
+
+    def rebalance(self, snapshot: Callable[[], Tuple[Dict[str, np.ndarray], int]]):
+        """
+        Re-partition the caller's graph and upload a shard to each node
+
+        Only snapshot() runs under `lock`; changes staged during the upload
+        are flushed after it.
+
+        Args:
+            snapshot: Returns the graph's compacted_arrays() and its version
+
+        Raises:
+            requests.RequestException: A shard could not be uploaded
+                (nothing is synced until the next rebalance)
+        """
+        with self._lock:
+            with self.lock:
+                arrays, graph_version = snapshot()
+                with self._pending_lock:
+                    generation = self.generation
+                    self._staging = True
+                    self._pending = []
+                    self.synced = None
+
+            shard_of = partition_graph(arrays['indptr'], arrays['indices'], len(self.urls))
+            version = self._max_version + 1
+            shards = [GraphShard.from_arrays(arrays, shard_of, shard_id, version)
+                      for shard_id in range(len(self.urls))]
+            try:
+                shard_stats = list(self.executor.map(self._put_shard, shards))
+            except requests.RequestException:
+                self._mark_stale()
+                raise
+            self._max_version = version
+
+            self.shard_of, self.added_shards = shard_of, {}
+            self.loads = np.bincount(shard_of, minlength=len(self.urls)).astype(np.int64)
+            self.stats = {
+                'num_shards': len(self.urls),
+                'synced': False,
+                'rebalances': self.stats.get('rebalances', 0) + 1,
+                'graph_version': graph_version,
+                'edge_cut': round(edge_cut(arrays['indptr'], arrays['indices'], shard_of), 4),
+                'versions': [version] * len(self.urls),
+                'shards': shard_stats
+            }
+            if self._set_synced(generation, graph_version, (version,) * len(self.urls)):
+                self._flush_locked()
+
+    def stage(self, graph, pairs: List[Tuple[str, str]]):
+        """
+        Queue the current connections between pairs of users for flush()
+
+        Call while holding the caller's write lock, right after changing its
+        SocialGraph. Nothing is queued before the first rebalance, after
+        detach() or after a failed upload.
+        """
+        with self._pending_lock:
+            if not self._staging:
+                return
+            connections = []
+            for user_id, other_id in pairs:
+                u, v = graph.index_of(user_id), graph.index_of(other_id)
+                if u is None or v is None or u == v:
+                    continue
+                weight_uv, weight_vu = graph.weight(u, v), graph.weight(v, u)
+                connections.append((u, v, np.nan if weight_uv is None else weight_uv,
+                                    np.nan if weight_vu is None else weight_vu))
+            self._pending.append((graph.version, connections))
+
+    def detach(self):
+        """
+        Forget the shards' graph because the caller replaced it
+
+        Call while holding the caller's write lock, with the replacement.
+        Traversals report no graph version until the next rebalance.
+        """
+        with self._pending_lock:
+            self.generation += 1
+        self._mark_stale()
+
+    def flush(self):
+        """Send the staged changes to the shards owning their users"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+            synced = self.synced
+        if not pending or synced is None:
+            return
+        generation, _, versions = synced
+        versions = list(versions)
+
+        # Each connection goes to the shards of both users, from that user's side
+        deltas = {}
+        for _, connections in pending:
+            for u, v, weight_uv, weight_vu in connections:
+                shard_u, shard_v = self._assign(u, v)
+                deltas.setdefault(shard_u, []).append((u, v, weight_uv, weight_vu, shard_v))
+                deltas.setdefault(shard_v, []).append((v, u, weight_vu, weight_uv, shard_u))
+
+        def apply(item):
+            shard, entries = item
+            sources, targets, weights_out, weights_in, target_shards = zip(*entries)
+            return shard, self._post(shard, '/apply-delta', {
+                'version': versions[shard], 'sources': sources, 'targets': targets,
+                'weights_out': _json_weights(weights_out), 'weights_in': _json_weights(weights_in),
+                'target_shards': target_shards
+            })
+        try:
+            for shard, response in self.executor.map(apply, deltas.items()):
+                versions[shard] = response['version']
+                self.stats['shards'][shard] = response['stats']
+        except requests.RequestException as e:
+            # Some shards may hold the change and others not
+            print(f"Error sending graph changes to shards, propagating in-process until a rebalance: {e}")
+            self._mark_stale()
+            return
+
+        self._max_version = max(self._max_version, *versions)
+        self.stats['versions'] = versions
+        if self._set_synced(generation, pending[-1][0], tuple(versions)):
+            self.stats['graph_version'] = pending[-1][0]
+
+    def _set_synced(self, generation: int, graph_version: int, versions: Tuple[int, ...]) -> bool:
+        """Record what the shards hold, unless the caller's graph was replaced meanwhile"""
+        with self._pending_lock:
+            if generation != self.generation or not self._staging:
+                return False
+            self.synced = (generation, graph_version, versions)
+        self.stats['synced'] = True
+        return True
+
+    def _assign(self, u: int, v: int) -> Tuple[int, int]:
+        """Shards of u and v, placing a user new since the partition with the user it connects to"""
+        shard_u, shard_v = self.owner(u), self.owner(v)
+        if shard_u is None:
+            shard_u = shard_v if shard_v is not None else int(np.argmin(self.loads))
+            self.added_shards[u] = shard_u
+            self.loads[shard_u] += 1
+        if shard_v is None:
+            shard_v = shard_u
+            self.added_shards[v] = shard_v
+            self.loads[shard_v] += 1
+        return shard_u, shard_v
+
+    def _mark_stale(self):
+        with self._pending_lock:
+            self._staging = False
+            self._pending = []
+            self.synced = None
+        self.stats['synced'] = False
+
+    def hop_distances(self, source: int, max_hops: int, max_fanout: Optional[int] = None,
+                      prune: Optional[Callable] = None) -> Tuple[Optional[int], Optional[Dict]]:
+        """
+        Sharded SocialGraph.hop_distances from one node, with its incident weights
+
+        Call flush() first so the shards hold the latest changes.
+
+        Args:
+            source: Graph index of the start node
+            max_hops: Maximum hops to expand
+            max_fanout: Expand only the strongest max_fanout connections of larger rows
+            prune: Given to_source(nodes) (weights nodes -> source, NaN where
+                none), returns keep(hop, nodes) or None; nodes it drops count as
+                visited but are neither recorded nor expanded
+
+        Returns:
+            (graph_version, reached): the graph version the shards held and a
+            dict with 'nodes' (ordered by hop, then index), 'hops', their
+            'to_source' and 'from_source' weights, and 'capped' and 'pruned'
+            like hop_distances' traversal; reached is None if the source has
+            no connections. graph_version is None if the shards hold no
+            partition or changed during the traversal.
+        """
+        synced = self.synced
+        if synced is None:
+            return None, None
+        _, graph_version, versions = synced
+        shard = self.owner(source)
+        if shard is None:
+            return graph_version, None
+        try:
+            return graph_version, self._traverse(versions, shard, source, max_hops, max_fanout, prune)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 409:
+                return None, None  # A delta or rebalance reached the shards first
+            raise
+
+    def _traverse(self, versions: Tuple[int, ...], shard: int, source: int, max_hops: int,
+                  max_fanout: Optional[int], prune: Optional[Callable]) -> Optional[Dict]:
+        # Only direct neighbors carry weights to/from the source
+        incident = self._post(shard, '/incident-weights', {'version': versions[shard], 'node': source})
+        if not incident['neighbors']:
+            return None
+        neighbors = np.array(incident['neighbors'], dtype=np.int64)
+
+        def weights_of(weights):
+            weights = np.array(weights, dtype=np.float64)
+            def lookup(nodes):
+                pos = np.minimum(np.searchsorted(neighbors, nodes), len(neighbors) - 1)
+                return np.where(neighbors[pos] == nodes, weights[pos], np.nan)
+            return lookup
+        to_source, from_source = weights_of(incident['weight_in']), weights_of(incident['weight_out'])
+        keep = prune(to_source) if prune is not None else None
+
+        visited = np.array([source], dtype=np.int64)
+        frontier = {shard: visited}
+        reached, hops, capped, pruned = [], [], [], 0
+
+        for hop in range(1, max_hops + 1):
+            if not frontier:
+                break
+
+            def expand(part):
+                shard, nodes = part
+                return self._post(shard, '/expand', {'version': versions[shard], 'frontier': nodes.tolist(),
+                                                     'max_fanout': max_fanout})
+            incoming, hop_capped = {}, []
+            for response in self.executor.map(expand, frontier.items()):
+                hop_capped.append(np.array(response['capped'], dtype=np.int64))
+                for shard, nodes in response['neighbors'].items():
+                    incoming.setdefault(int(shard), []).append(np.array(nodes, dtype=np.int64))
+            if max_fanout is not None:
+                capped.append(np.sort(np.concatenate(hop_capped)))
+
+            # Unvisited neighbors form the next frontier on the shard owning them
+            frontier, unvisited = {}, []
+            for shard, parts in sorted(incoming.items()):
+                nodes = sorted_unique(np.concatenate(parts))
+                nodes = nodes[~sorted_contains(visited, nodes)]
+                unvisited.append(nodes)
+                if keep is not None:
+                    mask = keep(hop, nodes)
+                    pruned += len(nodes) - int(np.count_nonzero(mask))
+                    nodes = nodes[mask]
+                if len(nodes):
+                    frontier[shard] = nodes
+            if unvisited:
+                visited = sorted_unique(np.concatenate([visited] + unvisited))
+            hop_nodes = np.sort(np.concatenate(list(frontier.values()))) if frontier else np.zeros(0, dtype=np.int64)
+            reached.append(hop_nodes)
+            hops.append(np.full(len(hop_nodes), hop, dtype=np.int32))
+
+        nodes = np.concatenate(reached) if reached else np.zeros(0, dtype=np.int64)
+        return {
+            'nodes': nodes,
+            'hops': np.concatenate(hops) if hops else np.zeros(0, dtype=np.int32),
+            'to_source': to_source(nodes),
+            'from_source': from_source(nodes),
+            'capped': np.concatenate(capped) if capped else np.zeros(0, dtype=np.int64),
+            'pruned': pruned
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def _json_weights(weights) -> List[Optional[float]]:
+    """Weights with NaN (no weight in that direction) as null"""
+    return [None if np.isnan(weight) else weight for weight in weights]
@@ -0,0 +1,359 @@
+"""
+Graph Stream Loader - Builds the community graph from mongoexport JSONL dumps
+Records flow through a generator pipeline (read -> parse -> map -> chunk -> append),
+so memory stays bounded by the chunk size no matter how large the export is.
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import uuid
+import base64
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from graph_builder import CommunityGraphBuilder
+
+# Edge weights, matching create_sample_community_graph
+INTERACTION_WEIGHTS = {
+    'posted': 1.0,
+    'liked': 0.5,
+    'commented': 0.7,
+    'reported': 1.5,
+    'follows': 0.5
+}
+
+# Default export file per collection (mongoexport --collection X --out X.jsonl)
+EXPORT_FILES = {
+    'users': 'CommunityProfiles.jsonl',
+    'posts': 'CommunityPosts.jsonl',
+    'likes': 'PostLikes.jsonl',
+    'comments': 'PostComments.jsonl',
+    'follows': 'UserFollows.jsonl',
+    'reports': 'ContentReports.jsonl'
+}
+
+
+def _extended_json_hook(obj: Dict):
+    """
+    Decode MongoDB Extended JSON wrappers ($oid, $date, $numberLong, $binary, ...)
+
+    Called bottom-up by json.loads, so nested wrappers are already decoded.
+    Dates become POSIX seconds, GUIDs become their canonical string form and
+    other binaries become lowercase hex, so every id is a plain string.
+    """
+    if len(obj) > 2:
+        return obj
+    if '$oid' in obj:
+        return obj['$oid']
+    if '$date' in obj:
+        value = obj['$date']
+        if isinstance(value, (int, float)):
+            return value / 1000.0
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    if '$numberLong' in obj or '$numberInt' in obj:
+        return int(obj.get('$numberLong', obj.get('$numberInt')))
+    if '$numberDouble' in obj or '$numberDecimal' in obj:
+        return float(obj.get('$numberDouble', obj.get('$numberDecimal')))
+    if '$uuid' in obj:
+        return obj['$uuid']
+    if '$binary' in obj:
+        binary = obj['$binary']
+        if isinstance(binary, dict):
+            data, subtype = binary['base64'], binary['subType']
+        else:
+            data, subtype = binary, obj.get('$type', '00')
+        raw = base64.b64decode(data)
+        if len(raw) == 16 and subtype in ('03', '3'):
+            return str(uuid.UUID(bytes_le=raw))  # C# legacy GUID byte order
+        if len(raw) == 16 and subtype in ('04', '4'):
+            return str(uuid.UUID(bytes=raw))
+        return raw.hex()
+    return obj
+
+
+_decoder = json.JSONDecoder(object_hook=_extended_json_hook)
+
+
+def _field(doc: Dict, *names, default=None):
+    """First present field among names"""
+    for name in names:
+        value = doc.get(name)
+        if value is not None:
+            return value
+    return default
+
+
+class LoadStats:
+    """Counters for one stream"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.records = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def to_dict(self) -> Dict:
+        seconds = self.seconds
+        return {
+            'kind': self.kind,
+            'records': self.records,
+            'skipped': self.skipped,
+            'seconds': round(seconds, 3),
+            'records_per_second': round(self.records / seconds, 1) if seconds > 0 else 0.0
+        }
+
+
+def read_jsonl(path: str, stats: LoadStats) -> Iterator[Dict]:
+    """Yield one decoded document per line (plain or .gz), skipping bad lines"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield _decoder.decode(line)
+            except (ValueError, KeyError):
+                stats.skipped += 1
+
+
+def chunked(records: Iterable, size: int) -> Iterator[List]:
+    """Group an iterable into lists of at most size items"""
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Mappers: document -> row tuple (or None to skip)
+
+def _is_deleted(doc: Dict) -> bool:
+    """Soft-deleted record (CommunityService filters these out of every query)"""
+    return bool(_field(doc, 'IsDeleted', 'is_deleted', default=False))
+
+
+def map_user(doc: Dict) -> Optional[Tuple]:
+    """CommunityProfile -> (user_id, created, posts, harmful, reports_received, reports_made)"""
+    user_id = _field(doc, 'UserId', 'user_id', 'id')
+    if user_id is None:
+        return None
+    return (
+        str(user_id),
+        _field(doc, 'CreatedAt', 'account_created', default=time.time()),
+        _field(doc, 'PostsCount', 'posts_count', default=0),
+        _field(doc, 'ViolationCount', 'harmful_posts', default=0),
+        _field(doc, 'ReportsReceived', 'reports_received', default=0),
+        _field(doc, 'ReportsMade', 'reports_made', default=0)
+    )
+
+
+def map_post(doc: Dict) -> Optional[Tuple]:
+    """CommunityPost -> (post_id, author_id, created, likes, comments, reports, flagged)"""
+    post_id = _field(doc, '_id', 'Id', 'id')
+    author_id = _field(doc, 'AuthorId', 'user_id')
+    if post_id is None or author_id is None or _is_deleted(doc):
+        return None
+    return (
+        str(post_id),
+        str(author_id),
+        _field(doc, 'CreatedAt', 'created_at', default=time.time()),
+        _field(doc, 'LikesCount', 'likes_count', default=0),
+        _field(doc, 'CommentsCount', 'comments_count', default=0),
+        _field(doc, 'ReportCount', 'reports_count', default=0),
+        bool(_field(doc, 'IsFlagged', 'is_flagged', default=False))
+    )
+
+
+def _edge_mapper(user_fields: Tuple[str, ...], target_fields: Tuple[str, ...],
+                 interaction_type: str, target_is_user: bool) -> Callable[[Dict], Optional[Tuple]]:
+    """Mapper for a collection of edges -> (user_id, target_id, type, weight, time, target_is_user)"""
+    weight = INTERACTION_WEIGHTS[interaction_type]
+
+    def mapper(doc: Dict) -> Optional[Tuple]:
+        user_id = _field(doc, *user_fields)
+        target_id = _field(doc, *target_fields)
+        if user_id is None or target_id is None or _is_deleted(doc):
+            return None
+        return (str(user_id), str(target_id), interaction_type, weight,
+                _field(doc, 'CreatedAt', 'timestamp', default=time.time()), target_is_user)
+
+    return mapper
+
+
+def map_report(doc: Dict) -> Optional[Tuple]:
+    """ContentReport -> edge to the reported post, or to the reported user"""
+    reporter_id = _field(doc, 'ReporterId', 'user_id')
+    if reporter_id is None:
+        return None
+    created = _field(doc, 'CreatedAt', 'timestamp', default=time.time())
+    weight = INTERACTION_WEIGHTS['reported']
+    if doc.get('TargetPostId'):
+        return (str(reporter_id), str(doc['TargetPostId']), 'reported', weight, created, False)
+    if doc.get('TargetUserId'):
+        return (str(reporter_id), str(doc['TargetUserId']), 'reported', weight, created, True)
+    return None
+
+
+INTERACTION_MAPPERS = {
+    'likes': _edge_mapper(('UserId', 'user_id'), ('PostId', 'post_id'), 'liked', False),
+    'comments': _edge_mapper(('AuthorId', 'user_id'), ('PostId', 'post_id'), 'commented', False),
+    'follows': _edge_mapper(('FollowerId', 'user_id'), ('FollowingId', 'user_id_2'), 'follows', True),
+    'reports': map_report
+}
+
+
+class GraphStreamLoader:
+    """Streams mongoexport dumps into a CommunityGraphBuilder in columnar chunks"""
+
+    def __init__(self, builder: Optional[CommunityGraphBuilder] = None,
+                 chunk_size: int = 10000, progress_every: int = 100000,
+                 progress_callback: Optional[Callable[[Dict], None]] = None):
+        """
+        Args:
+            builder: Builder to append to (a new unwindowed one by default)
+            chunk_size: Records appended to the builder per batch
+            progress_every: Report progress every N records
+            progress_callback: Receives LoadStats.to_dict(); prints by default
+        """
+        self.builder = builder or CommunityGraphBuilder()
+        self.chunk_size = chunk_size
+        self.progress_every = progress_every
+        self.progress_callback = progress_callback or self._print_progress
+
+    def _print_progress(self, stats: Dict):
+        print(f"  {stats['kind']}: {stats['records']:,} records "
+              f"({stats['records_per_second']:,.0f}/s, {stats['skipped']} skipped)")
+
+    def _stream(self, path: str, kind: str, mapper: Callable[[Dict], Optional[Tuple]],
+                sink: Callable[[List[Tuple]], None]) -> Dict:
+        """Run read -> map -> chunk -> sink over one file"""
+        stats = LoadStats(kind)
+        next_report = self.progress_every
+
+        def mapped_rows() -> Iterator[Tuple]:
+            for doc in read_jsonl(path, stats):
+                row = mapper(doc)
+                if row is None:
+                    stats.skipped += 1
+                    continue
+                yield row
+
+        for chunk in chunked(mapped_rows(), self.chunk_size):
+            sink(chunk)
+            stats.records += len(chunk)
+            if stats.records >= next_report:
+                self.progress_callback(stats.to_dict())
+                next_report += self.progress_every
+
+        result = stats.to_dict()
+        self.progress_callback(result)
+        return result
+
+    def load_users(self, path: str) -> Dict:
+        """Stream CommunityProfiles into user nodes"""
+        def sink(chunk: List[Tuple]):
+            user_ids, created, posts, harmful, received, made = zip(*chunk)
+            self.builder.add_users_batch(list(user_ids), np.array(created, dtype=np.float64),
+                                         posts, harmful, received, made)
+
+        return self._stream(path, 'users', map_user, sink)
+
+    def load_posts(self, path: str) -> Dict:
+        """Stream CommunityPosts into post nodes plus their 'posted' edges"""
+        weight = INTERACTION_WEIGHTS['posted']
+
+        def sink(chunk: List[Tuple]):
+            post_ids, author_ids, created, likes, comments, reports, flagged = zip(*chunk)
+            created = np.array(created, dtype=np.float64)
+            self.builder.add_posts_batch(list(post_ids), list(author_ids), created,
+                                         likes, comments, reports, flagged)
+            self.builder.add_interactions_batch(list(author_ids), list(post_ids),
+                                                ['posted'] * len(chunk),
+                                                np.full(len(chunk), weight), created)
+
+        return self._stream(path, 'posts', map_post, sink)
+
+    def load_interactions(self, path: str, kind: str) -> Dict:
+        """
+        Stream an edge collection into interaction edges
+
+        Args:
+            kind: 'likes', 'comments', 'follows' or 'reports'
+        """
+        if kind not in INTERACTION_MAPPERS:
+            raise ValueError(f"Unknown interaction kind: {kind}")
+
+        def sink(chunk: List[Tuple]):
+            for target_is_user in (False, True):
+                rows = [row for row in chunk if row[5] == target_is_user]
+                if not rows:
+                    continue
+                user_ids, target_ids, types, weights, timestamps, _ = zip(*rows)
+                self.builder.add_interactions_batch(list(user_ids), list(target_ids), list(types),
+                                                    np.array(weights), np.array(timestamps, dtype=np.float64),
+                                                    target_is_user=target_is_user)
+
+        return self._stream(path, kind, INTERACTION_MAPPERS[kind], sink)
+
+    def load_export(self, export_dir: str, files: Optional[Dict[str, str]] = None) -> Dict:
+        """
+        Load a full export directory (users, then posts, then edge collections)
+
+        Args:
+            export_dir: Directory holding the JSONL files
+            files: Override of EXPORT_FILES; missing files are skipped
+
+        Returns:
+            Per-kind stats plus totals
+        """
+        files = {**EXPORT_FILES, **(files or {})}
+        started = time.perf_counter()
+        results = {}
+
+        for kind, filename in files.items():
+            path = os.path.join(export_dir, filename)
+            if not os.path.exists(path) and os.path.exists(path + '.gz'):
+                path += '.gz'
+            if not os.path.exists(path):
+                continue
+            if kind == 'users':
+                results[kind] = self.load_users(path)
+            elif kind == 'posts':
+                results[kind] = self.load_posts(path)
+            else:
+                results[kind] = self.load_interactions(path, kind)
+
+        seconds = time.perf_counter() - started
+        total = sum(r['records'] for r in results.values())
+        results['total'] = {
+            'records': total,
+            'skipped': sum(r['skipped'] for r in results.values()),
+            'seconds': round(seconds, 3),
+            'records_per_second': round(total / seconds, 1) if seconds > 0 else 0.0
+        }
+        return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python graph_stream_loader.py <export_dir> [window_days]")
+        sys.exit(1)
+
+    window = timedelta(days=int(sys.argv[2])) if len(sys.argv) > 2 else None
+    loader = GraphStreamLoader(CommunityGraphBuilder(window=window))
+
+    print(f"Loading community export from {sys.argv[1]}...")
+    results = loader.load_export(sys.argv[1])
+    print(f"\nTotal: {results['total']}")
+    print(f"Graph: {loader.builder.compute_graph_statistics()}")
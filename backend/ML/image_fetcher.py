@@ -0,0 +1,205 @@
+"""
+Image Fetcher - Pooled, bounded and cached downloads of item images
+One keep-alive requests session with a connection pool shared by all
+downloads, a thread pool that prefetches every URL of a request at once,
+streaming reads that stop at max_bytes, and an on-disk cache revalidated
+with the server's ETag / Last-Modified validators, so an unchanged image
+costs a 304 instead of a full download.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+# Defaults, overridable by environment
+IMAGE_FETCH_WORKERS = int(os.environ.get('IMAGE_FETCH_WORKERS', 8))
+IMAGE_FETCH_MAX_BYTES = int(os.environ.get('IMAGE_FETCH_MAX_BYTES', 10 * 1024 * 1024))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageFetcher:
+    """
+    Downloads image URLs for CLIPService
+
+    Cache files in cache_dir:
+        <sha256 of url>.img  one JSON line {url, etag, last_modified, size},
+                             then the response body
+
+    Responses without ETag or Last-Modified are not cached, since they
+    could never be revalidated. Once the cache exceeds max_cache_bytes the
+    least recently used files are removed. All methods are thread-safe.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = IMAGE_FETCH_MAX_BYTES,
+                 max_workers: int = IMAGE_FETCH_WORKERS, timeout: float = 10,
+                 max_cache_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        """
+        Args:
+            cache_dir: Directory of the on-disk cache (None disables it)
+            max_bytes: Largest response body accepted
+            max_workers: Concurrent downloads, and pooled connections per host
+            timeout: Connect and read timeout in seconds
+            max_cache_bytes: Size the cache is trimmed back to
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_cache_bytes = max_cache_bytes
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-fetch')
+
+        self.stats = {'downloads': 0, 'revalidated': 0, 'bytes_downloaded': 0}
+        self._lock = threading.Lock()
+        self._cache_bytes = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._cache_bytes = sum(os.path.getsize(path) for path in self._cache_files())
+
+    def fetch(self, url: str) -> bytes:
+        """
+        Body of url, from the cache if the server confirms it is unchanged
+
+        Raises:
+            requests.RequestException: Connection errors and error statuses
+            ValueError: Body larger than max_bytes
+        """
+        cached = self._read_cache(url)
+        headers = {}
+        if cached:
+            meta, _ = cached
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304:
+                if not cached:
+                    raise requests.HTTPError(f"304 Not Modified for {url} without a cached copy", response=response)
+                self._count('revalidated')
+                return cached[1]
+            response.raise_for_status()
+
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise ValueError(f"Image at {url} is {declared} bytes (max {self.max_bytes})")
+            body = bytearray()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    raise ValueError(f"Image at {url} exceeds {self.max_bytes} bytes")
+            body = bytes(body)
+
+            self._count('downloads')
+            self._count('bytes_downloaded', len(body))
+            etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self._write_cache(url, {'url': url, 'etag': etag, 'last_modified': last_modified,
+                                        'size': len(body)}, body)
+            return body
+
+    def fetch_many(self, urls: Iterable[str]) -> Dict[str, Union[bytes, Exception]]:
+        """
+        Fetch urls concurrently, each distinct url once
+
+        Returns:
+            Dict mapping each url to its body, or to the exception raised
+            while fetching it
+        """
+        def fetch(url):
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                return e
+
+        distinct = list(dict.fromkeys(urls))
+        if len(distinct) <= 1:
+            return {url: fetch(url) for url in distinct}
+        return dict(zip(distinct, self.pool.map(fetch, distinct)))
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.session.close()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _cache_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.img')
+
+    def _cache_files(self):
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.img')]
+
+    def _read_cache(self, url: str) -> Optional[Tuple[Dict, bytes]]:
+        if not self.cache_dir:
+            return None
+        path = self._cache_path(url)
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url or meta.get('size') != len(body):
+            return None  # Hash collision or torn file
+        try:
+            os.utime(path)  # Recently used
+        except OSError:
+            pass
+        return meta, body
+
+    def _write_cache(self, url: str, meta: Dict, body: bytes):
+        if not self.cache_dir or len(body) > self.max_cache_bytes:
+            return
+        path = self._cache_path(url)
+        # Written beside the target and renamed, so readers never see a partial file
+        descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(json.dumps(meta).encode('utf-8') + b'\n')
+                f.write(body)
+            size = os.path.getsize(temp_path)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error caching image: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with self._lock:
+            self._cache_bytes += size - previous
+            if self._cache_bytes > self.max_cache_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used files until the cache is 90% of max_cache_bytes (lock held)"""
+        files = []
+        for path in self._cache_files():
+            try:
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+            except OSError:
+                continue
+        self._cache_bytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if self._cache_bytes <= 0.9 * self.max_cache_bytes:
+                break
+            try:
+                os.remove(path)
+                self._cache_bytes -= size
+            except OSError:
+                pass
@@ -5,11 +5,16 @@ When a new found item is reported, it checks for similar lost item reports and n
 """
 
 import os
+import hashlib
+import threading
+from collections import OrderedDict
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+from vector_index import VectorIndex
+from metadata_index import MetadataIndex
+from embedding_codec import pack_embedding, unpack_embedding, strip_embeddings
 
 app = Flask(__name__)
 CORS(app)
@@ -17,11 +22,27 @@ CORS(app)
 # Global model
 model = None
 MODEL_NAME = 'all-MiniLM-L6-v2'  # Lightweight but effective S-BERT model
+# Tag of embeddings handed out by /embed; bump when create_item_text changes,
+# so clients' cached embeddings are no longer accepted by /match
+EMBEDDING_VERSION = '1'
+
+# Server-side index of item embeddings, so /match need not resend candidates
+ITEM_INDEX_DIR = os.environ.get('ITEM_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data', 'item_index'))
+item_index = VectorIndex(ITEM_INDEX_DIR)
+metadata_index = MetadataIndex()
+
+# Normalized embeddings of recently matched items, keyed by (item id, text hash):
+# the open lost items are candidates in every request
+EMBEDDING_CACHE_SIZE = int(os.environ.get('ITEM_EMBEDDING_CACHE_SIZE', 20000))
+ENCODE_BATCH_SIZE = 64
+embedding_cache = OrderedDict()
+embedding_cache_lock = threading.Lock()
 
 def load_model():
     """Load the S-BERT model"""
     global model
     try:
+        from sentence_transformers import SentenceTransformer  # Heavy; only needed to serve
         print(f"Loading S-BERT model: {MODEL_NAME}...")
         model = SentenceTransformer(MODEL_NAME)
         print("S-BERT model loaded successfully!")
@@ -57,7 +78,82 @@ def compute_similarity(text1, text2):
     similarity = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
     return float(similarity)
 
-def find_matches(query_item, candidate_items, threshold=0.5, top_k=5):
+def embedding_cache_key(item, text):
+    return (str(item.get('id', '')), hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+def encode_items(items, stats=None):
+    """
+    Normalized S-BERT embeddings of items, from the LRU cache where possible
+    
+    An item's "embedding" (pack_embedding of an /embed result) is used when
+    its model, version and dimension match. Other items missing from the
+    cache (new, or edited since) are encoded in one batched model.encode call.
+    
+    Args:
+        items: Non-empty list of item dicts (keyed by id and text, so an
+            edited item is encoded again)
+        stats: Optional dict that receives the number of client embeddings
+            used and rejected
+    
+    Returns:
+        N x D float32 array of unit-length rows
+    """
+    texts = [create_item_text(item) for item in items]
+    keys = [embedding_cache_key(item, text) for item, text in zip(items, texts)]
+    
+    embeddings = [None] * len(items)
+    used = rejected = 0
+    for i, item in enumerate(items):
+        if item.get('embedding') is not None:
+            embeddings[i] = unpack_embedding(item['embedding'], MODEL_NAME, EMBEDDING_VERSION,
+                                             model.get_sentence_embedding_dimension())
+            if embeddings[i] is None:
+                rejected += 1
+            else:
+                used += 1
+    if stats is not None:
+        stats['client_embeddings'] = {'used': used, 'rejected': rejected}
+    
+    with embedding_cache_lock:
+        for i, key in enumerate(keys):
+            if embeddings[i] is None and key in embedding_cache:
+                embedding_cache.move_to_end(key)
+                embeddings[i] = embedding_cache[key]
+    
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        encoded = model.encode([texts[i] for i in missing], batch_size=ENCODE_BATCH_SIZE,
+                               normalize_embeddings=True, convert_to_numpy=True)
+        with embedding_cache_lock:
+            for i, embedding in zip(missing, np.asarray(encoded, dtype=np.float32)):
+                embeddings[i] = embedding
+                embedding_cache[keys[i]] = embedding
+                embedding_cache.move_to_end(keys[i])
+            while len(embedding_cache) > EMBEDDING_CACHE_SIZE:
+                embedding_cache.popitem(last=False)
+    
+    return np.stack(embeddings)
+
+def category_boost(query_item, candidate, similarity):
+    """Boost similarity by 0.15 when both items have the same category"""
+    if query_item.get('category') and candidate.get('category'):
+        if query_item['category'].lower() == candidate['category'].lower():
+            return min(1.0, similarity + 0.15)
+    return similarity
+
+def prefilter_options(data):
+    """MetadataIndex.prefilter options from the request's "prefilter" field (None when disabled)"""
+    prefilter = data.get('prefilter', True)
+    if not prefilter:
+        return None
+    if prefilter is True:
+        return {}
+    if not isinstance(prefilter, dict):
+        raise ValueError('prefilter must be a boolean or an object')
+    return {key: prefilter[key] for key in ('filters', 'min_candidates', 'fallback', 'window_days')
+            if key in prefilter}
+
+def find_matches(query_item, candidate_items, threshold=0.5, top_k=5, prefilter=None, stats=None):
     """
     Find matching items from candidates based on semantic similarity.
     
@@ -66,32 +162,33 @@ def find_matches(query_item, candidate_items, threshold=0.5, top_k=5):
         candidate_items: List of candidate items to search through
         threshold: Minimum similarity score (0-1) to consider a match
         top_k: Maximum number of matches to return
+        prefilter: MetadataIndex.prefilter options; None embeds every candidate
+        stats: Optional dict that receives encode_items stats
     
     Returns:
         List of matching items with similarity scores
     """
+    if prefilter is not None and candidate_items:
+        keys, _ = MetadataIndex.from_items(candidate_items).prefilter(query_item, **prefilter)
+        if keys is not None:
+            candidate_items = [candidate_items[i] for i in sorted(keys)]
+    
     if model is None or not candidate_items:
         return []
     
-    query_text = create_item_text(query_item)
-    query_embedding = model.encode([query_text])[0]
+    # One batched encode for uncached items, then one matrix-vector product
+    embeddings = encode_items([query_item] + list(candidate_items), stats)
+    similarities = embeddings[1:] @ embeddings[0]
     
     matches = []
     
-    for candidate in candidate_items:
-        candidate_text = create_item_text(candidate)
-        candidate_embedding = model.encode([candidate_text])[0]
-        
-        similarity = cosine_similarity([query_embedding], [candidate_embedding])[0][0]
-        
+    for candidate, similarity in zip(candidate_items, similarities):
         # Category boost: if categories match, boost similarity
-        if query_item.get('category') and candidate.get('category'):
-            if query_item['category'].lower() == candidate['category'].lower():
-                similarity = min(1.0, similarity + 0.15)  # Boost by 15%
+        similarity = category_boost(query_item, candidate, similarity)
         
         if similarity >= threshold:
             matches.append({
-                'item': candidate,
+                'item': strip_embeddings(candidate),
                 'similarity': float(similarity),
                 'match_percentage': round(float(similarity) * 100, 1)
             })
@@ -100,15 +197,123 @@ def find_matches(query_item, candidate_items, threshold=0.5, top_k=5):
     matches.sort(key=lambda x: x['similarity'], reverse=True)
     return matches[:top_k]
 
+def find_indexed_matches(query_item, query_vector, threshold=0.5, top_k=5, exclude=(), prefilter=None):
+    """
+    Find matching items in the item index.
+    
+    The index is searched for more than top_k items, since the category
+    boost can lift an item above ones with a higher raw similarity. With
+    prefilter, only items passing the metadata filters are searched.
+    
+    Args:
+        query_item: The item to match (used for the category boost)
+        query_vector: Embedding of the query item
+        threshold: Minimum similarity score (0-1) to consider a match
+        top_k: Maximum number of matches to return
+        exclude: Item ids to leave out
+        prefilter: MetadataIndex.prefilter options; None searches every item
+    
+    Returns:
+        (matches, stats): matches like find_matches, and the index search stats
+    """
+    include, applied = None, []
+    if prefilter is not None:
+        include, applied = metadata_index.prefilter(query_item, **prefilter)
+    
+    stats = {'prefilters': applied}
+    hits = item_index.search(query_vector, k=max(top_k * 5, 50), exclude=exclude, include=include, stats=stats)
+    _, _, payloads = item_index.get_many([item_id for item_id, _ in hits])
+    
+    matches = []
+    for (item_id, similarity), candidate in zip(hits, payloads):
+        candidate = candidate or {'id': item_id}
+        similarity = category_boost(query_item, candidate, similarity)
+        if similarity >= threshold:
+            matches.append({
+                'item': candidate,
+                'similarity': float(similarity),
+                'match_percentage': round(float(similarity) * 100, 1)
+            })
+    
+    matches.sort(key=lambda x: x['similarity'], reverse=True)
+    return matches[:top_k], stats
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'model_loaded': model is not None,
-        'model_name': MODEL_NAME
+        'model_name': MODEL_NAME,
+        'indexed_items': len(item_index)
     })
 
+@app.route('/items', methods=['POST'])
+def add_items():
+    """
+    Embed items once and add them to the item index (replacing any with the same id).
+    
+    Request body:
+    {
+        "items": [
+            {
+                "id": "lost_item_1",
+                "user_id": "user_123",
+                "title": "Lost Wallet",
+                "category": "Wallet",
+                "description": "Black wallet with cards",
+                "location": "Park area"
+            },
+            ...
+        ]
+    }
+    
+    Response:
+    {
+        "success": true,
+        "indexed": 1,
+        "total_items": 1250
+    }
+    """
+    if model is None:
+        return jsonify({'error': 'Model not loaded', 'success': False}), 500
+    
+    data = request.get_json()
+    items = (data or {}).get('items')
+    
+    if not items:
+        return jsonify({'error': 'Missing items', 'success': False}), 400
+    if any(not item.get('id') for item in items):
+        return jsonify({'error': 'Every item needs an id', 'success': False}), 400
+    
+    try:
+        embeddings = encode_items(items)
+        items = [strip_embeddings(item) for item in items]
+        item_index.add_many([str(item['id']) for item in items], embeddings, items)
+        for item in items:
+            metadata_index.add(str(item['id']), item)
+        
+        return jsonify({
+            'success': True,
+            'indexed': len(items),
+            'total_items': len(item_index)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/items/<item_id>', methods=['DELETE'])
+def remove_item(item_id):
+    """Remove an item (e.g. a resolved lost item report) from the item index"""
+    metadata_index.remove(item_id)
+    if not item_index.remove(item_id):
+        return jsonify({'error': 'Item not indexed', 'success': False}), 404
+    return jsonify({'success': True, 'total_items': len(item_index)})
+
+@app.route('/items/stats', methods=['GET'])
+def item_index_stats():
+    """Size and search mode of the item index"""
+    return jsonify({'success': True, 'stats': item_index.stats()})
+
 @app.route('/match', methods=['POST'])
 def match_items():
     """
@@ -130,14 +335,30 @@ def match_items():
                 "title": "Lost Wallet",
                 "category": "Wallet",
                 "description": "Black wallet with cards",
-                "location": "Park area"
+                "location": "Park area",
+                "embedding": {...}  # optional: "packed_embedding" from /embed, skips encoding
             },
             ...
         ],
         "threshold": 0.5,  # optional, default 0.5
-        "top_k": 5  # optional, default 5
+        "top_k": 5,  # optional, default 5
+        "prefilter": {  # optional, default true; false embeds every candidate
+            "filters": ["category", "location", "date"],
+            "min_candidates": 5,  # drop filters (location, then date, then category) below this
+            "window_days": 30
+        }
     }
     
+    Any item may carry the "packed_embedding" that /embed returned for it as
+    "embedding". It is used instead of encoding the item if its model,
+    version and dimension match; otherwise the item is encoded as usual.
+    
+    Without "candidate_items", the items added through POST /items are
+    searched instead. The query is then one of:
+        "query_item": {...}           embedded as above
+        "query_item_id": "item_id"    an indexed item (left out of the matches)
+        "query_vector": [0.1, ...]    an embedding from /embed
+    
     Response:
     {
         "success": true,
@@ -149,7 +370,8 @@ def match_items():
             },
             ...
         ],
-        "query_item_id": "item_id"
+        "query_item_id": "item_id",
+        "client_embeddings": {"used": 12, "rejected": 0}
     }
     """
     if model is None:
@@ -160,6 +382,9 @@ def match_items():
     if not data:
         return jsonify({'error': 'No data provided', 'success': False}), 400
     
+    if 'candidate_items' not in data:
+        return match_indexed_items(data)
+    
     query_item = data.get('query_item')
     candidate_items = data.get('candidate_items', [])
     threshold = data.get('threshold', 0.5)
@@ -177,15 +402,61 @@ def match_items():
         })
     
     try:
-        matches = find_matches(query_item, candidate_items, threshold, top_k)
+        stats = {}
+        matches = find_matches(query_item, candidate_items, threshold, top_k, prefilter_options(data), stats)
         
         return jsonify({
             'success': True,
             'matches': matches,
             'query_item_id': query_item.get('id'),
             'total_candidates': len(candidate_items),
-            'matches_found': len(matches)
+            'matches_found': len(matches),
+            'client_embeddings': stats.get('client_embeddings', {'used': 0, 'rejected': 0})
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+def match_indexed_items(data):
+    """Handle /match against the item index"""
+    threshold = data.get('threshold', 0.5)
+    top_k = data.get('top_k', 5)
+    query_item = data.get('query_item') or {}
+    exclude = []
+    encode_stats = {}
+    
+    try:
+        if data.get('query_item_id') is not None:
+            query_item_id = str(data['query_item_id'])
+            stored = item_index.get(query_item_id)
+            if stored is None:
+                return jsonify({'error': 'query_item_id is not indexed', 'success': False}), 404
+            query_vector, payload = stored
+            query_item = query_item or payload or {}
+            exclude = [query_item_id]
+        elif data.get('query_vector') is not None:
+            query_vector = np.asarray(data['query_vector'], dtype=np.float32)
+        elif query_item:
+            query_vector = encode_items([query_item], encode_stats)[0]
+        else:
+            return jsonify({'error': 'Missing query_item, query_item_id or query_vector', 'success': False}), 400
+        
+        matches, stats = find_indexed_matches(query_item, query_vector, threshold, top_k, exclude,
+                                              prefilter_options(data))
+        
+        return jsonify({
+            'success': True,
+            'matches': matches,
+            'query_item_id': data.get('query_item_id', query_item.get('id')),
+            'total_candidates': len(item_index),
+            'candidates_scanned': stats.get('scanned', 0),
+            'prefilters_applied': stats['prefilters'],
+            'matches_found': len(matches),
+            'client_embeddings': encode_stats.get('client_embeddings', {'used': 0, 'rejected': 0})
         })
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
@@ -256,15 +527,20 @@ def get_embedding():
             "category": "...",
             "description": "...",
             "location": "..."
-        }
+        },
+        "dtype": "float16"  # optional: or "int8", for packed_embedding
     }
     
     Response:
     {
         "success": true,
         "embedding": [0.1, 0.2, ...],
-        "dimension": 384
+        "dimension": 384,
+        "packed_embedding": {"model": "all-MiniLM-L6-v2", "version": "1", "dtype": "float16", "data": "..."}
     }
+    
+    Send packed_embedding back as the item's "embedding" in /match to skip
+    encoding it again.
     """
     if model is None:
         return jsonify({'error': 'Model not loaded', 'success': False}), 500
@@ -281,13 +557,21 @@ def get_embedding():
         return jsonify({
             'success': True,
             'embedding': embedding.tolist(),
-            'dimension': len(embedding)
+            'dimension': len(embedding),
+            'packed_embedding': pack_embedding(embedding, MODEL_NAME, EMBEDDING_VERSION,
+                                               data.get('dtype', 'float16'))
         })
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
 if __name__ == '__main__':
     if load_model():
+        recovery = item_index.load()
+        for item_id, item in item_index.items():
+            metadata_index.add(item_id, item or {})
+        print(f"Item index loaded: {recovery['snapshot_items']} items, {recovery['replayed_records']} logged changes")
         port = int(os.environ.get('ITEM_MATCHING_PORT', 5003))
         print(f"Starting Item Matching API on port {port}...")
         app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,201 @@
+"""
+Load Test for the Trust Propagation API
+Drives the app in-process with concurrent mixed read/write traffic (graph
+stats, follow/interaction deltas, score patches, ban propagations, recovery
+runs), reports per-endpoint latency percentiles and event loop lag, then
+checks that the final state is intact: graph counters match the adjacency,
+and replaying the write-ahead log from scratch reproduces the live graph,
+scores and penalty ledger exactly.
+
+Usage: python load_test_trust_propagation_api.py [num_edges] [num_requests] [concurrency]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+import numpy as np
+from collections import defaultdict
+from typing import Dict
+
+# State for this run goes to a scratch directory, never the service's own
+os.environ.setdefault("TRUST_STATE_DIR", tempfile.mkdtemp(prefix="trust_load_"))
+
+import httpx
+import trust_propagation_api as api
+from trust_propagation_service import TrustPropagationService
+from trust_state_store import TrustStateStore
+from benchmark_trust_propagation import generate_graph
+
+# Share of each request type in the mix
+TRAFFIC_MIX = [
+    ('graph-stats', 0.59),
+    ('compute-recovery', 0.10),
+    ('add-follows', 0.10),
+    ('remove-follows', 0.05),
+    ('add-interactions', 0.05),
+    ('patch-trust-scores', 0.04),
+    ('propagate-ban', 0.04),
+    ('propagate-bans', 0.02),
+    ('run-recovery', 0.01),
+]
+
+
+def _make_request(kind: str, rng: random.Random, num_users: int):
+    """(method, path, json body) for one request of the given kind"""
+    user = lambda: f'u{rng.randrange(num_users)}'
+    if kind == 'graph-stats':
+        return 'GET', '/graph-stats', None
+    if kind == 'compute-recovery':
+        return 'POST', '/compute-recovery', {'user_id': user(), 'days_since_penalty': rng.randrange(30)}
+    if kind in ('add-follows', 'remove-follows'):
+        pairs = [{'follower_id': user(), 'following_id': user()} for _ in range(rng.randint(1, 20))]
+        return 'POST', f'/{kind}', {'followers': pairs}
+    if kind == 'add-interactions':
+        interactions = [{'user_id': user(), 'target_user_id': user(), 'type': 'like',
+                         'weight': round(rng.uniform(0.1, 1.0), 2)} for _ in range(rng.randint(1, 20))]
+        return 'POST', '/add-interactions', {'interactions': interactions}
+    if kind == 'patch-trust-scores':
+        return 'POST', '/patch-trust-scores', {'trust_scores': {user(): round(rng.uniform(0.3, 0.9), 3)
+                                                                for _ in range(rng.randint(1, 50))}}
+    if kind == 'run-recovery':
+        return 'POST', '/run-recovery', {'recovery_rate': 0.05}
+    if kind == 'propagate-ban':
+        return 'POST', '/propagate-ban', {'banned_user_id': user(), 'max_hops': rng.choice([1, 2])}
+    return 'POST', '/propagate-bans', {'banned_user_ids': [user() for _ in range(rng.randint(2, 5))],
+                                       'aggregation': rng.choice(['max', 'sum', 'prob_or'])}
+
+
+async def _measure_loop_lag(stop: asyncio.Event, lags: list, interval: float = 0.005):
+    """How late a short sleep wakes up: time the event loop spent blocked"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def run_load_test(num_edges: int = 20000, num_requests: int = 500,
+                        concurrency: int = 16, seed: int = 0) -> Dict:
+    """
+    Build a synthetic graph, then send num_requests mixed requests from
+    concurrency clients at once
+
+    Returns:
+        Dict with latencies (endpoint -> list of seconds), errors, loop_lags
+        and num_users
+    """
+    followers, interactions, trust_scores = generate_graph(num_edges, seed=seed)
+    num_users = len(trust_scores)
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://trust", timeout=120) as client:
+        response = await client.post('/build-graph', json={
+            'followers': followers, 'interactions': interactions, 'trust_scores': trust_scores
+        })
+        response.raise_for_status()
+
+        rng = random.Random(seed)
+        kinds, shares = zip(*TRAFFIC_MIX)
+        plan = rng.choices(kinds, weights=shares, k=num_requests)
+        queue = asyncio.Queue()
+        for i, kind in enumerate(plan):
+            queue.put_nowait((kind, random.Random(seed * 1_000_003 + i)))
+
+        latencies = defaultdict(list)
+        errors = []
+
+        async def client_worker():
+            while not queue.empty():
+                kind, request_rng = queue.get_nowait()
+                method, path, body = _make_request(kind, request_rng, num_users)
+                start = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                latencies[kind].append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors.append((kind, response.status_code, response.text[:200]))
+
+        stop = asyncio.Event()
+        lags = []
+        probe = asyncio.create_task(_measure_loop_lag(stop, lags))
+        await asyncio.gather(*(client_worker() for _ in range(concurrency)))
+        stop.set()
+        await probe
+
+    return {'latencies': dict(latencies), 'errors': errors, 'loop_lags': lags, 'num_users': num_users}
+
+
+def check_state() -> Dict[str, bool]:
+    """
+    Verify the live service against its own invariants and a log replay
+
+    Returns:
+        Dict of check name -> passed
+    """
+    graph = api.trust_service.graph
+    degrees = graph.degrees()
+    checks = {
+        'connection counter': int(degrees.sum()) == 2 * graph.num_connections,
+        'user counter': int(np.count_nonzero(degrees)) == graph.num_users,
+    }
+
+    live_weights = {(u, v): w for u, v, w in graph.iter_weights()}
+    adjacency_ok = all(graph.weight(v, u) is not None or (v, u) not in live_weights
+                       for u, v in live_weights)
+    for u, v in live_weights:
+        if v not in set(graph.neighbors(u).tolist()):
+            adjacency_ok = False
+            break
+    checks['weights on connections'] = adjacency_ok
+
+    # Replay snapshot + log into a fresh service and compare
+    replayed = TrustPropagationService()
+    TrustStateStore(api.TRUST_STATE_DIR, fsync=False).restore(replayed)
+    ids, replayed_ids = graph.ids, replayed.graph.ids
+    replayed_weights = {(replayed_ids[u], replayed_ids[v]): w for u, v, w in replayed.graph.iter_weights()}
+    checks['replayed graph'] = replayed_weights == {(ids[u], ids[v]): w for (u, v), w in live_weights.items()}
+    checks['replayed trust scores'] = replayed.user_trust_scores == api.trust_service.user_trust_scores
+    checks['replayed content scores'] = (replayed.user_content_trust_scores ==
+                                         api.trust_service.user_content_trust_scores)
+    checks['replayed penalty ledger'] = (replayed.penalty_ledger.outstanding() ==
+                                         api.trust_service.penalty_ledger.outstanding())
+    checks['replayed built flag'] = replayed.graph_built == api.trust_service.graph_built
+    return checks
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:>10.1f}"
+
+
+def main():
+    num_edges = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+    print(f"Load test: ~{num_edges:,} edges, {num_requests:,} requests, {concurrency} concurrent clients")
+    print(f"State directory: {api.TRUST_STATE_DIR}")
+    start = time.perf_counter()
+    result = asyncio.run(run_load_test(num_edges, num_requests, concurrency))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{'endpoint':22}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, _ in TRAFFIC_MIX:
+        lat = np.array(result['latencies'].get(kind, []))
+        if len(lat):
+            print(f"{kind:22}{len(lat):>8}{_ms(np.percentile(lat, 50))}{_ms(np.percentile(lat, 99))}{_ms(lat.max())}")
+    lags = np.array(result['loop_lags'] or [0.0])
+    print(f"\nevent loop lag: p99 {np.percentile(lags, 99) * 1000:.1f} ms, max {lags.max() * 1000:.1f} ms")
+    print(f"throughput: {num_requests / elapsed:.0f} requests/s ({elapsed:.1f}s total)")
+    print(f"errors: {len(result['errors'])}")
+    for error in result['errors'][:5]:
+        print(f"  {error}")
+
+    print("\nConsistency checks:")
+    for name, passed in check_state().items():
+        print(f"  {name:26}{'ok' if passed else 'FAILED'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Match Scoring - Similarity arithmetic of multimodal item matching
+Combines precomputed CLIP embeddings into the image, text and cross-modal
+similarity terms, and runs the two-stage rerank cascade: every candidate is
+ranked by the terms that need no candidate image, and only the most promising
+candidates have their images loaded and scored. Kept free of model imports
+so benchmarks can run on stored embeddings.
+"""
+
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Weights of the combined similarity, and the boost for a matching category
+SIMILARITY_WEIGHTS = {
+    'image': 0.4,
+    'text': 0.4,
+    'cross_modal': 0.2
+}
+CATEGORY_BOOST = 0.1
+
+# Range assumed for a similarity term that was not computed. CLIP cosine
+# similarities between photos and item descriptions fall in [0, 1] in practice,
+# but a cosine can go down to -1, so bounds built on this range are estimates.
+UNSEEN_SIMILARITY_RANGE = (0.0, 1.0)
+
+# How item_similarities reduces the similarities of every image pair:
+# 'max' (best pair) or 'mean_top_k' (mean of the IMAGE_TOP_K best pairs)
+IMAGE_AGGREGATION = 'max'
+IMAGE_TOP_K = 3
+
+
+def same_category(query_item: Dict, candidate_items: List[Dict]) -> np.ndarray:
+    """Boolean mask of candidates in the query's category"""
+    query_category = query_item.get('category')
+    if not query_category:
+        return np.zeros(len(candidate_items), dtype=bool)
+    return np.array([bool(item.get('category')) and item['category'].lower() == query_category.lower()
+                     for item in candidate_items], dtype=bool)
+
+
+def apply_category_boost(combined: np.ndarray, boosted: np.ndarray) -> np.ndarray:
+    return np.where(boosted, np.minimum(1.0, combined + CATEGORY_BOOST), combined)
+
+
+def combine_similarities(query_item: Dict, candidate_items: List[Dict],
+                         query: Dict[str, np.ndarray],
+                         candidates: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    compute_multimodal_similarity terms for one query against all candidates
+
+    Args:
+        query_item: Item to match
+        candidate_items: Items scored against it
+        query: encode_items([query_item])
+        candidates: encode_items(candidate_items)
+
+    Returns:
+        Dict of float64 arrays over candidates: image_sim, text_sim,
+        cross_modal_sim and combined_sim
+    """
+    query_text = query['text_emb'][0].astype(np.float64)
+    query_image = query['image_emb'][0].astype(np.float64)
+    text_emb = candidates['text_emb'].astype(np.float64)
+    image_emb = candidates['image_emb'].astype(np.float64)
+    has_text, has_image = candidates['has_text'], candidates['has_image']
+    query_has_text, query_has_image = bool(query['has_text'][0]), bool(query['has_image'][0])
+
+    # One matrix-vector product per term; terms missing an input stay 0
+    text_sim = np.where(has_text & query_has_text, text_emb @ query_text, 0.0)
+    image_sim = np.where(has_image & query_has_image, image_emb @ query_image, 0.0)
+
+    # Cross-modal: mean of query image <-> candidate text and candidate image <-> query text
+    query_image_term = has_text & query_has_image
+    candidate_image_term = has_image & query_has_text
+    cross_sum = (np.where(query_image_term, text_emb @ query_image, 0.0) +
+                 np.where(candidate_image_term, image_emb @ query_text, 0.0))
+    cross_count = query_image_term.astype(np.int64) + candidate_image_term
+    cross_modal_sim = np.where(cross_count > 0, cross_sum / np.maximum(cross_count, 1), 0.0)
+
+    weights = SIMILARITY_WEIGHTS
+    combined = (
+        weights['image'] * image_sim +
+        weights['text'] * text_sim +
+        weights['cross_modal'] * cross_modal_sim
+    )
+
+    # Category boost
+    combined = apply_category_boost(combined, same_category(query_item, candidate_items))
+
+    return {
+        'image_sim': image_sim,
+        'text_sim': text_sim,
+        'cross_modal_sim': cross_modal_sim,
+        'combined_sim': combined
+    }
+
+
+def aggregate_similarities(similarities: np.ndarray, aggregation: str = IMAGE_AGGREGATION,
+                           top_k: int = IMAGE_TOP_K) -> float:
+    """Reduce a non-empty array of pair similarities to one score"""
+    values = np.asarray(similarities, dtype=np.float64).ravel()
+    if aggregation == 'max':
+        return float(values.max())
+    if aggregation == 'mean_top_k':
+        k = min(max(top_k, 1), len(values))
+        return float(np.partition(values, len(values) - k)[len(values) - k:].mean())
+    raise ValueError(f"Unknown image aggregation: {aggregation}")
+
+
+def item_similarities(text1: Optional[np.ndarray], images1: np.ndarray,
+                      text2: Optional[np.ndarray], images2: np.ndarray,
+                      aggregation: str = IMAGE_AGGREGATION, top_k: int = IMAGE_TOP_K) -> Dict[str, float]:
+    """
+    compute_multimodal_similarity terms of two items over all their images
+
+    The image term aggregates the similarity of every image pair, taken from
+    one images1 @ images2.T product, and each cross-modal direction
+    aggregates every image of one item against the other item's text.
+
+    Args:
+        text1, text2: Normalized text embeddings (None if an item has no text)
+        images1, images2: Normalized embeddings of each item's loaded images
+            (N1 x D and N2 x D, possibly empty)
+        aggregation, top_k: How pair similarities are reduced (aggregate_similarities)
+
+    Returns:
+        Dict with image_sim, text_sim, cross_modal_sim and combined_sim
+        (before the category boost)
+    """
+    similarities = {'image_sim': 0.0, 'text_sim': 0.0, 'cross_modal_sim': 0.0}
+    if text1 is not None and text2 is not None:
+        similarities['text_sim'] = float(np.dot(text1, text2))
+    if len(images1) and len(images2):
+        similarities['image_sim'] = aggregate_similarities(images1 @ images2.T, aggregation, top_k)
+
+    # Cross-modal: mean of images1 <-> text2 and images2 <-> text1
+    cross_modal_scores = []
+    if len(images1) and text2 is not None:
+        cross_modal_scores.append(aggregate_similarities(images1 @ text2, aggregation, top_k))
+    if len(images2) and text1 is not None:
+        cross_modal_scores.append(aggregate_similarities(images2 @ text1, aggregation, top_k))
+    if cross_modal_scores:
+        similarities['cross_modal_sim'] = float(np.mean(cross_modal_scores))
+
+    weights = SIMILARITY_WEIGHTS
+    similarities['combined_sim'] = (
+        weights['image'] * similarities['image_sim'] +
+        weights['text'] * similarities['text_sim'] +
+        weights['cross_modal'] * similarities['cross_modal_sim']
+    )
+    return similarities
+
+
+def text_stage_bounds(query_item: Dict, candidate_items: List[Dict], query: Dict[str, np.ndarray],
+                      text_emb: np.ndarray, has_text: np.ndarray,
+                      declares_image: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bounds on combined_sim from the terms that need no candidate image
+
+    The text term and the query image <-> candidate text term are exact. A
+    candidate that lists an image may also get an image term and a candidate
+    image <-> query text term, each in UNSEEN_SIMILARITY_RANGE, or neither
+    if its image fails to load.
+
+    Args:
+        query_item: Item to match
+        candidate_items: Items scored against it
+        query: encode_items([query_item])
+        text_emb, has_text: Candidate text embeddings and mask (encode_items format)
+        declares_image: Mask of candidates that list an image
+
+    Returns:
+        (lower, upper, unresolved): float64 bounds, and the mask of
+        candidates whose score depends on their image
+    """
+    without_image = {
+        'text_emb': text_emb,
+        'has_text': has_text,
+        'image_emb': np.zeros_like(text_emb),
+        'has_image': np.zeros(len(candidate_items), dtype=bool)
+    }
+    known = combine_similarities(query_item, candidate_items, query, without_image)
+    query_has_text, query_has_image = bool(query['has_text'][0]), bool(query['has_image'][0])
+    unresolved = declares_image & (query_has_text or query_has_image)
+
+    # Score if the image loads and every unseen term sits at one end of the range
+    weights = SIMILARITY_WEIGHTS
+    query_image_term = (has_text & query_has_image).astype(np.float64)
+    query_image_sum = known['cross_modal_sim'] * query_image_term
+    boosted = same_category(query_item, candidate_items)
+    ends = []
+    for unseen in UNSEEN_SIMILARITY_RANGE:
+        cross_modal = (np.where(query_has_text, (query_image_sum + unseen) / (query_image_term + 1),
+                                known['cross_modal_sim']))
+        combined = (weights['image'] * (unseen if query_has_image else 0.0) +
+                    weights['text'] * known['text_sim'] +
+                    weights['cross_modal'] * cross_modal)
+        ends.append(apply_category_boost(combined, boosted))
+
+    # The image may also fail to load, leaving the known score
+    lower = np.where(unresolved, np.minimum(known['combined_sim'], ends[0]), known['combined_sim'])
+    upper = np.where(unresolved, np.maximum(known['combined_sim'], ends[1]), known['combined_sim'])
+    return lower, upper, unresolved
+
+
+def cascade_similarities(query_item: Dict, candidate_items: List[Dict], query: Dict[str, np.ndarray],
+                         text_emb: np.ndarray, has_text: np.ndarray, declares_image: np.ndarray,
+                         encode_images: Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]],
+                         rerank_size: int,
+                         known_images: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """
+    Two-stage combine_similarities: image terms only for the top rerank_size
+
+    Candidates whose score depends on their image are ranked by the upper
+    bound of text_stage_bounds, and the first rerank_size have their images
+    encoded and are scored exactly. The others are estimated: they get the
+    midpoint of their bounds, and similarity_error is half the bounds' width.
+    That is an estimate of the error rather than a guarantee, since the bounds
+    assume unseen terms within UNSEEN_SIMILARITY_RANGE.
+
+    Args:
+        query_item, candidate_items, query, text_emb, has_text, declares_image:
+            As in text_stage_bounds
+        encode_images: Takes candidate positions, returns (image_emb, has_image)
+            for them in the encode_items format
+        rerank_size: Candidates whose images are encoded
+        known_images: (image_emb, has_image) of candidates whose image
+            embeddings are already known (e.g. sent by the client); these
+            are scored exactly and must not be in declares_image
+
+    Returns:
+        combine_similarities result, plus similarity_error (0 where exact)
+        and the boolean masks reranked and estimated; image_sim and
+        cross_modal_sim are NaN where estimated candidates lack the term
+    """
+    lower, upper, unresolved = text_stage_bounds(query_item, candidate_items, query,
+                                                 text_emb, has_text, declares_image)
+    pending = np.flatnonzero(unresolved)
+    chosen = pending[np.lexsort((pending, -upper[pending]))[:max(rerank_size, 0)]]
+
+    image_emb = np.zeros_like(text_emb)
+    has_image = np.zeros(len(candidate_items), dtype=bool)
+    if known_images is not None:
+        image_emb[:], has_image[:] = known_images
+    if len(chosen):
+        image_emb[chosen], has_image[chosen] = encode_images(chosen)
+    candidates = {'text_emb': text_emb, 'has_text': has_text, 'image_emb': image_emb, 'has_image': has_image}
+    similarities = combine_similarities(query_item, candidate_items, query, candidates)
+
+    reranked = np.zeros(len(candidate_items), dtype=bool)
+    reranked[chosen] = True
+    estimated = unresolved & ~reranked
+    similarities['combined_sim'] = np.where(estimated, (lower + upper) / 2, similarities['combined_sim'])
+    similarities['similarity_error'] = np.where(estimated, (upper - lower) / 2, 0.0)
+
+    # Terms involving an estimated candidate's image were never computed
+    if query['has_image'][0]:
+        similarities['image_sim'] = np.where(estimated, np.nan, similarities['image_sim'])
+    if query['has_text'][0]:
+        similarities['cross_modal_sim'] = np.where(estimated, np.nan, similarities['cross_modal_sim'])
+    similarities['reranked'] = reranked
+    similarities['estimated'] = estimated
+    return similarities
+
+
+def category_codes(items: List[Dict], vocabulary: Dict[str, int]) -> np.ndarray:
+    """Integer code of each item's lowercased category (-1 if missing), growing vocabulary"""
+    return np.array([vocabulary.setdefault(item['category'].lower(), len(vocabulary))
+                     if item.get('category') else -1 for item in items], dtype=np.int64)
+
+
+def combined_similarity_matrix(query: Dict[str, np.ndarray], candidates: Dict[str, np.ndarray],
+                               query_categories: np.ndarray, candidate_categories: np.ndarray) -> np.ndarray:
+    """
+    combined_sim of every query against every candidate, as float32 matmuls
+
+    Embeddings may be stored as float16; blocks are multiplied in float32.
+    Rows of missing text or images must be zero (as encode_items returns).
+
+    Args:
+        query, candidates: encode_items results (Q and C rows)
+        query_categories, candidate_categories: category_codes of both sides
+
+    Returns:
+        Q x C float32 array, equal to combine_similarities up to float32 rounding
+    """
+    query_text = query['text_emb'].astype(np.float32)
+    query_image = query['image_emb'].astype(np.float32)
+    text_emb = candidates['text_emb'].astype(np.float32)
+    image_emb = candidates['image_emb'].astype(np.float32)
+
+    # Missing embeddings are zero rows, so their products are already 0
+    text_sim = query_text @ text_emb.T
+    image_sim = query_image @ image_emb.T
+    cross_sum = query_image @ text_emb.T + query_text @ image_emb.T
+    cross_count = (np.outer(query['has_image'], candidates['has_text']).astype(np.float32) +
+                   np.outer(query['has_text'], candidates['has_image']))
+    cross_modal_sim = cross_sum / np.maximum(cross_count, 1)
+
+    weights = SIMILARITY_WEIGHTS
+    combined = (
+        weights['image'] * image_sim +
+        weights['text'] * text_sim +
+        weights['cross_modal'] * cross_modal_sim
+    )
+    boosted = (query_categories[:, None] == candidate_categories[None, :]) & (query_categories[:, None] >= 0)
+    return apply_category_boost(combined, boosted).astype(np.float32)
@@ -0,0 +1,230 @@
+"""
+Metadata Index - Inverted index over item category, location and date
+Lost and found items only match items in a related category, reported in a
+nearby date window and in the same area. The index keeps posting sets for
+each category, normalized location token and date bucket, so these boolean
+filters pick the candidates before any embedding is computed or compared.
+
+Items missing a field match every query on that field, as do queries
+missing it.
+"""
+
+import re
+import threading
+from datetime import date, datetime
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+# Categories (LostFoundItemCategory) whose items are often reported under one another
+RELATED_CATEGORIES = {
+    'wallet': {'id card', 'documents', 'bag'},
+    'id card': {'wallet', 'documents'},
+    'documents': {'id card', 'wallet', 'bag'},
+    'bag': {'wallet', 'documents'},
+    'mobile': {'electronics'},
+    'electronics': {'mobile'},
+    'pet': set()
+}
+
+# Items in these categories match any category
+WILDCARD_CATEGORIES = {'others', 'other'}
+
+LOCATION_STOPWORDS = {
+    'the', 'a', 'an', 'at', 'in', 'on', 'near', 'by', 'of', 'to', 'and', 'or', 'from',
+    'area', 'around', 'inside', 'outside', 'behind', 'opposite', 'next', 'road', 'rd',
+    'street', 'st', 'main'
+}
+
+# Filters dropped one at a time, least reliable first, while too few candidates survive
+PREFILTER_FALLBACK = ('location', 'date', 'category')
+
+DATE_FIELDS = ('date', 'lost_date', 'found_date', 'created_at')
+
+
+def normalize_category(category: Optional[str]) -> Optional[str]:
+    if not category:
+        return None
+    category = ' '.join(category.lower().split())
+    return None if category in WILDCARD_CATEGORIES else category
+
+
+def location_tokens(location: Optional[str]) -> Set[str]:
+    """Lowercase alphanumeric words of a location, without stopwords"""
+    if not location:
+        return set()
+    return {token for token in re.split(r'[^a-z0-9]+', location.lower())
+            if len(token) > 1 and token not in LOCATION_STOPWORDS}
+
+
+def item_day(item: Dict) -> Optional[int]:
+    """Proleptic ordinal day of the item's date (ISO string), or None"""
+    for field in DATE_FIELDS:
+        value = item.get(field)
+        if not value:
+            continue
+        try:
+            if isinstance(value, (date, datetime)):
+                return value.toordinal()
+            return datetime.fromisoformat(str(value)[:10]).toordinal()
+        except ValueError:
+            continue
+    return None
+
+
+class MetadataIndex:
+    """
+    Posting sets of item keys by category, location token and date bucket
+
+    Keys are any hashable item identifier: positions in a candidate list or
+    item ids of a persistent store. All methods are thread-safe.
+    """
+
+    FIELDS = ('category', 'location', 'date')
+
+    def __init__(self, bucket_days: int = 7, window_days: int = 30):
+        """
+        Args:
+            bucket_days: Width of a date bucket
+            window_days: Items more than this many days from the query's date
+                (rounded out to whole buckets) are filtered out
+        """
+        self.bucket_days = bucket_days
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[Hashable, Set]] = {field: {} for field in self.FIELDS}
+        self._unknown: Dict[str, Set] = {field: set() for field in self.FIELDS}
+        self._terms: Dict[Hashable, Dict[str, List]] = {}
+
+    @classmethod
+    def from_items(cls, items: List[Dict], **kwargs) -> 'MetadataIndex':
+        """Index a candidate list by position"""
+        index = cls(**kwargs)
+        for position, item in enumerate(items):
+            index.add(position, item)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def keys(self) -> Set:
+        with self._lock:
+            return set(self._terms)
+
+    def _item_terms(self, item: Dict) -> Dict[str, List]:
+        category = normalize_category(item.get('category'))
+        day = item_day(item)
+        return {
+            'category': [category] if category else [],
+            'location': sorted(location_tokens(item.get('location'))),
+            'date': [day // self.bucket_days] if day is not None else []
+        }
+
+    def add(self, key: Hashable, item: Dict):
+        """Index an item (replacing any earlier version under the same key)"""
+        terms = self._item_terms(item)
+        with self._lock:
+            self._remove(key)
+            self._terms[key] = terms
+            for field, values in terms.items():
+                if not values:
+                    self._unknown[field].add(key)
+                for value in values:
+                    self._postings[field].setdefault(value, set()).add(key)
+
+    def remove(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def _remove(self, key: Hashable) -> bool:
+        terms = self._terms.pop(key, None)
+        if terms is None:
+            return False
+        for field, values in terms.items():
+            self._unknown[field].discard(key)
+            for value in values:
+                posting = self._postings[field][value]
+                posting.discard(key)
+                if not posting:
+                    del self._postings[field][value]
+        return True
+
+    def _query_values(self, field: str, query_item: Dict, window_days: int) -> Optional[List]:
+        """Posting keys a query matches on a field; None if the field does not filter"""
+        if field == 'category':
+            category = normalize_category(query_item.get('category'))
+            if category is None:
+                return None
+            return [category] + sorted(RELATED_CATEGORIES.get(category, set()))
+        if field == 'location':
+            tokens = location_tokens(query_item.get('location'))
+            return sorted(tokens) if tokens else None
+        day = item_day(query_item)
+        if day is None:
+            return None
+        return list(range((day - window_days) // self.bucket_days,
+                          (day + window_days) // self.bucket_days + 1))
+
+    def _field_matches(self, field: str, query_item: Dict, window_days: int) -> Optional[Set]:
+        values = self._query_values(field, query_item, window_days)
+        if values is None:
+            return None
+        matched = set(self._unknown[field])
+        for value in values:
+            matched |= self._postings[field].get(value, set())
+        return matched
+
+    def candidates(self, query_item: Dict, filters: Iterable[str] = FIELDS,
+                   window_days: Optional[int] = None) -> Optional[Set]:
+        """
+        Keys of the items passing every filter
+
+        Args:
+            query_item: Item to match
+            filters: Fields to filter on
+            window_days: Date window (default self.window_days)
+
+        Returns:
+            Set of keys, or None if no filter applies (every item is a candidate)
+        """
+        with self._lock:
+            result = None
+            # Intersect starting from the smallest set
+            window_days = self.window_days if window_days is None else window_days
+            matches = [self._field_matches(field, query_item, window_days) for field in filters]
+            for matched in sorted((m for m in matches if m is not None), key=len):
+                result = matched if result is None else result & matched
+                if not result:
+                    break
+            return result
+
+    def prefilter(self, query_item: Dict, min_candidates: int = 5,
+                  filters: Iterable[str] = FIELDS,
+                  fallback: Iterable[str] = PREFILTER_FALLBACK,
+                  window_days: Optional[int] = None) -> Tuple[Optional[Set], List[str]]:
+        """
+        Candidates for a query, widening the search while too few survive
+
+        Filters are dropped in fallback order until at least
+        min(min_candidates, len(self)) items pass.
+
+        Args:
+            query_item: Item to match
+            min_candidates: Candidates wanted before giving up on a filter
+            filters: Filters to start with
+            fallback: Order in which filters are dropped
+            window_days: Date window (default self.window_days)
+
+        Returns:
+            (keys, applied): the candidate keys (None for all items) and the
+            filters that produced them
+        """
+        filters = set(filters)
+        window_days = self.window_days if window_days is None else window_days
+        applied = [field for field in self.FIELDS
+                   if field in filters and self._query_values(field, query_item, window_days) is not None]
+        wanted = min(min_candidates, len(self))
+        drop_order = [field for field in fallback if field in applied]
+        while True:
+            keys = self.candidates(query_item, applied, window_days)
+            if keys is None or len(keys) >= wanted or not drop_order:
+                return keys, applied
+            applied.remove(drop_order.pop(0))
@@ -350,9 +350,11 @@ class IntelligentModerationService:
             return
         
         print("Building community graph...")
-        users, posts, interactions = graph_builder.build_graph_data()
-        
-        self.gnn_service.build_graph(users, posts, interactions)
+        if hasattr(graph_builder, 'build_graph_columns'):
+            self.gnn_service.build_graph_from_columns(graph_builder.build_graph_columns())
+        else:
+            users, posts, interactions = graph_builder.build_graph_data()
+            self.gnn_service.build_graph(users, posts, interactions)
         
         # Initialize model with correct input dimension
         input_dim = self.gnn_service.graph_data.x.shape[1]
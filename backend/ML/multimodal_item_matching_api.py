@@ -4,9 +4,12 @@ Multimodal (CLIP) + Graph Neural Network (GNN) for Trust Scoring
 """
 
 import os
+import numpy as np
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from multimodal_matching_service import MultimodalMatchingService
+from multimodal_matching_service import MultimodalMatchingService, EMBEDDING_VERSION
+from embedding_codec import pack_embedding
+from match_scoring import IMAGE_AGGREGATION, IMAGE_TOP_K
 from datetime import datetime
 import traceback
 
@@ -16,6 +19,12 @@ CORS(app)
 # Global service
 matching_service = None
 
+# Candidates whose images are loaded in /match; the others are ranked by text terms
+RERANK_SIZE = int(os.environ.get('MULTIMODAL_RERANK_SIZE', 50))
+
+# Where items added through POST /items are persisted
+MULTIMODAL_INDEX_DIR = os.environ.get('MULTIMODAL_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data', 'multimodal_index'))
+
 def load_service():
     """Initialize the multimodal matching service"""
     global matching_service
@@ -23,7 +32,9 @@ def load_service():
         print("="*60)
         print("Initializing Multimodal Item Matching Service")
         print("="*60)
-        matching_service = MultimodalMatchingService(use_gat=False)  # Use GraphSAGE
+        matching_service = MultimodalMatchingService(use_gat=False, index_dir=MULTIMODAL_INDEX_DIR)  # Use GraphSAGE
+        recovery = matching_service.load_item_index()
+        print(f"Item index loaded: {recovery['snapshot_items']} items, {recovery['replayed_records']} logged changes")
         print("="*60)
         print("Service initialized successfully!")
         print("="*60)
@@ -39,7 +50,83 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'service_loaded': matching_service is not None,
-        'features': ['CLIP', 'GNN', 'Multimodal']
+        'features': ['CLIP', 'GNN', 'Multimodal'],
+        'indexed_items': len(matching_service.text_index) if matching_service is not None else 0
+    })
+
+@app.route('/items', methods=['POST'])
+def add_items():
+    """
+    Encode items once with CLIP and add them to the item index
+    
+    Request body:
+    {
+        "items": [
+            {
+                "id": "lost_item_1",
+                "user_id": "user_123",
+                "title": "Lost Wallet",
+                "category": "Wallet",
+                "description": "Black wallet with cards",
+                "location": "Park area",
+                "images": ["url1"]  // Optional
+            }
+        ]
+    }
+    
+    Response:
+    {
+        "success": true,
+        "indexed": 1,
+        "total_items": 1250
+    }
+    """
+    if matching_service is None:
+        return jsonify({'error': 'Service not loaded', 'success': False}), 500
+    
+    data = request.get_json()
+    items = (data or {}).get('items')
+    
+    if not items:
+        return jsonify({'error': 'Missing items', 'success': False}), 400
+    if any(not item.get('id') for item in items):
+        return jsonify({'error': 'Every item needs an id', 'success': False}), 400
+    
+    try:
+        indexed = matching_service.index_items(items)
+        
+        return jsonify({
+            'success': True,
+            'indexed': indexed,
+            'total_items': len(matching_service.text_index)
+        })
+    
+    except Exception as e:
+        print(f"Error indexing items: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/items/<item_id>', methods=['DELETE'])
+def remove_item(item_id):
+    """Remove an item (e.g. a resolved lost item report) from the item index"""
+    if matching_service is None:
+        return jsonify({'error': 'Service not loaded', 'success': False}), 500
+    
+    if not matching_service.remove_item(item_id):
+        return jsonify({'error': 'Item not indexed', 'success': False}), 404
+    
+    return jsonify({'success': True, 'total_items': len(matching_service.text_index)})
+
+@app.route('/items/stats', methods=['GET'])
+def item_index_stats():
+    """Size and search mode of the text and image indexes"""
+    if matching_service is None:
+        return jsonify({'error': 'Service not loaded', 'success': False}), 500
+    
+    return jsonify({
+        'success': True,
+        'text_index': matching_service.text_index.stats(),
+        'image_index': matching_service.image_index.stats()
     })
 
 @app.route('/match', methods=['POST'])
@@ -65,7 +152,9 @@ def match_items():
                 "category": "Wallet",
                 "description": "Black wallet with cards",
                 "location": "Park area",
-                "images": ["url1"]  // Optional
+                "images": ["url1"],  // Optional
+                "embedding": {...},  // Optional: packed_embedding from /embed/text with "item"
+                "image_embedding": {...}  // Optional: packed_embedding of the first image from /embed/image
             }
         ],
         "users": [  // Optional: for GNN trust scoring
@@ -95,9 +184,26 @@ def match_items():
         "threshold": 0.5,  // Optional
         "top_k": 5,  // Optional
         "alpha": 0.7,  // Weight for similarity
-        "beta": 0.3  // Weight for trust
+        "beta": 0.3,  // Weight for trust
+        "prefilter": {  // Optional, default true; false scores every candidate
+            "filters": ["category", "location", "date"],
+            "min_candidates": 5,  // Drop filters (location, then date, then category) below this
+            "window_days": 30
+        },
+        "rerank_size": 50  // Optional: images loaded for this many candidates; null loads all
     }
     
+    Packed embeddings on the query or candidates are used instead of
+    encoding their text or first image when their model, version and
+    dimension match; otherwise that item is encoded as usual.
+    
+    Without "candidate_items", the items added through POST /items are
+    searched instead. The query is then one of:
+        "query_item": {...}                 encoded with CLIP
+        "query_item_id": "item_id"          an indexed item (left out of the matches)
+        "query_vector": [0.1, ...]          a CLIP embedding from /embed/text,
+        "query_image_vector": [0.1, ...]    and/or one from /embed/image
+    
     Response:
     {
         "success": true,
@@ -113,10 +219,14 @@ def match_items():
                     "text_similarity": 0.80,
                     "cross_modal_similarity": 0.85,
                     "user_trust": 0.80,
-                    "item_trust": 0.70
+                    "item_trust": 0.70,
+                    "similarity_error": 0.0,  // Estimated bound on the similarity error, when rerank_size applies
+                    "estimated": false  // true: image not scored, similarity_score is an estimate and
+                                        // the similarities involving the candidate image are null
                 }
             }
-        ]
+        ],
+        "client_embeddings": {"used": 12, "rejected": 0}
     }
     """
     if matching_service is None:
@@ -127,6 +237,9 @@ def match_items():
     if not data:
         return jsonify({'error': 'No data provided', 'success': False}), 400
     
+    if 'candidate_items' not in data:
+        return match_indexed_items(data)
+    
     query_item = data.get('query_item')
     candidate_items = data.get('candidate_items', [])
     threshold = data.get('threshold', 0.5)
@@ -146,20 +259,9 @@ def match_items():
         })
     
     try:
-        # Initialize GNN if data provided
-        user_trust_scores = None
-        item_trust_scores = None
-        
-        users = data.get('users', [])
-        items_metadata = data.get('items_metadata', [])
-        interactions = data.get('interactions', [])
-        
-        if users and items_metadata:
-            print("Initializing GNN for trust scoring...")
-            user_trust_scores, item_trust_scores = matching_service.initialize_gnn(
-                users, items_metadata, interactions
-            )
-            print(f"GNN initialized: {len(user_trust_scores)} users, {len(item_trust_scores)} items")
+        prefilter = prefilter_options(data)
+        user_trust_scores, item_trust_scores = gnn_trust_scores(data)
+        stats = {}
         
         # Find matches
         matches = matching_service.find_matches(
@@ -170,7 +272,10 @@ def match_items():
             threshold=threshold,
             top_k=top_k,
             alpha=alpha,
-            beta=beta
+            beta=beta,
+            prefilter=prefilter,
+            rerank_size=data.get('rerank_size', RERANK_SIZE),
+            stats=stats
         )
         
         return jsonify({
@@ -179,9 +284,101 @@ def match_items():
             'query_item_id': query_item.get('id'),
             'total_candidates': len(candidate_items),
             'matches_found': len(matches),
+            'client_embeddings': stats.get('client_embeddings', {'used': 0, 'rejected': 0}),
             'gnn_enabled': user_trust_scores is not None
         })
     
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+    except Exception as e:
+        print(f"Error in match endpoint: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'success': False}), 500
+
+def prefilter_options(data):
+    """MetadataIndex.prefilter options from the request's "prefilter" field (None when disabled)"""
+    prefilter = data.get('prefilter', True)
+    if not prefilter:
+        return None
+    if prefilter is True:
+        return {}
+    if not isinstance(prefilter, dict):
+        raise ValueError('prefilter must be a boolean or an object')
+    return {key: prefilter[key] for key in ('filters', 'min_candidates', 'fallback', 'window_days')
+            if key in prefilter}
+
+def gnn_trust_scores(data):
+    """Train the GNN on the request's users and items, if provided"""
+    users = data.get('users', [])
+    items_metadata = data.get('items_metadata', [])
+    interactions = data.get('interactions', [])
+    
+    if not (users and items_metadata):
+        return None, None
+    
+    print("Initializing GNN for trust scoring...")
+    user_trust_scores, item_trust_scores = matching_service.initialize_gnn(
+        users, items_metadata, interactions
+    )
+    print(f"GNN initialized: {len(user_trust_scores)} users, {len(item_trust_scores)} items")
+    return user_trust_scores, item_trust_scores
+
+def match_indexed_items(data):
+    """Handle /match against the item index"""
+    query_item = data.get('query_item') or {}
+    exclude = ()
+    encode_stats = {}
+    
+    try:
+        if data.get('query_item_id') is not None:
+            query_item_id = str(data['query_item_id'])
+            items, query = matching_service.indexed_encoding([query_item_id])
+            if items[0] is None:
+                return jsonify({'error': 'query_item_id is not indexed', 'success': False}), 404
+            query_item = query_item or items[0]
+            exclude = (query_item_id,)
+        elif data.get('query_vector') is not None or data.get('query_image_vector') is not None:
+            query = {}
+            for name, key in (('text', 'query_vector'), ('image', 'query_image_vector')):
+                vector = data.get(key)
+                query[f'{name}_emb'] = np.asarray([vector if vector is not None else
+                                                   np.zeros(matching_service.clip_service.embedding_dim)], dtype=np.float32)
+                query[f'has_{name}'] = np.array([vector is not None])
+        elif query_item:
+            query = matching_service.encode_items([query_item], stats=encode_stats)
+        else:
+            return jsonify({'error': 'Missing query_item, query_item_id or query_vector', 'success': False}), 400
+        
+        prefilter = prefilter_options(data)
+        user_trust_scores, item_trust_scores = gnn_trust_scores(data)
+        
+        matches, stats = matching_service.find_indexed_matches(
+            query_item=query_item,
+            query=query,
+            user_trust_scores=user_trust_scores,
+            item_trust_scores=item_trust_scores,
+            threshold=data.get('threshold', 0.5),
+            top_k=data.get('top_k', 5),
+            alpha=data.get('alpha', 0.7),
+            beta=data.get('beta', 0.3),
+            exclude=exclude,
+            prefilter=prefilter
+        )
+        
+        return jsonify({
+            'success': True,
+            'matches': matches,
+            'query_item_id': data.get('query_item_id', query_item.get('id')),
+            'total_candidates': len(matching_service.text_index),
+            'candidates_scored': stats['candidates'],
+            'prefilters_applied': stats['prefilters'],
+            'matches_found': len(matches),
+            'client_embeddings': encode_stats.get('client_embeddings', {'used': 0, 'rejected': 0}),
+            'gnn_enabled': user_trust_scores is not None
+        })
+    
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         print(f"Error in match endpoint: {e}")
         traceback.print_exc()
@@ -199,9 +396,12 @@ def compute_similarity():
             "category": "...",
             "description": "...",
             "location": "...",
-            "images": ["url1"]  // Optional
+            "images": ["url1", "url2"]  // Optional, first image compared
         },
-        "item2": {...}
+        "item2": {...},
+        "all_images": false,          // optional: compare every image (score then differs from /match)
+        "image_aggregation": "max",   // optional: or "mean_top_k" over the image pairs
+        "image_top_k": 3              // optional: pairs averaged by mean_top_k
     }
     
     Response:
@@ -225,7 +425,10 @@ def compute_similarity():
     
     try:
         similarities = matching_service.compute_multimodal_similarity(
-            data['item1'], data['item2']
+            data['item1'], data['item2'],
+            aggregation=data.get('image_aggregation', IMAGE_AGGREGATION),
+            top_k=int(data.get('image_top_k', IMAGE_TOP_K)),
+            all_images=bool(data.get('all_images', False))
         )
         
         return jsonify({
@@ -239,6 +442,8 @@ def compute_similarity():
             }
         })
     
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         print(f"Error computing similarity: {e}")
         traceback.print_exc()
@@ -321,6 +526,11 @@ def compute_trust_scores():
         traceback.print_exc()
         return jsonify({'error': str(e), 'success': False}), 500
 
+def packed_embedding(embedding, data):
+    """embedding_codec form of an /embed result, packed as the request's dtype"""
+    return pack_embedding(embedding, matching_service.clip_service.model_name, EMBEDDING_VERSION,
+                          data.get('dtype', 'float16'))
+
 @app.route('/embed/image', methods=['POST'])
 def embed_image():
     """
@@ -328,15 +538,20 @@ def embed_image():
     
     Request body:
     {
-        "image_url": "http://..."
+        "image_url": "http://...",
+        "dtype": "float16"  // Optional: or "int8", for packed_embedding
     }
     
     Response:
     {
         "success": true,
         "embedding": [0.1, 0.2, ...],
-        "dimension": 512
+        "dimension": 512,
+        "packed_embedding": {"model": "openai/clip-vit-base-patch32", "version": "1", "dtype": "float16", "data": "..."}
     }
+    
+    Send packed_embedding of an item's first image back as its
+    "image_embedding" in /match to skip downloading and encoding it.
     """
     if matching_service is None:
         return jsonify({'error': 'Service not loaded', 'success': False}), 500
@@ -352,9 +567,12 @@ def embed_image():
         return jsonify({
             'success': True,
             'embedding': embedding.tolist(),
-            'dimension': len(embedding)
+            'dimension': len(embedding),
+            'packed_embedding': packed_embedding(embedding, data)
         })
     
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         print(f"Error embedding image: {e}")
         return jsonify({'error': str(e), 'success': False}), 500
@@ -362,37 +580,46 @@ def embed_image():
 @app.route('/embed/text', methods=['POST'])
 def embed_text():
     """
-    Get CLIP embedding for text
+    Get CLIP embedding for text, or for an item's text
     
     Request body:
     {
-        "text": "Black leather wallet"
+        "text": "Black leather wallet",  // or "item": {"title": ..., "category": ..., ...}
+        "dtype": "float16"  // Optional: or "int8", for packed_embedding
     }
     
     Response:
     {
         "success": true,
         "embedding": [0.1, 0.2, ...],
-        "dimension": 512
+        "dimension": 512,
+        "packed_embedding": {"model": "openai/clip-vit-base-patch32", "version": "1", "dtype": "float16", "data": "..."}
     }
+    
+    packed_embedding of an "item" request can be sent back as that item's
+    "embedding" in /match to skip encoding its text.
     """
     if matching_service is None:
         return jsonify({'error': 'Service not loaded', 'success': False}), 500
     
     data = request.get_json()
     
-    if not data or 'text' not in data:
-        return jsonify({'error': 'Missing text', 'success': False}), 400
+    if not data or ('text' not in data and 'item' not in data):
+        return jsonify({'error': 'Missing text or item', 'success': False}), 400
     
     try:
-        embedding = matching_service.clip_service.encode_text(data['text'])
+        text = data['text'] if 'text' in data else matching_service.create_item_text(data['item'])
+        embedding = matching_service.clip_service.encode_text(text)
         
         return jsonify({
             'success': True,
             'embedding': embedding.tolist(),
-            'dimension': len(embedding)
+            'dimension': len(embedding),
+            'packed_embedding': packed_embedding(embedding, data)
         })
     
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         print(f"Error embedding text: {e}")
         return jsonify({'error': str(e), 'success': False}), 500
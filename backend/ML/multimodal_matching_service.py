@@ -3,16 +3,45 @@ Multimodal Matching Service
 Combines CLIP embeddings, SBERT text similarity, and GNN trust scores
 """
 
+import os
+import math
+import threading
 import numpy as np
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple
 from clip_service import CLIPService
 from gnn_service import GNNService
+from vector_index import VectorIndex
+from metadata_index import MetadataIndex
+from embedding_codec import unpack_embedding, strip_embeddings
+from match_scoring import (CATEGORY_BOOST, IMAGE_AGGREGATION, IMAGE_TOP_K,
+                           combine_similarities, cascade_similarities, item_similarities)
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 
+# CLIP text embeddings kept in the LRU cache
+TEXT_CACHE_SIZE = 20000
+
+# Tag of the embeddings handed out by /embed/text and /embed/image; bump when
+# create_item_text changes, so clients' cached embeddings are no longer accepted
+EMBEDDING_VERSION = '1'
+
+
+def _term(value: float) -> Optional[float]:
+    """Similarity term for a response; None if it was not computed (NaN)"""
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
 class MultimodalMatchingService:
-    def __init__(self, use_gat: bool = False):
-        """Initialize multimodal matching service"""
+    def __init__(self, use_gat: bool = False, index_dir: Optional[str] = None):
+        """
+        Initialize multimodal matching service
+        
+        Args:
+            use_gat: Use GAT instead of GraphSAGE for trust scoring
+            index_dir: Where the item indexes are persisted (None keeps them in memory)
+        """
         print("Initializing Multimodal Matching Service...")
         
         # Initialize CLIP for multimodal embeddings
@@ -24,6 +53,16 @@ class MultimodalMatchingService:
         # Initialize GNN for trust scoring
         self.gnn_service = GNNService(use_gat=use_gat)
         
+        # Indexed items: text embeddings (with the item as payload) for every
+        # item, image embeddings for items with an image
+        self.text_index = VectorIndex(os.path.join(index_dir, 'text') if index_dir else None)
+        self.image_index = VectorIndex(os.path.join(index_dir, 'image') if index_dir else None)
+        self.metadata_index = MetadataIndex()
+        
+        # Item text -> CLIP text embedding, least recently used first
+        self.text_cache = OrderedDict()
+        self.text_cache_lock = threading.Lock()
+        
         print("Multimodal Matching Service initialized!")
     
     def create_item_text(self, item: Dict) -> str:
@@ -39,82 +78,236 @@ class MultimodalMatchingService:
             parts.append(f"Location: {item['location']}")
         return ' '.join(parts)
     
-    def compute_multimodal_similarity(self, item1: Dict, item2: Dict) -> Dict[str, float]:
+    def compute_multimodal_similarity(self, item1: Dict, item2: Dict,
+                                      aggregation: str = IMAGE_AGGREGATION,
+                                      top_k: int = IMAGE_TOP_K,
+                                      all_images: bool = False) -> Dict[str, float]:
         """
         Compute multimodal similarity between two items
         
+        By default only each item's first image is used, like score_candidates
+        and the item indexes, so the result equals the /match score. With
+        all_images, every image of both items is loaded concurrently and
+        encoded in one batch, and the image and cross-modal terms aggregate
+        over all image pairs (see match_scoring.item_similarities).
+        
+        Args:
+            item1, item2: Items to compare
+            aggregation: 'max' or 'mean_top_k' over image pair similarities
+            top_k: Pairs averaged by 'mean_top_k'
+            all_images: Compare every image instead of the first ones
+        
         Returns:
             Dict with image_sim, text_sim, cross_modal_sim, and combined_sim
         """
-        similarities = {
-            'image_sim': 0.0,
-            'text_sim': 0.0,
-            'cross_modal_sim': 0.0,
-            'combined_sim': 0.0
-        }
-        
-        # Text similarity using CLIP
+        # Text embeddings using CLIP
         text1 = self.create_item_text(item1)
         text2 = self.create_item_text(item2)
-        
-        if text1 and text2:
-            similarities['text_sim'] = self.clip_service.compute_text_text_similarity(text1, text2)
-        
-        # Image similarity using CLIP
-        images1 = item1.get('images', [])
-        images2 = item2.get('images', [])
-        
-        if images1 and images2:
-            # Compare first images (or average if multiple)
-            try:
-                img_sim = self.clip_service.compute_image_image_similarity(images1[0], images2[0])
-                similarities['image_sim'] = img_sim
-            except Exception as e:
-                print(f"Error computing image similarity: {e}")
-                similarities['image_sim'] = 0.0
-        
-        # Cross-modal similarity (image1 <-> text2 and text1 <-> image2)
-        cross_modal_scores = []
-        
-        if images1 and text2:
-            try:
-                score = self.clip_service.compute_image_text_similarity(images1[0], text2)
-                cross_modal_scores.append(score)
-            except:
-                pass
-        
-        if images2 and text1:
-            try:
-                score = self.clip_service.compute_image_text_similarity(images2[0], text1)
-                cross_modal_scores.append(score)
-            except:
-                pass
-        
-        if cross_modal_scores:
-            similarities['cross_modal_sim'] = np.mean(cross_modal_scores)
-        
-        # Combined similarity (weighted average)
-        weights = {
-            'image': 0.4,
-            'text': 0.4,
-            'cross_modal': 0.2
-        }
-        
-        combined = (
-            weights['image'] * similarities['image_sim'] +
-            weights['text'] * similarities['text_sim'] +
-            weights['cross_modal'] * similarities['cross_modal_sim']
-        )
-        
-        similarities['combined_sim'] = combined
+        texts = [text for text in (text1, text2) if text]
+        text_emb = iter(self.encode_texts(texts) if texts else [])
+        text1_emb = next(text_emb) if text1 else None
+        text2_emb = next(text_emb) if text2 else None
+        
+        # Image embeddings of both items, one forward pass per batch
+        images1 = item1.get('images', []) if (text2 or item2.get('images')) else []
+        images2 = item2.get('images', []) if (text1 or item1.get('images')) else []
+        if not all_images:
+            images1, images2 = images1[:1], images2[:1]
+        loaded = self.clip_service.load_images(list(images1) + list(images2))
+        valid = [image is not None for image in loaded]
+        
+        image_emb = np.zeros((0, self.clip_service.embedding_dim), dtype=np.float32)
+        if any(valid):
+            image_emb = self.clip_service.encode_batch_images([image for image in loaded if image is not None])
+        split = sum(valid[:len(images1)])
+        
+        similarities = item_similarities(text1_emb, image_emb[:split], text2_emb, image_emb[split:],
+                                         aggregation, top_k)
         
         # Category boost
         if item1.get('category') and item2.get('category'):
             if item1['category'].lower() == item2['category'].lower():
-                similarities['combined_sim'] = min(1.0, similarities['combined_sim'] + 0.1)
+                similarities['combined_sim'] = min(1.0, similarities['combined_sim'] + CATEGORY_BOOST)
         
         return similarities
     
+    def encode_texts(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        CLIP embeddings of texts, from the LRU cache where possible
+        
+        Texts not in the cache are encoded together, batch_size per forward pass.
+        
+        Returns:
+            N x D float32 array
+        """
+        embeddings = np.zeros((len(texts), self.clip_service.embedding_dim), dtype=np.float32)
+        missing = {}
+        with self.text_cache_lock:
+            for i, text in enumerate(texts):
+                cached = self.text_cache.get(text)
+                if cached is None:
+                    missing.setdefault(text, []).append(i)
+                else:
+                    self.text_cache.move_to_end(text)
+                    embeddings[i] = cached
+        
+        if missing:
+            encoded = self.clip_service.encode_batch_texts(list(missing), batch_size)
+            with self.text_cache_lock:
+                for (text, positions), embedding in zip(missing.items(), encoded):
+                    embeddings[positions] = embedding
+                    self.text_cache[text] = embeddings[positions[0]].copy()
+                while len(self.text_cache) > TEXT_CACHE_SIZE:
+                    self.text_cache.popitem(last=False)
+        return embeddings
+    
+    def encode_images(self, items: List[Dict], batch_size: int = 32) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        CLIP embeddings of each item's first image, batch_size per forward pass
+        
+        Returns:
+            (image_emb, has_image): N x D float32 array (zero rows for items
+            whose first image is missing or fails to load) and the mask of
+            items with an embedding
+        """
+        # First images are downloaded concurrently
+        positions = [i for i, item in enumerate(items) if item.get('images')]
+        loaded = self.clip_service.load_images([items[i]['images'][0] for i in positions])
+        images = [image for image in loaded if image is not None]
+        has_image = np.zeros(len(items), dtype=bool)
+        has_image[[i for i, image in zip(positions, loaded) if image is not None]] = True
+        
+        image_emb = np.zeros((len(items), self.clip_service.embedding_dim), dtype=np.float32)
+        if images:
+            image_emb[has_image] = self.clip_service.encode_batch_images(images, batch_size)
+        return image_emb, has_image
+    
+    def client_embeddings(self, items: List[Dict], field: str,
+                          stats: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Embeddings clients sent in each item's field (embedding_codec format)
+        
+        An embedding is used only if it is tagged with this CLIP model and
+        EMBEDDING_VERSION and has the model's dimension.
+        
+        Args:
+            items: Items, possibly carrying packed embeddings
+            field: 'embedding' (item text) or 'image_embedding' (first image)
+            stats: Optional dict whose client_embeddings counts (used,
+                rejected) are increased
+        
+        Returns:
+            (emb, has_emb): N x D float32 array (zero rows where missing or
+            rejected) and the mask of items with a usable embedding
+        """
+        dim = self.clip_service.embedding_dim
+        emb = np.zeros((len(items), dim), dtype=np.float32)
+        has_emb = np.zeros(len(items), dtype=bool)
+        rejected = 0
+        for i, item in enumerate(items):
+            if item.get(field) is None:
+                continue
+            vector = unpack_embedding(item[field], self.clip_service.model_name, EMBEDDING_VERSION, dim)
+            if vector is None:
+                rejected += 1
+            else:
+                emb[i], has_emb[i] = vector, True
+        
+        if stats is not None:
+            counts = stats.setdefault('client_embeddings', {'used': 0, 'rejected': 0})
+            counts['used'] += int(has_emb.sum())
+            counts['rejected'] += rejected
+        return emb, has_emb
+    
+    def encode_item_texts(self, items: List[Dict], batch_size: int = 32,
+                          stats: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        CLIP embeddings of each item's text, or the client's embedding of it
+        
+        Returns:
+            (text_emb, has_text): N x D float32 array (zero rows for items
+            without text) and the mask of items with an embedding
+        """
+        text_emb, has_text = self.client_embeddings(items, 'embedding', stats)
+        texts = [self.create_item_text(item) for item in items]
+        pending = [i for i, text in enumerate(texts) if text and not has_text[i]]
+        if pending:
+            text_emb[pending] = self.encode_texts([texts[i] for i in pending], batch_size)
+            has_text[pending] = True
+        return text_emb, has_text
+    
+    def encode_items(self, items: List[Dict], batch_size: int = 32,
+                     stats: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+        """
+        CLIP embeddings of each item's text and first image, batch_size per forward pass
+        
+        Items without text, or whose first image is missing or fails to load,
+        get a zero row and False in the matching mask. Usable embeddings the
+        client sent ("embedding", "image_embedding") are taken as they are.
+        
+        Args:
+            items: Items to encode
+            batch_size: Texts or images per forward pass
+            stats: Optional dict receiving client_embeddings counts
+        
+        Returns:
+            Dict with text_emb and image_emb (N x D float32) and the boolean
+            masks has_text and has_image (N,)
+        """
+        text_emb, has_text = self.encode_item_texts(items, batch_size, stats)
+        image_emb, has_image = self.client_embeddings(items, 'image_embedding', stats)
+        pending = np.flatnonzero(~has_image)
+        if len(pending):
+            image_emb[pending], has_image[pending] = self.encode_images([items[i] for i in pending.tolist()],
+                                                                        batch_size)
+        
+        return {
+            'text_emb': text_emb,
+            'has_text': has_text,
+            'image_emb': image_emb,
+            'has_image': has_image
+        }
+    
+    def combine_similarities(self, query_item: Dict, candidate_items: List[Dict],
+                             query: Dict[str, np.ndarray],
+                             candidates: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """compute_multimodal_similarity terms for one query against all candidates (see match_scoring)"""
+        return combine_similarities(query_item, candidate_items, query, candidates)
+    
+    def score_candidates(self, query_item: Dict, candidate_items: List[Dict],
+                         batch_size: int = 32, rerank_size: Optional[int] = None,
+                         stats: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+        """
+        compute_multimodal_similarity of a query against every candidate at once
+        
+        The query is encoded once and the candidates in batches, so scoring N
+        candidates takes 2 + 2N / batch_size CLIP forward passes instead of 6N.
+        
+        With rerank_size, candidate images are loaded and encoded only for the
+        rerank_size candidates ranked highest by their text terms
+        (match_scoring.cascade_similarities); the rest get an estimate.
+        Candidates whose image embedding the client sent are always scored
+        exactly.
+        
+        Returns:
+            combine_similarities result (cascade_similarities with rerank_size)
+        """
+        query = self.encode_items([query_item], batch_size, stats)
+        if rerank_size is None:
+            candidates = self.encode_items(candidate_items, batch_size, stats)
+            return self.combine_similarities(query_item, candidate_items, query, candidates)
+        
+        text_emb, has_text = self.encode_item_texts(candidate_items, batch_size, stats)
+        known_images = self.client_embeddings(candidate_items, 'image_embedding', stats)
+        declares_image = np.array([bool(item.get('images')) for item in candidate_items], dtype=bool)
+        declares_image &= ~known_images[1]
+        
+        def encode_images(positions):
+            return self.encode_images([candidate_items[i] for i in positions.tolist()], batch_size)
+        
+        return cascade_similarities(query_item, candidate_items, query, text_emb, has_text,
+                                    declares_image, encode_images, rerank_size, known_images)
+    
     def compute_final_score(self, similarity_score: float, trust_score: float, 
                            alpha: float = 0.7, beta: float = 0.3) -> float:
         """
@@ -135,10 +328,16 @@ class MultimodalMatchingService:
                     user_trust_scores: Optional[Dict[str, float]] = None,
                     item_trust_scores: Optional[Dict[str, float]] = None,
                     threshold: float = 0.5, top_k: int = 5,
-                    alpha: float = 0.7, beta: float = 0.3) -> List[Dict]:
+                    alpha: float = 0.7, beta: float = 0.3,
+                    prefilter: Optional[Dict] = None,
+                    rerank_size: Optional[int] = None,
+                    stats: Optional[Dict] = None) -> List[Dict]:
         """
         Find matching items using multimodal similarity and trust scores
         
+        All candidates are scored together by score_candidates, after the
+        metadata prefilter (if enabled) drops unrelated ones.
+        
         Args:
             query_item: Item to match
             candidate_items: List of candidate items
@@ -148,59 +347,208 @@ class MultimodalMatchingService:
             top_k: Maximum number of matches to return
             alpha: Weight for similarity score
             beta: Weight for trust score
+            prefilter: MetadataIndex.prefilter options; None scores every candidate
+            rerank_size: Load candidate images only for this many candidates
+                (see score_candidates); None loads every image
+            stats: Optional dict receiving client_embeddings counts
         
         Returns:
             List of matches with scores
         """
+        if prefilter is not None and candidate_items:
+            keys, _ = MetadataIndex.from_items(candidate_items).prefilter(query_item, **prefilter)
+            if keys is not None:
+                candidate_items = [candidate_items[i] for i in sorted(keys)]
+        
         if not candidate_items:
             return []
         
-        matches = []
+        similarities = self.score_candidates(query_item, candidate_items, rerank_size=rerank_size, stats=stats)
+        return self.rank_matches(candidate_items, similarities, user_trust_scores, item_trust_scores,
+                                 threshold, top_k, alpha, beta)
+    
+    def rank_matches(self, candidate_items: List[Dict], similarities: Dict[str, np.ndarray],
+                     user_trust_scores: Optional[Dict[str, float]] = None,
+                     item_trust_scores: Optional[Dict[str, float]] = None,
+                     threshold: float = 0.5, top_k: int = 5,
+                     alpha: float = 0.7, beta: float = 0.3) -> List[Dict]:
+        """
+        Combine similarities with trust scores and keep the best matches
+        
+        Args:
+            candidate_items: Candidate items
+            similarities: combine_similarities result for the candidates
+            (other arguments as in find_matches)
         
-        for candidate in candidate_items:
-            # Compute multimodal similarity
-            similarities = self.compute_multimodal_similarity(query_item, candidate)
-            similarity_score = similarities['combined_sim']
-            
-            # Get trust scores
-            user_id = candidate.get('user_id', '')
-            item_id = candidate.get('id', '')
-            
-            user_trust = 0.5  # Default
-            item_trust = 0.5  # Default
-            
-            if user_trust_scores and user_id:
-                user_trust = user_trust_scores.get(user_id, 0.5)
-            
-            if item_trust_scores and item_id:
-                item_trust = item_trust_scores.get(item_id, 0.5)
-            
-            # Combined trust score
-            trust_score = (user_trust + item_trust) / 2.0
-            
-            # Final score
-            final_score = self.compute_final_score(similarity_score, trust_score, alpha, beta)
-            
-            if final_score >= threshold:
-                matches.append({
-                    'item': candidate,
-                    'similarity_score': float(similarity_score),
-                    'trust_score': float(trust_score),
-                    'final_score': float(final_score),
-                    'match_percentage': round(float(final_score) * 100, 1),
-                    'details': {
-                        'image_similarity': float(similarities['image_sim']),
-                        'text_similarity': float(similarities['text_sim']),
-                        'cross_modal_similarity': float(similarities['cross_modal_sim']),
-                        'user_trust': float(user_trust),
-                        'item_trust': float(item_trust)
-                    }
-                })
+        Returns:
+            List of matches with scores
+        """
+        similarity_score = similarities['combined_sim']
+        
+        # Get trust scores (0.5 by default)
+        user_trust = np.array([
+            user_trust_scores.get(candidate.get('user_id', ''), 0.5)
+            if user_trust_scores and candidate.get('user_id', '') else 0.5
+            for candidate in candidate_items
+        ], dtype=np.float64)
+        item_trust = np.array([
+            item_trust_scores.get(candidate.get('id', ''), 0.5)
+            if item_trust_scores and candidate.get('id', '') else 0.5
+            for candidate in candidate_items
+        ], dtype=np.float64)
+        
+        # Combined trust score
+        trust_score = (user_trust + item_trust) / 2.0
+        
+        # Final score
+        final_score = self.compute_final_score(similarity_score, trust_score, alpha, beta)
+        
+        matches = []
+        for i in np.flatnonzero(final_score >= threshold).tolist():
+            matches.append({
+                'item': strip_embeddings(candidate_items[i]),
+                'similarity_score': float(similarity_score[i]),
+                'trust_score': float(trust_score[i]),
+                'final_score': float(final_score[i]),
+                'match_percentage': round(float(final_score[i]) * 100, 1),
+                'details': {
+                    'image_similarity': _term(similarities['image_sim'][i]),
+                    'text_similarity': float(similarities['text_sim'][i]),
+                    'cross_modal_similarity': _term(similarities['cross_modal_sim'][i]),
+                    'user_trust': float(user_trust[i]),
+                    'item_trust': float(item_trust[i])
+                }
+            })
+            if 'similarity_error' in similarities:
+                matches[-1]['details']['similarity_error'] = float(similarities['similarity_error'][i])
+                matches[-1]['details']['estimated'] = bool(similarities['estimated'][i])
         
         # Sort by final score descending
         matches.sort(key=lambda x: x['final_score'], reverse=True)
         return matches[:top_k]
     
+    def load_item_index(self) -> Dict:
+        """Load the persisted item indexes; returns the text index recovery stats"""
+        self.image_index.load()
+        recovery = self.text_index.load()
+        self.metadata_index = MetadataIndex()
+        for item_id, item in self.text_index.items():
+            self.metadata_index.add(item_id, item or {})
+        return recovery
+    
+    def index_items(self, items: List[Dict], batch_size: int = 32) -> int:
+        """
+        Encode items once and add them to the item indexes
+        
+        An item indexed again replaces its earlier version.
+        
+        Returns:
+            Number of indexed items
+        """
+        encoded = self.encode_items(items, batch_size)
+        items = [strip_embeddings(item) for item in items]
+        item_ids = [str(item['id']) for item in items]
+        self.text_index.add_many(item_ids, encoded['text_emb'], items)
+        for item_id, item in zip(item_ids, items):
+            self.metadata_index.add(item_id, item)
+        for item_id, has_image in zip(item_ids, encoded['has_image'].tolist()):
+            if not has_image:
+                self.image_index.remove(item_id)
+        with_image = np.flatnonzero(encoded['has_image'])
+        if len(with_image):
+            self.image_index.add_many([item_ids[i] for i in with_image.tolist()], encoded['image_emb'][with_image])
+        return len(items)
+    
+    def remove_item(self, item_id: str) -> bool:
+        """Remove an item from the item indexes; False if it was not indexed"""
+        self.image_index.remove(item_id)
+        self.metadata_index.remove(item_id)
+        return self.text_index.remove(item_id)
+    
+    def indexed_encoding(self, item_ids: List[str]) -> Tuple[List[Optional[Dict]], Dict[str, np.ndarray]]:
+        """
+        Stored items and their embeddings, in the encode_items format
+        
+        Returns:
+            (items, encoding): None in items for ids not indexed
+        """
+        text_emb, found, items = self.text_index.get_many(item_ids)
+        image_emb, has_image, _ = self.image_index.get_many(item_ids)
+        
+        # An index that is still empty has no dimension yet
+        dim = self.clip_service.embedding_dim
+        if text_emb.shape[1] != dim:
+            text_emb = np.zeros((len(item_ids), dim), dtype=np.float32)
+        if image_emb.shape[1] != dim:
+            image_emb = np.zeros((len(item_ids), dim), dtype=np.float32)
+        
+        return items, {
+            'text_emb': text_emb,
+            'has_text': found & np.any(text_emb != 0, axis=1),
+            'image_emb': image_emb,
+            'has_image': has_image
+        }
+    
+    def find_indexed_matches(self, query_item: Dict, query: Dict[str, np.ndarray],
+                             user_trust_scores: Optional[Dict[str, float]] = None,
+                             item_trust_scores: Optional[Dict[str, float]] = None,
+                             threshold: float = 0.5, top_k: int = 5,
+                             alpha: float = 0.7, beta: float = 0.3,
+                             exclude: Tuple[str, ...] = (),
+                             prefilter: Optional[Dict] = None) -> Tuple[List[Dict], Dict]:
+        """
+        Find matching items among the indexed items
+        
+        With prefilter, only the indexed items passing the metadata filters
+        are searched. Each similarity term with a query embedding (text <-> text, image <->
+        image and both cross-modal pairs) retrieves its nearest indexed items.
+        Their union is then scored exactly like find_matches from the stored
+        embeddings, so nothing is re-encoded. More than top_k items are
+        retrieved per term, since the category boost and trust scores can
+        reorder them.
+        
+        Args:
+            query_item: Item to match (its category is used for the boost)
+            query: Query embeddings in the encode_items format (one row)
+            exclude: Item ids to leave out (e.g. the query item itself)
+            (other arguments as in find_matches)
+        
+        Returns:
+            (matches, stats): matches as in find_matches, and the number of
+            candidates retrieved, vectors scanned and prefilters applied
+        """
+        include, applied = None, []
+        if prefilter is not None:
+            include, applied = self.metadata_index.prefilter(query_item, **prefilter)
+        
+        pool_size = max(top_k * 5, 50)
+        searches = []
+        if query['has_text'][0]:
+            searches += [(self.text_index, query['text_emb'][0]), (self.image_index, query['text_emb'][0])]
+        if query['has_image'][0]:
+            searches += [(self.image_index, query['image_emb'][0]), (self.text_index, query['image_emb'][0])]
+        
+        candidate_ids, scanned = [], 0
+        for index, vector in searches:
+            stats = {}
+            hits = index.search(vector, pool_size, exclude=exclude, include=include, stats=stats)
+            candidate_ids += [item_id for item_id, _ in hits]
+            scanned += stats.get('scanned', 0)
+        candidate_ids = list(dict.fromkeys(candidate_ids))
+        stats = {'candidates': len(candidate_ids), 'scanned': scanned, 'prefilters': applied}
+        
+        candidate_items, candidates = self.indexed_encoding(candidate_ids)
+        found = [i for i, item in enumerate(candidate_items) if item is not None]
+        if not found:
+            return [], stats
+        candidate_items = [candidate_items[i] for i in found]
+        candidates = {name: values[found] for name, values in candidates.items()}
+        
+        similarities = self.combine_similarities(query_item, candidate_items, query, candidates)
+        matches = self.rank_matches(candidate_items, similarities, user_trust_scores, item_trust_scores,
+                                    threshold, top_k, alpha, beta)
+        return matches, stats
+    
     def initialize_gnn(self, users: List[Dict], items: List[Dict], 
                       interactions: List[Dict]) -> Tuple[Dict[str, float], Dict[str, float]]:
         """
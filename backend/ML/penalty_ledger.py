@@ -0,0 +1,158 @@
+"""
+Penalty Ledger - Columnar record of trust penalties awaiting recovery
+Every applied ban penalty is one row (user, time, amount, amount recovered so
+far). The recovery job recomputes all rows in one NumPy pass and drops rows
+that are fully recovered.
+"""
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+SECONDS_PER_DAY = 86400.0
+
+
+class PenaltyLedger:
+    """
+    Growable columnar penalty table
+
+    Columns (first `size` entries are valid):
+        user          int32   index into ids
+        penalized_at  float64 unix time the penalty was applied
+        amount        float64 trust score actually taken away
+        recovered     float64 part of amount already given back
+
+    Users are interned separately from the SocialGraph, so rows survive
+    graph rebuilds.
+    """
+
+    def __init__(self):
+        self.id_to_index = {}  # user_id -> ledger index
+        self.ids = []          # ledger index -> user_id
+        self.user = np.zeros(0, dtype=np.int32)
+        self.penalized_at = np.zeros(0, dtype=np.float64)
+        self.amount = np.zeros(0, dtype=np.float64)
+        self.recovered = np.zeros(0, dtype=np.float64)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _intern(self, user_id: str) -> int:
+        idx = self.id_to_index.get(user_id)
+        if idx is None:
+            idx = len(self.ids)
+            self.id_to_index[user_id] = idx
+            self.ids.append(user_id)
+        return idx
+
+    def _grow(self, capacity: int):
+        capacity = max(capacity, 2 * len(self.user), 64)
+        for name in ('user', 'penalized_at', 'amount', 'recovered'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def record(self, user_ids: List[str], amounts: np.ndarray, penalized_at: float):
+        """
+        Append one row per penalized user
+
+        Args:
+            user_ids: Penalized users
+            amounts: Trust score taken from each user (rows <= 0 are skipped)
+            penalized_at: Unix time of the penalty
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        keep = np.flatnonzero(amounts > 0)
+        if len(keep) == 0:
+            return
+        users = np.array([self._intern(user_ids[i]) for i in keep.tolist()], dtype=np.int32)
+        end = self.size + len(keep)
+        if end > len(self.user):
+            self._grow(end)
+        self.user[self.size:end] = users
+        self.penalized_at[self.size:end] = penalized_at
+        self.amount[self.size:end] = amounts[keep]
+        self.recovered[self.size:end] = 0.0
+        self.size = end
+
+    def recover(self, now: float, recovery_rate: float = 0.01, max_recovery: float = 0.3,
+                apply: bool = True) -> Tuple[List[str], np.ndarray]:
+        """
+        Recovery owed since the last run, per user
+
+        Each row recovers recovery_rate per day since its penalty, up to
+        min(amount, max_recovery) in total.
+
+        Args:
+            now: Unix time to recover up to
+            recovery_rate: Daily recovery per penalty
+            max_recovery: Cap on the total recovery of one penalty
+            apply: Mark the recovery as given and drop finished rows;
+                False only computes it
+
+        Returns:
+            (user_ids, recovery) for users with recovery > 0
+        """
+        n = self.size
+        if n == 0:
+            return [], np.zeros(0, dtype=np.float64)
+
+        days = np.maximum(now - self.penalized_at[:n], 0.0) / SECONDS_PER_DAY
+        limit = np.minimum(self.amount[:n], max_recovery)
+        target = np.minimum(recovery_rate * days, limit)
+        delta = np.maximum(target - self.recovered[:n], 0.0)
+
+        per_user = np.bincount(self.user[:n], weights=delta, minlength=len(self.ids))
+        owed = np.flatnonzero(per_user > 0)
+        user_ids = [self.ids[idx] for idx in owed.tolist()]
+
+        if apply:
+            self.recovered[:n] += delta
+            self._drop(self.recovered[:n] >= limit)
+        return user_ids, per_user[owed]
+
+    def _drop(self, done: np.ndarray):
+        """Remove rows where done is True, keeping row order"""
+        if not done.any():
+            return
+        keep = np.flatnonzero(~done)
+        for name in ('user', 'penalized_at', 'amount', 'recovered'):
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+        self.size = len(keep)
+
+    def outstanding(self) -> Dict[str, float]:
+        """user_id -> penalty not yet recovered"""
+        n = self.size
+        remaining = np.bincount(self.user[:n], weights=self.amount[:n] - self.recovered[:n],
+                                minlength=len(self.ids))
+        users = np.flatnonzero(np.bincount(self.user[:n], minlength=len(self.ids)))
+        return dict(zip((self.ids[idx] for idx in users.tolist()), remaining[users].tolist()))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Valid rows as compact arrays (user ids renumbered to those in use)"""
+        n = self.size
+        used = np.flatnonzero(np.bincount(self.user[:n], minlength=len(self.ids)))
+        remap = np.zeros(len(self.ids), dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        return {
+            'ids': [self.ids[idx] for idx in used.tolist()],
+            'user': remap[self.user[:n]],
+            'penalized_at': self.penalized_at[:n].copy(),
+            'amount': self.amount[:n].copy(),
+            'recovered': self.recovered[:n].copy(),
+        }
+
+    @classmethod
+    def from_arrays(cls, ids: List[str], user: np.ndarray, penalized_at: np.ndarray,
+                    amount: np.ndarray, recovered: np.ndarray) -> 'PenaltyLedger':
+        ledger = cls()
+        ledger.ids = list(ids)
+        ledger.id_to_index = {user_id: idx for idx, user_id in enumerate(ledger.ids)}
+        ledger.user = np.asarray(user, dtype=np.int32).copy()
+        ledger.penalized_at = np.asarray(penalized_at, dtype=np.float64).copy()
+        ledger.amount = np.asarray(amount, dtype=np.float64).copy()
+        ledger.recovered = np.asarray(recovered, dtype=np.float64).copy()
+        ledger.size = len(ledger.user)
+        return ledger
@@ -0,0 +1,201 @@
+"""
+Propagation Workers - Ban propagation in worker processes over a shared-memory graph
+The parent publishes the compacted CSR arrays of the social graph into
+multiprocessing.shared_memory once per graph version (an epoch). Worker
+processes attach to them without copying, compute penalty arrays for
+index-based tasks and send back only the result, so independent propagations
+run on separate cores instead of sharing one GIL.
+
+Trust scores stay in the parent: computing penalties never reads them, and
+applying them must stay under the service lock so the write-ahead log order
+holds.
+"""
+
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+from social_graph import SocialGraph
+from trust_propagation_service import TrustPropagationService
+
+# Graph arrays published per epoch
+SHARED_ARRAYS = ('indptr', 'indices', 'weights', 'reverse_weights', 'degree')
+
+
+class SharedGraphPublisher:
+    """
+    Parent side: the graph's arrays in shared memory, one segment set per epoch
+
+    The current epoch is also kept in a small shared counter, so a worker can
+    skip a task whose epoch was superseded before it started (its result
+    would be recomputed anyway). An old epoch is unlinked once no task uses it.
+    Callers serialize publish() with graph mutations (the service write lock).
+    """
+
+    def __init__(self):
+        self.counter = shared_memory.SharedMemory(create=True, size=8)
+        self._epoch = np.ndarray(1, dtype=np.int64, buffer=self.counter.buf)
+        self._epoch[0] = 0
+        self._lock = threading.Lock()
+        self._segments = {}  # epoch -> [SharedMemory]
+        self._in_use = {}    # epoch -> running tasks
+        self._graph = None   # Graph object of the current epoch
+        self.current = None  # Handle of the current epoch
+
+    def is_current(self, graph: SocialGraph) -> bool:
+        """True if the current epoch holds this graph at its present version"""
+        return self._graph is graph and self.current['version'] == graph.version
+
+    def publish(self, graph: SocialGraph):
+        """
+        Copy the graph's compacted arrays into a new epoch (O(connections))
+
+        The graph itself is not compacted, so it stays exactly as a replay of
+        the log would rebuild it.
+
+        Args:
+            graph: The service's graph; must not change during the call
+        """
+        arrays = graph.compacted_arrays()
+        segments, layout = [], {}
+        for name in SHARED_ARRAYS:
+            array = np.ascontiguousarray(arrays[name])
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[:] = array
+            segments.append(segment)
+            layout[name] = (segment.name, array.dtype.str, len(array))
+
+        with self._lock:
+            epoch = int(self._epoch[0]) + 1
+            previous = self.current['epoch'] if self.current else None
+            self._segments[epoch] = segments
+            self._in_use[epoch] = 0
+            self._graph = graph
+            self.current = {'epoch': epoch, 'version': graph.version,
+                            'num_nodes': graph.num_nodes, 'arrays': layout}
+            self._epoch[0] = epoch
+            if previous is not None and self._in_use[previous] == 0:
+                self._unlink(previous)
+
+    def acquire(self) -> Dict:
+        """Handle of the current epoch, kept alive until release()"""
+        with self._lock:
+            self._in_use[self.current['epoch']] += 1
+            return self.current
+
+    def release(self, handle: Dict):
+        with self._lock:
+            epoch = handle['epoch']
+            self._in_use[epoch] -= 1
+            if self._in_use[epoch] == 0 and epoch != self.current['epoch']:
+                self._unlink(epoch)
+
+    def _unlink(self, epoch: int):
+        for segment in self._segments.pop(epoch):
+            segment.close()
+            segment.unlink()
+        del self._in_use[epoch]
+
+    def close(self):
+        """Unlink every segment, including the epoch counter"""
+        with self._lock:
+            for epoch in list(self._segments):
+                self._unlink(epoch)
+            self.current = None
+            self._graph = None
+        del self._epoch
+        self.counter.close()
+        self.counter.unlink()
+
+
+# Worker process state: the epoch counter and the last attached epoch
+_worker_counter = None
+_worker_epoch = {}
+
+
+def _init_worker(counter_name: str):
+    global _worker_counter
+    segment = shared_memory.SharedMemory(name=counter_name)
+    _worker_counter = (segment, np.ndarray(1, dtype=np.int64, buffer=segment.buf))
+
+
+def _attach(handle: Dict):
+    """TrustPropagationService over the handle's epoch, reused while it is current"""
+    if _worker_epoch.get('epoch') == handle['epoch']:
+        return _worker_epoch['service']
+
+    # Drop the previous epoch's views before closing its segments
+    segments = _worker_epoch.get('segments', [])
+    _worker_epoch.clear()
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            pass  # A view is still referenced; the mapping goes with it
+
+    segments, arrays = [], {}
+    for name, (segment_name, dtype, length) in handle['arrays'].items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        segments.append(segment)
+        arrays[name] = np.ndarray(length, dtype=np.dtype(dtype), buffer=segment.buf)
+    service = TrustPropagationService()
+    service.graph = SocialGraph.from_shared_arrays(handle['num_nodes'], version=handle['version'], **arrays)
+    _worker_epoch.update(epoch=handle['epoch'], segments=segments, service=service)
+    return service
+
+
+def run_task(handle: Dict, method: str, args: Dict) -> Tuple[bool, Optional[Dict[str, np.ndarray]]]:
+    """
+    Run service.method(**args) on the handle's epoch (in a worker process)
+
+    Returns:
+        (ran, result) - ran is False if the epoch was superseded before the
+        task started, in which case result is None
+    """
+    if int(_worker_counter[1][0]) != handle['epoch']:
+        return False, None
+    return True, getattr(_attach(handle), method)(**args)
+
+
+def _ready() -> bool:
+    return True
+
+
+class PropagationWorkerPool:
+    """
+    Process pool computing penalty arrays on the published graph
+
+    Usage:
+        pool = PropagationWorkerPool(4)
+        pool.publisher.publish(graph)          # under the service write lock
+        handle = pool.publisher.acquire()
+        ran, penalties = pool.run(handle, 'compute_index_ban_penalties', {'banned_idx': 7})
+        pool.publisher.release(handle)
+    """
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        self.publisher = SharedGraphPublisher()
+        # Spawned, not forked: the parent runs threads and holds locks
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.publisher.counter.name,)
+        )
+
+    def start(self):
+        """Start every worker now rather than on the first tasks"""
+        for future in [self.executor.submit(_ready) for _ in range(self.num_workers)]:
+            future.result()
+
+    def run(self, handle: Dict, method: str, args: Dict) -> Tuple[bool, Optional[Dict[str, np.ndarray]]]:
+        """run_task in a worker; blocks the calling thread until it is done"""
+        return self.executor.submit(run_task, handle, method, args).result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.publisher.close()
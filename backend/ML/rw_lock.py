@@ -0,0 +1,96 @@
+"""
+Reader-Writer Lock
+Many concurrent readers or one writer. Waiting writers block new readers so a
+steady stream of reads cannot starve mutations.
+"""
+
+import threading
+
+
+class ReaderWriterLock:
+    """
+    Reader-writer lock with writer preference
+
+    Usage:
+        with lock.read:
+            ...  # Concurrent with other readers
+        with lock.write:
+            ...  # Exclusive; reentrant for the owning thread
+
+    A thread holding the write lock may also enter `read` (treated as a
+    nested write). Read sections must not be nested: a waiting writer would
+    block the inner read.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None        # Thread ident of the current writer
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self.read = _ReadSide(self)
+        self.write = _WriteSide(self)
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth -= 1
+                return
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        with self._cond:
+            self._write_depth -= 1
+            if self._write_depth == 0:
+                self._writer = None
+                self._cond.notify_all()
+
+
+class _ReadSide:
+    def __init__(self, lock: ReaderWriterLock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire_read()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release_read()
+
+
+class _WriteSide:
+    def __init__(self, lock: ReaderWriterLock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire_write()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release_write()
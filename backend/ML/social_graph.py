@@ -0,0 +1,824 @@
+"""
+Social Graph - Compact CSR adjacency for trust propagation
+String user IDs are interned to dense ints once; adjacency is stored as CSR
+arrays (indptr/indices) with parallel float32 weight arrays.
+
+Incremental changes (follows added/removed, new interactions) are applied in
+O(delta) through a small overlay on top of the CSR arrays and folded back in
+by compact() once the overlay grows large.
+"""
+
+import math
+import numpy as np
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from collections.abc import Mapping
+
+# Directed weights set by a follow relationship (see build_social_graph)
+FOLLOWER_WEIGHT = 0.8   # follower -> following
+FOLLOWING_WEIGHT = 0.3  # following -> follower
+
+# Overlay size (added + removed slots) that triggers compaction: the larger of
+# COMPACT_MIN_SLOTS and COMPACT_FRACTION of the CSR slots
+COMPACT_MIN_SLOTS = 10000
+COMPACT_FRACTION = 0.05
+
+
+class SocialGraph:
+    """
+    Undirected user graph in CSR form with directed connection weights
+
+    For the slot of edge (u, v) in row u:
+        weights[slot]         = weight of u -> v (NaN if that direction has no weight)
+        reverse_weights[slot] = weight of v -> u (NaN if that direction has no weight)
+    Rows are sorted by neighbor index, so a directed weight lookup is a binary
+    search within one row.
+
+    Mutations never resize the CSR arrays:
+        - weight changes on existing slots are written in place
+        - removed connections are masked out of `alive`
+        - new connections live in `extra`: node -> {neighbor: [weight
+          node -> neighbor, weight neighbor -> node]}, stored from both ends
+    Degrees, num_users and num_connections are maintained incrementally.
+    """
+
+    def __init__(self):
+        self.id_to_index = {}  # user_id -> dense index
+        self.ids = []          # dense index -> user_id
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.reverse_weights = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.extra = {}
+        self.num_users = 0     # Nodes with at least one connection
+        self._degree = np.zeros(0, dtype=np.int64)   # Per node, grown on intern
+        self._has_extra = np.zeros(0, dtype=bool)
+        self._num_slots = 0
+        self._num_dead = 0     # Masked-out CSR slots
+        self._num_extra = 0    # Overlay slots
+        self.version = 0       # Bumped on every connection or weight change
+        self._top_cache = {}   # (node, k) -> top_neighbors result, valid for _top_version
+        self._top_version = 0
+
+    @classmethod
+    def from_relationships(cls, followers: List[Dict], interactions: List[Dict]) -> 'SocialGraph':
+        """
+        Build the graph from follower relationships and interactions
+
+        Same semantics as the original dict-based builder: a follow sets
+        follower->following = 0.8 and following->follower = 0.3 (later follows
+        overwrite earlier ones), then interactions keep the maximum weight.
+        """
+        graph = cls()
+        intern = graph.intern
+
+        follow_src, follow_dst = [], []
+        for follow in followers:
+            follow_src.append(intern(follow['follower_id']))
+            follow_dst.append(intern(follow['following_id']))
+
+        inter_src, inter_dst, inter_weight = [], [], []
+        for interaction in interactions:
+            target_user_id = interaction.get('target_user_id')
+            if target_user_id:
+                inter_src.append(intern(interaction['user_id']))
+                inter_dst.append(intern(target_user_id))
+                inter_weight.append(interaction.get('weight', 0.5))
+
+        n = len(graph.ids)
+        follow_src = np.asarray(follow_src, dtype=np.int64)
+        follow_dst = np.asarray(follow_dst, dtype=np.int64)
+
+        # Follow keys in assignment order; the last assignment of a key wins
+        follow_keys = np.stack([follow_src * n + follow_dst, follow_dst * n + follow_src], axis=1).reshape(-1)
+        follow_values = np.tile([FOLLOWER_WEIGHT, FOLLOWING_WEIGHT], len(follow_src))
+        reversed_keys = follow_keys[::-1]
+        follow_keys, first = np.unique(reversed_keys, return_index=True)
+        follow_values = follow_values[::-1][first]
+
+        # Interactions take the max with whatever is already there (default 0)
+        inter_keys = np.asarray(inter_src, dtype=np.int64) * n + np.asarray(inter_dst, dtype=np.int64)
+        inter_values = np.maximum(np.asarray(inter_weight, dtype=np.float64), 0.0)
+
+        keys = np.concatenate([follow_keys, inter_keys])
+        values = np.concatenate([follow_values, inter_values])
+        order = np.lexsort((values, keys))
+        keys, values = keys[order], values[order]
+        if keys.size:
+            last_of_key = np.append(keys[1:] != keys[:-1], True)
+            keys, values = keys[last_of_key], values[last_of_key]
+
+        graph._set_edges(keys, values)
+        return graph
+
+    @classmethod
+    def from_arrays(cls, ids: List[str], indptr: np.ndarray, indices: np.ndarray,
+                    weights: np.ndarray, reverse_weights: np.ndarray) -> 'SocialGraph':
+        """Rebuild a graph from compacted CSR arrays (e.g. a saved snapshot)"""
+        graph = cls()
+        graph.ids = list(ids)
+        graph.id_to_index = dict(zip(graph.ids, range(len(graph.ids))))
+        graph.indptr = np.asarray(indptr, dtype=np.int64)
+        graph.indices = np.asarray(indices, dtype=np.int32)
+        graph.weights = np.asarray(weights, dtype=np.float32)
+        graph.reverse_weights = np.asarray(reverse_weights, dtype=np.float32)
+        graph.alive = np.ones(len(graph.indices), dtype=bool)
+        graph._degree = np.diff(graph.indptr)
+        graph._has_extra = np.zeros(len(graph.ids), dtype=bool)
+        graph._num_slots = len(graph.indices)
+        graph.num_users = int(np.count_nonzero(graph._degree))
+        return graph
+
+    @classmethod
+    def from_shared_arrays(cls, num_nodes: int, indptr: np.ndarray, indices: np.ndarray,
+                           weights: np.ndarray, reverse_weights: np.ndarray,
+                           degree: np.ndarray, version: int = 0) -> 'SocialGraph':
+        """
+        Read-only graph over existing compacted arrays, without copying them
+
+        Used by propagation worker processes on arrays in shared memory. Nodes
+        are known by index only (ids is range(num_nodes) and index_of finds
+        nothing); the graph must not be mutated.
+        """
+        graph = cls()
+        graph.ids = range(num_nodes)
+        graph.indptr, graph.indices = indptr, indices
+        graph.weights, graph.reverse_weights = weights, reverse_weights
+        graph.alive = np.ones(0, dtype=bool)  # Only read when slots are masked out
+        graph._degree = degree
+        graph._num_slots = len(indices)
+        graph.num_users = int(np.count_nonzero(degree))
+        graph.version = version
+        return graph
+
+    def _set_edges(self, keys: np.ndarray, values: np.ndarray):
+        """Build CSR arrays from sorted unique directed keys (src * n + dst) and weights"""
+        n = len(self.ids)
+        self.indptr, self.indices, self.weights, self.reverse_weights = self._build_csr(n, keys, values)
+        self.alive = np.ones(len(self.indices), dtype=bool)
+        self.extra = {}
+
+        self._degree = np.diff(self.indptr)
+        self._has_extra = np.zeros(n, dtype=bool)
+        self._num_slots = len(self.indices)
+        self._num_dead = 0
+        self._num_extra = 0
+        self.num_users = int(np.count_nonzero(self._degree))
+
+    @classmethod
+    def _build_csr(cls, n: int, keys: np.ndarray, values: np.ndarray, dtype=np.float32):
+        """(indptr, indices, weights, reverse_weights) for sorted unique directed keys"""
+        src, dst = keys // max(n, 1), keys % max(n, 1)
+
+        # Every directed weight implies an undirected connection
+        slot_keys = sorted_unique(np.concatenate([keys, dst * n + src]))
+        rows, cols = slot_keys // max(n, 1), slot_keys % max(n, 1)
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return (indptr, cols.astype(np.int32), cls._lookup(keys, values, slot_keys, dtype),
+                cls._lookup(keys, values, cols * n + rows, dtype))
+
+    @staticmethod
+    def _lookup(keys: np.ndarray, values: np.ndarray, queries: np.ndarray, dtype=np.float32) -> np.ndarray:
+        """Values for query keys in sorted keys (NaN where missing)"""
+        result = np.full(len(queries), np.nan, dtype=dtype)
+        if len(keys) == 0:
+            return result
+        pos = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+        found = keys[pos] == queries
+        result[found] = values[pos[found]]
+        return result
+
+    def intern(self, user_id: str) -> int:
+        """Dense index for a user id, assigning a new one if needed"""
+        idx = self.id_to_index.get(user_id)
+        if idx is None:
+            idx = len(self.ids)
+            self.id_to_index[user_id] = idx
+            self.ids.append(user_id)
+            if idx >= len(self._degree):
+                self._grow(max(2 * len(self._degree), 16))
+        return idx
+
+    def _grow(self, capacity: int):
+        """Grow the per-node arrays to capacity (zero-filled)"""
+        extra = capacity - len(self._degree)
+        self._degree = np.concatenate([self._degree, np.zeros(extra, dtype=np.int64)])
+        self._has_extra = np.concatenate([self._has_extra, np.zeros(extra, dtype=bool)])
+
+    def index_of(self, user_id: str) -> Optional[int]:
+        return self.id_to_index.get(user_id)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.ids)
+
+    @property
+    def num_base_nodes(self) -> int:
+        """Nodes covered by the CSR arrays (later nodes only have overlay rows)"""
+        return len(self.indptr) - 1
+
+    @property
+    def num_slots(self) -> int:
+        """Adjacency entries (each connection counted from both ends)"""
+        return self._num_slots
+
+    @property
+    def num_connections(self) -> int:
+        return self.num_slots // 2
+
+    def degrees(self) -> np.ndarray:
+        """Degree of every node"""
+        return self._degree[:self.num_nodes]
+
+    def degree(self, idx: int) -> int:
+        if idx >= self.num_nodes:
+            return 0
+        return int(self._degree[idx])
+
+    def neighbors(self, idx: int) -> np.ndarray:
+        if idx >= self.num_nodes:
+            return np.zeros(0, dtype=np.int64)
+        return self.expand(np.array([idx], dtype=np.int64))
+
+    def row_slots(self, frontier: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        CSR slots of all frontier rows in one gather (including masked-out slots)
+
+        Returns:
+            (slots, counts): slot positions of every row concatenated in
+            frontier order, and the number of slots per frontier node
+        """
+        in_base = frontier < self.num_base_nodes
+        starts = np.zeros(len(frontier), dtype=np.int64)
+        counts = np.zeros(len(frontier), dtype=np.int64)
+        starts[in_base] = self.indptr[frontier[in_base]]
+        counts[in_base] = self.indptr[frontier[in_base] + 1] - starts[in_base]
+        # Position of every neighbor slot: row start + offset within the row
+        row_offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return row_offsets + np.arange(int(counts.sum())), counts
+
+    def _gather(self, frontier: np.ndarray, with_weights: bool = False,
+                max_fanout: Optional[int] = None):
+        """
+        Live neighbors of all frontier nodes, from the CSR arrays and the overlay
+
+        Args:
+            frontier: Node indices to gather
+            with_weights: Also return the weights of each connection
+            max_fanout: Gather only the top_neighbors of nodes with a larger degree
+
+        Returns:
+            (neighbors, owners, weights): neighbor indices, the position in
+            frontier each one belongs to, and if with_weights a pair of float64
+            arrays (weight owner -> neighbor, weight neighbor -> owner)
+        """
+        if max_fanout is not None:
+            capped = self._degree[frontier] > max_fanout
+            if capped.any():
+                return self._gather_capped(frontier, capped, with_weights, max_fanout)
+
+        slots, counts = self.row_slots(frontier)
+        owners = np.repeat(np.arange(len(frontier)), counts)
+        if self._num_dead:
+            keep = self.alive[slots]
+            slots, owners = slots[keep], owners[keep]
+        neighbors = self.indices[slots].astype(np.int64)
+        weights = None
+        if with_weights:
+            weights = (self.weights[slots].astype(np.float64),
+                       self.reverse_weights[slots].astype(np.float64))
+
+        if self._num_extra:
+            positions = np.flatnonzero(self._has_extra[frontier])
+            extra_neighbors, extra_owners, extra_out, extra_in = [], [], [], []
+            for pos in positions.tolist():
+                for neighbor, (weight_out, weight_in) in self.extra[int(frontier[pos])].items():
+                    extra_neighbors.append(neighbor)
+                    extra_owners.append(pos)
+                    extra_out.append(weight_out)
+                    extra_in.append(weight_in)
+            if extra_neighbors:
+                neighbors = np.concatenate([neighbors, np.array(extra_neighbors, dtype=np.int64)])
+                owners = np.concatenate([owners, np.array(extra_owners, dtype=np.int64)])
+                if with_weights:
+                    weights = (np.concatenate([weights[0], extra_out]),
+                               np.concatenate([weights[1], extra_in]))
+
+        return neighbors, owners, weights
+
+    def _gather_capped(self, frontier: np.ndarray, capped: np.ndarray,
+                       with_weights: bool, max_fanout: int):
+        """_gather where the capped frontier positions contribute only their top_neighbors"""
+        uncapped = np.flatnonzero(~capped)
+        neighbors, owners, weights = self._gather(frontier[uncapped], with_weights)
+        parts_neighbors, parts_owners = [neighbors], [uncapped[owners]]
+        parts_out, parts_in = ([weights[0]], [weights[1]]) if with_weights else ([], [])
+        for pos in np.flatnonzero(capped).tolist():
+            top, weight_out, weight_in = self.top_neighbors(int(frontier[pos]), max_fanout)
+            parts_neighbors.append(top)
+            parts_owners.append(np.full(len(top), pos, dtype=np.int64))
+            parts_out.append(weight_out)
+            parts_in.append(weight_in)
+        weights = (np.concatenate(parts_out), np.concatenate(parts_in)) if with_weights else None
+        return np.concatenate(parts_neighbors), np.concatenate(parts_owners), weights
+
+    def top_neighbors(self, idx: int, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The k strongest connections of a node, cached until the graph changes
+
+        Connections are ordered by max(weight out, weight in) descending, then
+        neighbor index, so the choice depends only on the logical graph.
+
+        Returns:
+            (neighbors, weight_out, weight_in), strongest first
+        """
+        if self._top_version != self.version:
+            self._top_cache = {}
+            self._top_version = self.version
+        cached = self._top_cache.get((idx, k))
+        if cached is None:
+            neighbors, _, (weight_out, weight_in) = self._gather(np.array([idx], dtype=np.int64), with_weights=True)
+            strength = np.nan_to_num(np.fmax(weight_out, weight_in), nan=0.0)
+            top = np.lexsort((neighbors, -strength))[:k]
+            cached = (neighbors[top], weight_out[top], weight_in[top])
+            self._top_cache[(idx, k)] = cached
+        return cached
+
+    def expand(self, frontier: np.ndarray) -> np.ndarray:
+        """Neighbors of all frontier nodes in one gather (may contain repeats)"""
+        return self._gather(frontier)[0]
+
+    def hop_distances(self, source: int, max_hops: int,
+                      max_fanout: Optional[int] = None,
+                      keep: Optional[Callable[[int, np.ndarray], np.ndarray]] = None,
+                      stats: Optional[Dict] = None) -> np.ndarray:
+        """
+        Hop distance from source to every node, via boolean frontier expansion
+
+        Args:
+            source: Node index to start from
+            max_hops: Maximum distance to expand
+            max_fanout: Expand at most this many neighbors per node (its
+                strongest connections, see top_neighbors)
+            keep: keep(hop, nodes) -> bool mask of newly reached nodes to
+                record and expand; the rest are pruned (never reached later)
+            stats: Filled with 'capped' (node indices whose expansion was
+                cut by max_fanout) and 'pruned' (number of pruned nodes)
+
+        Returns:
+            int32 array of length num_nodes (-1 where unreached within max_hops)
+        """
+        distance = np.full(self.num_nodes, -1, dtype=np.int32)
+        distance[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+        capped, pruned = [], 0
+
+        for hop in range(1, max_hops + 1):
+            if len(frontier) == 0:
+                break
+            if max_fanout is not None:
+                capped.append(frontier[self._degree[frontier] > max_fanout])
+            next_frontier = np.zeros(self.num_nodes, dtype=bool)
+            next_frontier[self._gather(frontier, max_fanout=max_fanout)[0]] = True
+            next_frontier &= distance == -1
+            frontier = np.flatnonzero(next_frontier)
+            if keep is not None:
+                mask = keep(hop, frontier)
+                distance[frontier[~mask]] = -2  # Pruned: not recorded, not expanded
+                pruned += len(frontier) - int(np.count_nonzero(mask))
+                frontier = frontier[mask]
+            distance[frontier] = hop
+
+        if pruned:
+            distance[distance == -2] = -1
+        if stats is not None:
+            stats['capped'] = np.concatenate(capped) if capped else np.zeros(0, dtype=np.int64)
+            stats['pruned'] = pruned
+        return distance
+
+    def multi_source_hop_distances(self, sources: np.ndarray, max_hops: int,
+                                   max_fanout: Optional[int] = None,
+                                   keep: Optional[Callable[[int, np.ndarray, np.ndarray], np.ndarray]] = None,
+                                   stats: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Hop distances from each of several sources in a single traversal
+
+        The frontier holds (node, source) pairs, so every source's
+        neighborhood is expanded together and overlapping neighborhoods are
+        gathered once per hop.
+
+        Args:
+            sources: Node indices to start from
+            max_hops: Maximum distance to expand
+            max_fanout: Expand at most this many neighbors per node
+            keep: keep(hop, nodes, source_positions) -> bool mask of newly
+                reached pairs to record and expand; the rest are pruned
+            stats: Filled like hop_distances (capped nodes listed once)
+
+        Returns:
+            (nodes, source_positions, distances) for every (node, source) pair
+            reached within max_hops, excluding the sources themselves at
+            distance 0; source_positions index into sources
+        """
+        num_sources = len(sources)
+        frontier_nodes = np.asarray(sources, dtype=np.int64)
+        frontier_labels = np.arange(num_sources, dtype=np.int64)
+        visited = np.sort(frontier_nodes * num_sources + frontier_labels)
+        reached_keys, reached_hops = [], []
+        capped, pruned = [], 0
+
+        for hop in range(1, max_hops + 1):
+            if len(frontier_nodes) == 0:
+                break
+            if max_fanout is not None:
+                capped.append(frontier_nodes[self._degree[frontier_nodes] > max_fanout])
+            neighbors, owners, _ = self._gather(frontier_nodes, max_fanout=max_fanout)
+            keys = sorted_unique(neighbors * num_sources + frontier_labels[owners])
+            keys = keys[~sorted_contains(visited, keys)]
+            visited = np.sort(np.concatenate([visited, keys]))
+            if keep is not None:
+                mask = keep(hop, keys // num_sources, keys % num_sources)
+                pruned += len(keys) - int(np.count_nonzero(mask))
+                keys = keys[mask]
+            reached_keys.append(keys)
+            reached_hops.append(np.full(len(keys), hop, dtype=np.int32))
+            frontier_nodes, frontier_labels = keys // num_sources, keys % num_sources
+
+        if stats is not None:
+            stats['capped'] = sorted_unique(np.concatenate(capped)) if capped else np.zeros(0, dtype=np.int64)
+            stats['pruned'] = pruned
+        if not reached_keys:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.int32)
+        keys = np.concatenate(reached_keys)
+        return keys // num_sources, keys % num_sources, np.concatenate(reached_hops)
+
+    def personalized_pagerank(self, sources: np.ndarray, residual: np.ndarray,
+                              alpha: float = 0.15, tolerance: float = 1e-4,
+                              max_hops: Optional[int] = None,
+                              max_fanout: Optional[int] = None,
+                              stats: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Approximate personalized PageRank by local push (Andersen-Chung-Lang)
+
+        The walk moves from u to v with probability strength(u, v) / d(u)
+        and otherwise stays at u, where strength is max(weight out, weight
+        in) clipped to [0, 1] and d(u) is the degree (or max_fanout if
+        capped). Weak ties therefore pass on less, and the walk is reversible
+        with d as its stationary weight: pagerank[v] / d(v) from source s
+        equals the PageRank of s from v.
+
+        A node u is pushed while residual[u] >= tolerance * d(u): alpha of
+        the residual becomes PageRank and the rest moves along its
+        connections. Every push turns at least alpha * tolerance * d(u) of the
+        starting mass into PageRank and costs O(d(u)), so the total work is
+        O(sum(residual) / (alpha * tolerance)) whatever the size of the graph.
+        The sources are always pushed once. Nodes above the threshold are
+        pushed together in rounds; only touched nodes are stored.
+
+        Args:
+            sources: Sorted unique node indices holding the starting mass
+            residual: Starting mass of each source
+            alpha: Teleport (restart) probability
+            tolerance: Residual per connection below which a node is not pushed
+            max_hops: Do not push nodes further than this from the sources
+            max_fanout: Push only to the top_neighbors of nodes with a larger degree
+            stats: Filled with 'capped' (pushed nodes whose push was cut by
+                max_fanout), 'pushes' and 'rounds'
+
+        Returns:
+            (nodes, pagerank, residual, hops) for every touched node, sorted by
+            node; hops is the number of pushes the first mass took to arrive
+        """
+        nodes = np.asarray(sources, dtype=np.int64)
+        residual = np.asarray(residual, dtype=np.float64).copy()
+        pagerank = np.zeros(len(nodes), dtype=np.float64)
+        hops = np.zeros(len(nodes), dtype=np.int32)
+        capped, pushes, rounds = [], 0, 0
+
+        while True:
+            reads = self._degree[nodes]
+            if max_fanout is not None:
+                reads = np.minimum(reads, max_fanout)
+            if rounds == 0:
+                active = reads > 0
+            else:
+                active = (residual >= tolerance * reads) & (reads > 0)
+            if max_hops is not None:
+                active &= hops < max_hops
+            active = np.flatnonzero(active)
+            if len(active) == 0:
+                break
+
+            frontier, mass, frontier_reads = nodes[active], residual[active], reads[active]
+            if max_fanout is not None:
+                capped.append(frontier[self._degree[frontier] > max_fanout])
+
+            neighbors, owners, (weight_out, weight_in) = self._gather(frontier, with_weights=True,
+                                                                      max_fanout=max_fanout)
+            # Canonical (owner, neighbor) order, so sums do not depend on how
+            # the rows are laid out (CSR vs overlay, compacted or not)
+            order = np.lexsort((neighbors, owners))
+            neighbors, owners = neighbors[order], owners[order]
+            weight_out, weight_in = weight_out[order], weight_in[order]
+            strength = np.clip(np.nan_to_num(np.fmax(weight_out, weight_in), nan=0.0), 0.0, 1.0)
+            share = strength / frontier_reads[owners]
+            row_share = np.bincount(owners, weights=share, minlength=len(frontier))
+
+            # The share not passed on stays as residual at the pushed node
+            pagerank[active] += alpha * mass
+            residual[active] = (1.0 - alpha) * mass * np.maximum(1.0 - row_share, 0.0)
+
+            # Merge the pushed mass into the touched nodes
+            all_nodes = np.concatenate([nodes, neighbors])
+            order = np.argsort(all_nodes, kind='stable')
+            all_nodes = all_nodes[order]
+            starts = np.flatnonzero(np.r_[True, all_nodes[1:] != all_nodes[:-1]])
+            nodes = all_nodes[starts]
+            incoming = (1.0 - alpha) * mass[owners] * share
+            residual = np.add.reduceat(np.concatenate([residual, incoming])[order], starts)
+            pagerank = np.add.reduceat(np.concatenate([pagerank, np.zeros(len(neighbors))])[order], starts)
+            arrival = hops[active][owners] + 1
+            hops = np.minimum.reduceat(np.concatenate([hops, arrival.astype(np.int32)])[order], starts)
+            pushes += len(frontier)
+            rounds += 1
+
+        if stats is not None:
+            stats['capped'] = sorted_unique(np.concatenate(capped)) if capped else np.zeros(0, dtype=np.int64)
+            stats['pushes'] = pushes
+            stats['rounds'] = rounds
+        return nodes, pagerank, residual, hops
+
+    def incident_weights(self, idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Directed weights between a node and every other node
+
+        Returns:
+            (to_idx, from_idx) float64 arrays of length num_nodes: weight of
+            v -> idx and idx -> v (NaN where that direction has no weight)
+        """
+        to_idx = np.full(self.num_nodes, np.nan)
+        from_idx = np.full(self.num_nodes, np.nan)
+        neighbors, _, (weight_out, weight_in) = self._gather(np.array([idx], dtype=np.int64), with_weights=True)
+        to_idx[neighbors] = weight_in
+        from_idx[neighbors] = weight_out
+        return to_idx, from_idx
+
+    def incident_pair_weights(self, sources: np.ndarray, nodes: np.ndarray,
+                              source_positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Directed weights between nodes[i] and sources[source_positions[i]]
+
+        Returns:
+            (to_source, from_source) float64 arrays: weight of node -> source
+            and source -> node (NaN where that direction has no weight)
+        """
+        num_sources = len(sources)
+        neighbors, owners, (weight_out, weight_in) = self._gather(
+            np.asarray(sources, dtype=np.int64), with_weights=True
+        )
+        row_keys = neighbors * num_sources + owners
+        order = np.argsort(row_keys)
+        row_keys, weight_out, weight_in = row_keys[order], weight_out[order], weight_in[order]
+
+        to_source = np.full(len(nodes), np.nan)
+        from_source = np.full(len(nodes), np.nan)
+        if len(row_keys) == 0:
+            return to_source, from_source
+        queries = nodes.astype(np.int64) * num_sources + source_positions
+        pos = np.minimum(np.searchsorted(row_keys, queries), len(row_keys) - 1)
+        found = row_keys[pos] == queries
+        to_source[found] = weight_in[pos[found]]
+        from_source[found] = weight_out[pos[found]]
+        return to_source, from_source
+
+    def _slot(self, u: int, v: int) -> Optional[int]:
+        """CSR slot of edge (u, v) in row u, live or masked out, or None"""
+        if u >= self.num_base_nodes:
+            return None
+        start, end = self.indptr[u], self.indptr[u + 1]
+        pos = start + int(np.searchsorted(self.indices[start:end], v))
+        if pos < end and self.indices[pos] == v:
+            return int(pos)
+        return None
+
+    def weight(self, u: int, v: int) -> Optional[float]:
+        """Directed connection weight u -> v, or None if that direction has none"""
+        entry = self.extra.get(u, {}).get(v)
+        if entry is not None:
+            weight = entry[0]
+        else:
+            slot = self._slot(u, v)
+            if slot is None or not self.alive[slot]:
+                return None
+            weight = float(self.weights[slot])
+        return None if math.isnan(weight) else weight
+
+    def set_weight(self, u: int, v: int, weight: float):
+        """
+        Set the directed weight u -> v, connecting u and v if needed (O(log degree))
+
+        Self-connections are ignored.
+        """
+        if u == v:
+            return
+        self.version += 1
+        entry = self.extra.get(u, {}).get(v)
+        if entry is not None:
+            entry[0] = weight
+            self.extra[v][u][1] = weight
+            return
+
+        slot = self._slot(u, v)
+        if slot is not None:
+            back = self._slot(v, u)
+            if not self.alive[slot]:
+                # Revive a removed connection with no weights yet
+                self.alive[slot] = self.alive[back] = True
+                self.weights[[slot, back]] = np.nan
+                self.reverse_weights[[slot, back]] = np.nan
+                self._num_dead -= 2
+                self._connect_degrees(u, v, 1)
+            self.weights[slot] = weight
+            self.reverse_weights[back] = weight
+            return
+
+        # New connection goes to the overlay
+        self.extra.setdefault(u, {})[v] = [weight, math.nan]
+        self.extra.setdefault(v, {})[u] = [math.nan, weight]
+        self._has_extra[u] = self._has_extra[v] = True
+        self._num_extra += 2
+        self._connect_degrees(u, v, 1)
+        self._maybe_compact()
+
+    def remove_connection(self, u: int, v: int) -> bool:
+        """Remove the connection between u and v (both directions); False if absent"""
+        entry = self.extra.get(u, {}).pop(v, None)
+        if entry is not None:
+            del self.extra[v][u]
+            for node in (u, v):
+                if not self.extra[node]:
+                    del self.extra[node]
+                    self._has_extra[node] = False
+            self._num_extra -= 2
+            self._connect_degrees(u, v, -1)
+            self.version += 1
+            return True
+
+        slot = self._slot(u, v)
+        if slot is None or not self.alive[slot]:
+            return False
+        self.alive[slot] = self.alive[self._slot(v, u)] = False
+        self._num_dead += 2
+        self._connect_degrees(u, v, -1)
+        self.version += 1
+        self._maybe_compact()
+        return True
+
+    def _connect_degrees(self, u: int, v: int, delta: int):
+        """Update degree, user and slot counters for one added/removed connection"""
+        for node in (u, v):
+            before = self._degree[node]
+            self._degree[node] = before + delta
+            if before == 0:
+                self.num_users += 1
+            elif before + delta == 0:
+                self.num_users -= 1
+        self._num_slots += 2 * delta
+
+    def add_follow(self, follower: int, following: int):
+        """Apply a follow exactly as build_social_graph does for a later follow"""
+        self.set_weight(follower, following, FOLLOWER_WEIGHT)
+        self.set_weight(following, follower, FOLLOWING_WEIGHT)
+
+    def add_interaction(self, user: int, target: int, weight: float = 0.5):
+        """Apply an interaction: the directed weight keeps its maximum"""
+        current = self.weight(user, target)
+        self.set_weight(user, target, max(0.0 if current is None else current, weight))
+
+    def _maybe_compact(self):
+        overlay = self._num_extra + self._num_dead
+        if overlay > max(COMPACT_MIN_SLOTS, COMPACT_FRACTION * len(self.indices)):
+            self.compact()
+
+    def compact(self):
+        """Fold the overlay back into fresh CSR arrays (O(connections))"""
+        if not self._num_extra and not self._num_dead and self.num_base_nodes == self.num_nodes:
+            return
+        self._set_edges(*self._live_edges())
+
+    def compacted_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        CSR arrays with the overlay folded in, leaving the graph itself unchanged
+
+        Weights are float64 so overlay weights keep their exact values; a graph
+        from_shared_arrays over them traverses exactly like this one.
+
+        Returns:
+            Dict with indptr, indices, weights, reverse_weights and degree
+        """
+        indptr, indices, weights, reverse_weights = self._build_csr(
+            self.num_nodes, *self._live_edges(), dtype=np.float64)
+        return {'indptr': indptr, 'indices': indices, 'weights': weights,
+                'reverse_weights': reverse_weights, 'degree': np.diff(indptr)}
+
+    def _live_edges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted directed keys (src * n + dst) and weights of base and overlay"""
+        n = self.num_nodes
+        rows = np.repeat(np.arange(self.num_base_nodes, dtype=np.int64), np.diff(self.indptr))
+        live = self.alive & ~np.isnan(self.weights)
+        keys = [rows[live] * n + self.indices[live]]
+        values = [self.weights[live].astype(np.float64)]
+
+        extra_keys, extra_values = [], []
+        for u, row in self.extra.items():
+            for v, (weight_out, _) in row.items():
+                if not math.isnan(weight_out):
+                    extra_keys.append(u * n + v)
+                    extra_values.append(weight_out)
+        keys.append(np.array(extra_keys, dtype=np.int64))
+        values.append(np.array(extra_values, dtype=np.float64))
+
+        keys, values = np.concatenate(keys), np.concatenate(values)
+        order = np.argsort(keys)
+        return keys[order], values[order]
+
+    def iter_weights(self) -> Iterator[Tuple[int, int, float]]:
+        """All directed weights as (u, v, weight)"""
+        rows = np.repeat(np.arange(self.num_base_nodes), np.diff(self.indptr))
+        live = np.flatnonzero(self.alive & ~np.isnan(self.weights))
+        for slot in live.tolist():
+            yield int(rows[slot]), int(self.indices[slot]), float(self.weights[slot])
+        for u, row in self.extra.items():
+            for v, (weight_out, _) in row.items():
+                if not math.isnan(weight_out):
+                    yield u, v, weight_out
+
+    def num_weights(self) -> int:
+        """Number of directed weights"""
+        count = int(np.count_nonzero(self.alive & ~np.isnan(self.weights)))
+        return count + sum(not math.isnan(entry[0]) for row in self.extra.values() for entry in row.values())
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the adjacency arrays (excluding the id table and overlay)"""
+        return (self.indptr.nbytes + self.indices.nbytes + self.weights.nbytes +
+                self.reverse_weights.nbytes + self.alive.nbytes + self._degree.nbytes)
+
+
+def sorted_unique(keys: np.ndarray) -> np.ndarray:
+    """Sorted unique keys (sort-based; much faster than np.unique's hashing here)"""
+    keys = np.sort(keys)
+    if len(keys) == 0:
+        return keys
+    return keys[np.r_[True, keys[1:] != keys[:-1]]]
+
+
+def sorted_contains(sorted_keys: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """Boolean mask of queries present in sorted_keys"""
+    if len(sorted_keys) == 0:
+        return np.zeros(len(queries), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_keys, queries), len(sorted_keys) - 1)
+    return sorted_keys[pos] == queries
+
+
+class AdjacencyView(Mapping):
+    """Read-only user_id -> set of neighbor ids view of a SocialGraph"""
+
+    def __init__(self, graph: SocialGraph):
+        self._graph = graph
+
+    def __getitem__(self, user_id: str) -> Set[str]:
+        idx = self._graph.index_of(user_id)
+        if idx is None or self._graph.degree(idx) == 0:
+            raise KeyError(user_id)
+        ids = self._graph.ids
+        return {ids[v] for v in self._graph.neighbors(idx).tolist()}
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._graph.ids[idx] for idx in np.flatnonzero(self._graph.degrees()))
+
+    def __len__(self) -> int:
+        return self._graph.num_users
+
+
+class WeightView(Mapping):
+    """Read-only (user_id, user_id) -> weight view of a SocialGraph"""
+
+    def __init__(self, graph: SocialGraph):
+        self._graph = graph
+
+    def __getitem__(self, key: Tuple[str, str]) -> float:
+        u, v = (self._graph.index_of(user_id) for user_id in key)
+        weight = None if u is None or v is None else self._graph.weight(u, v)
+        if weight is None:
+            raise KeyError(key)
+        return weight
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        ids = self._graph.ids
+        return ((ids[u], ids[v]) for u, v, _ in self._graph.iter_weights())
+
+    def __len__(self) -> int:
+        return self._graph.num_weights()
@@ -0,0 +1,135 @@
+"""
+Test script for the bulk all-pairs lost-vs-found matching job
+"""
+
+import os
+import json
+import tempfile
+import numpy as np
+from bulk_matching_job import BulkMatchingJob
+from benchmark_matching_cascade import generate_items
+from match_scoring import combine_similarities
+
+class StoredEmbeddings:
+    """Encoder returning precomputed embeddings for items carrying their row"""
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+        self.items_encoded = 0
+
+    def encode_items(self, items, batch_size=32):
+        rows = [item['row'] for item in items]
+        self.items_encoded += len(rows)
+        return {name: values[rows] for name, values in self.encoded.items()}
+
+def make_job_data(num_found=300, num_lost=700):
+    items, encoded = generate_items(num_found + num_lost, seed=5)
+    for row, item in enumerate(items):
+        item['row'] = row
+    return items[:num_found], items[num_found:], encoded
+
+def read_output(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_all_pairs():
+    """Test that blocked all-pairs matching equals scoring each found item on its own"""
+    print("=" * 60)
+    print("TEST 1: Blocked All-Pairs Top-K")
+    print("=" * 60)
+
+    found_items, lost_items, encoded = make_job_data()
+    directory = tempfile.mkdtemp(prefix="bulk_matching_test_")
+    output = os.path.join(directory, 'matches.jsonl')
+    job = BulkMatchingJob(StoredEmbeddings(encoded), found_items, lost_items, output,
+                          os.path.join(directory, 'checkpoint'), top_k=5, threshold=0.6,
+                          block_size=128, embed_chunk=200, progress=lambda *args: None)
+    summary = job.run()
+    records = read_output(output)
+    print(f"Summary: {summary}")
+    assert len(records) == len(found_items)
+
+    lost = {name: values[[item['row'] for item in lost_items]] for name, values in encoded.items()}
+    for found, record in zip(found_items, records):
+        scores = combine_similarities(found, lost_items, {name: values[[found['row']]] for name, values in encoded.items()},
+                                      lost)['combined_sim']
+        order = np.lexsort((np.arange(len(scores)), -scores))[:5]
+        expected = [(lost_items[i]['id'], scores[i]) for i in order if scores[i] >= 0.6]
+        assert record['found_item_id'] == found['id']
+        assert [m['lost_item_id'] for m in record['matches']] == [item_id for item_id, _ in expected]
+        np.testing.assert_allclose([m['similarity_score'] for m in record['matches']],
+                                   [score for _, score in expected], atol=1e-12)
+    assert summary['pairs_written'] == sum(len(record['matches']) for record in records)
+
+    # float16 storage selects nearly the same pairs, still scored exactly
+    output16 = os.path.join(directory, 'matches16.jsonl')
+    BulkMatchingJob(StoredEmbeddings(encoded), found_items, lost_items, output16,
+                    os.path.join(directory, 'checkpoint16'), top_k=5, threshold=0.6,
+                    block_size=128, dtype='float16', progress=lambda *args: None).run()
+    pairs = {(r['found_item_id'], m['lost_item_id']) for r in records for m in r['matches']}
+    pairs16 = {(r['found_item_id'], m['lost_item_id']) for r in read_output(output16) for m in r['matches']}
+    print(f"float16 selection agreement: {len(pairs & pairs16) / len(pairs):.4f}")
+    assert len(pairs & pairs16) >= 0.99 * len(pairs)
+    print()
+
+def test_resume():
+    """Test resuming an interrupted job from its checkpoints"""
+    print("=" * 60)
+    print("TEST 2: Resume From Checkpoint")
+    print("=" * 60)
+
+    found_items, lost_items, encoded = make_job_data()
+    directory = tempfile.mkdtemp(prefix="bulk_matching_test_")
+    reference = os.path.join(directory, 'reference.jsonl')
+    BulkMatchingJob(StoredEmbeddings(encoded), found_items, lost_items, reference,
+                    os.path.join(directory, 'reference_checkpoint'), top_k=5, threshold=0.6,
+                    block_size=64, progress=lambda *args: None).run()
+
+    class Interrupted(Exception):
+        pass
+
+    def crash_after_two_blocks(stage, done, total, started):
+        if stage == 'match' and done >= 128:
+            raise Interrupted()
+
+    output = os.path.join(directory, 'matches.jsonl')
+    checkpoint = os.path.join(directory, 'checkpoint')
+    encoder = StoredEmbeddings(encoded)
+    try:
+        BulkMatchingJob(encoder, found_items, lost_items, output, checkpoint, top_k=5, threshold=0.6,
+                        block_size=64, progress=crash_after_two_blocks).run()
+        assert False, "job was not interrupted"
+    except Interrupted:
+        pass
+    # A partial line written after the last checkpoint is dropped on resume
+    with open(output, 'a', encoding='utf-8') as f:
+        f.write('{"found_item_id": "partial')
+    with open(os.path.join(checkpoint, 'state.json'), encoding='utf-8') as f:
+        print(f"Interrupted after {json.load(f)['rows_done']} rows")
+
+    resumed = StoredEmbeddings(encoded)
+    summary = BulkMatchingJob(resumed, found_items, lost_items, output, checkpoint, top_k=5, threshold=0.6,
+                              block_size=64, progress=lambda *args: None).run()
+    print(f"Items re-encoded on resume: {resumed.items_encoded}; summary {summary}")
+    assert resumed.items_encoded == 0
+    assert read_output(output) == read_output(reference)
+
+    # Different inputs start over instead of reusing the checkpoint
+    changed = StoredEmbeddings(encoded)
+    BulkMatchingJob(changed, found_items[:100], lost_items, output, checkpoint, top_k=5, threshold=0.6,
+                    block_size=64, progress=lambda *args: None).run()
+    assert changed.items_encoded == 100 + len(lost_items)
+    assert len(read_output(output)) == 100
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("BULK MATCHING JOB - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_all_pairs()
+    test_resume()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
@@ -0,0 +1,87 @@
+"""
+Test script for the packed embeddings clients send back to /match
+"""
+
+import base64
+import numpy as np
+from embedding_codec import pack_embedding, unpack_embedding, strip_embeddings
+
+MODEL = 'all-MiniLM-L6-v2'
+
+def random_embeddings(count, dim=384, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def test_round_trip():
+    """Test that float16 and int8 payloads keep similarities and rankings"""
+    print("=" * 60)
+    print("TEST 1: Round Trip")
+    print("=" * 60)
+
+    vectors = random_embeddings(200)
+    exact = vectors[1:] @ vectors[0]
+    for dtype, tolerance in (('float16', 1e-3), ('int8', 5e-3)):
+        payloads = [pack_embedding(vector, MODEL, '1', dtype) for vector in vectors]
+        decoded = np.stack([unpack_embedding(payload, MODEL, '1', 384) for payload in payloads])
+        assert decoded.dtype == np.float32
+        np.testing.assert_allclose(np.linalg.norm(decoded, axis=1), 1.0, atol=1e-5)
+        similarities = decoded[1:] @ decoded[0]
+        error = np.abs(similarities - exact).max()
+        top = set(np.argsort(-exact)[:10]) & set(np.argsort(-similarities)[:10])
+        print(f"{dtype}: {len(payloads[0]['data'])} base64 chars, max similarity error {error:.5f}, "
+              f"top-10 overlap {len(top)}/10")
+        assert error < tolerance and len(top) >= 9
+
+    try:
+        pack_embedding(vectors[0], MODEL, '1', 'float64')
+        assert False, "unsupported dtype accepted"
+    except ValueError:
+        pass
+    print()
+
+def test_rejected_payloads():
+    """Test that mismatched or malformed payloads are rejected rather than used"""
+    print("=" * 60)
+    print("TEST 2: Validation")
+    print("=" * 60)
+
+    vector = random_embeddings(1)[0]
+    payload = pack_embedding(vector, MODEL, '1')
+    rejected = {
+        'other model': (payload, 'openai/clip-vit-base-patch32', '1', 384),
+        'other version': (payload, MODEL, '2', 384),
+        'other dimension': (payload, MODEL, '1', 512),
+        'unknown dtype': (dict(payload, dtype='float32'), MODEL, '1', 384),
+        'bad base64': (dict(payload, data='not base64!'), MODEL, '1', 384),
+        'truncated data': (dict(payload, data=payload['data'][:40]), MODEL, '1', 384),
+        'odd byte count': (dict(payload, data=base64.b64encode(b'abc').decode('ascii')), MODEL, '1', 384),
+        'odd byte count, dim 1': (dict(payload, data=base64.b64encode(b'abc').decode('ascii')), MODEL, '1', 1),
+        'bad int8 scale': (dict(pack_embedding(vector, MODEL, '1', 'int8'), scale=-1), MODEL, '1', 384),
+        'zero vector': (pack_embedding(np.zeros(384), MODEL, '1'), MODEL, '1', 384),
+        'not an object': ([0.1, 0.2], MODEL, '1', 384),
+    }
+    for reason, (candidate, model, version, dim) in rejected.items():
+        assert unpack_embedding(candidate, model, version, dim) is None, reason
+    print(f"Rejected: {', '.join(rejected)}")
+
+    # Versions may arrive as numbers
+    assert unpack_embedding(dict(payload, version=1), MODEL, '1', 384) is not None
+
+    item = {'id': 'lost_1', 'title': 'Wallet', 'embedding': payload, 'image_embedding': payload}
+    assert strip_embeddings(item) == {'id': 'lost_1', 'title': 'Wallet'}
+    assert 'embedding' in item
+    plain = {'id': 'lost_2'}
+    assert strip_embeddings(plain) is plain
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("EMBEDDING CODEC - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_round_trip()
+    test_rejected_payloads()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
@@ -0,0 +1,267 @@
+"""
+Test script for Community Graph Builder
+"""
+
+import os
+import numpy as np
+from datetime import datetime, timedelta
+import graph_builder
+from graph_builder import CommunityGraphBuilder, create_sample_community_graph
+from graph_stream_loader import GraphStreamLoader, _decoder, map_user
+
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data', 'community_export')
+
+def test_sample_graph():
+    """Test the sample community graph statistics"""
+    print("=" * 60)
+    print("TEST 1: Sample Community Graph")
+    print("=" * 60)
+
+    builder = create_sample_community_graph()
+    stats = builder.compute_graph_statistics()
+
+    print(f"\nStats: {stats}")
+    assert stats['num_users'] == 4
+    assert stats['num_posts'] == 5
+    assert stats['num_interactions'] == 10
+    assert stats['flagged_posts'] == 2
+    print()
+
+def test_sliding_window_eviction():
+    """Test that edges older than the window are evicted"""
+    print("=" * 60)
+    print("TEST 2: Sliding Window Eviction")
+    print("=" * 60)
+
+    builder = CommunityGraphBuilder(window=timedelta(days=7), bucket_size=timedelta(hours=1))
+    start = datetime(2024, 1, 1)
+
+    # One interaction per hour for 30 days
+    for hour in range(30 * 24):
+        builder.add_interaction('user1', f'post{hour}', 'liked', weight=1.0,
+                                timestamp=start + timedelta(hours=hour))
+
+    retained = builder.compute_graph_statistics()['num_interactions']
+    print(f"\nRetained {retained} of {30 * 24} interactions (7 day window)")
+    assert retained <= 7 * 24 + 1
+
+    now = start + timedelta(hours=30 * 24 - 1)
+    _, _, interactions = builder.build_graph_data(now=now)
+    assert all(now - edge['timestamp'] <= timedelta(days=7) for edge in interactions)
+
+    # Late edges behind the horizon are dropped, late edges inside it are kept
+    builder.add_interaction('user2', 'old', 'liked', timestamp=start)
+    builder.add_interaction('user2', 'late', 'liked', timestamp=now - timedelta(days=1))
+    posts = {edge['post_id'] for edge in builder.interactions}
+    assert 'old' not in posts and 'late' in posts
+    print()
+
+def test_edge_decay():
+    """Test exponential decay of edge weights by age"""
+    print("=" * 60)
+    print("TEST 3: Edge Weight Decay")
+    print("=" * 60)
+
+    builder = CommunityGraphBuilder(decay_half_life=timedelta(days=1))
+    now = datetime(2024, 1, 10)
+    builder.add_interaction('user1', 'post1', 'liked', weight=1.0, timestamp=now)
+    builder.add_interaction('user1', 'post2', 'liked', weight=1.0, timestamp=now - timedelta(days=1))
+    builder.add_interaction('user1', 'post3', 'liked', weight=1.0, timestamp=now - timedelta(days=2))
+
+    _, _, interactions = builder.build_graph_data(now=now)
+    weights = {edge['post_id']: edge['weight'] for edge in interactions}
+    print(f"\nDecayed weights: {weights}")
+    assert abs(weights['post1'] - 1.0) < 1e-9
+    assert abs(weights['post2'] - 0.5) < 1e-9
+    assert abs(weights['post3'] - 0.25) < 1e-9
+    print()
+
+def test_columnar_storage():
+    """Test indexed feature lookup and the columnar graph export"""
+    print("=" * 60)
+    print("TEST 4: Columnar Storage")
+    print("=" * 60)
+
+    builder = create_sample_community_graph()
+    builder.add_interaction('user1', 'unknown_post', 'liked')  # Endpoint without features
+
+    user = builder.get_user_features('user2')
+    post = builder.get_post_features('post2')
+    print(f"\nuser2: {user}")
+    print(f"post2: {post}")
+    assert user['posts_count'] == 20 and user['harmful_posts'] == 8
+    assert post['user_id'] == 'user2' and post['is_flagged'] is True
+    assert builder.get_user_features('missing') is None
+    assert builder.get_post_features('unknown_post') is None
+
+    columns = builder.build_graph_columns()
+    assert columns['user_ids'] == ['user1', 'user2', 'user3', 'user4']
+    assert len(columns['post_ids']) == 5
+    assert list(columns['post_features']['user_row']) == [0, 1, 2, 3, 1]
+    # The edge to the unknown post is dropped
+    assert len(columns['edges']['source']) == 10
+    assert builder.compute_graph_statistics()['num_interactions'] == 11
+    print()
+
+def test_stream_loader():
+    """Test streaming a mongoexport dump into the builder"""
+    print("=" * 60)
+    print("TEST 5: Streaming JSONL Export Loader")
+    print("=" * 60)
+
+    progress = []
+    loader = GraphStreamLoader(chunk_size=2, progress_every=2, progress_callback=progress.append)
+    results = loader.load_export(EXPORT_DIR)
+    print(f"\nTotals: {results['total']}")
+
+    assert results['users']['records'] == 4
+    assert results['users']['skipped'] == 1   # Truncated line
+    assert results['posts']['records'] == 3
+    assert results['posts']['skipped'] == 1   # Deleted post
+    assert results['reports']['records'] == 2
+    assert results['comments']['records'] == 1
+    assert results['comments']['skipped'] == 1   # Deleted comment
+    assert len(progress) > len(results) - 1
+
+    builder = loader.builder
+    stats = builder.compute_graph_statistics()
+    assert stats['num_users'] == 4 and stats['num_posts'] == 3
+    # 3 posted + 2 likes + 1 comment + 2 follows + 2 reports
+    assert stats['num_interactions'] == 10
+
+    # Legacy binary GUIDs decode to the same id as string GUIDs
+    user = builder.get_user_features('3f2504e0-4f89-11d3-9a0c-0305e82c3301')
+    assert user is not None and user['posts_count'] == 50
+    post = builder.get_post_features('65b000000000000000000002')
+    assert post['user_id'] == '6ba7b810-9dad-11d1-80b4-00c04fd430c8' and post['is_flagged']
+    # Other binaries decode to hex strings
+    doc = _decoder.decode('{"UserId": {"$binary": {"base64": "AQID/w==", "subType": "00"}}}')
+    assert doc['UserId'] == '010203ff' and map_user(doc)[0] == '010203ff'
+
+    # Same graph regardless of chunk size
+    other = GraphStreamLoader(chunk_size=1000, progress_callback=lambda stats: None)
+    other.load_export(EXPORT_DIR)
+    assert other.builder.compute_graph_statistics() == stats
+    assert other.builder.interactions == builder.interactions
+    print()
+
+def test_historical_window():
+    """Test that a build without `now` keeps the last window of a historical stream"""
+    print("=" * 60)
+    print("TEST 6: Historical Window Anchor")
+    print("=" * 60)
+
+    builder = CommunityGraphBuilder(window=timedelta(days=1), decay_half_life=timedelta(days=1))
+    start = datetime(2020, 3, 1)
+    builder.add_user('user1', account_created=start - timedelta(days=30))
+    for hour in range(48):
+        builder.add_post(f'post{hour}', 'user1', created_at=start + timedelta(hours=hour))
+        builder.add_interaction('user1', f'post{hour}', 'liked', weight=1.0,
+                                timestamp=start + timedelta(hours=hour))
+
+    _, _, interactions = builder.build_graph_data()
+    newest = start + timedelta(hours=47)
+    print(f"\nKept {len(interactions)} edges of a stream ending {newest}")
+    assert 24 <= len(interactions) <= 25
+    weights = {edge['post_id']: edge['weight'] for edge in interactions}
+    assert abs(weights['post47'] - 1.0) < 1e-9
+    assert abs(weights['post23'] - 0.5) < 1e-9
+    print()
+
+def test_released_nodes():
+    """Test that users and posts whose edges were all evicted are released"""
+    print("=" * 60)
+    print("TEST 7: Released Nodes Keep Memory Bounded")
+    print("=" * 60)
+
+    window = timedelta(days=1)
+    builder = CommunityGraphBuilder(window=window)
+    start = datetime(2024, 1, 1)
+    hours = 3000
+    events = []
+    for hour in range(hours):
+        when = start + timedelta(hours=hour)
+        user, post = f'user{hour}', f'post{hour}'
+        events.append((when, user, post))
+        builder.add_user(user, account_created=start - timedelta(days=30), posts_count=hour % 7)
+        builder.add_post(post, user, created_at=when, likes_count=hour % 5)
+        builder.add_interaction(user, post, 'posted', weight=1.0, timestamp=when)
+        if hour:
+            builder.add_user_interaction(user, f'user{hour - 1}', timestamp=when)
+
+    rows = len(builder.user_table) + len(builder.post_table)
+    print(f"\nStreamed {2 * hours} nodes, holding {rows} rows")
+    assert rows <= graph_builder.RELEASE_MIN_ROWS + 100
+    assert len(builder.user_table.present) <= 4 * graph_builder.RELEASE_MIN_ROWS
+
+    # Releasing the rest leaves the graph of a fresh builder fed only the events still in the window
+    cutoff = builder._bucket_index(builder._latest_timestamp - window.total_seconds())
+    assert builder.release_inactive(cutoff * builder.bucket_size.total_seconds(), min_rows=0) > 0
+    users, posts, interactions = builder.build_graph_data()
+    fresh = CommunityGraphBuilder(window=window)
+    for when, user, post in events:
+        if builder._bucket_index(when.timestamp()) < cutoff:
+            continue
+        hour = int(user[4:])
+        fresh.add_user(user, account_created=start - timedelta(days=30), posts_count=hour % 7)
+        fresh.add_post(post, user, created_at=when, likes_count=hour % 5)
+        fresh.add_interaction(user, post, 'posted', weight=1.0, timestamp=when)
+        if hour:
+            fresh.add_user(f'user{hour - 1}', account_created=start - timedelta(days=30), posts_count=(hour - 1) % 7)
+            fresh.add_user_interaction(user, f'user{hour - 1}', timestamp=when)
+
+    def key(records):
+        return sorted(tuple(sorted(record.items())) for record in records)
+
+    expected = fresh.build_graph_data()
+    assert key(users) == key(expected[0])
+    assert key(posts) == key(expected[1])
+    assert key(interactions) == key(expected[2])
+    print()
+
+def test_exact_columns():
+    """Test that trust ratios round-trip exactly and stats count only edges inside the window"""
+    print("=" * 60)
+    print("TEST 8: Exact Ratios And Window Statistics")
+    print("=" * 60)
+
+    builder = CommunityGraphBuilder(window=timedelta(days=1))
+    newest = datetime(2024, 1, 2, 10, 45)
+    builder.add_user('user1', account_created=newest - timedelta(days=90), posts_count=3, harmful_posts=1)
+    builder.add_users_batch(['user2'], np.array([(newest - timedelta(days=90)).timestamp()]),
+                            np.array([7]), np.array([1]), np.array([1]), np.array([0]))
+    builder.add_post('post1', 'user1', created_at=newest - timedelta(days=2))
+    builder.add_post('post2', 'user2', created_at=newest - timedelta(days=2))
+
+    users, _, _ = builder.build_graph_data()
+    ratios = {user['id']: user['trust_ratio'] for user in users}
+    print(f"\nTrust ratios: {ratios}")
+    assert ratios['user1'] == builder._compute_user_trust_ratio(3, 1, 0)
+    assert ratios['user2'] == builder._compute_user_trust_ratio(7, 1, 1)
+
+    # The older edge shares the boundary bucket but lies behind the window
+    builder.add_interaction('user1', 'post1', 'liked', timestamp=newest - timedelta(days=1, minutes=30))
+    builder.add_interaction('user2', 'post2', 'liked', timestamp=newest)
+    stats = builder.compute_graph_statistics()
+    columns = builder.build_graph_columns()
+    print(f"Interactions: {stats['num_interactions']}, built edges: {len(columns['edges']['source'])}")
+    assert stats['num_interactions'] == len(columns['edges']['source']) == 1
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("COMMUNITY GRAPH BUILDER - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_sample_graph()
+    test_sliding_window_eviction()
+    test_edge_decay()
+    test_columnar_storage()
+    test_stream_loader()
+    test_historical_window()
+    test_released_nodes()
+    test_exact_columns()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
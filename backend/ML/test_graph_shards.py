@@ -0,0 +1,297 @@
+"""
+Test script for community-partitioned graph shards and sharded ban propagation
+"""
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+import numpy as np
+import requests
+
+os.environ.setdefault("TRUST_STATE_DIR", tempfile.mkdtemp(prefix="trust_shard_test_"))
+
+from trust_propagation_service import TrustPropagationService
+from social_graph import SocialGraph
+from graph_shards import GraphShard, ShardCoordinator, partition_graph, edge_cut
+
+def community_relationships(num_communities=6, size=40, seed=0):
+    """Followers inside communities of users plus a few follows across them"""
+    rng = np.random.default_rng(seed)
+    followers = []
+    for c in range(num_communities):
+        members = [f'c{c}u{i}' for i in range(size)]
+        for a, b in rng.integers(0, size, (4 * size, 2)):
+            if a != b:
+                followers.append({'follower_id': members[a], 'following_id': members[b]})
+    for _ in range(num_communities * 3):
+        c1, c2 = rng.choice(num_communities, 2, replace=False)
+        followers.append({'follower_id': f'c{c1}u{rng.integers(size)}', 'following_id': f'c{c2}u{rng.integers(size)}'})
+    interactions = [{'user_id': f['follower_id'], 'target_user_id': f['following_id'], 'type': 'comment', 'weight': 0.9}
+                    for f in followers[::7]]
+    return followers, interactions
+
+def test_partition():
+    """Test that communities stay together and shards stay balanced"""
+    print("=" * 60)
+    print("TEST 1: Label Propagation Partition")
+    print("=" * 60)
+
+    service = TrustPropagationService()
+    service.build_social_graph(*community_relationships())
+    arrays = service.graph.compacted_arrays()
+    n = len(arrays['indptr']) - 1
+
+    shard_of = partition_graph(arrays['indptr'], arrays['indices'], 3)
+    loads = np.bincount(shard_of, minlength=3)
+    cut = edge_cut(arrays['indptr'], arrays['indices'], shard_of)
+    random_cut = edge_cut(arrays['indptr'], arrays['indices'], np.random.default_rng(0).integers(0, 3, n))
+    print(f"Loads: {loads.tolist()}, edge cut {cut:.3f} (random assignment {random_cut:.3f})")
+    assert loads.sum() == n
+    assert loads.max() <= np.ceil(n / 3 * 1.1)
+    assert cut < 0.1 < random_cut
+    print()
+
+def test_shard_expansion():
+    """Test that shards together expand exactly like the whole graph"""
+    print("=" * 60)
+    print("TEST 2: Shard Rows And Ghost Nodes")
+    print("=" * 60)
+
+    service = TrustPropagationService()
+    service.build_social_graph(*community_relationships(seed=1))
+    graph = service.graph
+    arrays = graph.compacted_arrays()
+    shard_of = partition_graph(arrays['indptr'], arrays['indices'], 4)
+    shards = [GraphShard.from_bytes(GraphShard.from_arrays(arrays, shard_of, s, version=7).to_bytes())
+              for s in range(4)]
+    print(f"Shards: {[shard.stats()['num_owned'] for shard in shards]} owned, "
+          f"{[shard.stats()['num_ghosts'] for shard in shards]} ghosts")
+    assert sum(shard.num_owned for shard in shards) == graph.num_nodes
+    assert all(shard.version == 7 for shard in shards)
+
+    assert_shards_match(graph, shards, lambda node: int(shard_of[node]))
+    for node in range(graph.num_nodes):
+        if graph.degree(node) > 3:
+            _, capped = shards[shard_of[node]].expand(np.array([node]), max_fanout=3)
+            assert capped.tolist() == [node]
+
+    try:
+        shards[0].expand(np.array([int(np.flatnonzero(shard_of == 1)[0])]))
+        assert False, "expanded a node owned by another shard"
+    except ValueError:
+        pass
+    print()
+
+def assert_shards_match(graph, shards, owner):
+    """Every node expands and reports weights on its shard exactly as on the graph"""
+    for node in range(graph.num_nodes):
+        shard = shards[owner(node)]
+        neighbors, capped = shard.expand(np.array([node]))
+        assert len(capped) == 0
+        reached = np.concatenate(list(neighbors.values())) if neighbors else np.zeros(0, dtype=np.int64)
+        assert sorted(reached.tolist()) == sorted(graph.neighbors(node).tolist()), node
+        assert all(owner(n) == s for s, nodes in neighbors.items() for n in nodes.tolist())
+        if graph.degree(node) > 3:
+            neighbors, _ = shard.expand(np.array([node]), max_fanout=3)
+            top = np.concatenate(list(neighbors.values()))
+            assert sorted(top.tolist()) == sorted(graph.top_neighbors(node, 3)[0].tolist()), node
+        nodes, weight_out, weight_in = shard.incident_weights(node)
+        to_idx, from_idx = graph.incident_weights(node)
+        np.testing.assert_array_equal(weight_out, from_idx[nodes])
+        np.testing.assert_array_equal(weight_in, to_idx[nodes])
+
+def test_shard_deltas():
+    """Test that deltas applied to the owning shards keep them equal to the changed graph"""
+    print("=" * 60)
+    print("TEST 3: Shard Deltas")
+    print("=" * 60)
+
+    service = TrustPropagationService()
+    followers, interactions = community_relationships(seed=3)
+    service.build_social_graph(followers, interactions)
+    graph = service.graph
+    arrays = graph.compacted_arrays()
+    shard_of = partition_graph(arrays['indptr'], arrays['indices'], 3)
+    shards = [GraphShard.from_arrays(arrays, shard_of, s, version=1) for s in range(3)]
+    added = {}
+    owner = lambda node: int(shard_of[node]) if node < len(shard_of) else added[node]
+
+    # Follows (some of new users), unfollows and interactions, routed like ShardCoordinator
+    rng = np.random.default_rng(3)
+    users = sorted(graph.id_to_index)
+    pairs = [(users[a], users[b]) for a, b in rng.integers(0, len(users), (60, 2))]
+    pairs += [(f'new{i}', users[i * 7]) for i in range(5)] + [('new0', 'new5')]
+    service.add_follows([{'follower_id': a, 'following_id': b} for a, b in pairs])
+    unfollows = followers[::9] + [{'follower_id': a, 'following_id': b} for a, b in pairs[::4]]
+    service.remove_follows(unfollows)
+    service.add_interactions([{'user_id': b, 'target_user_id': a, 'type': 'like', 'weight': 0.7} for a, b in pairs[1::3]])
+    changed = pairs + [(f['follower_id'], f['following_id']) for f in unfollows]
+
+    deltas = {}
+    for a, b in changed:
+        u, v = graph.index_of(a), graph.index_of(b)
+        if u == v:
+            continue
+        for node, other in ((u, v), (v, u)):
+            if node >= len(shard_of) and node not in added:
+                added[node] = owner(other) if other < len(shard_of) or other in added else 0
+        weight_uv, weight_vu = (np.nan if w is None else w for w in (graph.weight(u, v), graph.weight(v, u)))
+        deltas.setdefault(owner(u), []).append((u, v, weight_uv, weight_vu, owner(v)))
+        deltas.setdefault(owner(v), []).append((v, u, weight_vu, weight_uv, owner(u)))
+    for shard_id, entries in deltas.items():
+        assert shards[shard_id].apply_delta(*map(np.array, zip(*entries))) == len(entries)
+        assert shards[shard_id].version == 2
+    print(f"Applied {sum(map(len, deltas.values()))} connection changes; "
+          f"overlay slots {[shard.stats()['overlay_slots'] for shard in shards]}")
+    assert_shards_match(graph, shards, owner)
+
+    # Folding the overlay in (as a compaction or an upload does) changes nothing
+    shards = [GraphShard.from_bytes(shard.to_bytes()) for shard in shards]
+    assert all(shard.stats()['overlay_slots'] == 0 for shard in shards)
+    assert_shards_match(graph, shards, owner)
+
+    try:
+        foreign = int(shards[0].ghosts[0])  # A user the shard knows is owned elsewhere
+        shards[0].apply_delta(np.array([foreign]), np.array([0]), np.array([0.5]), np.array([np.nan]), np.array([0]))
+        assert False, "applied a delta for a node owned by another shard"
+    except ValueError:
+        assert shards[0].version == 2
+    print()
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_shard_nodes(count):
+    """Run trust_shard_api.py in local processes standing in for shard nodes"""
+    ports = [_free_port() for _ in range(count)]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trust_shard_api.py')
+    processes = [subprocess.Popen([sys.executable, script, str(port)], stdout=subprocess.DEVNULL)
+                 for port in ports]
+    urls = [f'http://127.0.0.1:{port}' for port in ports]
+    deadline = time.time() + 60
+    for url in urls:
+        while True:
+            try:
+                requests.get(url, timeout=1).raise_for_status()
+                break
+            except requests.RequestException:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.2)
+    return processes, urls
+
+def test_sharded_propagation():
+    """Test multi-hop propagation across shard node processes as the graph changes"""
+    print("=" * 60)
+    print("TEST 4: Sharded Propagation Across Node Processes")
+    print("=" * 60)
+
+    import trust_propagation_api as api
+    from fastapi.testclient import TestClient
+    from load_test_trust_propagation_api import check_state
+
+    processes, urls = start_shard_nodes(3)
+    api.shard_coordinator = ShardCoordinator(urls, lock=api.state_lock.read)
+    try:
+        client = TestClient(api.app)
+        followers, interactions = community_relationships(seed=2)
+        users = sorted({f['follower_id'] for f in followers})
+        scores = {user: 0.8 for user in users}
+        assert client.post('/build-graph', json={'followers': followers, 'interactions': interactions,
+                                                 'trust_scores': scores}).status_code == 200
+
+        cases = [{'max_hops': 3}, {'max_hops': 3, 'epsilon': 0.03}, {'max_hops': 3, 'max_fanout': 4}]
+        def assert_matches(sample):
+            graph = api.trust_service.graph
+            for user in sample:
+                for case in cases:
+                    local = api.trust_service.compute_user_ban_penalties(user, **case)
+                    args = {'banned_user_id': user, 'base_penalty': 0.15, 'epsilon': 0.0, 'max_fanout': None, **case}
+                    sharded, sharded_graph, version = api._compute_on_shards(args)
+                    assert sharded_graph is graph and version == graph.version
+                    for name, values in local.items():
+                        np.testing.assert_array_equal(np.asarray(sharded[name]), np.asarray(values))
+
+        assert_matches(users[::25])
+        stats = client.get('/shards').json()
+        print(f"Matched {len(users[::25]) * len(cases)} propagations; edge cut {stats['edge_cut']}, "
+              f"owned {[shard['num_owned'] for shard in stats['shards']]}")
+        assert stats['rebalances'] == 1 and stats['versions'] == [1, 1, 1]
+
+        # The coordinator keeps the partition map, not the graph
+        coordinator = api.shard_coordinator
+        assert not any(isinstance(value, SocialGraph) for value in vars(coordinator).values())
+        assert len(coordinator.shard_of) == api.trust_service.graph.num_nodes
+
+        # Graph changes go to the owning shards only; the partition stays put
+        owners = {int(coordinator.shard_of[api.trust_service.graph.index_of(user)]) for user in (users[0], users[-1])}
+        assert client.post('/add-follows', json={'followers': [{'follower_id': users[0],
+                                                                'following_id': users[-1]}]}).status_code == 200
+        stats = client.get('/shards').json()
+        print(f"After one follow: shard versions {stats['versions']}, rebalances {stats['rebalances']}")
+        assert stats['rebalances'] == 1
+        assert [shard for shard, version in enumerate(stats['versions']) if version == 2] == sorted(owners)
+        assert stats['graph_version'] == api.trust_service.graph.version
+
+        result = client.post('/propagate-ban', json={'banned_user_id': users[-1], 'max_hops': 3}).json()
+        print(f"Propagation through the API: {result['summary']['total_affected']} users")
+        assert result['summary']['total_affected'] > 0
+        assert result['affected_users'][users[0]]['distance'] == 1
+
+        # New users, unfollows and interactions, then an explicit rebalance
+        new_follows = [{'follower_id': f'new{i}', 'following_id': users[i * 11]} for i in range(6)]
+        new_follows.append({'follower_id': 'new0', 'following_id': 'new6'})
+        assert client.post('/add-follows', json={'followers': new_follows}).status_code == 200
+        assert client.post('/remove-follows', json={'followers': followers[::10]}).status_code == 200
+        assert client.post('/add-interactions', json={'interactions': [
+            {'user_id': users[i], 'target_user_id': f'new{i % 7}', 'type': 'like', 'weight': 0.6}
+            for i in range(0, 60, 6)]}).status_code == 200
+        assert client.get('/shards').json()['rebalances'] == 1
+        assert_matches(users[::25] + ['new0', 'new3', 'new6'])
+
+        stats = client.post('/shards/rebalance').json()
+        print(f"Rebalanced: edge cut {stats['edge_cut']}, versions {stats['versions']}")
+        assert stats['rebalances'] == 2 and len(set(stats['versions'])) == 1
+        assert_matches(users[::25] + ['new0'])
+
+        # Replacing the graph drops the partition until the new graph is uploaded
+        generation = coordinator.generation
+        with api.state_lock.write:
+            coordinator.detach()
+        assert coordinator.hop_distances(0, 2) == (None, None)
+        assert client.post('/build-graph', json={'followers': followers, 'interactions': interactions,
+                                                 'trust_scores': scores}).status_code == 200
+        stats = client.get('/shards').json()
+        assert coordinator.generation == generation + 2 and stats['synced'] and stats['rebalances'] == 3
+        assert_matches(users[::50])
+
+        # The log replays the sharded propagation with the in-process traversal
+        checks = check_state()
+        print(f"Replay matches: {all(checks.values())}")
+        assert all(checks.values())
+    finally:
+        api.shard_coordinator.close()
+        api.shard_coordinator = None
+        for process in processes:
+            process.terminate()
+            process.wait()
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("GRAPH SHARDS - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_partition()
+    test_shard_expansion()
+    test_shard_deltas()
+    test_sharded_propagation()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
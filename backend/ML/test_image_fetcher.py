@@ -0,0 +1,188 @@
+"""
+Test script for the pooled, bounded and cached image fetcher
+Runs against a local http.server stand-in for the image hosts
+"""
+
+import os
+import time
+import tempfile
+import threading
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from image_fetcher import ImageFetcher
+
+class ImageHost(BaseHTTPRequestHandler):
+    """Stand-in image host counting full responses, 304s and client connections"""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    version = 1
+    full_responses = {}
+    not_modified = 0
+    clients = set()
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, headers=(), length=True):
+        self.send_response(200)
+        for name, value in headers:
+            self.send_header(name, value)
+        if length:
+            self.send_header('Content-Length', str(len(body)))
+        else:
+            self.send_header('Connection', 'close')  # Body ends when the connection closes
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+        with ImageHost.lock:
+            ImageHost.full_responses[self.path] = ImageHost.full_responses.get(self.path, 0) + 1
+
+    def send_not_modified(self):
+        self.send_response(304)
+        self.end_headers()
+        with ImageHost.lock:
+            ImageHost.not_modified += 1
+
+    def do_GET(self):
+        with ImageHost.lock:
+            ImageHost.clients.add(self.client_address)
+        name = self.path.strip('/').split('/')[0]
+        if name == 'etag':
+            etag = f'"v{ImageHost.version}"'
+            if self.headers.get('If-None-Match') == etag:
+                return self.send_not_modified()
+            self.send_body(f"{self.path} version {ImageHost.version}".encode() * 50, [('ETag', etag)])
+        elif name == 'modified':
+            last_modified = 'Mon, 05 Oct 2026 10:00:00 GMT'
+            if self.headers.get('If-Modified-Since') == last_modified:
+                return self.send_not_modified()
+            self.send_body(b'modified image' * 50, [('Last-Modified', last_modified)])
+        elif name == 'slow':
+            time.sleep(0.3)
+            self.send_body(self.path.encode())
+        elif name == 'big':
+            self.send_body(b'x' * 5000)
+        elif name == 'streamed':
+            self.send_body(b'x' * 5000, length=False)
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+def start_host():
+    ImageHost.version = 1
+    ImageHost.full_responses, ImageHost.not_modified, ImageHost.clients = {}, 0, set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHost)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def test_pooled_concurrent_fetch():
+    """Test keep-alive reuse, concurrent prefetch and fetching each distinct URL once"""
+    print("=" * 60)
+    print("TEST 1: Pooled Concurrent Fetch")
+    print("=" * 60)
+
+    server, host = start_host()
+    fetcher = ImageFetcher(max_workers=8)
+    try:
+        for i in range(5):
+            fetcher.fetch(f"{host}/slow/{i}")
+        print(f"5 sequential fetches used {len(ImageHost.clients)} connection(s)")
+        assert len(ImageHost.clients) == 1
+
+        urls = [f"{host}/slow/p{i}" for i in range(8)]
+        start = time.perf_counter()
+        fetched = fetcher.fetch_many(urls + urls[:3])
+        elapsed = time.perf_counter() - start
+        print(f"8 URLs taking 0.3s each fetched in {elapsed:.2f}s")
+        assert elapsed < 1.2
+        assert fetched == {url: url[len(host):].encode() for url in urls}
+        assert all(ImageHost.full_responses[url[len(host):]] == 1 for url in urls)
+    finally:
+        fetcher.close()
+        server.shutdown()
+    print()
+
+def test_size_limit_and_errors():
+    """Test that oversized bodies are rejected, with or without Content-Length"""
+    print("=" * 60)
+    print("TEST 2: Max Bytes and Errors")
+    print("=" * 60)
+
+    server, host = start_host()
+    fetcher = ImageFetcher(max_bytes=1000)
+    try:
+        fetched = fetcher.fetch_many([f"{host}/big", f"{host}/streamed", f"{host}/missing", f"{host}/slow/ok"])
+        for path in ('/big', '/streamed'):
+            assert isinstance(fetched[host + path], ValueError), fetched[host + path]
+            print(f"{path}: {fetched[host + path]}")
+        assert isinstance(fetched[f"{host}/missing"], requests.HTTPError)
+        assert fetched[f"{host}/slow/ok"] == b'/slow/ok'
+        assert ImageFetcher(max_bytes=5000).fetch(f"{host}/streamed") == b'x' * 5000
+    finally:
+        fetcher.close()
+        server.shutdown()
+    print()
+
+def test_disk_cache():
+    """Test revalidation with ETag and Last-Modified, changed images, corruption and eviction"""
+    print("=" * 60)
+    print("TEST 3: Revalidated Disk Cache")
+    print("=" * 60)
+
+    server, host = start_host()
+    cache_dir = tempfile.mkdtemp(prefix="image_cache_test_")
+    try:
+        first = ImageFetcher(cache_dir=cache_dir)
+        body = first.fetch(f"{host}/etag/1")
+        modified = first.fetch(f"{host}/modified/1")
+
+        # A new fetcher (e.g. after a restart) revalidates instead of downloading
+        second = ImageFetcher(cache_dir=cache_dir)
+        assert second.fetch(f"{host}/etag/1") == body
+        assert second.fetch(f"{host}/modified/1") == modified
+        print(f"Second fetcher: {second.stats}, server 304s: {ImageHost.not_modified}")
+        assert second.stats['downloads'] == 0 and second.stats['revalidated'] == 2
+        assert ImageHost.full_responses == {'/etag/1': 1, '/modified/1': 1}
+
+        # A changed image is downloaded again and replaces the cached copy
+        ImageHost.version = 2
+        changed = second.fetch(f"{host}/etag/1")
+        assert changed != body and b'version 2' in changed
+        assert ImageFetcher(cache_dir=cache_dir).fetch(f"{host}/etag/1") == changed
+        assert ImageHost.full_responses['/etag/1'] == 2
+
+        # A damaged cache file is ignored
+        path = second._cache_path(f"{host}/modified/1")
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 10)
+        assert ImageFetcher(cache_dir=cache_dir).fetch(f"{host}/modified/1") == modified
+        assert ImageHost.full_responses['/modified/1'] == 2
+
+        # Least recently used files are evicted beyond max_cache_bytes
+        small = ImageFetcher(cache_dir=cache_dir, max_cache_bytes=4000)
+        for i in range(6):
+            small.fetch(f"{host}/etag/{i}")
+            time.sleep(0.01)
+        cached = [name for name in os.listdir(cache_dir) if name.endswith('.img')]
+        total = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in cached)
+        print(f"Cache after eviction: {len(cached)} files, {total} bytes")
+        assert total <= 4000 and os.path.exists(small._cache_path(f"{host}/etag/5"))
+        assert not os.path.exists(small._cache_path(f"{host}/etag/0"))
+    finally:
+        server.shutdown()
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("IMAGE FETCHER - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_pooled_concurrent_fetch()
+    test_size_limit_and_errors()
+    test_disk_cache()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
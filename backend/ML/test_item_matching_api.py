@@ -0,0 +1,116 @@
+"""
+Test script for the embedding cache of the S-BERT item matching API
+A stand-in model replaces S-BERT and records every text it encodes
+"""
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+# Keep the test's index out of Data/item_index; set before the API module reads it
+os.environ['ITEM_INDEX_DIR'] = tempfile.mkdtemp(prefix='item_index_')
+import item_matching_api as api
+
+class StandInModel:
+    """Deterministic vector per text, recording each encode call"""
+
+    def __init__(self, dim=32):
+        self.dim = dim
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False, convert_to_numpy=True):
+        self.calls.append(list(texts))
+        vectors = np.stack([
+            np.random.default_rng(int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)).normal(size=self.dim)
+            for text in texts
+        ])
+        if normalize_embeddings:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    @property
+    def encoded(self):
+        return [text for call in self.calls for text in call]
+
+def lost_items(count, start=0):
+    return [{'id': f'lost_{i}', 'title': f'Black wallet {i}', 'category': 'Wallet', 'location': 'Bus Stand'}
+            for i in range(start, start + count)]
+
+def use_stand_in():
+    api.model = StandInModel()
+    api.embedding_cache.clear()
+    return api.model
+
+def test_cache_reuse():
+    """Test that unchanged items are not re-encoded and edited items are"""
+    print("=" * 60)
+    print("TEST 1: Cached And Edited Items")
+    print("=" * 60)
+
+    model = use_stand_in()
+    items = lost_items(10)
+    first = api.encode_items(items)
+    assert first.shape == (10, model.dim) and first.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(first, axis=1), 1.0, atol=1e-6)
+    assert len(model.calls) == 1 and len(model.encoded) == 10  # One batched call
+
+    second = api.encode_items(items)
+    print(f"Second request: {len(model.calls) - 1} extra encode calls")
+    assert len(model.calls) == 1
+    np.testing.assert_array_equal(second, first)
+
+    # Editing an item changes its text, so only that item is encoded again
+    edited = dict(items[3], description='Brown leather, torn strap')
+    third = api.encode_items(items[:3] + [edited] + items[4:])
+    print(f"After editing one item: encoded {model.calls[-1]}")
+    assert model.calls[-1] == [api.create_item_text(edited)]
+    assert not np.allclose(third[3], first[3])
+    np.testing.assert_array_equal(np.delete(third, 3, axis=0), np.delete(first, 3, axis=0))
+    print()
+
+def test_cache_size():
+    """Test that the cache is trimmed to EMBEDDING_CACHE_SIZE, least recently used first"""
+    print("=" * 60)
+    print("TEST 2: Cache Size Limit")
+    print("=" * 60)
+
+    size = api.EMBEDDING_CACHE_SIZE
+    api.EMBEDDING_CACHE_SIZE = 5
+    try:
+        model = use_stand_in()
+        items = lost_items(8)
+        api.encode_items(items)
+        print(f"Cached {len(api.embedding_cache)} of {len(items)} items")
+        assert len(api.embedding_cache) == 5
+        assert [key[0] for key in api.embedding_cache] == [item['id'] for item in items[3:]]
+
+        # Using an item keeps it; the oldest one makes room for a new item
+        api.encode_items(items[3:4])
+        api.encode_items(lost_items(1, start=8))
+        assert len(api.embedding_cache) == 5
+        assert [key[0] for key in api.embedding_cache] == ['lost_5', 'lost_6', 'lost_7', 'lost_3', 'lost_8']
+
+        # An evicted item is encoded again
+        encoded = len(model.encoded)
+        api.encode_items(items[:1])
+        assert model.encoded[encoded:] == [api.create_item_text(items[0])]
+        assert len(api.embedding_cache) == 5
+    finally:
+        api.EMBEDDING_CACHE_SIZE = size
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("ITEM MATCHING API - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_cache_reuse()
+    test_cache_size()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
@@ -0,0 +1,140 @@
+"""
+Test script for the multimodal similarity arithmetic and the two-stage rerank cascade
+"""
+
+import numpy as np
+from match_scoring import combine_similarities, cascade_similarities, text_stage_bounds, item_similarities
+from benchmark_matching_cascade import generate_items
+
+def split(encoded, rows):
+    return {name: values[rows] for name, values in encoded.items()}
+
+def test_cascade_matches_exhaustive():
+    """Test that reranking every candidate with an image reproduces exhaustive scoring"""
+    print("=" * 60)
+    print("TEST 1: Full Rerank Equals Exhaustive Scoring")
+    print("=" * 60)
+
+    items, encoded = generate_items(400, seed=1)
+    for q in (0, 1, 2):
+        rows = np.arange(3, 400)
+        candidate_items = [items[i] for i in rows]
+        query, candidates = split(encoded, np.array([q])), split(encoded, rows)
+        declares_image = np.array([bool(item['images']) for item in candidate_items])
+
+        exact = combine_similarities(items[q], candidate_items, query, candidates)
+        cascade = cascade_similarities(items[q], candidate_items, query, candidates['text_emb'],
+                                       candidates['has_text'], declares_image,
+                                       lambda p: (candidates['image_emb'][p], candidates['has_image'][p]),
+                                       rerank_size=len(rows))
+        for name in ('image_sim', 'text_sim', 'cross_modal_sim', 'combined_sim'):
+            np.testing.assert_allclose(cascade[name], exact[name], atol=1e-12)
+        assert not cascade['similarity_error'].any()
+    print(f"Reranked {int(cascade['reranked'].sum())} of {len(rows)} candidates; scores identical")
+
+    # Image embeddings known up front (sent by the client) are scored exactly without reranking
+    known = np.arange(len(rows)) % 2 == 0
+    known_images = (np.where(known[:, None], candidates['image_emb'], 0.0), candidates['has_image'] & known)
+    cascade = cascade_similarities(items[q], candidate_items, query, candidates['text_emb'],
+                                   candidates['has_text'], declares_image & ~known,
+                                   lambda p: (candidates['image_emb'][p], candidates['has_image'][p]),
+                                   rerank_size=0, known_images=known_images)
+    np.testing.assert_allclose(cascade['combined_sim'][known], exact['combined_sim'][known], atol=1e-12)
+    assert not cascade['similarity_error'][known].any() and not cascade['reranked'].any()
+    print()
+
+def test_bounds():
+    """Test that estimates stay within their error bound and only top candidates load images"""
+    print("=" * 60)
+    print("TEST 2: Bounded Estimates")
+    print("=" * 60)
+
+    items, encoded = generate_items(600, seed=2)
+    rows = np.arange(1, 600)
+    candidate_items = [items[i] for i in rows]
+    declares_image = np.array([bool(item['images']) for item in candidate_items])
+
+    # Queries with text and image, text only and image only
+    variants = [split(encoded, np.array([0]))]
+    variants.append(dict(variants[0], has_image=np.array([False]), image_emb=np.zeros_like(variants[0]['image_emb'])))
+    variants.append(dict(variants[0], has_text=np.array([False]), text_emb=np.zeros_like(variants[0]['text_emb'])))
+    candidates = split(encoded, rows)
+    for query in variants:
+        exact = combine_similarities(items[0], candidate_items, query, candidates)['combined_sim']
+        lower, upper, unresolved = text_stage_bounds(items[0], candidate_items, query, candidates['text_emb'],
+                                                     candidates['has_text'], declares_image)
+        assert np.all(lower <= exact + 1e-9) and np.all(exact <= upper + 1e-9)
+        assert np.array_equal(unresolved, declares_image)
+
+        requested = []
+        def encode_images(positions):
+            requested.extend(positions.tolist())
+            return candidates['image_emb'][positions], candidates['has_image'][positions]
+        cascade = cascade_similarities(items[0], candidate_items, query, candidates['text_emb'],
+                                       candidates['has_text'], declares_image, encode_images, rerank_size=20)
+        assert len(requested) == 20 and declares_image[requested].all()
+        assert np.all(upper[requested].min() >= upper[declares_image & ~cascade['reranked']])
+        error = np.abs(cascade['combined_sim'] - exact)
+        assert np.all(error <= cascade['similarity_error'] + 1e-9)
+        assert not cascade['similarity_error'][cascade['reranked'] | ~declares_image].any()
+
+        # Estimated candidates report the image terms they lack as NaN, and only those
+        estimated = cascade['estimated']
+        assert np.array_equal(estimated, declares_image & ~cascade['reranked'])
+        for name, needs_image in (('image_sim', query['has_image'][0]), ('cross_modal_sim', query['has_text'][0])):
+            assert np.array_equal(np.isnan(cascade[name]), estimated & needs_image), name
+        print(f"Max estimate error {error.max():.4f}, max bound {cascade['similarity_error'].max():.4f}")
+    print()
+
+def test_multi_image_similarity():
+    """Test that every image pair is scored and aggregated by max or mean of the top pairs"""
+    print("=" * 60)
+    print("TEST 3: Multi-Image Similarity")
+    print("=" * 60)
+
+    items, encoded = generate_items(40, seed=3)
+    text, images = encoded['text_emb'].astype(np.float64), encoded['image_emb'].astype(np.float64)
+    images = images[encoded['has_image']]
+
+    # One image each reproduces the single-image terms of combine_similarities
+    first, second = np.flatnonzero(encoded['has_image'])[:2]
+    exact = combine_similarities({}, [{}], split(encoded, np.array([first])), split(encoded, np.array([second])))
+    single = item_similarities(text[first], images[:1], text[second], images[1:2])
+    for name in ('image_sim', 'text_sim', 'cross_modal_sim', 'combined_sim'):
+        assert abs(single[name] - exact[name][0]) < 1e-9
+
+    # Several images: the best pair, or the mean of the best pairs
+    images1, images2 = images[:3], images[3:7]
+    pairs = np.array([[np.dot(a, b) for b in images2] for a in images1])
+    best = item_similarities(text[0], images1, text[1], images2)
+    assert abs(best['image_sim'] - pairs.max()) < 1e-9
+    expected_cross = (max(np.dot(a, text[1]) for a in images1) + max(np.dot(b, text[0]) for b in images2)) / 2
+    assert abs(best['cross_modal_sim'] - expected_cross) < 1e-9
+    top = item_similarities(text[0], images1, text[1], images2, aggregation='mean_top_k', top_k=3)
+    assert abs(top['image_sim'] - np.sort(pairs.ravel())[-3:].mean()) < 1e-9
+    assert top['image_sim'] <= best['image_sim']
+    print(f"max {best['image_sim']:.4f}, mean of top 3 {top['image_sim']:.4f} over {pairs.size} pairs")
+
+    # Missing text or images leave their terms at 0
+    no_images = item_similarities(text[0], images[:0], None, images2)
+    assert no_images['image_sim'] == 0.0 and no_images['text_sim'] == 0.0
+    assert abs(no_images['cross_modal_sim'] - max(np.dot(b, text[0]) for b in images2)) < 1e-9
+    try:
+        item_similarities(text[0], images1, text[1], images2, aggregation='median')
+        assert False, "unknown aggregation accepted"
+    except ValueError:
+        pass
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("MATCH SCORING - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_cascade_matches_exhaustive()
+    test_bounds()
+    test_multi_image_similarity()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
@@ -0,0 +1,141 @@
+"""
+Test script for the metadata inverted index used to prefilter match candidates
+"""
+
+import numpy as np
+from datetime import date, timedelta
+from metadata_index import MetadataIndex, RELATED_CATEGORIES, location_tokens
+from vector_index import VectorIndex
+
+CATEGORIES = ['Wallet', 'Mobile', 'ID Card', 'Bag', 'Pet', 'Electronics', 'Documents', 'Others', '']
+PLACES = ['Central Park', 'City Bus Stand', 'Railway Station, Platform 2', 'College Library',
+          'Lulu Mall', 'near the Central Library', '']
+
+def random_items(n, seed=0):
+    rng = np.random.default_rng(seed)
+    start = date(2026, 1, 1)
+    items = []
+    for i in range(n):
+        item = {'id': f'item{i}', 'title': f'item {i}',
+                'category': CATEGORIES[rng.integers(len(CATEGORIES))],
+                'location': PLACES[rng.integers(len(PLACES))]}
+        if rng.random() < 0.9:
+            item['date'] = (start + timedelta(days=int(rng.integers(0, 365)))).isoformat()
+        items.append(item)
+    return items
+
+def passes(query, item, window_days=30, bucket_days=7):
+    """Brute-force version of the three filters"""
+    q_cat, i_cat = query.get('category', '').lower(), item.get('category', '').lower()
+    if q_cat and q_cat != 'others' and i_cat and i_cat != 'others':
+        if i_cat != q_cat and i_cat not in RELATED_CATEGORIES.get(q_cat, set()):
+            return False
+    q_loc, i_loc = location_tokens(query.get('location')), location_tokens(item.get('location'))
+    if q_loc and i_loc and not q_loc & i_loc:
+        return False
+    if query.get('date') and item.get('date'):
+        q_day, i_day = date.fromisoformat(query['date']).toordinal(), date.fromisoformat(item['date']).toordinal()
+        if not (q_day - window_days) // bucket_days <= i_day // bucket_days <= (q_day + window_days) // bucket_days:
+            return False
+    return True
+
+def test_filters():
+    """Test that the posting-set filters agree with checking every item"""
+    print("=" * 60)
+    print("TEST 1: Category, Location And Date Filters")
+    print("=" * 60)
+
+    items = random_items(2000)
+    index = MetadataIndex.from_items(items)
+    sizes = []
+    for query in random_items(100, seed=1):
+        keys = index.candidates(query)
+        expected = {i for i, item in enumerate(items) if passes(query, item)}
+        assert (keys if keys is not None else set(range(len(items)))) == expected
+        sizes.append(len(expected))
+    print(f"Candidates kept: {np.mean(sizes):.0f} of {len(items)} on average")
+    assert np.mean(sizes) < 0.2 * len(items)
+
+    # Queries without metadata keep every item
+    assert index.candidates({'title': 'wallet'}) is None
+    assert location_tokens('Near the Central Park, Main Road') == {'central', 'park'}
+    print()
+
+def test_fallback():
+    """Test widening the search when too few candidates survive"""
+    print("=" * 60)
+    print("TEST 2: Fallback To A Wider Search")
+    print("=" * 60)
+
+    items = [
+        {'id': 'a', 'category': 'Wallet', 'location': 'Central Park', 'date': '2026-03-02'},
+        {'id': 'b', 'category': 'Wallet', 'location': 'Bus Stand', 'date': '2026-03-05'},
+        {'id': 'c', 'category': 'ID Card', 'location': 'Mall', 'date': '2026-09-01'},
+        {'id': 'd', 'category': 'Mobile', 'location': 'Central Park', 'date': '2026-03-03'},
+        {'id': 'e', 'category': 'Pet', 'location': 'Library', 'date': '2026-03-01'}
+    ]
+    index = MetadataIndex.from_items(items)
+    query = {'category': 'Wallet', 'location': 'central park gate', 'date': '2026-03-04'}
+
+    keys, applied = index.prefilter(query, min_candidates=1)
+    print(f"min_candidates=1: {sorted(keys)} with {applied}")
+    assert keys == {0} and applied == ['category', 'location', 'date']
+
+    keys, applied = index.prefilter(query, min_candidates=2)
+    print(f"min_candidates=2: {sorted(keys)} with {applied}")
+    assert keys == {0, 1} and applied == ['category', 'date']
+
+    keys, applied = index.prefilter(query, min_candidates=3)
+    assert keys == {0, 1, 2} and applied == ['category']
+
+    keys, applied = index.prefilter(query, min_candidates=4)
+    assert keys is None and applied == []
+
+    # A wider date window keeps more, and removed items are gone from every posting
+    assert index.prefilter(query, min_candidates=3, fallback=('location',), window_days=200)[0] == {0, 1, 2}
+    assert index.remove(1) and not index.remove(1)
+    assert index.prefilter(query, min_candidates=2)[0] == {0, 2}
+    assert all(1 not in posting for postings in index._postings.values() for posting in postings.values())
+    print()
+
+def test_indexed_search():
+    """Test restricting item index search to prefiltered candidates"""
+    print("=" * 60)
+    print("TEST 3: Prefiltered Item Index Search")
+    print("=" * 60)
+
+    items = random_items(3000, seed=2)
+    rng = np.random.default_rng(3)
+    vectors = rng.normal(size=(len(items), 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    vector_index = VectorIndex(flat_threshold=1000)
+    vector_index.add_many([item['id'] for item in items], vectors, items)
+    metadata = MetadataIndex()
+    for item_id, item in vector_index.items():
+        metadata.add(item_id, item)
+
+    for query_item, query in zip(random_items(20, seed=4), rng.normal(size=(20, 32))):
+        include, _ = metadata.prefilter(query_item)
+        stats = {}
+        hits = vector_index.search(query, k=10, include=include, stats=stats)
+        assert include is None or {item_id for item_id, _ in hits} <= include
+        allowed = [i for i, item in enumerate(items) if include is None or item['id'] in include]
+        scores = vectors[allowed] @ (query / np.linalg.norm(query))
+        expected = {items[allowed[i]]['id'] for i in np.argsort(-scores)[:10]}
+        if stats['mode'] == 'subset':
+            assert {item_id for item_id, _ in hits} == expected
+    print(f"Last query: {stats['scanned']} vectors scanned in {stats['mode']} mode of {len(vector_index)}")
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("METADATA INDEX - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_filters()
+    test_fallback()
+    test_indexed_search()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
@@ -3,9 +3,12 @@ Test script for Multimodal Item Matching
 Demonstrates CLIP + GNN integration
 """
 
+import io
+import base64
 import requests
 import json
 from datetime import datetime, timedelta
+from PIL import Image
 
 API_URL = "http://localhost:5003"
 
@@ -244,6 +247,73 @@ def test_full_matching():
     
     return response.status_code == 200
 
+def image_data_uri(color):
+    """Small solid-color PNG as a data URI, so image cases need no network"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, format='PNG')
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def test_match_consistency():
+    """Test that batched /match scores equal per-pair /similarity scores"""
+    print("\n" + "="*60)
+    print("Testing /match Against /similarity")
+    print("="*60)
+    
+    query_item = {
+        "id": "found_bag_1",
+        "title": "Blue Backpack Found",
+        "category": "Bag",
+        "description": "Blue backpack with laptop compartment found in library",
+        "location": "Main Library"
+    }
+    candidate_items = [
+        {"id": "lost_bag_1", "user_id": "user1", "title": "Lost Backpack", "category": "bag",
+         "description": "Navy blue backpack with a laptop inside", "location": "Library"},
+        {"id": "lost_keys_1", "user_id": "user2", "title": "Lost Keys", "category": "Keys",
+         "description": "Car keys on a red keychain", "location": "Parking lot"},
+        {"id": "lost_item_1", "user_id": "user3", "title": "Lost Umbrella"}
+    ]
+    
+    # With images: /match and /similarity both compare the first images
+    image_query = dict(query_item, id="found_bag_2", images=[image_data_uri('blue'), image_data_uri('black')])
+    image_candidates = [
+        dict(candidate_items[0], id="lost_bag_2", images=[image_data_uri('navy'), image_data_uri('blue')]),
+        dict(candidate_items[1], id="lost_keys_2", images=[image_data_uri('red')]),
+        {"id": "lost_photo_1", "user_id": "user4", "images": [image_data_uri('gray'), image_data_uri('black')]}
+    ]
+    
+    consistent = check_match_consistency(query_item, candidate_items)
+    consistent = check_match_consistency(image_query, image_candidates) and consistent
+    
+    # all_images compares every pair, so the second images now count too
+    pair = requests.post(f"{API_URL}/similarity", json={"item1": image_query, "item2": image_candidates[0],
+                                                        "all_images": True}).json()
+    first = requests.post(f"{API_URL}/similarity", json={"item1": image_query, "item2": image_candidates[0]}).json()
+    print(f"  - all_images image similarity {pair['details']['image_similarity']:.4f}, "
+          f"first images {first['details']['image_similarity']:.4f}")
+    consistent = consistent and pair['details']['image_similarity'] >= first['details']['image_similarity']
+    
+    print(f"\n{'✓' if consistent else '✗'} Batched scores match per-pair scores")
+    return consistent
+
+def check_match_consistency(query_item, candidate_items):
+    """Score candidates with /match and pair by pair with /similarity"""
+    response = requests.post(f"{API_URL}/match", json={
+        "query_item": query_item,
+        "candidate_items": candidate_items,
+        "threshold": 0.0,
+        "top_k": len(candidate_items)
+    })
+    matches = {match['item']['id']: match for match in response.json()['matches']}
+    
+    consistent = len(matches) == len(candidate_items)
+    for candidate in candidate_items:
+        pair = requests.post(f"{API_URL}/similarity", json={"item1": query_item, "item2": candidate}).json()
+        batched = matches[candidate['id']]['similarity_score']
+        print(f"  - {candidate['id']}: /match {batched:.4f}, /similarity {pair['similarity_score']:.4f}")
+        consistent = consistent and abs(batched - pair['similarity_score']) < 1e-4
+    return response.status_code == 200 and consistent
+
 def main():
     """Run all tests"""
     print("\n" + "="*60)
@@ -255,7 +325,8 @@ def main():
         ("Health Check", test_health),
         ("Multimodal Similarity", test_similarity),
         ("GNN Trust Scoring", test_trust_scores),
-        ("Full Matching Pipeline", test_full_matching)
+        ("Full Matching Pipeline", test_full_matching),
+        ("Batched Match Consistency", test_match_consistency)
     ]
     
     results = []
@@ -2,7 +2,8 @@
 Test script for Trust Propagation Service
 """
 
-from trust_propagation_service import TrustPropagationService, create_sample_social_graph
+import numpy as np
+from trust_propagation_service import TrustPropagationService, ScoreOverlay, create_sample_social_graph
 
 def test_basic_propagation():
     """Test basic trust score propagation"""
@@ -131,6 +132,424 @@ def test_trust_recovery():
         print(f"    Content Trust: {recovery['new_content_trust_score']}")
     print()
 
+def test_csr_graph():
+    """Test the interned CSR graph against the dict-based semantics"""
+    print("=" * 60)
+    print("TEST 5: CSR Social Graph")
+    print("=" * 60)
+    
+    service = TrustPropagationService()
+    followers = [
+        {'follower_id': 'user2', 'following_id': 'user1'},
+        {'follower_id': 'user1', 'following_id': 'user2'},  # Overwrites user2 -> user1 with 0.3
+        {'follower_id': 'user3', 'following_id': 'user1'},
+    ]
+    interactions = [
+        {'user_id': 'user3', 'target_user_id': 'user1', 'type': 'like', 'weight': 0.95},
+        {'user_id': 'user4', 'target_user_id': 'user1', 'type': 'like', 'weight': 0.4},
+        {'user_id': 'user4', 'target_user_id': 'user1', 'type': 'comment', 'weight': 0.2},
+        {'user_id': 'user5', 'type': 'like', 'weight': 1.0},  # No target user: ignored
+    ]
+    service.build_social_graph(followers, interactions)
+    graph = service.graph
+    
+    print(f"\nUsers: {graph.num_users}, connections: {graph.num_connections}, "
+          f"{graph.memory_bytes()} bytes")
+    assert graph.num_users == 4 and graph.num_connections == 3
+    assert graph.indices.dtype == np.int32 and graph.weights.dtype == np.float32
+    assert service.user_graph['user1'] == {'user2', 'user3', 'user4'}
+    assert 'user5' not in service.user_graph
+    
+    weights = service.interaction_weights
+    assert abs(weights[('user2', 'user1')] - 0.3) < 1e-6
+    assert abs(weights[('user1', 'user2')] - 0.8) < 1e-6
+    assert abs(weights[('user3', 'user1')] - 0.95) < 1e-6
+    assert abs(weights[('user4', 'user1')] - 0.4) < 1e-6
+    assert ('user1', 'user4') not in weights
+    assert len(weights) == 5
+    
+    assert service._determine_relationship('user2', 'user1') == "mutual_follow"
+    assert service._determine_relationship('user3', 'user1') == "mutual_follow"
+    assert service._determine_relationship('user4', 'user1') == "follower"
+    assert service._determine_relationship('user1', 'user4') == "following"
+    assert service._determine_relationship('user2', 'user3') == "indirect_connection"
+    
+    affected = service.propagate_ban_penalty('user1', max_hops=2)
+    assert set(affected) == {'user2', 'user3', 'user4'}
+    assert affected['user4']['relationship_type'] == "follower"
+    assert affected['user4']['penalty_applied'] == round(0.15 * 0.4, 4)
+    assert service.propagate_ban_penalty('missing') == {}
+    
+    # No relationships at all builds an empty graph
+    service.build_social_graph([], [{'user_id': 'user5', 'type': 'like', 'weight': 1.0}])
+    assert service.graph.num_users == 0 and service.graph.num_connections == 0
+    assert len(service.graph.indptr) == 1 and len(service.graph.indices) == 0
+    assert service.propagate_ban_penalty('user1') == {}
+    print()
+
+def test_vectorized_propagation():
+    """Test frontier-expansion hop distances and array penalties"""
+    print("=" * 60)
+    print("TEST 6: Vectorized Ban Propagation")
+    print("=" * 60)
+    
+    service = TrustPropagationService()
+    
+    # Hub user0 followed by 200 users who all follow each other in a ring,
+    # plus a chain hanging off user1
+    followers = [{'follower_id': f'user{i}', 'following_id': 'user0'} for i in range(1, 201)]
+    followers += [{'follower_id': f'user{i}', 'following_id': f'user{i % 200 + 1}'} for i in range(1, 201)]
+    followers += [{'follower_id': 'chain1', 'following_id': 'user1'},
+                  {'follower_id': 'chain2', 'following_id': 'chain1'},
+                  {'follower_id': 'chain3', 'following_id': 'chain2'}]
+    service.build_social_graph(followers, [])
+    graph = service.graph
+    
+    distance = graph.hop_distances(graph.index_of('user0'), max_hops=3)
+    hops = {graph.ids[i]: int(d) for i, d in enumerate(distance)}
+    print(f"\nchain distances: {[hops[f'chain{i}'] for i in range(1, 4)]}")
+    assert hops['user0'] == 0 and hops['user150'] == 1
+    assert hops['chain1'] == 2 and hops['chain2'] == 3 and hops['chain3'] == -1
+    
+    affected = service.propagate_ban_penalty('user0', max_hops=3)
+    assert len(affected) == 202 and 'user0' not in affected and 'chain3' not in affected
+    assert [data['distance'] for data in affected.values()] == sorted(data['distance'] for data in affected.values())
+    assert affected['user7']['relationship_type'] == "mutual_follow"
+    assert affected['user7']['penalty_applied'] == round(0.15 * 0.8, 4)
+    assert affected['chain1']['relationship_type'] == "indirect_connection"
+    assert affected['chain1']['penalty_applied'] == round(0.15 * 0.5 / 2 ** 1.5, 4)
+    
+    penalties = service.compute_ban_penalties(graph.index_of('user0'), max_hops=1)
+    assert len(penalties['user_index']) == 200
+    assert np.all(penalties['distance'] == 1)
+    print()
+
+def test_batch_ban_propagation():
+    """Test combined penalties for several banned users"""
+    print("=" * 60)
+    print("TEST 7: Batch Ban Propagation")
+    print("=" * 60)
+    
+    followers = [
+        {'follower_id': 'both', 'following_id': 'ring1'},
+        {'follower_id': 'both', 'following_id': 'ring2'},
+        {'follower_id': 'one', 'following_id': 'ring1'},
+        {'follower_id': 'ring2', 'following_id': 'ring1'},
+    ]
+    
+    def run(banned, **kwargs):
+        service = TrustPropagationService()
+        service.build_social_graph(followers, [])
+        service.set_user_trust_scores({'both': 0.8, 'one': 0.8})
+        return service.propagate_ban_penalties(banned, max_hops=2, **kwargs)
+    
+    combined = run(['ring1', 'ring2'], aggregation='max')
+    print(f"\nmax: { {u: d['penalty_applied'] for u, d in combined.items()} }")
+    assert set(combined) == {'both', 'one'}  # Banned users are not penalized
+    assert combined['both']['banned_connections'] == 2
+    assert combined['one']['banned_connections'] == 2  # ring2 via ring1
+    assert combined['one']['distance'] == 1
+    assert combined['both']['penalty_applied'] == 0.12
+    assert combined['both']['new_user_trust_score'] == 0.68
+    
+    summed = run(['ring1', 'ring2'], aggregation='sum')
+    assert summed['both']['penalty_applied'] == 0.24
+    assert run(['ring1', 'ring2'], aggregation='sum', penalty_cap=0.2)['both']['penalty_applied'] == 0.2
+    
+    prob_or = run(['ring1', 'ring2'], aggregation='prob_or')
+    assert prob_or['both']['penalty_applied'] == round(1 - 0.88 ** 2, 4)
+    
+    # Order of the bans does not matter, unknown ids are ignored
+    assert run(['ring2', 'ring1', 'missing'], aggregation='sum') == summed
+    
+    # A ring of banned users reaches nobody else, so nobody is penalized
+    ring = run(['ring1', 'ring2', 'both', 'one'])
+    assert ring == {}
+    service = TrustPropagationService()
+    service.build_social_graph(followers, [])
+    penalties = service.compute_batch_ban_penalties(['ring1', 'ring2', 'both', 'one'])
+    assert len(penalties['penalty']) == 0
+    assert service.penalty_summary(penalties)['total_affected'] == 0
+    
+    # A single ban matches propagate_ban_penalty
+    service = create_sample_social_graph()
+    single = service.propagate_ban_penalty('user1')
+    batch = create_sample_social_graph().propagate_ban_penalties(['user1'])
+    assert list(single) == list(batch)
+    assert all(batch[u].pop('banned_connections') == 1 and batch[u] == single[u] for u in single)
+    
+    try:
+        run(['ring1'], aggregation='mean')
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    print()
+
+def test_incremental_mutations():
+    """Test follow/unfollow/interaction deltas against a rebuilt reference"""
+    print("=" * 60)
+    print("TEST 8: Incremental Graph Mutations")
+    print("=" * 60)
+    
+    rng = np.random.default_rng(3)
+    users = [f'user{i}' for i in range(40)]
+    followers = [{'follower_id': users[a], 'following_id': users[b]}
+                 for a, b in rng.integers(0, 30, (60, 2)) if a != b]
+    service = TrustPropagationService()
+    service.build_social_graph(followers, [])
+    
+    # Reference: the original dict semantics applied operation by operation
+    adjacency = {u: set(v) for u, v in service.user_graph.items()}
+    weights = dict(service.interaction_weights.items())
+    
+    def connect(u, v):
+        adjacency.setdefault(u, set()).add(v)
+        adjacency.setdefault(v, set()).add(u)
+    
+    for step in range(400):
+        a, b = (users[i] for i in rng.choice(40, 2, replace=False))
+        op = rng.integers(3)
+        if op == 0:
+            service.add_follows([{'follower_id': a, 'following_id': b}])
+            connect(a, b)
+            weights[(a, b)], weights[(b, a)] = 0.8, 0.3
+        elif op == 1:
+            weight = float(rng.uniform(0.1, 1.0))
+            service.add_interactions([{'user_id': a, 'target_user_id': b, 'type': 'like', 'weight': weight}])
+            connect(a, b)
+            weights[(a, b)] = max(weights.get((a, b), 0), weight)
+        else:
+            removed = service.remove_follows([{'follower_id': a, 'following_id': b}])
+            assert removed == (b in adjacency.get(a, set()))
+            if removed:
+                adjacency[a].discard(b)
+                adjacency[b].discard(a)
+                weights.pop((a, b), None)
+                weights.pop((b, a), None)
+        
+        if step % 100 == 99:
+            service.graph.compact()
+    
+        graph = service.graph
+        expected = {u: v for u, v in adjacency.items() if v}
+        assert dict(service.user_graph.items()) == expected
+        assert graph.num_users == len(expected)
+        assert graph.num_connections == sum(len(v) for v in expected.values()) // 2
+        got = dict(service.interaction_weights.items())
+        assert got.keys() == weights.keys()
+        assert all(abs(got[k] - weights[k]) < 1e-6 for k in weights)
+    
+    # Propagation on the mutated graph matches a graph rebuilt from scratch
+    rebuilt = TrustPropagationService()
+    rebuilt.build_social_graph([], [{'user_id': u, 'target_user_id': v, 'weight': w} for (u, v), w in weights.items()])
+    banned = max(expected, key=lambda u: len(expected[u]))
+    assert service.propagate_ban_penalty(banned) == rebuilt.propagate_ban_penalty(banned)
+    print(f"\n{graph.num_users} users, {graph.num_connections} connections after 400 deltas")
+    
+    service.patch_trust_scores({'user1': 0.9, 'new_user': 0.7}, {'user1': 0.4})
+    assert service.user_trust_scores['user1'] == 0.9 and service.user_content_trust_scores['user1'] == 0.4
+    assert service.user_content_trust_scores['new_user'] == 0.7
+    print()
+
+def test_dry_run_overlay():
+    """Test previewing bans in an overlay, then committing or rejecting them"""
+    print("=" * 60)
+    print("TEST 9: Dry-Run Overlay")
+    print("=" * 60)
+    
+    service = create_sample_social_graph()
+    before_trust = dict(service.user_trust_scores)
+    before_content = dict(service.user_content_trust_scores)
+    
+    # Two chained previews see each other's changes but not the service's tables
+    overlay = ScoreOverlay(service)
+    preview = service.propagate_ban_penalty('user1', overlay=overlay)
+    service.propagate_ban_penalties(['user5'], overlay=overlay)
+    assert service.user_trust_scores == before_trust
+    assert service.user_content_trust_scores == before_content
+    print(f"\nPreviewed {len(preview)} users, overlay holds {len(overlay)}")
+    
+    expected = create_sample_social_graph()
+    assert expected.propagate_ban_penalty('user1') == preview
+    expected.propagate_ban_penalties(['user5'])
+    assert len(overlay) <= len(expected.user_trust_scores)
+    
+    assert service.commit_overlay(overlay) == len(overlay)
+    assert service.user_trust_scores == expected.user_trust_scores
+    assert service.user_content_trust_scores == expected.user_content_trust_scores
+    
+    # A touched user's score changing makes the preview stale
+    overlay = ScoreOverlay(service)
+    affected = service.propagate_ban_penalty('user2', overlay=overlay)
+    touched = next(iter(affected))
+    service.patch_trust_scores({touched: 0.9})
+    assert not overlay.is_current()
+    try:
+        service.commit_overlay(overlay)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    
+    # ...and so does any graph change
+    overlay = ScoreOverlay(service)
+    service.propagate_ban_penalty('user2', overlay=overlay)
+    assert overlay.is_current()
+    service.add_follows([{'follower_id': 'user9', 'following_id': 'user8'}])
+    assert not overlay.is_current()
+    print()
+
+def test_penalty_ledger_recovery():
+    """Test the penalty ledger and the vectorized recovery job"""
+    print("=" * 60)
+    print("TEST 10: Penalty Ledger Recovery")
+    print("=" * 60)
+    
+    day = 86400.0
+    service = create_sample_social_graph()
+    before = dict(service.user_trust_scores)
+    affected = service.propagate_ban_penalty('user1', penalized_at=0.0)
+    taken = {u: before.get(u, 0.5) - service.user_trust_scores[u] for u in affected}
+    outstanding = service.penalty_ledger.outstanding()
+    print(f"\nLedger: {len(service.penalty_ledger)} penalties for {len(affected)} affected users")
+    assert outstanding.keys() == {u for u, t in taken.items() if t > 0}
+    assert all(abs(outstanding[u] - taken[u]) < 1e-12 for u in outstanding)
+    
+    # Previewing changes nothing
+    scores = dict(service.user_trust_scores)
+    preview = service.run_trust_recovery(now=2 * day, recovery_rate=0.01, apply=False)
+    assert service.user_trust_scores == scores and service.penalty_ledger.outstanding() == outstanding
+    
+    # Each penalty recovers 0.01 per day, up to what it took
+    recovered = service.run_trust_recovery(now=2 * day, recovery_rate=0.01)
+    assert recovered == preview
+    for user_id, data in recovered.items():
+        expected = min(0.02, taken[user_id])
+        assert abs(data['recovery_applied'] - round(expected, 4)) < 1e-9
+        assert abs(service.user_trust_scores[user_id] - min(0.9, scores[user_id] + expected)) < 1e-12
+    
+    # A second run at the same time owes nothing; later runs only the remainder
+    assert service.run_trust_recovery(now=2 * day, recovery_rate=0.01) == {}
+    service.run_trust_recovery(now=100 * day, recovery_rate=0.01)
+    assert len(service.penalty_ledger) == 0
+    for user_id in taken:
+        assert abs(service.user_trust_scores[user_id] - min(0.9, before.get(user_id, 0.5))) < 1e-9
+    
+    # Committed previews are recorded too
+    overlay = ScoreOverlay(service)
+    service.propagate_ban_penalty('user2', overlay=overlay)
+    assert len(service.penalty_ledger) == 0
+    service.commit_overlay(overlay, penalized_at=0.0)
+    assert service.penalty_ledger.outstanding().keys() == {u for u, t in overlay.penalties.items() if t > 0}
+    print()
+
+def test_fanout_cap_and_epsilon():
+    """Test hub fan-out caps and epsilon pruning of ban propagation"""
+    print("=" * 60)
+    print("TEST 11: Fan-Out Cap + Epsilon Pruning")
+    print("=" * 60)
+    
+    # 'banned' follows a hub with 300 followers; 'weak' and 'faint' hang off 'banned'
+    followers = [{'follower_id': 'banned', 'following_id': 'admin'}]
+    followers += [{'follower_id': f'fan{i}', 'following_id': 'admin'} for i in range(300)]
+    followers += [{'follower_id': 'friend', 'following_id': 'banned'},
+                  {'follower_id': 'friend_of_friend', 'following_id': 'friend'},
+                  {'follower_id': 'behind_faint', 'following_id': 'faint'}]
+    interactions = [{'user_id': 'admin', 'target_user_id': f'fan{i}', 'type': 'comment', 'weight': 0.95}
+                    for i in (250, 260)]
+    interactions += [{'user_id': 'faint', 'target_user_id': 'banned', 'type': 'like', 'weight': 0.1}]
+    
+    def build():
+        service = TrustPropagationService()
+        service.build_social_graph(followers, interactions)
+        return service
+    
+    uncapped = build().propagate_ban_penalty('banned', max_hops=2)
+    assert sum(u.startswith('fan') for u in uncapped) == 300
+    
+    # The hub only passes the penalty on to its strongest connections
+    service = build()
+    penalties = service.compute_user_ban_penalties('banned', max_hops=2, max_fanout=5)
+    summary = service.traversal_summary(penalties)
+    capped = service.propagate_ban_penalty('banned', max_hops=2, max_fanout=5)
+    fans = sorted(u for u in capped if u.startswith('fan'))
+    print(f"\nUncapped: {len(uncapped)} affected, capped: {len(capped)} affected, summary: {summary}")
+    assert summary['capped_user_ids'] == ['admin'] and summary['capped_expansions'] == 1
+    assert {'fan250', 'fan260'} <= set(fans) and len(fans) <= 4  # Strongest first, then 'banned' and the lowest indices
+    assert fans == sorted(u for u in build().propagate_ban_penalty('banned', max_hops=2, max_fanout=5) if u.startswith('fan'))
+    assert len(build().propagate_ban_penalty('banned', max_hops=3, max_fanout=5)) <= 5 + 5 * 5 + 5 * 5 * 5
+    
+    # Epsilon drops negligible penalties and stops expanding through them
+    service = build()
+    pruned = service.propagate_ban_penalty('banned', max_hops=2, epsilon=0.02)
+    print(f"Epsilon 0.02: {sorted(pruned)[:4]}... ({len(pruned)} affected)")
+    assert 'faint' not in pruned and 'behind_faint' not in pruned  # 0.15 * 0.1 = 0.015
+    assert 'friend_of_friend' in pruned  # 0.15 * 0.5 / 2 ** 1.5 = 0.027
+    assert all(data['penalty_applied'] >= 0.02 for data in pruned.values())
+    strict = build().propagate_ban_penalty('banned', max_hops=2, epsilon=0.03)
+    assert all(data['distance'] == 1 for data in strict.values())
+    
+    # The batch traversal applies the same rules
+    for kwargs in ({'max_fanout': 5}, {'epsilon': 0.02}, {'max_fanout': 5, 'epsilon': 0.02}):
+        single = build().propagate_ban_penalty('banned', max_hops=2, **kwargs)
+        batch = build().propagate_ban_penalties(['banned'], max_hops=2, **kwargs)
+        assert single.keys() == batch.keys()
+    print()
+
+def test_ppr_engine():
+    """Test the local-push personalized PageRank propagation engine"""
+    print("=" * 60)
+    print("TEST 12: Personalized PageRank Engine")
+    print("=" * 60)
+    
+    service = create_sample_social_graph()
+    bfs = create_sample_social_graph().propagate_ban_penalty('user1', max_hops=2)
+    affected = service.propagate_ban_penalty('user1', max_hops=2, engine='ppr')
+    print("\nPPR penalties:")
+    for user_id, data in sorted(affected.items()):
+        print(f"  {user_id}: -{data['penalty_applied']} (distance {data['distance']}, {data['relationship_type']})")
+    assert affected.keys() == bfs.keys()
+    assert all(affected[u]['distance'] == bfs[u]['distance'] for u in affected)
+    assert all(affected[u]['relationship_type'] == bfs[u]['relationship_type'] for u in affected)
+    assert max(data['penalty_applied'] for data in affected.values()) == 0.15
+    
+    # Random sparse graph: the touched region depends on the tolerance, not the graph size
+    rng = np.random.default_rng(0)
+    n = 20000
+    pairs = rng.integers(0, n, size=(5 * n, 2))
+    followers = [{'follower_id': f'u{a}', 'following_id': f'u{b}'} for a, b in pairs.tolist() if a != b]
+    service = TrustPropagationService()
+    service.build_social_graph(followers, [])
+    graph = service.graph
+    source = graph.index_of('u0')
+    
+    for alpha, tolerance in ((0.15, 1e-3), (0.15, 1e-4), (0.3, 1e-4)):
+        stats = {}
+        nodes, pagerank, residual, hops = graph.personalized_pagerank(
+            np.array([source]), np.ones(1), alpha, tolerance, stats=stats
+        )
+        bound = graph.degree(source) + 1 / (alpha * tolerance)
+        print(f"alpha {alpha}, tolerance {tolerance}: {len(nodes)} touched (bound {bound:.0f}), "
+              f"{stats['pushes']} pushes in {stats['rounds']} rounds")
+        assert len(nodes) <= min(bound, n)
+        assert abs(pagerank.sum() + residual.sum() - 1.0) < 1e-9  # Mass is conserved
+    
+    # Reversible walk: pagerank(s -> v) / d(v) == pagerank(v -> s) / d(s)
+    target = int(nodes[np.argmax(pagerank * (nodes != source))])
+    def ppr(a, b):
+        nodes, pagerank, residual, _ = graph.personalized_pagerank(np.array([a]), np.ones(1), 0.15, 1e-7)
+        return pagerank[np.searchsorted(nodes, b)]
+    forward = ppr(source, target) / graph.degree(target)
+    backward = ppr(target, source) / graph.degree(source)
+    print(f"Symmetry: {forward:.6g} vs {backward:.6g}")
+    assert abs(forward - backward) < 1e-3 * max(forward, backward)
+    
+    # Further than the BFS engine allows, with the same result structure
+    far = service.propagate_ban_penalty('u0', max_hops=6, engine='ppr', epsilon=0.0001, ppr_tolerance=1e-6)
+    print(f"max_hops=6, epsilon=0.0001: {len(far)} affected")
+    assert max(data['distance'] for data in far.values()) > 3
+    assert all(data['penalty_applied'] >= 0.0001 for data in far.values())
+    print()
+
 if __name__ == "__main__":
     print("\n" + "=" * 60)
     print("TRUST PROPAGATION SERVICE - TEST SUITE")
@@ -140,6 +559,14 @@ if __name__ == "__main__":
     test_follower_impact()
     test_distance_decay()
     test_trust_recovery()
+    test_csr_graph()
+    test_vectorized_propagation()
+    test_batch_ban_propagation()
+    test_incremental_mutations()
+    test_dry_run_overlay()
+    test_penalty_ledger_recovery()
+    test_fanout_cap_and_epsilon()
+    test_ppr_engine()
     
     print("=" * 60)
     print("ALL TESTS COMPLETED")
@@ -0,0 +1,356 @@
+"""
+Test script for concurrent serving in the Trust Propagation API
+"""
+
+import os
+import time
+import asyncio
+import tempfile
+import threading
+
+os.environ.setdefault("TRUST_STATE_DIR", tempfile.mkdtemp(prefix="trust_api_test_"))
+
+import trust_propagation_api as api
+from rw_lock import ReaderWriterLock
+from load_test_trust_propagation_api import run_load_test, check_state
+
+def test_reader_writer_lock():
+    """Test that readers share the lock, writers are exclusive and not starved"""
+    print("=" * 60)
+    print("TEST 1: Reader-Writer Lock")
+    print("=" * 60)
+
+    lock = ReaderWriterLock()
+    events = []
+    both_reading = threading.Barrier(2, timeout=5)
+
+    def reader(name):
+        with lock.read:
+            both_reading.wait()  # Deadlocks unless two readers hold the lock at once
+            events.append(name)
+
+    readers = [threading.Thread(target=reader, args=(f'r{i}',)) for i in range(2)]
+    for thread in readers:
+        thread.start()
+    for thread in readers:
+        thread.join()
+    print(f"Concurrent readers: {events}")
+    assert sorted(events) == ['r0', 'r1']
+
+    # A waiting writer goes before readers that arrive after it
+    order = []
+    lock.acquire_read()
+    writer = threading.Thread(target=lambda: (lock.acquire_write(), order.append('writer'), lock.release_write()))
+    writer.start()
+    time.sleep(0.05)
+    late_reader = threading.Thread(target=lambda: (lock.acquire_read(), order.append('reader'), lock.release_read()))
+    late_reader.start()
+    time.sleep(0.05)
+    assert order == []
+    lock.release_read()
+    writer.join()
+    late_reader.join()
+    print(f"Order after release: {order}")
+    assert order == ['writer', 'reader']
+
+    # The write side is reentrant and may read
+    with lock.write:
+        with lock.write:
+            with lock.read:
+                pass
+    with lock.read:
+        pass
+    print()
+
+def test_stale_penalties_recomputed():
+    """Test that a graph change between compute and apply forces a recompute"""
+    print("=" * 60)
+    print("TEST 2: Propagation Recomputed After Concurrent Change")
+    print("=" * 60)
+
+    followers = [{'follower_id': f'user{i}', 'following_id': 'user0'} for i in range(1, 6)]
+    api.trust_service.build_social_graph(followers, [])
+    api.trust_service.set_user_trust_scores({f'user{i}': 0.8 for i in range(6)})
+
+    calls = []
+    def compute(**args):
+        calls.append(api.trust_service.graph.version)
+        if len(calls) == 1:
+            # Simulate a mutation landing between the read and write phases
+            api.trust_service.graph.version += 1
+        return api.trust_service.compute_user_ban_penalties(**args)
+
+    affected, _, _ = api._propagate('propagate_ban_penalty', {'banned_user_id': 'user0'}, compute)
+    print(f"Compute calls: {len(calls)}, affected users: {len(affected)}")
+    assert len(calls) == 2
+    assert len(affected) == 5
+    assert api.trust_service.user_trust_scores['user1'] < 0.8
+    print()
+
+def test_concurrent_mixed_traffic():
+    """Test mixed concurrent reads, deltas and propagations for corruption"""
+    print("=" * 60)
+    print("TEST 3: Concurrent Mixed Traffic")
+    print("=" * 60)
+
+    result = asyncio.run(run_load_test(num_edges=3000, num_requests=300, concurrency=16))
+    print(f"Requests per endpoint: { {kind: len(lat) for kind, lat in result['latencies'].items()} }")
+    print(f"Errors: {result['errors'][:3]}")
+    assert result['errors'] == []
+    assert sum(len(lat) for lat in result['latencies'].values()) == 300
+
+    checks = check_state()
+    for name, passed in checks.items():
+        print(f"  {name}: {'ok' if passed else 'FAILED'}")
+    assert all(checks.values())
+    print()
+
+def test_preview_commit_and_discard():
+    """Test dry-run previews through the API: commit, discard and conflicts"""
+    print("=" * 60)
+    print("TEST 4: Dry-Run Previews")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+    client = TestClient(api.app)
+    followers = [{'follower_id': f'user{i}', 'following_id': 'user0'} for i in range(1, 6)]
+    scores = {f'user{i}': 0.8 for i in range(6)}
+    assert client.post('/build-graph', json={'followers': followers, 'trust_scores': scores}).status_code == 200
+
+    preview = client.post('/propagate-ban', json={'banned_user_id': 'user0', 'dry_run': True}).json()
+    print(f"Preview {preview['preview_id']}: {len(preview['affected_users'])} users")
+    assert len(preview['affected_users']) == 5
+    assert api.trust_service.user_trust_scores == scores
+
+    committed = client.post(f"/previews/{preview['preview_id']}/commit").json()
+    assert committed == {'success': True, 'applied': 5}
+    assert round(api.trust_service.user_trust_scores['user1'], 4) == preview['affected_users']['user1']['new_user_trust_score']
+    assert client.post(f"/previews/{preview['preview_id']}/commit").status_code == 404
+
+    # A second preview of the same ban goes stale once the first is committed
+    first = client.post('/propagate-bans', json={'banned_user_ids': ['user0'], 'dry_run': True}).json()
+    second = client.post('/propagate-bans', json={'banned_user_ids': ['user0'], 'dry_run': True}).json()
+    assert client.post(f"/previews/{first['preview_id']}/commit").status_code == 200
+    assert client.post(f"/previews/{second['preview_id']}/commit").status_code == 409
+
+    discarded = client.post('/propagate-ban', json={'banned_user_id': 'user0', 'dry_run': True}).json()
+    trust_before = dict(api.trust_service.user_trust_scores)
+    assert client.delete(f"/previews/{discarded['preview_id']}").status_code == 200
+    assert client.delete(f"/previews/{discarded['preview_id']}").status_code == 404
+    assert api.trust_service.user_trust_scores == trust_before
+
+    # Committed previews are logged like ordinary propagations
+    checks = check_state()
+    print(f"Replay matches: {all(checks.values())}")
+    assert all(checks.values())
+    print()
+
+def test_ppr_engine_endpoint():
+    """Test /propagate-ban with the personalized PageRank engine"""
+    print("=" * 60)
+    print("TEST 5: PPR Engine Through The API")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+    client = TestClient(api.app)
+    followers = [{'follower_id': f'user{i + 1}', 'following_id': f'user{i}'} for i in range(8)]
+    scores = {f'user{i}': 0.8 for i in range(9)}
+    assert client.post('/build-graph', json={'followers': followers, 'trust_scores': scores}).status_code == 200
+
+    # BFS stays limited to 3 hops; PPR may walk further
+    too_far = client.post('/propagate-ban', json={'banned_user_id': 'user0', 'max_hops': 6})
+    assert too_far.status_code == 400
+    response = client.post('/propagate-ban', json={'banned_user_id': 'user0', 'max_hops': 6, 'engine': 'ppr',
+                                                   'ppr_tolerance': 1e-6})
+    result = response.json()
+    print(f"Distances: { {u: d['distance'] for u, d in result['affected_users'].items()} }")
+    assert response.status_code == 200
+    assert max(data['distance'] for data in result['affected_users'].values()) == 6
+    assert result['affected_users']['user1']['relationship_type'] == 'mutual_follow'
+    assert result['summary']['total_affected'] == len(result['affected_users'])
+
+    # Replaying the log reruns the propagation with the same engine
+    checks = check_state()
+    print(f"Replay matches: {all(checks.values())}")
+    assert all(checks.values())
+    print()
+
+def test_columnar_pages():
+    """Test the columnar /propagate-ban response and its cursor pages"""
+    print("=" * 60)
+    print("TEST 6: Columnar Response Pages")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+    client = TestClient(api.app)
+    # 29 followers share one penalty, so the first page boundary falls inside a tie
+    followers = [{'follower_id': f'user{i}', 'following_id': 'user0'} for i in range(1, 30)]
+    followers += [{'follower_id': f'fan{i}', 'following_id': f'user{i % 29 + 1}'} for i in range(60)]
+    assert client.post('/build-graph', json={'followers': followers, 'trust_scores': {}}).status_code == 200
+
+    full = client.post('/propagate-ban', json={'banned_user_id': 'user0', 'dry_run': True}).json()
+    page = client.post('/propagate-ban', json={'banned_user_id': 'user0', 'response_format': 'columnar',
+                                               'limit': 25}).json()
+    print(f"First page: {len(page['columns']['user_ids'])} of {page['total']}, summary {page['summary']}")
+    assert page['summary'] == full['summary']
+    trust_after = dict(api.trust_service.user_trust_scores)
+
+    rows = []
+    while True:
+        columns = page['columns']
+        rows += zip(columns['user_ids'], columns['penalties'], columns['distances'], columns['new_user_trust_scores'])
+        if page['next_cursor'] is None:
+            break
+        page = client.get('/propagate-ban/pages', params={'cursor': page['next_cursor']}).json()
+    print(f"Pages read: {len(rows)} rows")
+    assert len(rows) == len({row[0] for row in rows}) == len(full['affected_users'])
+    assert [row[1] for row in rows] == sorted((row[1] for row in rows), reverse=True)
+    for user_id, penalty, distance, trust in rows:
+        assert penalty == full['affected_users'][user_id]['penalty_applied']
+        assert distance == full['affected_users'][user_id]['distance']
+    assert api.trust_service.user_trust_scores == trust_after  # Paging never re-applies
+    assert api.paged_results == {}  # Dropped after the last page
+
+    # min_penalty only trims the response
+    top = client.post('/propagate-ban', json={'banned_user_id': 'user0', 'response_format': 'columnar',
+                                              'min_penalty': 0.05, 'dry_run': True}).json()
+    assert top['total'] == 29 and top['next_cursor'] is None
+    assert top['summary']['total_affected'] == 89
+    assert client.get('/propagate-ban/pages', params={'cursor': 'missing:25'}).status_code == 404
+    assert client.get('/propagate-ban/pages', params={'cursor': 'missing'}).status_code == 400
+    print()
+
+def test_process_workers():
+    """Test propagations computed by worker processes over the shared-memory graph"""
+    print("=" * 60)
+    print("TEST 7: Shared-Memory Propagation Workers")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+    from multiprocessing import shared_memory
+    from propagation_workers import PropagationWorkerPool
+    client = TestClient(api.app)
+    followers = [{'follower_id': f'user{i}', 'following_id': f'user{i // 3}'} for i in range(1, 40)]
+    scores = {f'user{i}': 0.8 for i in range(40)}
+    assert client.post('/build-graph', json={'followers': followers, 'trust_scores': scores}).status_code == 200
+
+    requests = [
+        ('/propagate-ban', {'banned_user_id': 'user1', 'dry_run': True}),
+        ('/propagate-ban', {'banned_user_id': 'user2', 'engine': 'ppr', 'max_hops': 5, 'dry_run': True}),
+        ('/propagate-bans', {'banned_user_ids': ['user1', 'user5', 'missing'], 'dry_run': True})
+    ]
+    local = [client.post(path, json=body).json() for path, body in requests]
+
+    pool = PropagationWorkerPool(2)
+    pool.start()
+    api.worker_pool = pool
+    try:
+        remote = [client.post(path, json=body).json() for path, body in requests]
+        for before, after in zip(local, remote):
+            assert before['affected_users'] == after['affected_users']
+        print(f"Worker results match for {len(requests)} requests, epoch {pool.publisher.current['epoch']}")
+
+        # A graph change publishes a new epoch; tasks on the old one are skipped
+        stale = pool.publisher.acquire()
+        assert client.post('/add-follows', json={'followers': [{'follower_id': 'user39', 'following_id': 'user1'}]}).status_code == 200
+        client.post('/propagate-ban', json={'banned_user_id': 'user1'})
+        assert pool.publisher.current['epoch'] == stale['epoch'] + 1
+        assert pool.run(stale, 'compute_index_ban_penalties', {'banned_idx': 0}) == (False, None)
+        old_segment = stale['arrays']['indptr'][0]
+        pool.publisher.release(stale)
+        try:
+            shared_memory.SharedMemory(name=old_segment)
+            assert False, "old epoch still linked"
+        except FileNotFoundError:
+            pass
+    finally:
+        api.worker_pool = None
+        pool.close()
+
+    checks = check_state()
+    print(f"Replay matches: {all(checks.values())}")
+    assert all(checks.values())
+    print()
+
+def test_banned_ring():
+    """Test /propagate-bans when every reached user is banned too"""
+    print("=" * 60)
+    print("TEST 8: Banned Ring")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+    client = TestClient(api.app)
+    ring = [f'ring{i}' for i in range(4)]
+    followers = [{'follower_id': user, 'following_id': ring[(i + 1) % 4]} for i, user in enumerate(ring)]
+    followers.append({'follower_id': 'outsider', 'following_id': 'other'})
+    scores = {user: 0.8 for user in ring + ['outsider', 'other']}
+    assert client.post('/build-graph', json={'followers': followers, 'trust_scores': scores}).status_code == 200
+
+    for dry_run in (True, False):
+        response = client.post('/propagate-bans', json={'banned_user_ids': ring, 'dry_run': dry_run})
+        result = response.json()
+        print(f"dry_run={dry_run}: {response.status_code} {result['summary']}")
+        assert response.status_code == 200
+        assert result['affected_users'] == {}
+        assert result['summary']['total_affected'] == 0 and result['summary']['num_banned'] == 4
+    assert api.trust_service.user_trust_scores == scores
+
+    checks = check_state()
+    print(f"Replay matches: {all(checks.values())}")
+    assert all(checks.values())
+    print()
+
+def test_empty_graph():
+    """Test building and propagating on a graph without relationships, or that lost them all"""
+    print("=" * 60)
+    print("TEST 9: Empty Graph")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+    client = TestClient(api.app)
+    response = client.post('/build-graph', json={'followers': [], 'interactions': [], 'trust_scores': {}})
+    print(f"Empty build: {response.status_code} {response.json()}")
+    assert response.status_code == 200
+    assert api.trust_service.graph.num_users == 0
+    assert client.get('/graph-stats').json()['graph_built'] is True
+
+    checks = check_state()
+    print(f"Replay matches: {all(checks.values())}")
+    assert all(checks.values())
+
+    # Unfollowing the last connection leaves a built graph
+    follow = {'follower_id': 'lone1', 'following_id': 'lone2'}
+    assert client.post('/build-graph', json={'followers': [follow], 'trust_scores': {}}).status_code == 200
+    assert client.post('/remove-follows', json={'followers': [follow]}).status_code == 200
+    assert api.trust_service.graph.num_users == 0
+    response = client.post('/propagate-ban', json={'banned_user_id': 'lone1'})
+    print(f"Ban after the last unfollow: {response.status_code}")
+    assert response.status_code == 200
+    assert client.get('/graph-stats').json()['graph_built'] is True
+    assert all(check_state().values())
+
+    # Only a reset clears it
+    assert client.post('/reset').status_code == 200
+    assert client.post('/propagate-ban', json={'banned_user_id': 'lone1'}).status_code == 400
+    assert client.get('/graph-stats').json()['graph_built'] is False
+    assert all(check_state().values())
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("TRUST PROPAGATION API CONCURRENCY - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_reader_writer_lock()
+    test_stale_penalties_recomputed()
+    test_concurrent_mixed_traffic()
+    test_preview_commit_and_discard()
+    test_ppr_engine_endpoint()
+    test_columnar_pages()
+    test_process_workers()
+    test_banned_ring()
+    test_empty_graph()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
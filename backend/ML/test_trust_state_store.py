@@ -0,0 +1,172 @@
+"""
+Test script for Trust State Store (snapshot + write-ahead log)
+"""
+
+import os
+import time
+import tempfile
+from trust_propagation_service import TrustPropagationService, create_sample_social_graph
+from trust_state_store import TrustStateStore
+
+def apply_logged(store, service, op, **args):
+    """Apply a service operation and log it, as the API does"""
+    with store.lock:
+        result = getattr(service, op)(**args)
+        store.append(op, args)
+    return result
+
+def same_state(a, b):
+    return (dict(a.interaction_weights.items()) == dict(b.interaction_weights.items()) and
+            a.graph.num_users == b.graph.num_users and
+            a.graph.num_connections == b.graph.num_connections and
+            a.user_trust_scores == b.user_trust_scores and
+            a.user_content_trust_scores == b.user_content_trust_scores)
+
+def test_snapshot_and_replay():
+    """Test restoring a snapshot plus the log written after it"""
+    print("=" * 60)
+    print("TEST 1: Snapshot + Log Replay")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = TrustStateStore(directory, fsync=False)
+        service = create_sample_social_graph()
+        store.snapshot(service)
+        
+        apply_logged(store, service, 'add_follows', followers=[{'follower_id': 'user9', 'following_id': 'user1'}])
+        apply_logged(store, service, 'add_interactions',
+                     interactions=[{'user_id': 'user3', 'target_user_id': 'user9', 'type': 'like', 'weight': 0.9}])
+        apply_logged(store, service, 'remove_follows', followers=[{'follower_id': 'user2', 'following_id': 'user1'}])
+        apply_logged(store, service, 'patch_trust_scores', trust_scores={'user9': 0.4}, content_trust_scores=None)
+        apply_logged(store, service, 'propagate_ban_penalty', banned_user_id='user1', max_hops=2, base_penalty=0.15)
+        apply_logged(store, service, 'propagate_ban_penalties', banned_user_ids=['user3', 'user9'],
+                     max_hops=2, base_penalty=0.15, aggregation='sum', penalty_cap=0.5)
+        store.close()
+        
+        restored = TrustPropagationService()
+        recovery = TrustStateStore(directory, fsync=False).restore(restored)
+        print(f"\nRecovery: {recovery}")
+        assert recovery['snapshot_seq'] == 0 and recovery['replayed'] == 6
+        assert same_state(service, restored)
+        assert restored.propagate_ban_penalty('user4') == service.propagate_ban_penalty('user4')
+        
+        # Ids with separators or non-ASCII characters survive a snapshot
+        store = TrustStateStore(directory, fsync=False)
+        apply_logged(store, service, 'add_follows',
+                     followers=[{'follower_id': 'odd\nuser', 'following_id': 'user1'},
+                                {'follower_id': 'user1', 'following_id': 'ünïcode, "quoted"'}])
+        store.snapshot(service)
+        store.close()
+        restored = TrustPropagationService()
+        TrustStateStore(directory, fsync=False).restore(restored)
+        assert same_state(service, restored)
+        assert list(restored.graph.ids) == list(service.graph.ids)
+    print()
+
+def test_torn_write_and_bad_snapshot():
+    """Test recovery skips a torn log line and an unreadable snapshot"""
+    print("=" * 60)
+    print("TEST 2: Torn Log Write + Unreadable Snapshot")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = TrustStateStore(directory, fsync=False)
+        service = create_sample_social_graph()
+        store.snapshot(service)
+        apply_logged(store, service, 'propagate_ban_penalty', banned_user_id='user2', max_hops=2, base_penalty=0.15)
+        store.close()
+        
+        wal = [f for f in os.listdir(directory) if f.startswith('wal-')][-1]
+        with open(os.path.join(directory, wal), 'a') as f:
+            f.write('{"seq": 2, "op": "add_fol')  # Crash mid-write
+        with open(os.path.join(directory, 'snapshot-000000000099.npz'), 'wb') as f:
+            f.write(b'not a snapshot')
+        
+        restored = TrustPropagationService()
+        recovery = TrustStateStore(directory, fsync=False).restore(restored)
+        print(f"\nRecovery: {recovery}")
+        assert recovery['replayed'] == 1 and recovery['skipped'] == 1
+        assert same_state(service, restored)
+    print()
+
+def test_background_compaction():
+    """Test that the log is folded into a new snapshot in the background"""
+    print("=" * 60)
+    print("TEST 3: Background Compaction")
+    print("=" * 60)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = TrustStateStore(directory, fsync=False, max_wal_records=5)
+        service = TrustPropagationService()
+        store.replace_state(service, lambda: service.build_social_graph(
+            [{'follower_id': 'a', 'following_id': 'b'}], []))
+        store.start_background_compaction(service, interval=0.05)
+        
+        for i in range(12):
+            apply_logged(store, service, 'add_follows', followers=[{'follower_id': f'u{i}', 'following_id': 'a'}])
+            time.sleep(0.02)
+        time.sleep(0.3)
+        store.close()
+        
+        files = sorted(os.listdir(directory))
+        print(f"\nFiles: {files}")
+        assert len([f for f in files if f.startswith('snapshot-')]) == 1
+        restored = TrustPropagationService()
+        recovery = TrustStateStore(directory, fsync=False).restore(restored)
+        print(f"Recovery: {recovery}")
+        assert recovery['snapshot_seq'] >= 5 and recovery['replayed'] < 12
+        assert same_state(service, restored)
+        
+        # A reset is persisted as an empty snapshot
+        store = TrustStateStore(directory, fsync=False)
+        store.restore(restored)
+        store.replace_state(restored, restored.reset)
+        store.close()
+        empty = TrustPropagationService()
+        assert TrustStateStore(directory, fsync=False).restore(empty)['replayed'] == 0
+        assert empty.graph.num_users == 0 and empty.user_trust_scores == {}
+    print()
+
+def test_penalty_ledger_persistence():
+    """Test the penalty ledger survives snapshots and log replay"""
+    print("=" * 60)
+    print("TEST 4: Penalty Ledger Persistence")
+    print("=" * 60)
+    
+    day = 86400.0
+    with tempfile.TemporaryDirectory() as directory:
+        store = TrustStateStore(directory, fsync=False)
+        service = create_sample_social_graph()
+        apply_logged(store, service, 'propagate_ban_penalty', banned_user_id='user1', max_hops=2,
+                     base_penalty=0.15, penalized_at=0.0)
+        store.snapshot(service)
+        apply_logged(store, service, 'propagate_ban_penalties', banned_user_ids=['user5'], max_hops=2,
+                     base_penalty=0.15, aggregation='max', penalty_cap=0.5, penalized_at=day)
+        apply_logged(store, service, 'run_trust_recovery', now=3 * day, recovery_rate=0.01, max_recovery=0.3)
+        store.close()
+        
+        restored = TrustPropagationService()
+        TrustStateStore(directory, fsync=False).restore(restored)
+        print(f"Ledger: {len(service.penalty_ledger)} live, {len(restored.penalty_ledger)} restored")
+        assert same_state(service, restored)
+        assert restored.penalty_ledger.outstanding() == service.penalty_ledger.outstanding()
+        assert len(restored.penalty_ledger) == len(service.penalty_ledger) > 0
+        
+        # Both recover identically from here on
+        assert (restored.run_trust_recovery(now=10 * day, recovery_rate=0.01) ==
+                service.run_trust_recovery(now=10 * day, recovery_rate=0.01))
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("TRUST STATE STORE - TEST SUITE")
+    print("=" * 60 + "\n")
+    
+    test_snapshot_and_replay()
+    test_torn_write_and_bad_snapshot()
+    test_background_compaction()
+    test_penalty_ledger_persistence()
+    
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
@@ -0,0 +1,136 @@
+"""
+Test script for the persistent item vector index (flat + IVF search)
+"""
+
+import time
+import tempfile
+import numpy as np
+from vector_index import VectorIndex
+
+def clustered_vectors(n, dim=64, num_clusters=50, seed=0):
+    """Normalized vectors around random cluster centers, like item embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_clusters, dim))
+    vectors = centers[rng.integers(0, num_clusters, n)] + 0.35 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def exact_top(vectors, query, k):
+    scores = vectors @ (query / np.linalg.norm(query))
+    return set(np.argsort(-scores)[:k].tolist())
+
+def test_flat_search():
+    """Test exact search, replacement and removal below the IVF threshold"""
+    print("=" * 60)
+    print("TEST 1: Flat Exact Search")
+    print("=" * 60)
+
+    vectors = clustered_vectors(300)
+    index = VectorIndex(flat_threshold=1000)
+    index.add_many([f'item{i}' for i in range(300)], vectors, [{'n': i} for i in range(300)])
+
+    stats = {}
+    hits = index.search(vectors[7], k=5, stats=stats)
+    print(f"Top hits: {hits[:3]}, {stats}")
+    assert hits[0][0] == 'item7' and abs(hits[0][1] - 1.0) < 1e-5
+    assert stats == {'scanned': 300, 'mode': 'flat'}
+    assert {int(item_id[4:]) for item_id, _ in hits} == exact_top(vectors, vectors[7], 5)
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+    # The query item can be left out, and items replaced or removed
+    assert 'item7' not in [item_id for item_id, _ in index.search(vectors[7], k=5, exclude=['item7'])]
+    index.add('item7', vectors[8], {'n': 'moved'})
+    assert len(index) == 300 and index.get('item7')[1] == {'n': 'moved'}
+    assert index.remove('item8') and not index.remove('item8')
+    assert 'item8' not in index and len(index) == 299
+    assert 'item8' not in [item_id for item_id, _ in index.search(vectors[8], k=10)]
+
+    found_vectors, found, payloads = index.get_many(['item1', 'item8'])
+    assert found.tolist() == [True, False] and payloads == [{'n': 1}, None]
+    np.testing.assert_allclose(found_vectors[0], vectors[1], atol=1e-6)
+    print()
+
+def test_ivf_recall_and_cost():
+    """Test IVF recall against exact search and that queries scan a fraction of the index"""
+    print("=" * 60)
+    print("TEST 2: IVF Recall And Scan Cost")
+    print("=" * 60)
+
+    queries = clustered_vectors(50, seed=9)
+    for n in (4000, 16000):
+        vectors = clustered_vectors(n)
+        index = VectorIndex(flat_threshold=1000, nprobe=8)
+        index.add_many([str(i) for i in range(n)], vectors)
+
+        recall, scanned = [], []
+        start = time.time()
+        for query in queries:
+            stats = {}
+            hits = index.search(query, k=10, stats=stats)
+            recall.append(len({int(item_id) for item_id, _ in hits} & exact_top(vectors, query, 10)) / 10)
+            scanned.append(stats['scanned'])
+        elapsed = (time.time() - start) / len(queries)
+        print(f"n={n}: {index.stats()['nlist']} lists, recall@10 {np.mean(recall):.3f}, "
+              f"scanned {np.mean(scanned):.0f} vectors ({np.mean(scanned) / n:.1%}), {elapsed * 1000:.2f} ms/query")
+        assert index.stats()['mode'] == 'ivf'
+        assert np.mean(recall) >= 0.9
+        assert np.mean(scanned) < 0.3 * n
+
+    # Items added after clustering are searchable immediately
+    index.add('new', queries[0])
+    assert index.search(queries[0], k=1)[0][0] == 'new'
+    print()
+
+def test_persistence():
+    """Test that the index reloads from its snapshot plus log"""
+    print("=" * 60)
+    print("TEST 3: Snapshot + Log Persistence")
+    print("=" * 60)
+
+    directory = tempfile.mkdtemp(prefix="vector_index_test_")
+    vectors = clustered_vectors(1500, seed=3)
+    index = VectorIndex(directory, flat_threshold=1000)
+    index.add_many([f'item{i}' for i in range(1200)], vectors[:1200], [{'title': f't{i}'} for i in range(1200)])
+    index.save()
+    index.add_many([f'item{i}' for i in range(1200, 1500)], vectors[1200:])
+    index.remove('item3')
+    index.close()
+
+    reloaded = VectorIndex(directory, flat_threshold=1000)
+    recovery = reloaded.load()
+    print(f"Recovery: {recovery}, stats: {reloaded.stats()}")
+    assert recovery == {'snapshot_items': 1200, 'replayed_records': 301}
+    assert len(reloaded) == 1499 and 'item3' not in reloaded
+    assert reloaded.get('item5')[1] == {'title': 't5'}
+    assert reloaded.stats()['mode'] == 'ivf'
+    for i in (0, 700, 1400):
+        assert reloaded.search(vectors[i], k=1)[0][0] == f'item{i}'
+
+    # A torn final log line is ignored
+    reloaded.add('item1600', vectors[0])
+    reloaded.close()
+    with open(reloaded._paths()[1], 'a') as f:
+        f.write('{"op": "add", "id": "torn", "vec')
+    again = VectorIndex(directory, flat_threshold=1000)
+    again.load()
+    assert 'item1600' in again and 'torn' not in again
+
+    # Records written after recovering from the torn line are kept
+    again.add('item1601', vectors[1])
+    again.close()
+    final = VectorIndex(directory, flat_threshold=1000)
+    final.load()
+    assert 'item1600' in final and 'item1601' in final and len(final) == 1501
+    print()
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("VECTOR INDEX - TEST SUITE")
+    print("=" * 60 + "\n")
+
+    test_flat_search()
+    test_ivf_recall_and_cost()
+    test_persistence()
+
+    print("=" * 60)
+    print("ALL TESTS COMPLETED")
+    print("=" * 60)
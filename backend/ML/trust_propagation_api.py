@@ -3,21 +3,114 @@ Trust Propagation API
 FastAPI service for propagating trust score penalties when users are banned
 """
 
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+import numpy as np
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
-from trust_propagation_service import TrustPropagationService
+from typing import Callable, List, Dict, Literal, Optional, Tuple
+from trust_propagation_service import TrustPropagationService, ScoreOverlay
+from social_graph import SocialGraph
+from trust_state_store import TrustStateStore
+from rw_lock import ReaderWriterLock
+from propagation_workers import PropagationWorkerPool
+from graph_shards import ShardCoordinator
 import uvicorn
 
+# Optional: faster JSON encoding (and NumPy arrays without tolist) for columnar responses
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Global service instance
+trust_service = TrustPropagationService()
+
+# Reads share the lock; mutations and snapshots take it exclusively
+state_lock = ReaderWriterLock()
+
+# Graph + score state survives restarts as snapshot + write-ahead log
+TRUST_STATE_DIR = os.environ.get(
+    "TRUST_STATE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data", "trust_state")
+)
+state_store = TrustStateStore(TRUST_STATE_DIR, lock=state_lock.write)
+
+# Propagations and graph builds are CPU-heavy; they run on their own pool so
+# the event loop and the default threadpool (reads, small deltas) stay responsive
+COMPUTE_WORKERS = int(os.environ.get("TRUST_COMPUTE_WORKERS", "2"))
+
+# With TRUST_PROCESS_WORKERS > 0, propagations are computed by that many
+# worker processes over a shared-memory copy of the graph (see
+# propagation_workers); the compute threads then mostly wait on them
+PROCESS_WORKERS = int(os.environ.get("TRUST_PROCESS_WORKERS", "0"))
+worker_pool: Optional[PropagationWorkerPool] = None
+compute_executor = ThreadPoolExecutor(max_workers=max(COMPUTE_WORKERS, PROCESS_WORKERS),
+                                      thread_name_prefix="trust-compute")
+
+# Comma-separated trust_shard_api.py nodes; when set, BFS /propagate-ban
+# traversals run on community shards of the graph (see ShardCoordinator)
+SHARD_URLS = [url for url in os.environ.get("TRUST_SHARD_URLS", "").split(",") if url]
+
+# Fan-out cap for propagations that do not set max_fanout (0 = uncapped)
+DEFAULT_MAX_FANOUT = int(os.environ.get("TRUST_MAX_FANOUT", "0")) or None
+
+# The BFS engine touches the whole neighborhood of every hop; the PPR engine's
+# cost is set by its tolerance, so it may walk further
+MAX_BFS_HOPS = 3
+MAX_PPR_HOPS = 10
+
+# Dry-run previews awaiting commit/discard: preview_id -> (op, args, overlay);
+# the oldest are dropped beyond MAX_PENDING_PREVIEWS
+MAX_PENDING_PREVIEWS = 100
+pending_previews = OrderedDict()
+previews_lock = threading.Lock()
+
+# Columnar propagation results with pages left: result_id -> (penalties,
+# scores, limit, min_penalty); the oldest are dropped beyond MAX_PAGED_RESULTS
+MAX_PAGED_RESULTS = 100
+paged_results = OrderedDict()
+
+shard_coordinator = ShardCoordinator(SHARD_URLS, lock=state_lock.read) if SHARD_URLS else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global worker_pool
+    recovery = state_store.restore(trust_service)
+    print(f"Restored trust state from {TRUST_STATE_DIR}: {recovery}")
+    await asyncio.get_running_loop().run_in_executor(None, _rebalance_shards)
+    state_store.start_background_compaction(trust_service)
+    if PROCESS_WORKERS > 0:
+        worker_pool = PropagationWorkerPool(PROCESS_WORKERS)
+        await asyncio.get_running_loop().run_in_executor(None, worker_pool.start)
+        print(f"Started {PROCESS_WORKERS} propagation worker processes")
+    yield
+    compute_executor.shutdown(wait=True)
+    if worker_pool is not None:
+        worker_pool.close()
+        worker_pool = None
+    if shard_coordinator is not None:
+        shard_coordinator.close()
+    state_store.close()
+
 app = FastAPI(
     title="Trust Propagation API",
     description="Propagates trust score penalties through social graph when users are banned",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Global service instance
-trust_service = TrustPropagationService()
-
 # Request/Response Models
 class FollowerRelationship(BaseModel):
     follower_id: str = Field(..., description="ID of the follower")
@@ -40,8 +133,29 @@ class BuildGraphRequest(BaseModel):
 
 class PropagateBanRequest(BaseModel):
     banned_user_id: str = Field(..., description="ID of the banned user")
-    max_hops: int = Field(2, ge=1, le=3, description="Maximum propagation distance")
+    max_hops: int = Field(
+        2, ge=1, le=MAX_PPR_HOPS, description=f"Maximum propagation distance (up to {MAX_BFS_HOPS} for the bfs engine)"
+    )
     base_penalty: float = Field(0.15, ge=0.0, le=0.5, description="Base penalty for direct connections")
+    epsilon: float = Field(0.0, ge=0.0, le=0.5, description="Skip users whose penalty would be below this")
+    max_fanout: Optional[int] = Field(
+        None, ge=1, description="Expand at most this many connections per user, strongest first"
+    )
+    dry_run: bool = Field(False, description="Preview the affected users without changing any scores")
+    engine: Literal['bfs', 'ppr'] = Field(
+        'bfs', description="Hop-by-hop falloff (bfs) or personalized PageRank by local push (ppr)"
+    )
+    ppr_alpha: float = Field(0.15, ge=0.01, le=0.9, description="Restart probability of the ppr engine")
+    ppr_tolerance: float = Field(
+        1e-4, ge=1e-7, le=1e-2, description="Push tolerance of the ppr engine; lower reaches further at more cost"
+    )
+    response_format: Literal['full', 'columnar'] = Field(
+        'full', description="Per-user objects (full) or parallel arrays sorted by penalty (columnar)"
+    )
+    limit: Optional[int] = Field(None, ge=1, description="Columnar only: rows per page, strongest penalty first")
+    min_penalty: float = Field(
+        0.0, ge=0.0, description="Columnar only: leave out rows with a smaller penalty (they are still applied)"
+    )
 
 class AffectedUserInfo(BaseModel):
     new_user_trust_score: float
@@ -55,6 +169,40 @@ class PropagateBanResponse(BaseModel):
     success: bool
     affected_users: Dict[str, AffectedUserInfo]
     summary: Dict
+    preview_id: Optional[str] = None
+
+class PropagateBansRequest(BaseModel):
+    banned_user_ids: List[str] = Field(..., min_length=1, description="IDs of the banned users")
+    max_hops: int = Field(2, ge=1, le=3, description="Maximum propagation distance")
+    base_penalty: float = Field(0.15, ge=0.0, le=0.5, description="Base penalty for direct connections")
+    aggregation: Literal['max', 'sum', 'prob_or'] = Field(
+        'max', description="How penalties from several banned users combine: strongest, capped sum, or probabilistic OR"
+    )
+    penalty_cap: float = Field(0.5, ge=0.0, le=1.0, description="Maximum combined penalty for 'sum' aggregation")
+    epsilon: float = Field(0.0, ge=0.0, le=0.5, description="Skip user/banned-user pairs whose penalty would be below this")
+    max_fanout: Optional[int] = Field(
+        None, ge=1, description="Expand at most this many connections per user, strongest first"
+    )
+    dry_run: bool = Field(False, description="Preview the affected users without changing any scores")
+
+class MergedAffectedUserInfo(AffectedUserInfo):
+    banned_connections: int
+
+class PropagateBansResponse(BaseModel):
+    success: bool
+    affected_users: Dict[str, MergedAffectedUserInfo]
+    summary: Dict
+    preview_id: Optional[str] = None
+
+class FollowDeltaRequest(BaseModel):
+    followers: List[FollowerRelationship] = Field(..., description="Follower relationships to add or remove")
+
+class InteractionDeltaRequest(BaseModel):
+    interactions: List[UserInteraction] = Field(..., description="User interactions to add")
+
+class TrustScorePatchRequest(BaseModel):
+    trust_scores: Dict[str, float] = Field(..., description="New user trust scores")
+    content_trust_scores: Optional[Dict[str, float]] = Field(None, description="New content trust scores")
 
 class RecoveryRequest(BaseModel):
     user_id: str
@@ -67,9 +215,275 @@ class RecoveryResponse(BaseModel):
     new_content_trust_score: float
     recovery_applied: float
 
+class RecoveryJobRequest(BaseModel):
+    recovery_rate: float = Field(0.01, ge=0.0, le=0.1, description="Daily recovery per penalty")
+    max_recovery: float = Field(0.3, ge=0.0, le=1.0, description="Cap on the total recovery of one penalty")
+    apply: bool = Field(True, description="Apply the recovery; false only previews it")
+
+class RecoveredUserInfo(BaseModel):
+    new_user_trust_score: float
+    new_content_trust_score: float
+    recovery_applied: float
+
+class RecoveryJobResponse(BaseModel):
+    success: bool
+    recovered_users: Dict[str, RecoveredUserInfo]
+    summary: Dict
+
+
+def _read(read: Callable):
+    """Run read() under the shared read lock"""
+    with state_lock.read:
+        return read()
+
+def _mutate(op: str, args: Dict, apply: Callable, pairs: Tuple[Tuple[str, str], ...] = ()):
+    """
+    Run apply() under the write lock and log it as op(**args)
+    
+    pairs are the (user_id, user_id) connections apply() may change; with
+    shards they are sent to the owning shards after the lock is released.
+    """
+    with state_lock.write:
+        result = apply()
+        state_store.append(op, args)
+        if shard_coordinator is not None and pairs:
+            shard_coordinator.stage(trust_service.graph, pairs)
+    if shard_coordinator is not None and pairs:
+        shard_coordinator.flush()
+    return result
+
+def _propagate(op: str, args: Dict, compute: Callable, dry_run: bool = False) -> Tuple[Dict, Dict, Optional[str]]:
+    """
+    _propagate_arrays with the per-user result built after the lock is released
+    
+    Returns:
+        (affected_users, traversal, preview_id) - traversal is the service's
+        traversal_summary; preview_id is None unless dry_run
+    """
+    penalties, scores, traversal, preview_id = _propagate_arrays(op, args, compute, dry_run)
+    if penalties is None:
+        return {}, traversal, preview_id
+    return trust_service.format_penalties(penalties, scores), traversal, preview_id
+
+def _propagate_arrays(op: str, args: Dict, compute: Callable, dry_run: bool = False):
+    """
+    Run a logged propagation without blocking readers during the traversal
+    
+    Penalties are computed under the read lock and applied under the write
+    lock; if the graph changed in between they are recomputed first, so the
+    result matches a sequential replay of the log.
+    
+    A dry run only takes the read lock: the new scores go to a ScoreOverlay
+    kept as a pending preview, and nothing is logged until it is committed.
+    
+    With a worker pool the service's own computations run in a worker
+    process without holding any lock, then are checked against the graph
+    version the same way; so do BFS bans on shards (TRUST_SHARD_URLS).
+    
+    Returns:
+        (penalties, scores, traversal, preview_id) - the service's penalty
+        arrays and update_scores result (None if nobody was affected), its
+        traversal_summary, and preview_id (None unless dry_run)
+    """
+    # penalized_at is only logged and recorded in the ledger
+    penalized_at = args.get('penalized_at')
+    compute_args = {name: value for name, value in args.items() if name != 'penalized_at'}
+    
+    graph = version = None
+    if (shard_coordinator is not None and compute == trust_service.compute_user_ban_penalties
+            and compute_args.get('engine', 'bfs') == 'bfs'):
+        penalties, graph, version = _compute_on_shards(compute_args)
+    elif worker_pool is not None and compute in (trust_service.compute_user_ban_penalties,
+                                                 trust_service.compute_batch_ban_penalties):
+        penalties, graph, version = _compute_in_workers(op, compute_args)
+    
+    if dry_run:
+        with state_lock.read:
+            _require_graph()
+            if trust_service.graph is not graph or graph.version != version:
+                penalties = compute(**compute_args)
+            overlay = ScoreOverlay(trust_service)
+            scores = trust_service.update_scores(penalties, overlay) if penalties is not None else None
+            traversal = trust_service.traversal_summary(penalties)
+        return penalties, scores, traversal, _add_preview(op, args, overlay)
+    
+    if graph is None:
+        with state_lock.read:
+            graph, version = trust_service.graph, trust_service.graph.version
+            _require_graph()
+            penalties = compute(**compute_args)
+    
+    with state_lock.write:
+        if trust_service.graph is not graph or graph.version != version:
+            penalties = compute(**compute_args)
+        scores = trust_service.update_scores(penalties, penalized_at=penalized_at) if penalties is not None else None
+        traversal = trust_service.traversal_summary(penalties)
+        state_store.append(op, args)
+    
+    return penalties, scores, traversal, None
+
+def _compute_on_shards(compute_args: Dict):
+    """
+    Compute a BFS ban on the shards, holding no lock meanwhile
+    
+    Staged graph changes are flushed to the shards first.
+    
+    Returns:
+        (penalties, graph, version) like _compute_in_workers; graph is None
+        if the shards did not hold the graph, so it is computed in-process
+    """
+    with state_lock.read:
+        _require_graph()
+        graph, version = trust_service.graph, trust_service.graph.version
+        banned_idx = graph.index_of(compute_args['banned_user_id'])
+    if banned_idx is None:
+        return None, graph, version
+    shard_coordinator.flush()
+    base_penalty, epsilon = compute_args['base_penalty'], compute_args['epsilon']
+    version, reached = shard_coordinator.hop_distances(
+        banned_idx, compute_args['max_hops'], compute_args['max_fanout'],
+        lambda to_banned: TrustPropagationService.epsilon_filter(to_banned, base_penalty, epsilon))
+    if version is None:
+        return None, None, None
+    if reached is None:
+        return None, graph, version
+    traversal = {'capped': reached['capped'], 'pruned': reached['pruned']}
+    penalties = TrustPropagationService.hop_penalties(reached['nodes'], reached['hops'], reached['to_source'],
+                                                      reached['from_source'], base_penalty, traversal)
+    return penalties, graph, version
+
+def _rebalance_shards():
+    """Partition a replaced graph onto the shards (propagations run in-process if they are unreachable)"""
+    if shard_coordinator is None:
+        return
+    try:
+        shard_coordinator.rebalance(_graph_snapshot)
+    except requests.RequestException as e:
+        print(f"Error uploading shards: {e}")
+
+def _graph_snapshot() -> Tuple[Dict[str, np.ndarray], int]:
+    """The graph's compacted arrays and version, for ShardCoordinator.rebalance (under the read lock)"""
+    return trust_service.graph.compacted_arrays(), trust_service.graph.version
+
+def _detach_shards():
+    """Drop the shards' partition when the graph is replaced (under the write lock)"""
+    if shard_coordinator is not None:
+        shard_coordinator.detach()
+
+def _require_graph():
+    if not trust_service.graph_built:
+        raise HTTPException(
+            status_code=400, 
+            detail="Social graph not built. Call /build-graph first."
+        )
+
+def _worker_task(op: str, compute_args: Dict) -> Optional[Tuple[str, Dict]]:
+    """
+    Index-based service call for a propagation, for a worker process
+    
+    Returns:
+        (method, args), or None if no banned user is in the graph
+    """
+    graph = trust_service.graph
+    args = dict(compute_args)
+    if op == 'propagate_ban_penalty':
+        banned_idx = graph.index_of(args.pop('banned_user_id'))
+        if banned_idx is None:
+            return None
+        return 'compute_index_ban_penalties', {'banned_idx': banned_idx, **args}
+    sources = {graph.index_of(user_id) for user_id in args.pop('banned_user_ids')}
+    sources = np.array(sorted(idx for idx in sources if idx is not None), dtype=np.int64)
+    if len(sources) == 0:
+        return None
+    return 'compute_sources_ban_penalties', {'sources': sources, **args}
+
+def _compute_in_workers(op: str, compute_args: Dict):
+    """
+    Compute a propagation's penalties in the worker pool, holding no lock meanwhile
+    
+    The graph is published to a new shared-memory epoch first if it changed
+    since the last one (under the write lock, which that needs).
+    
+    Returns:
+        (penalties, graph, version) the penalties were computed for; graph
+        is None if the epoch was superseded before a worker started the task
+    """
+    publisher = worker_pool.publisher
+    for lock in (state_lock.read, state_lock.write):
+        with lock:
+            _require_graph()
+            graph, version = trust_service.graph, trust_service.graph.version
+            task = _worker_task(op, compute_args)
+            if task is None:
+                return None, graph, version
+            if lock is state_lock.write and not publisher.is_current(graph):
+                publisher.publish(graph)
+            if publisher.is_current(graph):
+                handle = publisher.acquire()
+                break
+    
+    try:
+        ran, penalties = worker_pool.run(handle, *task)
+    finally:
+        publisher.release(handle)
+    return (penalties, graph, version) if ran else (None, None, None)
+
+def _add_preview(op: str, args: Dict, overlay: ScoreOverlay) -> str:
+    preview_id = uuid.uuid4().hex
+    with previews_lock:
+        pending_previews[preview_id] = (op, args, overlay)
+        while len(pending_previews) > MAX_PENDING_PREVIEWS:
+            pending_previews.popitem(last=False)
+    return preview_id
+
+def _clear_previews():
+    """Drop all previews (after the state is replaced they can never commit)"""
+    with previews_lock:
+        pending_previews.clear()
+
+def _pop_preview(preview_id: str):
+    with previews_lock:
+        preview = pending_previews.pop(preview_id, None)
+    if preview is None:
+        raise HTTPException(status_code=404, detail=f"Preview '{preview_id}' not found or expired")
+    return preview
+
+def _fast_json(content: Dict) -> Response:
+    """Encode a response with orjson if installed (NumPy arrays included), else json"""
+    if ORJSON_AVAILABLE:
+        body = orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(content, separators=(',', ':'), default=lambda array: array.tolist())
+    return Response(content=body, media_type="application/json")
+
+def _columnar_page(penalties: Optional[Dict], scores: Optional[Tuple], offset: int,
+                   limit: Optional[int], min_penalty: float, result_id: Optional[str] = None) -> Dict:
+    """
+    One page of a columnar result, with the cursor of the next page
+    
+    The result is stored under result_id (a new one if None) while pages are
+    left, and dropped once the last page is read.
+    """
+    columns, total = trust_service.rank_penalties(penalties, scores, offset, limit, min_penalty)
+    end = offset + len(columns['user_ids'])
+    next_cursor = None
+    with previews_lock:
+        if end < total:
+            result_id = result_id or uuid.uuid4().hex
+            paged_results[result_id] = (penalties, scores, limit, min_penalty)
+            while len(paged_results) > MAX_PAGED_RESULTS:
+                paged_results.popitem(last=False)
+            next_cursor = f"{result_id}:{end}"
+        elif result_id is not None:
+            paged_results.pop(result_id, None)
+    return {"columns": columns, "total": total, "next_cursor": next_cursor}
+
+async def _in_compute_pool(func: Callable, *args):
+    return await asyncio.get_running_loop().run_in_executor(compute_executor, func, *args)
+
 
 @app.get("/")
-def root():
+async def root():
     """API health check"""
     return {
         "service": "Trust Propagation API",
@@ -78,25 +492,34 @@ def root():
     }
 
 @app.post("/build-graph")
-def build_graph(request: BuildGraphRequest):
+async def build_graph(request: BuildGraphRequest):
     """
     Build social graph from follower relationships and interactions
     """
     try:
         # Convert to dict format
-        followers = [f.dict() for f in request.followers]
-        interactions = [i.dict() for i in request.interactions]
+        followers = [f.model_dump() for f in request.followers]
+        interactions = [i.model_dump() for i in request.interactions]
         
-        # Build graph
-        trust_service.build_social_graph(followers, interactions)
-        trust_service.set_user_trust_scores(request.trust_scores)
+        # Build the new graph off the event loop and without holding the lock;
+        # only the swap (and its snapshot) is exclusive
+        graph = await _in_compute_pool(SocialGraph.from_relationships, followers, interactions)
+        
+        def swap():
+            trust_service.graph = graph
+            trust_service.graph_built = True
+            trust_service.set_user_trust_scores(request.trust_scores)
+            _clear_previews()
+            _detach_shards()
+        await _in_compute_pool(state_store.replace_state, trust_service, swap)
+        await _in_compute_pool(_rebalance_shards)
         
         return {
             "success": True,
             "message": "Social graph built successfully",
             "stats": {
-                "num_users": len(trust_service.user_graph),
-                "num_connections": sum(len(v) for v in trust_service.user_graph.values()) // 2,
+                "num_users": graph.num_users,
+                "num_connections": graph.num_connections,
                 "num_followers": len(followers),
                 "num_interactions": len(interactions)
             }
@@ -104,49 +527,267 @@ def build_graph(request: BuildGraphRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error building graph: {str(e)}")
 
-@app.post("/propagate-ban", response_model=PropagateBanResponse)
-def propagate_ban(request: PropagateBanRequest):
+def _follow_pairs(followers: List[Dict]) -> Tuple[Tuple[str, str], ...]:
+    return tuple((f['follower_id'], f['following_id']) for f in followers)
+
+def _graph_counters() -> Dict:
+    """Graph size counters (maintained incrementally by the graph)"""
+    return {
+        "num_users": trust_service.graph.num_users,
+        "num_connections": trust_service.graph.num_connections
+    }
+
+@app.post("/add-follows")
+async def add_follows(request: FollowDeltaRequest):
     """
-    Propagate trust score penalties when a user is banned
+    Add follower relationships to the current graph without rebuilding it
+    """
+    try:
+        followers = [f.model_dump() for f in request.followers]
+        applied, stats = await run_in_threadpool(
+            _mutate, 'add_follows', {'followers': followers},
+            lambda: (trust_service.add_follows(followers), _graph_counters()),
+            _follow_pairs(followers)
+        )
+        return {"success": True, "applied": applied, "stats": stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error adding follows: {str(e)}")
+
+@app.post("/remove-follows")
+async def remove_follows(request: FollowDeltaRequest):
+    """
+    Remove follower relationships (unfollows) from the current graph
     
-    Returns affected users with updated trust scores
+    Removes the whole connection between the two users
     """
     try:
-        if not trust_service.user_graph:
-            raise HTTPException(
-                status_code=400, 
-                detail="Social graph not built. Call /build-graph first."
-            )
-        
-        # Propagate penalties
-        affected_users = trust_service.propagate_ban_penalty(
-            banned_user_id=request.banned_user_id,
-            max_hops=request.max_hops,
-            base_penalty=request.base_penalty
+        followers = [f.model_dump() for f in request.followers]
+        removed, stats = await run_in_threadpool(
+            _mutate, 'remove_follows', {'followers': followers},
+            lambda: (trust_service.remove_follows(followers), _graph_counters()),
+            _follow_pairs(followers)
+        )
+        return {"success": True, "applied": removed, "stats": stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error removing follows: {str(e)}")
+
+@app.post("/add-interactions")
+async def add_interactions(request: InteractionDeltaRequest):
+    """
+    Add user interactions to the current graph without rebuilding it
+    """
+    try:
+        interactions = [i.model_dump() for i in request.interactions]
+        applied, stats = await run_in_threadpool(
+            _mutate, 'add_interactions', {'interactions': interactions},
+            lambda: (trust_service.add_interactions(interactions), _graph_counters()),
+            tuple((i['user_id'], i['target_user_id']) for i in interactions if i.get('target_user_id'))
+        )
+        return {"success": True, "applied": applied, "stats": stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error adding interactions: {str(e)}")
+
+@app.post("/patch-trust-scores")
+async def patch_trust_scores(request: TrustScorePatchRequest):
+    """
+    Update trust scores for a subset of users
+    """
+    try:
+        args = {
+            'trust_scores': request.trust_scores,
+            'content_trust_scores': request.content_trust_scores
+        }
+        await run_in_threadpool(
+            _mutate, 'patch_trust_scores', args,
+            lambda: trust_service.patch_trust_scores(**args)
         )
+        return {"success": True, "applied": len(request.trust_scores)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error patching trust scores: {str(e)}")
+
+@app.post("/propagate-ban", responses={200: {
+    "model": PropagateBanResponse,
+    "description": "Affected users (response_format 'full'); 'columnar' returns "
+                   "columns, total and next_cursor instead, with the same summary and preview_id"
+}})
+async def propagate_ban(request: PropagateBanRequest):
+    """
+    Propagate trust score penalties when a user is banned
+    
+    Returns affected users with updated trust scores. engine="ppr" spreads the
+    penalty by personalized PageRank instead of hop distance. With dry_run the
+    scores are left unchanged and a preview_id is returned for
+    /previews/{preview_id}/commit or DELETE /previews/{preview_id}
+    """
+    if request.engine == 'bfs' and request.max_hops > MAX_BFS_HOPS:
+        raise HTTPException(status_code=400,
+                            detail=f"max_hops above {MAX_BFS_HOPS} requires engine 'ppr'")
+    
+    # Propagate penalties (logged, since it updates trust scores)
+    args = {
+        'banned_user_id': request.banned_user_id,
+        'max_hops': request.max_hops,
+        'base_penalty': request.base_penalty,
+        'penalized_at': time.time(),
+        'epsilon': request.epsilon,
+        'max_fanout': request.max_fanout or DEFAULT_MAX_FANOUT
+    }
+    if request.engine == 'ppr':
+        args.update(engine='ppr', ppr_alpha=request.ppr_alpha, ppr_tolerance=request.ppr_tolerance)
+    
+    def run():
+        if request.response_format == 'columnar':
+            return run_columnar()
+        affected_users, traversal, preview_id = _propagate('propagate_ban_penalty', args,
+                                                           trust_service.compute_user_ban_penalties,
+                                                           request.dry_run)
         
         # Get summary
         summary = trust_service.get_affected_users_summary(affected_users)
+        summary.update(traversal)
         
-        return PropagateBanResponse(
-            success=True,
-            affected_users=affected_users,
-            summary=summary
-        )
+        # Serialized here so large responses are not encoded on the event loop
+        return JSONResponse(content={
+            "success": True,
+            "affected_users": affected_users,
+            "summary": summary,
+            "preview_id": preview_id
+        })
+    
+    def run_columnar():
+        # No per-user dicts: the page is cut from the arrays with a partial sort
+        penalties, scores, traversal, preview_id = _propagate_arrays('propagate_ban_penalty', args,
+                                                                     trust_service.compute_user_ban_penalties,
+                                                                     request.dry_run)
+        summary = trust_service.penalty_summary(penalties)
+        summary.update(traversal)
+        return _fast_json({
+            "success": True,
+            **_columnar_page(penalties, scores, 0, request.limit, request.min_penalty),
+            "summary": summary,
+            "preview_id": preview_id
+        })
+    
+    try:
+        return await _in_compute_pool(run)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error propagating ban: {str(e)}")
 
+@app.get("/propagate-ban/pages")
+async def propagate_ban_page(cursor: str):
+    """
+    Next page of a columnar /propagate-ban result
+    
+    The cursor comes from the previous page's next_cursor; pages use the
+    original request's limit and min_penalty. Only the result is paged -
+    the penalties were all applied by the original request
+    """
+    result_id, _, offset = cursor.partition(':')
+    if not offset.isdigit():
+        raise HTTPException(status_code=400, detail=f"Malformed cursor '{cursor}'")
+    with previews_lock:
+        result = paged_results.get(result_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired; run the propagation again")
+    
+    def page():
+        penalties, scores, limit, min_penalty = result
+        return _fast_json({"success": True, **_columnar_page(penalties, scores, int(offset), limit, min_penalty,
+                                                             result_id)})
+    return await _in_compute_pool(page)
+
+@app.post("/propagate-bans", responses={200: {"model": PropagateBansResponse, "description": "Merged affected users"}})
+async def propagate_bans(request: PropagateBansRequest):
+    """
+    Propagate trust score penalties for several banned users at once
+    
+    Walks the graph once from all banned users and returns one merged
+    affected-user map with a single combined penalty per user. Supports
+    dry_run like /propagate-ban
+    """
+    args = {
+        'banned_user_ids': request.banned_user_ids,
+        'max_hops': request.max_hops,
+        'base_penalty': request.base_penalty,
+        'aggregation': request.aggregation,
+        'penalty_cap': request.penalty_cap,
+        'penalized_at': time.time(),
+        'epsilon': request.epsilon,
+        'max_fanout': request.max_fanout or DEFAULT_MAX_FANOUT
+    }
+    
+    def run():
+        affected_users, traversal, preview_id = _propagate('propagate_ban_penalties', args,
+                                                           trust_service.compute_batch_ban_penalties,
+                                                           request.dry_run)
+        
+        summary = trust_service.get_affected_users_summary(affected_users)
+        summary['num_banned'] = len(set(request.banned_user_ids))
+        summary['aggregation'] = request.aggregation
+        summary.update(traversal)
+        
+        return JSONResponse(content={
+            "success": True,
+            "affected_users": affected_users,
+            "summary": summary,
+            "preview_id": preview_id
+        })
+    
+    try:
+        return await _in_compute_pool(run)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error propagating bans: {str(e)}")
+
+@app.post("/previews/{preview_id}/commit")
+async def commit_preview(preview_id: str):
+    """
+    Apply a dry-run propagation's scores exactly as previewed
+    
+    Fails with 409 if the graph or any affected user's score changed since
+    the preview; the preview is dropped either way
+    """
+    def commit():
+        op, args, overlay = _pop_preview(preview_id)
+        with state_lock.write:
+            if not overlay.is_current():
+                raise HTTPException(
+                    status_code=409,
+                    detail="Scores or graph changed since the preview; run the dry run again"
+                )
+            args['penalized_at'] = time.time()
+            applied = trust_service.commit_overlay(overlay, args['penalized_at'])
+            # Replaying the original propagation reproduces the previewed scores
+            state_store.append(op, args)
+        return {"success": True, "applied": applied}
+    
+    try:
+        return await run_in_threadpool(commit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error committing preview: {str(e)}")
+
+@app.delete("/previews/{preview_id}")
+async def discard_preview(preview_id: str):
+    """Discard a dry-run propagation without applying it"""
+    _pop_preview(preview_id)
+    return {"success": True}
+
 @app.post("/compute-recovery", response_model=RecoveryResponse)
-def compute_recovery(request: RecoveryRequest):
+async def compute_recovery(request: RecoveryRequest):
     """
     Compute trust score recovery for a user over time
     """
     try:
-        recovery_data = trust_service.compute_trust_recovery(
+        recovery_data = await run_in_threadpool(_read, lambda: trust_service.compute_trust_recovery(
             user_id=request.user_id,
             days_since_penalty=request.days_since_penalty,
             recovery_rate=request.recovery_rate
-        )
+        ))
         
         return RecoveryResponse(
             user_id=request.user_id,
@@ -155,17 +796,50 @@ def compute_recovery(request: RecoveryRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error computing recovery: {str(e)}")
 
-@app.get("/graph-stats")
-def get_graph_stats():
-    """Get statistics about the current social graph"""
-    if not trust_service.user_graph:
+@app.post("/run-recovery", responses={200: {"model": RecoveryJobResponse, "description": "Recovered users and a summary"}})
+async def run_recovery(request: RecoveryJobRequest):
+    """
+    Recover trust for every penalized user at once (e.g. from a daily job)
+    
+    Uses the penalty ledger, so callers need not track who was penalized or
+    when; each run only returns what recovered since the previous one
+    """
+    args = {
+        'now': time.time(),
+        'recovery_rate': request.recovery_rate,
+        'max_recovery': request.max_recovery
+    }
+    
+    def run():
+        if request.apply:
+            recovered_users = _mutate('run_trust_recovery', args, lambda: trust_service.run_trust_recovery(**args))
+        else:
+            recovered_users = _read(lambda: trust_service.run_trust_recovery(**args, apply=False))
+        return JSONResponse(content={
+            "success": True,
+            "recovered_users": recovered_users,
+            "summary": {
+                "num_recovered": len(recovered_users),
+                "total_recovery": round(sum(u['recovery_applied'] for u in recovered_users.values()), 4),
+                "pending_penalties": len(trust_service.penalty_ledger),
+                "applied": request.apply
+            }
+        })
+    
+    try:
+        return await _in_compute_pool(run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error running recovery: {str(e)}")
+
+def _graph_stats() -> Dict:
+    if not trust_service.graph_built:
         return {
             "graph_built": False,
             "message": "No graph built yet"
         }
     
-    num_users = len(trust_service.user_graph)
-    num_connections = sum(len(v) for v in trust_service.user_graph.values()) // 2
+    num_users = trust_service.graph.num_users
+    num_connections = trust_service.graph.num_connections
     
     avg_connections = num_connections / num_users if num_users > 0 else 0
     
@@ -174,14 +848,47 @@ def get_graph_stats():
         "num_users": num_users,
         "num_connections": num_connections,
         "avg_connections_per_user": round(avg_connections, 2),
-        "num_trust_scores": len(trust_service.user_trust_scores)
+        "num_trust_scores": len(trust_service.user_trust_scores),
+        "pending_penalties": len(trust_service.penalty_ledger)
     }
 
+@app.get("/graph-stats")
+async def get_graph_stats():
+    """Get statistics about the current social graph"""
+    return await run_in_threadpool(_read, _graph_stats)
+
+@app.get("/shards")
+async def get_shard_stats():
+    """Partition of the graph across shard nodes (TRUST_SHARD_URLS); edge_cut is as of the last rebalance"""
+    if shard_coordinator is None:
+        return {"sharded": False}
+    return {"sharded": True, **shard_coordinator.stats}
+
+@app.post("/shards/rebalance")
+async def rebalance_shards():
+    """
+    Re-partition the graph by community and upload every shard
+    
+    Graph changes otherwise go to the shards owning their users, so the
+    partition drifts from the communities over time; this restores it.
+    """
+    if shard_coordinator is None:
+        raise HTTPException(status_code=400, detail="Not sharded: TRUST_SHARD_URLS is not set")
+    try:
+        await _in_compute_pool(shard_coordinator.rebalance, _graph_snapshot)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rebalancing shards: {str(e)}")
+    return {"success": True, **shard_coordinator.stats}
+
 @app.post("/reset")
-def reset_graph():
+async def reset_graph():
     """Reset the social graph (for testing)"""
-    global trust_service
-    trust_service = TrustPropagationService()
+    def reset():
+        trust_service.reset()
+        _clear_previews()
+        _detach_shards()
+    await run_in_threadpool(state_store.replace_state, trust_service, reset)
+    await run_in_threadpool(_rebalance_shards)
     return {
         "success": True,
         "message": "Social graph reset successfully"
@@ -3,23 +3,108 @@ Trust Score Propagation Service
 Propagates trust score penalties when users are banned based on their interactions
 """
 
+import time
 import torch
 import numpy as np
-from typing import Dict, List, Tuple, Set
+from typing import Callable, Dict, List, Optional, Tuple, Set
 from datetime import datetime
-from collections import defaultdict, deque
+from collections import defaultdict
+from social_graph import SocialGraph, AdjacencyView, WeightView
+from penalty_ledger import PenaltyLedger
+
+# Indexed by is_follower * 2 + is_following
+RELATIONSHIP_TYPES = np.array(["indirect_connection", "following", "follower", "mutual_follow"])
+
+# How propagate_ban_penalties combines penalties from several banned users
+AGGREGATIONS = ('max', 'sum', 'prob_or')
+
+# How propagate_ban_penalty walks the graph: hop-by-hop BFS with a 1/distance^1.5
+# falloff, or approximate personalized PageRank by local push
+ENGINES = ('bfs', 'ppr')
+
+class ScoreOverlay:
+    """
+    Copy-on-write layer over a service's trust score tables
+    
+    Dry-run propagations write here instead of the service. The overlay holds
+    only the touched users, plus the base scores each change was computed
+    from, so it can later be committed if those are still current.
+    """
+    
+    def __init__(self, service: 'TrustPropagationService'):
+        self.service = service
+        self.graph = service.graph
+        self.graph_version = service.graph.version
+        self.user_trust_scores = {}  # user_id -> pending trust score
+        self.user_content_trust_scores = {}  # user_id -> pending content trust score
+        self.penalties = {}  # user_id -> trust taken by the pending changes
+        self._base_trust = {}  # user_id -> base score read (None if unset)
+        self._base_content = {}
+    
+    def __len__(self) -> int:
+        return len(self.user_trust_scores)
+    
+    def current_scores(self, user_ids: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Trust and content scores as seen through the overlay (default 0.5)"""
+        trust = np.empty(len(user_ids), dtype=np.float64)
+        content = np.empty(len(user_ids), dtype=np.float64)
+        base_trust, base_content = self.service.user_trust_scores, self.service.user_content_trust_scores
+        for i, user_id in enumerate(user_ids):
+            if user_id in self.user_trust_scores:
+                trust[i] = self.user_trust_scores[user_id]
+                content[i] = self.user_content_trust_scores[user_id]
+                continue
+            trust_value = self._base_trust.setdefault(user_id, base_trust.get(user_id))
+            content_value = self._base_content.setdefault(user_id, base_content.get(user_id))
+            trust[i] = 0.5 if trust_value is None else trust_value
+            content[i] = 0.5 if content_value is None else content_value
+        return trust, content
+    
+    def set_scores(self, user_ids: List[str], trust: np.ndarray, content: np.ndarray, taken: np.ndarray):
+        self.user_trust_scores.update(zip(user_ids, trust.tolist()))
+        self.user_content_trust_scores.update(zip(user_ids, content.tolist()))
+        for user_id, amount in zip(user_ids, taken.tolist()):
+            self.penalties[user_id] = self.penalties.get(user_id, 0.0) + amount
+    
+    def is_current(self) -> bool:
+        """True if the graph and every base score read are unchanged"""
+        service = self.service
+        if service.graph is not self.graph or self.graph.version != self.graph_version:
+            return False
+        return (all(service.user_trust_scores.get(u) == v for u, v in self._base_trust.items()) and
+                all(service.user_content_trust_scores.get(u) == v for u, v in self._base_content.items()))
 
 class TrustPropagationService:
     """
     Propagates trust score changes through the social graph when users are banned.
     Uses graph traversal to identify affected users and compute penalty scores.
+    The graph is held as a compact CSR SocialGraph over interned integer ids.
     """
     
     def __init__(self):
-        self.user_graph = defaultdict(set)  # user_id -> set of connected user_ids
-        self.interaction_weights = {}  # (user1, user2) -> weight
+        self.graph = SocialGraph()
+        self.graph_built = False  # Set by a build; an empty built graph still counts
         self.user_trust_scores = {}  # user_id -> current trust score
         self.user_content_trust_scores = {}  # user_id -> content trust score
+        self.penalty_ledger = PenaltyLedger()  # Applied penalties awaiting recovery
+    
+    def reset(self):
+        """Clear the graph, all scores and the penalty ledger in place"""
+        self.graph = SocialGraph()
+        self.graph_built = False
+        self.user_trust_scores = {}
+        self.user_content_trust_scores = {}
+        self.penalty_ledger = PenaltyLedger()
+    
+    @property
+    def user_graph(self) -> AdjacencyView:
+        """Read-only user_id -> set of connected user_ids view"""
+        return AdjacencyView(self.graph)
+    
+    @property
+    def interaction_weights(self) -> WeightView:
+        """Read-only (user1, user2) -> weight view"""
+        return WeightView(self.graph)
     
     def build_social_graph(self, followers: List[Dict], interactions: List[Dict]):
         """
@@ -28,48 +113,104 @@ class TrustPropagationService:
         Args:
             followers: List of {follower_id, following_id}
             interactions: List of {user_id, target_user_id, type, weight}
+        
+        Follows connect both users (follower->following weight 0.8,
+        following->follower weight 0.3); interactions (likes, comments, etc.)
+        connect both users and keep the maximum weight per direction.
+        """
+        self.graph = SocialGraph.from_relationships(followers, interactions)
+        self.graph_built = True
+    
+    def set_user_trust_scores(self, trust_scores: Dict[str, float]):
+        """Set current trust scores for users"""
+        self.user_trust_scores = trust_scores.copy()
+        self.user_content_trust_scores = trust_scores.copy()
+    
+    def add_follows(self, followers: List[Dict]) -> int:
         """
-        self.user_graph.clear()
-        self.interaction_weights.clear()
+        Add follower relationships to the existing graph in O(len(followers))
         
-        # Add follower relationships
+        Args:
+            followers: List of {follower_id, following_id}
+        
+        Returns:
+            Number of follows applied
+        """
+        graph = self.graph
         for follow in followers:
-            follower_id = follow['follower_id']
-            following_id = follow['following_id']
-            
-            # Bidirectional connection
-            self.user_graph[follower_id].add(following_id)
-            self.user_graph[following_id].add(follower_id)
-            
-            # Follower has stronger connection to following
-            self.interaction_weights[(follower_id, following_id)] = 0.8
-            self.interaction_weights[(following_id, follower_id)] = 0.3
-        
-        # Add interaction-based connections (likes, comments, etc.)
+            graph.add_follow(graph.intern(follow['follower_id']), graph.intern(follow['following_id']))
+        return len(followers)
+    
+    def remove_follows(self, followers: List[Dict]) -> int:
+        """
+        Remove follower relationships (unfollows) from the existing graph
+        
+        The graph does not track where a weight came from, so removing a
+        follow removes the whole connection between the two users, including
+        weights from interactions between them.
+        
+        Args:
+            followers: List of {follower_id, following_id}
+        
+        Returns:
+            Number of connections removed
+        """
+        graph = self.graph
+        removed = 0
+        for follow in followers:
+            follower = graph.index_of(follow['follower_id'])
+            following = graph.index_of(follow['following_id'])
+            if follower is not None and following is not None:
+                removed += graph.remove_connection(follower, following)
+        return removed
+    
+    def add_interactions(self, interactions: List[Dict]) -> int:
+        """
+        Add interactions to the existing graph in O(len(interactions))
+        
+        Args:
+            interactions: List of {user_id, target_user_id, type, weight}
+        
+        Returns:
+            Number of interactions applied (those without a target user are skipped)
+        """
+        graph = self.graph
+        applied = 0
         for interaction in interactions:
-            user_id = interaction['user_id']
             target_user_id = interaction.get('target_user_id')
-            weight = interaction.get('weight', 0.5)
-            
             if target_user_id:
-                self.user_graph[user_id].add(target_user_id)
-                self.user_graph[target_user_id].add(user_id)
-                
-                # Update weights (keep maximum)
-                key = (user_id, target_user_id)
-                self.interaction_weights[key] = max(
-                    self.interaction_weights.get(key, 0), 
-                    weight
-                )
+                graph.add_interaction(graph.intern(interaction['user_id']), graph.intern(target_user_id),
+                                      interaction.get('weight', 0.5))
+                applied += 1
+        return applied
     
-    def set_user_trust_scores(self, trust_scores: Dict[str, float]):
-        """Set current trust scores for users"""
-        self.user_trust_scores = trust_scores.copy()
-        self.user_content_trust_scores = trust_scores.copy()
+    def patch_trust_scores(self, trust_scores: Dict[str, float],
+                           content_trust_scores: Optional[Dict[str, float]] = None):
+        """
+        Update trust scores for some users, leaving everyone else untouched
+        
+        Args:
+            trust_scores: user_id -> new user trust score
+            content_trust_scores: user_id -> new content trust score; users
+                without one keep their current content trust score, or start
+                from their user trust score like set_user_trust_scores
+        """
+        self.user_trust_scores.update(trust_scores)
+        for user_id, score in trust_scores.items():
+            self.user_content_trust_scores.setdefault(user_id, score)
+        if content_trust_scores:
+            self.user_content_trust_scores.update(content_trust_scores)
     
     def propagate_ban_penalty(self, banned_user_id: str, 
                              max_hops: int = 2,
-                             base_penalty: float = 0.15) -> Dict[str, Dict[str, float]]:
+                             base_penalty: float = 0.15,
+                             overlay: Optional[ScoreOverlay] = None,
+                             penalized_at: Optional[float] = None,
+                             epsilon: float = 0.0,
+                             max_fanout: Optional[int] = None,
+                             engine: str = 'bfs',
+                             ppr_alpha: float = 0.15,
+                             ppr_tolerance: float = 1e-4) -> Dict[str, Dict[str, float]]:
         """
         Propagate trust score penalties when a user is banned
         
@@ -77,6 +218,18 @@ class TrustPropagationService:
             banned_user_id: ID of the banned user
             max_hops: Maximum distance to propagate (1=direct connections, 2=friends of friends)
             base_penalty: Base penalty for direct connections (0-1)
+            overlay: Dry run - write the new scores to this overlay instead
+                of the service's score tables
+            penalized_at: Unix time recorded in the penalty ledger (default now)
+            epsilon: Skip (and do not expand from) users whose penalty would
+                be below this
+            max_fanout: Expand at most this many connections per user, the
+                strongest first, so hub accounts do not pull in the whole graph
+            engine: 'bfs' (hop-by-hop falloff) or 'ppr' (personalized
+                PageRank, see compute_ppr_ban_penalties)
+            ppr_alpha: Restart probability of the 'ppr' engine
+            ppr_tolerance: Push tolerance of the 'ppr' engine; its cost grows
+                with 1 / (ppr_alpha * ppr_tolerance), not with the graph
         
         Returns:
             Dict mapping user_id to {
@@ -87,82 +240,492 @@ class TrustPropagationService:
                 'relationship_type': str
             }
         """
-        if banned_user_id not in self.user_graph:
+        penalties = self.compute_user_ban_penalties(banned_user_id, max_hops, base_penalty,
+                                                    epsilon, max_fanout, engine, ppr_alpha, ppr_tolerance)
+        if penalties is None:
             return {}
+        return self.apply_penalties(penalties, overlay, penalized_at)
+    
+    def compute_user_ban_penalties(self, banned_user_id: str, max_hops: int = 2,
+                                   base_penalty: float = 0.15,
+                                   epsilon: float = 0.0,
+                                   max_fanout: Optional[int] = None,
+                                   engine: str = 'bfs',
+                                   ppr_alpha: float = 0.15,
+                                   ppr_tolerance: float = 1e-4) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Penalty arrays for propagate_ban_penalty without applying them
         
-        affected_users = {}
-        visited = set()
-        queue = deque([(banned_user_id, 0)])  # (user_id, distance)
+        Returns:
+            Arrays as returned by compute_ban_penalties, or None if the user
+            has no connections
+        """
+        banned_idx = self.graph.index_of(banned_user_id)
+        if banned_idx is None:
+            return None
+        return self.compute_index_ban_penalties(banned_idx, max_hops, base_penalty, epsilon, max_fanout,
+                                                engine, ppr_alpha, ppr_tolerance)
+    
+    def compute_index_ban_penalties(self, banned_idx: int, max_hops: int = 2,
+                                    base_penalty: float = 0.15,
+                                    epsilon: float = 0.0,
+                                    max_fanout: Optional[int] = None,
+                                    engine: str = 'bfs',
+                                    ppr_alpha: float = 0.15,
+                                    ppr_tolerance: float = 1e-4) -> Optional[Dict[str, np.ndarray]]:
+        """
+        compute_user_ban_penalties for a graph index
         
-        while queue:
-            current_user, distance = queue.popleft()
-            
-            if current_user in visited or distance > max_hops:
-                continue
-            
-            visited.add(current_user)
-            
-            # Skip the banned user themselves
-            if current_user == banned_user_id:
-                # Add neighbors to queue
-                for neighbor in self.user_graph[current_user]:
-                    if neighbor not in visited:
-                        queue.append((neighbor, distance + 1))
-                continue
-            
-            # Calculate penalty based on distance and connection strength
-            connection_weight = self.interaction_weights.get(
-                (current_user, banned_user_id), 
-                0.5
-            )
-            
-            # Penalty decreases with distance
-            distance_factor = 1.0 / (distance ** 1.5)
-            penalty = base_penalty * connection_weight * distance_factor
-            
-            # Get current scores
-            current_trust = self.user_trust_scores.get(current_user, 0.5)
-            current_content_trust = self.user_content_trust_scores.get(current_user, 0.5)
-            
-            # Apply penalties
-            # User trust score decreases (less trustworthy)
-            new_user_trust = max(0.1, current_trust - penalty)
-            
-            # Content trust score increases (more scrutiny needed)
-            # Higher content trust = stricter moderation
-            content_penalty_factor = 1.5  # Content scrutiny increases more
-            new_content_trust = min(0.9, current_content_trust + (penalty * content_penalty_factor))
-            
-            # Determine relationship type
-            relationship_type = self._determine_relationship(
-                current_user, banned_user_id
-            )
-            
-            affected_users[current_user] = {
-                'new_user_trust_score': round(new_user_trust, 4),
-                'new_content_trust_score': round(new_content_trust, 4),
-                'penalty_applied': round(penalty, 4),
-                'distance': distance,
+        Needs no user ids, so it also runs on a worker's shared-memory graph.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+        if self.graph.degree(banned_idx) == 0:
+            return None
+        if engine == 'ppr':
+            return self.compute_ppr_ban_penalties(banned_idx, max_hops, base_penalty, epsilon, max_fanout,
+                                                  ppr_alpha, ppr_tolerance)
+        return self.compute_ban_penalties(banned_idx, max_hops, base_penalty, epsilon, max_fanout)
+    
+    def propagate_ban_penalties(self, banned_user_ids: List[str],
+                                max_hops: int = 2,
+                                base_penalty: float = 0.15,
+                                aggregation: str = 'max',
+                                penalty_cap: float = 0.5,
+                                overlay: Optional[ScoreOverlay] = None,
+                                penalized_at: Optional[float] = None,
+                                epsilon: float = 0.0,
+                                max_fanout: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Propagate penalties for several banned users in one multi-source traversal
+        
+        Each affected user gets one combined penalty from all banned users
+        within max_hops, so the result does not depend on the order of the bans.
+        
+        Args:
+            banned_user_ids: IDs of the banned users
+            max_hops: Maximum distance to propagate
+            base_penalty: Base penalty for direct connections (0-1)
+            aggregation: How per-ban penalties combine: 'max' (strongest
+                connection), 'sum' (total, capped at penalty_cap) or 'prob_or'
+                (1 - prod(1 - penalty))
+            penalty_cap: Upper bound on the combined penalty for 'sum'
+            overlay: Dry run - write the new scores to this overlay instead
+                of the service's score tables
+            penalized_at: Unix time recorded in the penalty ledger (default now)
+            epsilon: Skip (user, banned user) pairs whose penalty would be
+                below this, and do not expand from them
+            max_fanout: Expand at most this many connections per user
+        
+        Returns:
+            Dict mapping user_id to the same fields as propagate_ban_penalty
+            (distance is the closest banned user; relationship_type and
+            connection_weight come from the strongest one), plus
+            'banned_connections': number of banned users within max_hops
+        """
+        penalties = self.compute_batch_ban_penalties(banned_user_ids, max_hops, base_penalty,
+                                                     aggregation, penalty_cap, epsilon, max_fanout)
+        if penalties is None:
+            return {}
+        return self.apply_penalties(penalties, overlay, penalized_at)
+    
+    def compute_batch_ban_penalties(self, banned_user_ids: List[str],
+                                    max_hops: int = 2,
+                                    base_penalty: float = 0.15,
+                                    aggregation: str = 'max',
+                                    penalty_cap: float = 0.5,
+                                    epsilon: float = 0.0,
+                                    max_fanout: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Combined penalty arrays for propagate_ban_penalties without applying them
+        
+        Returns:
+            Arrays as returned by compute_ban_penalties plus
+            'banned_connections', or None if no banned user has connections
+        """
+        graph = self.graph
+        sources = {graph.index_of(user_id) for user_id in banned_user_ids}
+        sources = np.array(sorted(idx for idx in sources if idx is not None), dtype=np.int64)
+        return self.compute_sources_ban_penalties(sources, max_hops, base_penalty, aggregation,
+                                                  penalty_cap, epsilon, max_fanout)
+    
+    def compute_sources_ban_penalties(self, sources: np.ndarray,
+                                      max_hops: int = 2,
+                                      base_penalty: float = 0.15,
+                                      aggregation: str = 'max',
+                                      penalty_cap: float = 0.5,
+                                      epsilon: float = 0.0,
+                                      max_fanout: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        """
+        compute_batch_ban_penalties for sorted unique graph indices
+        
+        Needs no user ids, so it also runs on a worker's shared-memory graph.
+        """
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation '{aggregation}', expected one of {AGGREGATIONS}")
+        
+        graph = self.graph
+        sources = sources[graph.degrees()[sources] > 0]
+        if len(sources) == 0:
+            return None
+        
+        prune = None
+        if epsilon > 0:
+            def prune(hop, nodes, source_positions):
+                to_banned, _ = graph.incident_pair_weights(sources, nodes, source_positions)
+                weight = np.where(np.isnan(to_banned), 0.5, to_banned)
+                return base_penalty * weight / hop ** 1.5 >= epsilon
+        
+        # Every (user, banned user) pair within max_hops, skipping banned users themselves
+        traversal = {}
+        nodes, source_positions, hops = graph.multi_source_hop_distances(sources, max_hops, max_fanout,
+                                                                         prune, traversal)
+        keep = ~np.isin(nodes, sources)
+        nodes, source_positions, hops = nodes[keep], source_positions[keep], hops[keep]
+        if len(nodes) == 0:
+            # Only banned users were reached (a banned ring) or epsilon pruned every pair
+            return {
+                'user_index': nodes,
+                'distance': hops,
+                'connection_weight': np.zeros(0),
+                'penalty': np.zeros(0),
+                'relationship_code': np.zeros(0, dtype=np.int64),
+                'banned_connections': np.zeros(0, dtype=np.int64),
+                'capped_index': traversal['capped'],
+                'num_pruned': traversal['pruned']
+            }
+        
+        to_banned, from_banned = graph.incident_pair_weights(sources, nodes, source_positions)
+        is_follower = ~np.isnan(to_banned)
+        connection_weight = np.where(is_follower, to_banned, 0.5)
+        penalty = base_penalty * connection_weight / (hops.astype(np.float64) ** 1.5)
+        
+        # Group pairs by user, strongest penalty first within each group
+        order = np.lexsort((-penalty, nodes))
+        nodes, hops, penalty = nodes[order], hops[order], penalty[order]
+        starts = np.flatnonzero(np.r_[True, nodes[1:] != nodes[:-1]])
+        strongest = order[starts]
+        
+        if aggregation == 'max':
+            combined = penalty[starts]
+        elif aggregation == 'sum':
+            combined = np.minimum(np.add.reduceat(penalty, starts), penalty_cap)
+        else:
+            combined = 1.0 - np.multiply.reduceat(1.0 - penalty, starts)
+        
+        affected = nodes[starts]
+        distance = np.minimum.reduceat(hops, starts)
+        by_distance = np.lexsort((affected, distance))
+        
+        return {
+            'user_index': affected[by_distance],
+            'distance': distance[by_distance],
+            'connection_weight': connection_weight[strongest][by_distance],
+            'penalty': combined[by_distance],
+            'relationship_code': (is_follower * 2 + ~np.isnan(from_banned))[strongest][by_distance],
+            'banned_connections': np.diff(np.r_[starts, len(nodes)])[by_distance],
+            'capped_index': traversal['capped'],
+            'num_pruned': traversal['pruned']
+        }
+    
+    def apply_penalties(self, penalties: Dict[str, np.ndarray],
+                        overlay: Optional[ScoreOverlay] = None,
+                        penalized_at: Optional[float] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Apply penalty arrays to the current scores and build the per-user result
+        
+        Args:
+            penalties: Parallel arrays as returned by compute_ban_penalties,
+                optionally with 'banned_connections'
+            overlay: Write the new scores here instead of the score tables
+            penalized_at: Unix time recorded in the penalty ledger (default now)
+        
+        Returns:
+            Dict mapping user_id to its updated scores and penalty details
+        """
+        return self.format_penalties(penalties, self.update_scores(penalties, overlay, penalized_at))
+    
+    def update_scores(self, penalties: Dict[str, np.ndarray],
+                      overlay: Optional[ScoreOverlay] = None,
+                      penalized_at: Optional[float] = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Apply penalty arrays to the current scores
+        
+        Args:
+            penalties: Parallel arrays as returned by compute_ban_penalties
+            overlay: Read and write scores through this overlay, leaving the
+                score tables untouched
+            penalized_at: Unix time recorded in the penalty ledger (default now)
+        
+        Returns:
+            (user_ids, new_user_trust, new_content_trust) for format_penalties
+        """
+        graph = self.graph
+        affected = penalties['user_index']
+        penalty = penalties['penalty']
+        
+        # Get current scores
+        user_ids = [graph.ids[idx] for idx in affected.tolist()]
+        if overlay is not None:
+            current_trust, current_content_trust = overlay.current_scores(user_ids)
+        else:
+            current_trust = np.array([self.user_trust_scores.get(u, 0.5) for u in user_ids], dtype=np.float64)
+            current_content_trust = np.array([self.user_content_trust_scores.get(u, 0.5) for u in user_ids], dtype=np.float64)
+        
+        # Apply penalties
+        # User trust score decreases (less trustworthy)
+        new_user_trust = np.maximum(0.1, current_trust - penalty)
+        
+        # Content trust score increases (more scrutiny needed)
+        # Higher content trust = stricter moderation
+        content_penalty_factor = 1.5  # Content scrutiny increases more
+        new_content_trust = np.minimum(0.9, current_content_trust + (penalty * content_penalty_factor))
+        
+        # Update internal scores for cascading effects
+        # The ledger records the trust actually taken (after the 0.1 floor)
+        taken = current_trust - new_user_trust
+        if overlay is not None:
+            overlay.set_scores(user_ids, new_user_trust, new_content_trust, taken)
+        else:
+            self.user_trust_scores.update(zip(user_ids, new_user_trust.tolist()))
+            self.user_content_trust_scores.update(zip(user_ids, new_content_trust.tolist()))
+            self.penalty_ledger.record(user_ids, taken, time.time() if penalized_at is None else penalized_at)
+        
+        return user_ids, new_user_trust, new_content_trust
+    
+    def commit_overlay(self, overlay: ScoreOverlay, penalized_at: Optional[float] = None) -> int:
+        """
+        Apply a dry run's pending scores to the score tables
+        
+        Args:
+            overlay: Overlay filled by a dry-run propagation on this service
+            penalized_at: Unix time recorded in the penalty ledger (default now)
+        
+        Returns:
+            Number of users updated
+        
+        Raises:
+            ValueError: If the graph or a base score changed since the dry run
+        """
+        if overlay.service is not self or not overlay.is_current():
+            raise ValueError("Scores or graph changed since the dry run; run it again")
+        self.user_trust_scores.update(overlay.user_trust_scores)
+        self.user_content_trust_scores.update(overlay.user_content_trust_scores)
+        self.penalty_ledger.record(list(overlay.penalties), np.fromiter(overlay.penalties.values(), dtype=np.float64),
+                                   time.time() if penalized_at is None else penalized_at)
+        return len(overlay)
+    
+    def format_penalties(self, penalties: Dict[str, np.ndarray],
+                         scores: Tuple[List[str], np.ndarray, np.ndarray]) -> Dict[str, Dict[str, float]]:
+        """
+        Build the per-user result for penalties applied by update_scores
+        
+        Only reads its arguments, so it can run after the service lock is released.
+        """
+        user_ids, new_user_trust, new_content_trust = scores
+        penalty = penalties['penalty']
+        relationship_types = RELATIONSHIP_TYPES[penalties['relationship_code']]
+        
+        affected_users = {
+            user_id: {
+                'new_user_trust_score': trust,
+                'new_content_trust_score': content_trust,
+                'penalty_applied': user_penalty,
+                'distance': hop,
                 'relationship_type': relationship_type,
-                'connection_weight': round(connection_weight, 4)
+                'connection_weight': weight
             }
-            
-            # Update internal scores for cascading effects
-            self.user_trust_scores[current_user] = new_user_trust
-            self.user_content_trust_scores[current_user] = new_content_trust
-            
-            # Add neighbors to queue
-            for neighbor in self.user_graph[current_user]:
-                if neighbor not in visited:
-                    queue.append((neighbor, distance + 1))
+            for user_id, trust, content_trust, user_penalty, hop, relationship_type, weight in zip(
+                user_ids,
+                np.round(new_user_trust, 4).tolist(),
+                np.round(new_content_trust, 4).tolist(),
+                np.round(penalty, 4).tolist(),
+                penalties['distance'].tolist(),
+                relationship_types.tolist(),
+                np.round(penalties['connection_weight'], 4).tolist()
+            )
+        }
+        
+        if 'banned_connections' in penalties:
+            for data, count in zip(affected_users.values(), penalties['banned_connections'].tolist()):
+                data['banned_connections'] = count
         
         return affected_users
     
+    def compute_ban_penalties(self, banned_idx: int, max_hops: int = 2,
+                              base_penalty: float = 0.15,
+                              epsilon: float = 0.0,
+                              max_fanout: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Array core of propagate_ban_penalty over interned user indices
+        
+        Args:
+            banned_idx: Graph index of the banned user
+            max_hops: Maximum distance to propagate
+            base_penalty: Base penalty for direct connections (0-1)
+            epsilon: Prune users whose penalty would be below this
+            max_fanout: Expand at most this many connections per user
+        
+        Returns:
+            Dict of parallel arrays ordered by distance then index: user_index,
+            distance, connection_weight, penalty, relationship_code
+            (index into RELATIONSHIP_TYPES); plus capped_index (users whose
+            expansion was cut by max_fanout) and num_pruned
+        """
+        graph = self.graph
+        
+        # Only direct neighbors carry weights to/from the banned user
+        to_banned_all, from_banned_all = graph.incident_weights(banned_idx)
+        prune = self.epsilon_filter(lambda nodes: to_banned_all[nodes], base_penalty, epsilon)
+        
+        # Hop distance of every user from the banned user (frontier expansion)
+        traversal = {}
+        distance = graph.hop_distances(banned_idx, max_hops, max_fanout, prune, traversal)
+        distance[banned_idx] = -1  # Skip the banned user themselves
+        return self.distance_penalties(distance, to_banned_all, from_banned_all, base_penalty, traversal)
+    
+    @staticmethod
+    def epsilon_filter(to_banned: Callable[[np.ndarray], np.ndarray], base_penalty: float,
+                       epsilon: float) -> Optional[Callable[[int, np.ndarray], np.ndarray]]:
+        """
+        keep(hop, nodes) for hop_distances: users whose penalty would reach epsilon
+        
+        Args:
+            to_banned: Weights nodes -> banned user for an array of nodes (NaN where none)
+        
+        Returns:
+            The filter, or None if epsilon is 0 (nothing is pruned)
+        """
+        if epsilon <= 0:
+            return None
+        def keep(hop, nodes):
+            weight = to_banned(nodes)
+            weight = np.where(np.isnan(weight), 0.5, weight)
+            return base_penalty * weight / hop ** 1.5 >= epsilon
+        return keep
+    
+    @staticmethod
+    def distance_penalties(distance: np.ndarray, to_banned_all: np.ndarray, from_banned_all: np.ndarray,
+                           base_penalty: float, traversal: Dict) -> Dict[str, np.ndarray]:
+        """
+        compute_ban_penalties arrays from finished hop distances
+        
+        Args:
+            distance: Hop distance per node (> 0 for affected users)
+            to_banned_all, from_banned_all: incident_weights of the banned user
+            base_penalty: Base penalty for direct connections (0-1)
+            traversal: hop_distances stats ('capped' and 'pruned')
+        """
+        affected = np.flatnonzero(distance > 0)
+        affected = affected[np.argsort(distance[affected], kind='stable')]
+        return TrustPropagationService.hop_penalties(affected, distance[affected], to_banned_all[affected],
+                                                     from_banned_all[affected], base_penalty, traversal)
+    
+    @staticmethod
+    def hop_penalties(affected: np.ndarray, hops: np.ndarray, to_banned: np.ndarray, from_banned: np.ndarray,
+                      base_penalty: float, traversal: Dict) -> Dict[str, np.ndarray]:
+        """
+        compute_ban_penalties arrays for the affected users alone
+        
+        Args:
+            affected: Affected users ordered by distance then index
+            hops: Their hop distances
+            to_banned, from_banned: Their weights to/from the banned user (NaN where none)
+            base_penalty: Base penalty for direct connections (0-1)
+            traversal: hop_distances stats ('capped' and 'pruned')
+        """
+        is_follower = ~np.isnan(to_banned)
+        is_following = ~np.isnan(from_banned)
+        
+        # Calculate penalty based on distance and connection strength
+        connection_weight = np.where(is_follower, to_banned, 0.5)
+        
+        # Penalty decreases with distance
+        distance_factor = 1.0 / (hops.astype(np.float64) ** 1.5)
+        penalty = base_penalty * connection_weight * distance_factor
+        
+        return {
+            'user_index': affected,
+            'distance': hops,
+            'connection_weight': connection_weight,
+            'penalty': penalty,
+            'relationship_code': is_follower * 2 + is_following,
+            'capped_index': traversal['capped'],
+            'num_pruned': traversal['pruned']
+        }
+    
+    def compute_ppr_ban_penalties(self, banned_idx: int, max_hops: Optional[int] = None,
+                                  base_penalty: float = 0.15,
+                                  epsilon: float = 0.0,
+                                  max_fanout: Optional[int] = None,
+                                  alpha: float = 0.15,
+                                  tolerance: float = 1e-4) -> Dict[str, np.ndarray]:
+        """
+        compute_ban_penalties with personalized PageRank instead of BFS falloff
+        
+        Runs SocialGraph.personalized_pagerank from the banned user. A user's
+        exposure is pagerank / degree, which equals the chance that a random
+        walk from that user (restarting with probability alpha, following
+        strong ties more often) ends at the banned user. The penalty fades
+        along weak or crowded paths instead of by hop count, and the work
+        depends on alpha and tolerance, not on max_hops or the graph size.
+        The most exposed user gets base_penalty and the rest a proportional
+        share.
+        
+        Args:
+            banned_idx: Graph index of the banned user
+            max_hops: Do not push further than this (None = no limit)
+            base_penalty: Penalty of the most exposed user
+            epsilon: Drop users whose penalty would be below this
+            max_fanout: Push along at most this many connections per user
+            alpha: Restart probability; higher keeps the penalty closer
+            tolerance: Push tolerance; lower reaches further at more cost
+        
+        Returns:
+            Same arrays as compute_ban_penalties; distance is the number of
+            pushes the penalty took to reach the user
+        """
+        graph = self.graph
+        source = np.array([banned_idx], dtype=np.int64)
+        
+        traversal = {}
+        nodes, pagerank, residual, hops = graph.personalized_pagerank(source, np.ones(1), alpha, tolerance,
+                                                                      max_hops, max_fanout, traversal)
+        # Residual that was never pushed still keeps at least alpha of itself
+        exposure = (pagerank + alpha * residual) / np.maximum(graph.degrees()[nodes], 1)
+        exposure[nodes == banned_idx] = 0.0
+        top = exposure.max() if len(exposure) else 0.0
+        penalty = base_penalty * exposure / top if top > 0 else exposure
+        
+        reached = penalty > 0
+        keep = reached & (penalty >= epsilon)
+        order = np.lexsort((nodes[keep], hops[keep]))
+        affected, hops, penalty = nodes[keep][order], hops[keep][order], penalty[keep][order]
+        
+        to_banned, from_banned = graph.incident_pair_weights(source, affected, np.zeros(len(affected), dtype=np.int64))
+        is_follower = ~np.isnan(to_banned)
+        is_following = ~np.isnan(from_banned)
+        
+        return {
+            'user_index': affected,
+            'distance': hops,
+            'connection_weight': np.where(is_follower, to_banned, 0.5),
+            'penalty': penalty,
+            'relationship_code': is_follower * 2 + is_following,
+            'capped_index': traversal['capped'],
+            'num_pruned': int(np.count_nonzero(reached)) - len(affected)
+        }
+    
     def _determine_relationship(self, user_id: str, banned_user_id: str) -> str:
         """Determine the type of relationship between users"""
+        user_idx = self.graph.index_of(user_id)
+        banned_idx = self.graph.index_of(banned_user_id)
+        if user_idx is None or banned_idx is None:
+            return "indirect_connection"
+        
         # Check if user follows banned user
-        is_follower = (user_id, banned_user_id) in self.interaction_weights
-        is_following = (banned_user_id, user_id) in self.interaction_weights
+        is_follower = self.graph.weight(user_idx, banned_idx) is not None
+        is_following = self.graph.weight(banned_idx, user_idx) is not None
         
         if is_follower and is_following:
             return "mutual_follow"
@@ -202,6 +765,142 @@ class TrustPropagationService:
             'recovery_applied': round(recovery_amount, 4)
         }
     
+    def run_trust_recovery(self, now: Optional[float] = None,
+                           recovery_rate: float = 0.01,
+                           max_recovery: float = 0.3,
+                           apply: bool = True) -> Dict[str, Dict[str, float]]:
+        """
+        Recover trust for every user in the penalty ledger in one pass
+        
+        Each penalty recovers recovery_rate per day since it was applied, up to
+        min(penalty, max_recovery); a run only gives back what accrued since
+        the previous run, so it can be scheduled (e.g. daily).
+        
+        Args:
+            now: Unix time to recover up to (default now)
+            recovery_rate: Daily recovery per penalty
+            max_recovery: Cap on the total recovery of one penalty
+            apply: Update the scores and ledger; False only previews
+        
+        Returns:
+            Dict mapping user_id to the same fields as compute_trust_recovery
+        """
+        user_ids, recovery = self.penalty_ledger.recover(time.time() if now is None else now,
+                                                         recovery_rate, max_recovery, apply)
+        current_trust = np.array([self.user_trust_scores.get(u, 0.5) for u in user_ids], dtype=np.float64)
+        current_content_trust = np.array([self.user_content_trust_scores.get(u, 0.5) for u in user_ids], dtype=np.float64)
+        
+        # Recovery increases trust, decreases content scrutiny
+        new_user_trust = np.minimum(0.9, current_trust + recovery)
+        new_content_trust = np.maximum(0.3, current_content_trust - recovery)
+        
+        if apply:
+            self.user_trust_scores.update(zip(user_ids, new_user_trust.tolist()))
+            self.user_content_trust_scores.update(zip(user_ids, new_content_trust.tolist()))
+        
+        return {
+            user_id: {
+                'new_user_trust_score': trust,
+                'new_content_trust_score': content_trust,
+                'recovery_applied': amount
+            }
+            for user_id, trust, content_trust, amount in zip(
+                user_ids,
+                np.round(new_user_trust, 4).tolist(),
+                np.round(new_content_trust, 4).tolist(),
+                np.round(recovery, 4).tolist()
+            )
+        }
+    
+    def traversal_summary(self, penalties: Optional[Dict[str, np.ndarray]]) -> Dict:
+        """
+        How much a propagation's traversal was cut short by max_fanout and epsilon
+        
+        Args:
+            penalties: Arrays as returned by compute_ban_penalties (or None)
+        
+        Returns:
+            Dict with capped_expansions, capped_user_ids and pruned_users
+        """
+        if penalties is None:
+            return {'capped_expansions': 0, 'capped_user_ids': [], 'pruned_users': 0}
+        capped = penalties['capped_index'].tolist()
+        return {
+            'capped_expansions': len(capped),
+            'capped_user_ids': [self.graph.ids[idx] for idx in capped],
+            'pruned_users': int(penalties['num_pruned'])
+        }
+    
+    def rank_penalties(self, penalties: Optional[Dict[str, np.ndarray]],
+                       scores: Optional[Tuple[List[str], np.ndarray, np.ndarray]],
+                       offset: int = 0,
+                       limit: Optional[int] = None,
+                       min_penalty: float = 0.0) -> Tuple[Dict, int]:
+        """
+        Columnar page of applied penalties, strongest first
+        
+        Rows are ordered by penalty descending, then user index. With a limit
+        only the rows up to offset + limit are sorted (a partial sort picks
+        them first), so the top of a large ban is cheap to return. Like
+        format_penalties it only reads its arguments.
+        
+        Args:
+            penalties: Arrays as returned by compute_ban_penalties (or None)
+            scores: (user_ids, new_user_trust, new_content_trust) from update_scores
+            offset: Rows to skip
+            limit: Maximum rows to return (None = all)
+            min_penalty: Leave out rows with a smaller penalty
+        
+        Returns:
+            (columns, total): columns user_ids, distances, penalties,
+            new_user_trust_scores and new_content_trust_scores (values rounded
+            like format_penalties), and the number of rows with penalty >=
+            min_penalty
+        """
+        if penalties is None:
+            penalties = {name: np.zeros(0) for name in ('penalty', 'user_index', 'distance')}
+            scores = ([], np.zeros(0), np.zeros(0))
+        user_ids, new_user_trust, new_content_trust = scores
+        penalty = penalties['penalty']
+        rows = np.flatnonzero(penalty >= min_penalty) if min_penalty > 0 else np.arange(len(penalty))
+        total = len(rows)
+        end = total if limit is None else min(offset + limit, total)
+        
+        if offset >= end:
+            rows = rows[:0]
+        else:
+            if end < total:
+                # Every row at least as strong as the end-th strongest; ties
+                # at the boundary are all kept so pages never skip or repeat
+                threshold = -np.partition(-penalty[rows], end - 1)[end - 1]
+                rows = rows[penalty[rows] >= threshold]
+            order = np.lexsort((penalties['user_index'][rows], -penalty[rows]))
+            rows = rows[order][offset:end]
+        
+        columns = {
+            'user_ids': [user_ids[row] for row in rows.tolist()],
+            'distances': penalties['distance'][rows],
+            'penalties': np.round(penalty[rows], 4),
+            'new_user_trust_scores': np.round(new_user_trust[rows], 4),
+            'new_content_trust_scores': np.round(new_content_trust[rows], 4)
+        }
+        return columns, total
+    
+    def penalty_summary(self, penalties: Optional[Dict[str, np.ndarray]]) -> Dict:
+        """get_affected_users_summary computed from the penalty arrays"""
+        if penalties is None or len(penalties['penalty']) == 0:
+            return self.get_affected_users_summary({})
+        
+        distance_counts = np.bincount(penalties['distance'])
+        relationship_counts = np.bincount(penalties['relationship_code'], minlength=len(RELATIONSHIP_TYPES))
+        return {
+            'total_affected': len(penalties['penalty']),
+            'by_distance': {hop: count for hop, count in enumerate(distance_counts.tolist()) if count},
+            'by_relationship': {name: count for name, count in zip(RELATIONSHIP_TYPES.tolist(), relationship_counts.tolist())
+                                if count},
+            'avg_penalty': round(float(np.round(penalties['penalty'], 4).mean()), 4)
+        }
+    
     def get_affected_users_summary(self, affected_users: Dict) -> Dict:
         """Generate summary statistics for affected users"""
         if not affected_users:
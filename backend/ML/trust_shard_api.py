@@ -0,0 +1,138 @@
+"""
+Trust Shard API
+FastAPI node holding one shard of the social graph for sharded ban propagation.
+The trust propagation API partitions the graph, uploads a shard to each node,
+sends it the graph changes touching its users through /apply-delta and drives
+traversals through /expand (see graph_shards.ShardCoordinator).
+
+Run one node per shard: python trust_shard_api.py [port]
+"""
+
+import os
+import sys
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
+from typing import List, Optional
+from graph_shards import GraphShard
+from rw_lock import ReaderWriterLock
+import uvicorn
+
+app = FastAPI(
+    title="Trust Shard API",
+    description="One shard of the social graph for sharded ban propagation",
+    version="1.0.0"
+)
+
+# The loaded shard; replaced whole by PUT /shard, changed in place by
+# /apply-delta (write lock) while traversals read it (read lock)
+shard: Optional[GraphShard] = None
+shard_lock = ReaderWriterLock()
+
+class ExpandRequest(BaseModel):
+    version: int
+    frontier: List[int]
+    max_fanout: Optional[int] = None
+
+class IncidentRequest(BaseModel):
+    version: int
+    node: int
+
+class DeltaRequest(BaseModel):
+    version: int
+    sources: List[int]
+    targets: List[int]
+    weights_out: List[Optional[float]]
+    weights_in: List[Optional[float]]
+    target_shards: List[int]
+
+def _current(version: int) -> GraphShard:
+    """The loaded shard, if it has the version the coordinator expects (call with shard_lock held)"""
+    current = shard
+    if current is None:
+        raise HTTPException(status_code=409, detail="No shard loaded")
+    if current.version != version:
+        raise HTTPException(status_code=409, detail=f"Shard version {current.version}, expected {version}")
+    return current
+
+@app.get("/")
+def root():
+    """Health check endpoint"""
+    with shard_lock.read:
+        stats = shard.stats() if shard is not None else None
+    return {
+        "status": "healthy",
+        "service": "Trust Shard API",
+        "shard": stats
+    }
+
+@app.put("/shard")
+async def load_shard(request: Request):
+    """
+    Replace the shard with one serialized by GraphShard.to_bytes
+    """
+    global shard
+    try:
+        loaded = GraphShard.from_bytes(await request.body())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid shard: {str(e)}")
+    with shard_lock.write:
+        shard = loaded
+    return {"success": True, "stats": loaded.stats()}
+
+@app.post("/expand")
+def expand(request: ExpandRequest):
+    """
+    Neighbors of owned frontier nodes, grouped by owning shard
+    """
+    with shard_lock.read:
+        current = _current(request.version)
+        try:
+            neighbors, capped = current.expand(np.array(request.frontier, dtype=np.int64), request.max_fanout)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "neighbors": {str(owner): nodes.tolist() for owner, nodes in neighbors.items()},
+        "capped": capped.tolist()
+    }
+
+@app.post("/incident-weights")
+def incident_weights(request: IncidentRequest):
+    """
+    Connections of an owned node with their weights (null where absent)
+    """
+    with shard_lock.read:
+        current = _current(request.version)
+        try:
+            neighbors, weight_out, weight_in = current.incident_weights(request.node)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "neighbors": neighbors.tolist(),
+        "weight_out": [None if np.isnan(w) else w for w in weight_out.tolist()],
+        "weight_in": [None if np.isnan(w) else w for w in weight_in.tolist()]
+    }
+
+@app.post("/apply-delta")
+def apply_delta(request: DeltaRequest):
+    """
+    Set connections of owned users (null weights where a direction has none)
+    
+    Applied in place; the shard's version goes up by one.
+    """
+    with shard_lock.write:
+        current = _current(request.version)
+        try:
+            applied = current.apply_delta(
+                np.array(request.sources, dtype=np.int64), np.array(request.targets, dtype=np.int64),
+                np.array(request.weights_out, dtype=np.float64), np.array(request.weights_in, dtype=np.float64),
+                np.array(request.target_shards, dtype=np.int64))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"success": True, "applied": applied, "version": current.version, "stats": current.stats()}
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get("TRUST_SHARD_PORT", "8016"))
+    print("Starting Trust Shard API...")
+    print(f"API will be available at: http://localhost:{port}")
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level="warning")
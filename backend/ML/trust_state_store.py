@@ -0,0 +1,315 @@
+"""
+Trust State Store - Durable snapshot + write-ahead log for trust propagation
+The social graph and trust scores are saved as a compact .npz snapshot; every
+mutation and propagation after it is appended to a JSON-lines write-ahead log.
+On startup the latest snapshot is loaded and the log after it is replayed.
+"""
+
+import os
+import glob
+import json
+import time
+import threading
+import numpy as np
+from typing import Dict, List, Tuple
+from social_graph import SocialGraph
+from penalty_ledger import PenaltyLedger
+from trust_propagation_service import TrustPropagationService
+
+# Service methods that may be logged and replayed, called as method(**args)
+REPLAYABLE_OPS = {
+    'add_follows',
+    'remove_follows',
+    'add_interactions',
+    'patch_trust_scores',
+    'propagate_ban_penalty',
+    'propagate_ban_penalties',
+    'run_trust_recovery',
+}
+
+def _encode_ids(ids: List[str]) -> np.ndarray:
+    """User ids as a JSON array (any character, newlines included, survives)"""
+    return np.frombuffer(json.dumps(list(ids)).encode('utf-8'), dtype=np.uint8)
+
+
+def _decode_ids(blob: np.ndarray, count: int) -> List[str]:
+    if count == 0:
+        return []
+    text = blob.tobytes().decode('utf-8')
+    try:
+        ids = json.loads(text)
+        if isinstance(ids, list) and len(ids) == count:
+            return ids
+    except ValueError:
+        pass
+    # Snapshots written before ids were stored as JSON joined them with newlines
+    return text.split('\n')
+
+
+class TrustStateStore:
+    """
+    Snapshot + write-ahead log persistence for a TrustPropagationService
+
+    Files in directory:
+        snapshot-<seq>.npz  state after log record <seq>
+        wal-<seq>.jsonl     log records after <seq>, one {seq, op, args} per line
+
+    Mutations must hold `lock` while applying the change and calling
+    append(), so a snapshot never sees a change without its log record.
+    """
+
+    def __init__(self, directory: str, fsync: bool = True,
+                 max_wal_records: int = 5000, max_wal_propagations: int = 50,
+                 lock=None):
+        """
+        Args:
+            directory: Where snapshots and log segments are kept
+            fsync: fsync the log after every record (durable across power loss)
+            max_wal_records: Log records that trigger a background snapshot
+            max_wal_propagations: Logged propagations that trigger a background
+                snapshot (they are the expensive records to replay)
+            lock: Reentrant lock guarding the service state (defaults to a
+                new RLock); pass the writer side of a ReaderWriterLock to let
+                readers run between mutations
+        """
+        self.directory = directory
+        self.fsync = fsync
+        self.max_wal_records = max_wal_records
+        self.max_wal_propagations = max_wal_propagations
+        self.lock = lock if lock is not None else threading.RLock()
+        self.seq = 0
+        self._wal = None
+        self._wal_records = 0
+        self._wal_propagations = 0
+        self._snapshot_lock = threading.RLock()  # Always taken before lock
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Write-ahead log
+    # ------------------------------------------------------------------
+
+    def append(self, op: str, args: Dict):
+        """Append one mutation/propagation record (call while holding lock)"""
+        if op not in REPLAYABLE_OPS:
+            raise ValueError(f"Operation '{op}' cannot be logged")
+        with self.lock:
+            if self._wal is None:
+                self._open_segment(self.seq)
+            self.seq += 1
+            self._wal.write(json.dumps({'seq': self.seq, 'op': op, 'args': args}, separators=(',', ':')) + '\n')
+            self._wal.flush()
+            if self.fsync:
+                os.fsync(self._wal.fileno())
+            self._wal_records += 1
+            self._wal_propagations += op.startswith('propagate')
+            if (self._wal_records >= self.max_wal_records or
+                    self._wal_propagations >= self.max_wal_propagations):
+                self._wake.set()
+
+    def _open_segment(self, start_seq: int):
+        if self._wal is not None:
+            self._wal.close()
+        path = os.path.join(self.directory, f'wal-{start_seq:012d}.jsonl')
+        self._wal = open(path, 'a', encoding='utf-8')
+        self._wal_records = 0
+        self._wal_propagations = 0
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    def snapshot(self, service: TrustPropagationService) -> str:
+        """
+        Write a snapshot of the current state and drop the log it covers
+
+        The state is copied under lock (the graph is compacted first); the
+        file itself is written outside the lock.
+
+        Returns:
+            Path of the snapshot file
+        """
+        with self._snapshot_lock:
+            with self.lock:
+                service.graph.compact()
+                graph = service.graph
+                seq = self.seq
+                state = {
+                    'seq': np.array([seq], dtype=np.int64),
+                    'graph_built': np.array([service.graph_built], dtype=np.bool_),
+                    'num_ids': np.array([len(graph.ids)], dtype=np.int64),
+                    'ids': _encode_ids(graph.ids),
+                    'indptr': graph.indptr.copy(),
+                    'indices': graph.indices.copy(),
+                    'weights': graph.weights.copy(),
+                    'reverse_weights': graph.reverse_weights.copy(),
+                }
+                trust_scores = dict(service.user_trust_scores)
+                content_scores = dict(service.user_content_trust_scores)
+                ledger = service.penalty_ledger.to_arrays()
+                # New records go to a fresh segment starting after seq
+                self._open_segment(seq)
+
+            for name, scores in (('trust', trust_scores), ('content', content_scores)):
+                state[f'{name}_num_ids'] = np.array([len(scores)], dtype=np.int64)
+                state[f'{name}_ids'] = _encode_ids(list(scores.keys()))
+                state[f'{name}_values'] = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+            state['ledger_num_ids'] = np.array([len(ledger['ids'])], dtype=np.int64)
+            state['ledger_ids'] = _encode_ids(ledger.pop('ids'))
+            for column, values in ledger.items():
+                state[f'ledger_{column}'] = values
+
+            path = os.path.join(self.directory, f'snapshot-{seq:012d}.npz')
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **state)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+            self._remove_covered(seq)
+            return path
+
+    def replace_state(self, service: TrustPropagationService, apply) -> str:
+        """
+        Apply a full-state change (graph build, reset) and snapshot it
+
+        Full rebuilds are not logged; the snapshot is written before any
+        other mutation can be logged on top of the new state.
+
+        Args:
+            service: Service whose state is replaced
+            apply: Callable performing the change
+
+        Returns:
+            Path of the snapshot file
+        """
+        with self._snapshot_lock:
+            with self.lock:
+                apply()
+                return self.snapshot(service)
+
+    def _remove_covered(self, seq: int):
+        """Delete older snapshots and log segments that end at or before seq"""
+        for old in self._files('snapshot-*.npz'):
+            if _file_seq(old) < seq:
+                os.remove(old)
+        for old in self._files('wal-*.jsonl'):
+            if _file_seq(old) < seq:
+                os.remove(old)
+
+    def _files(self, pattern: str) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, pattern)), key=_file_seq)
+
+    def _load_snapshot(self, path: str) -> Tuple[int, SocialGraph, bool, Dict, Dict, PenaltyLedger]:
+        with np.load(path) as data:
+            ids = _decode_ids(data['ids'], int(data['num_ids'][0]))
+            graph = SocialGraph.from_arrays(ids, data['indptr'], data['indices'],
+                                            data['weights'], data['reverse_weights'])
+            # Snapshots from before the flag: any users means it was built
+            built = bool(data['graph_built'][0]) if 'graph_built' in data.files else graph.num_users > 0
+            scores = []
+            for name in ('trust', 'content'):
+                keys = _decode_ids(data[f'{name}_ids'], int(data[f'{name}_num_ids'][0]))
+                scores.append(dict(zip(keys, data[f'{name}_values'].tolist())))
+            ledger = PenaltyLedger()
+            if 'ledger_user' in data.files:  # Snapshots from before the ledger have none
+                ledger = PenaltyLedger.from_arrays(
+                    _decode_ids(data['ledger_ids'], int(data['ledger_num_ids'][0])),
+                    data['ledger_user'], data['ledger_penalized_at'],
+                    data['ledger_amount'], data['ledger_recovered'])
+            return int(data['seq'][0]), graph, built, scores[0], scores[1], ledger
+
+    # ------------------------------------------------------------------
+    # Recovery
+    # ------------------------------------------------------------------
+
+    def restore(self, service: TrustPropagationService) -> Dict:
+        """
+        Load the latest snapshot into service and replay the log after it
+
+        Returns:
+            Dict with snapshot_seq, replayed, skipped and seconds
+        """
+        start = time.perf_counter()
+        snapshot_seq = 0
+        for path in reversed(self._files('snapshot-*.npz')):
+            try:
+                snapshot_seq, graph, built, trust_scores, content_scores, ledger = self._load_snapshot(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipping unreadable snapshot {path}: {e}")
+                continue
+            service.graph = graph
+            service.graph_built = built
+            service.user_trust_scores = trust_scores
+            service.user_content_trust_scores = content_scores
+            service.penalty_ledger = ledger
+            break
+
+        replayed = skipped = 0
+        self.seq = snapshot_seq
+        for path in self._files('wal-*.jsonl'):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        skipped += 1  # Torn write at the end of a segment
+                        continue
+                    if record['seq'] <= self.seq:
+                        continue
+                    if record['op'] not in REPLAYABLE_OPS:
+                        skipped += 1
+                        continue
+                    getattr(service, record['op'])(**record['args'])
+                    self.seq = record['seq']
+                    replayed += 1
+
+        # Continue logging in a fresh segment after the replayed records
+        self._open_segment(self.seq)
+        return {
+            'snapshot_seq': snapshot_seq,
+            'replayed': replayed,
+            'skipped': skipped,
+            'seconds': round(time.perf_counter() - start, 3)
+        }
+
+    # ------------------------------------------------------------------
+    # Background compaction
+    # ------------------------------------------------------------------
+
+    def start_background_compaction(self, service: TrustPropagationService, interval: float = 60.0):
+        """Snapshot in a daemon thread when the log grows past its limits"""
+        def run():
+            while not self._stop.is_set():
+                self._wake.wait(interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                if (self._wal_records >= self.max_wal_records or
+                        self._wal_propagations >= self.max_wal_propagations):
+                    try:
+                        self.snapshot(service)
+                    except Exception as e:
+                        print(f"Background snapshot failed: {e}")
+
+        self._thread = threading.Thread(target=run, name='trust-state-compaction', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the background thread and close the log"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self.lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+
+
+def _file_seq(path: str) -> int:
+    """Sequence number in a snapshot-<seq>.npz / wal-<seq>.jsonl file name"""
+    return int(os.path.basename(path).split('-', 1)[1].split('.', 1)[0])
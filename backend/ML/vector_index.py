@@ -0,0 +1,431 @@
+"""
+Vector Index - Persistent approximate nearest-neighbor index for item embeddings
+Normalized vectors (CLIP or SBERT) keyed by item id, searched by inner product.
+Small indexes are searched exactly; from flat_threshold vectors on, an IVF
+(inverted file) index clusters them with spherical k-means into about
+sqrt(n) lists and a query scans only the nprobe lists whose centroids are
+closest, so query cost grows with sqrt(n) instead of n.
+
+The index is saved as an .npz snapshot plus a JSON-lines log of the adds and
+removes after it, replayed on load.
+"""
+
+import os
+import json
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def _encode_json(value) -> np.ndarray:
+    return np.frombuffer(json.dumps(value).encode('utf-8'), dtype=np.uint8)
+
+
+def _decode_json(blob: np.ndarray):
+    return json.loads(blob.tobytes().decode('utf-8'))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length rows (zero rows stay zero)"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 8,
+                     seed: int = 0) -> np.ndarray:
+    """
+    k unit centroids of normalized vectors (cosine k-means)
+
+    Args:
+        vectors: Normalized rows, at least k of them
+        k: Number of centroids
+        iterations: Assignment/update rounds
+        seed: Seed for the initial centroids (a random sample of rows)
+
+    Returns:
+        k x dim float32 array
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assign, kind='stable')
+        clusters, starts = np.unique(assign[order], return_index=True)
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids[clusters] = _normalize(sums)  # Empty clusters keep their centroid
+    return centroids
+
+
+class VectorIndex:
+    """
+    Item vectors with exact search for small sizes and IVF search beyond
+
+    Files in directory:
+        index.npz    vectors, ids, payloads and IVF lists at the last save()
+        index.jsonl  {op, id, vector, payload} adds and {op, id} removes since
+
+    All methods are thread-safe.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flat_threshold: int = 1024,
+                 nprobe: int = 8, max_log_records: int = 10000,
+                 fsync: bool = False, seed: int = 0):
+        """
+        Args:
+            directory: Where the index is persisted (None keeps it in memory)
+            flat_threshold: Search exactly below this many vectors
+            nprobe: IVF lists scanned per query
+            max_log_records: Logged changes that trigger a save()
+            fsync: fsync the log after every change
+            seed: Seed for k-means
+        """
+        self.directory = directory
+        self.flat_threshold = flat_threshold
+        self.nprobe = nprobe
+        self.max_log_records = max_log_records
+        self.fsync = fsync
+        self.seed = seed
+        self._lock = threading.RLock()
+        self._log = None
+        self._log_records = 0
+        self._clear()
+
+    def _clear(self, dim: Optional[int] = None):
+        self.dim = dim
+        self._vectors = np.zeros((0, dim or 0), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._payloads: List[Optional[Dict]] = []
+        self._slot_of: Dict[str, int] = {}
+        self._free: List[int] = []
+        self.centroids = None
+        self._list_of = np.zeros(0, dtype=np.int32)
+        self._lists: List[List[int]] = []
+        self._list_cache: Dict[int, np.ndarray] = {}
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._slot_of
+
+    def add(self, item_id: str, vector: np.ndarray, payload: Optional[Dict] = None):
+        """Add or replace an item (the vector is normalized)"""
+        self.add_many([item_id], np.atleast_2d(vector), [payload])
+
+    def add_many(self, item_ids: List[str], vectors: np.ndarray,
+                 payloads: Optional[List[Optional[Dict]]] = None):
+        """
+        Add or replace several items
+
+        Args:
+            item_ids: Item ids
+            vectors: len(item_ids) x dim array
+            payloads: JSON-serializable value stored with each item (e.g. the item)
+        """
+        vectors = _normalize(vectors)
+        payloads = payloads if payloads is not None else [None] * len(item_ids)
+        with self._lock:
+            for item_id, vector, payload in zip(item_ids, vectors, payloads):
+                self._add(item_id, vector, payload)
+                self._append({'op': 'add', 'id': item_id, 'vector': vector.tolist(), 'payload': payload})
+                self._maybe_train()
+            self._maybe_save()
+
+    def remove(self, item_id: str) -> bool:
+        """Remove an item; False if it was not indexed"""
+        with self._lock:
+            if not self._remove(item_id):
+                return False
+            self._append({'op': 'remove', 'id': item_id})
+            self._maybe_save()
+            return True
+
+    def _add(self, item_id: str, vector: np.ndarray, payload: Optional[Dict]):
+        if self.dim is None:
+            self._clear(len(vector))
+        if len(vector) != self.dim:
+            raise ValueError(f"Vector dimension {len(vector)}, index dimension {self.dim}")
+        self._remove(item_id)
+
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._ids)
+            if slot == len(self._vectors):
+                self._grow(max(2 * slot, 64))
+            self._ids.append(None)
+            self._payloads.append(None)
+        self._vectors[slot] = vector
+        self._alive[slot] = True
+        self._ids[slot] = item_id
+        self._payloads[slot] = payload
+        self._slot_of[item_id] = slot
+        if self.centroids is not None:
+            self._assign(np.array([slot]))
+
+    def _remove(self, item_id: str) -> bool:
+        slot = self._slot_of.pop(item_id, None)
+        if slot is None:
+            return False
+        self._alive[slot] = False
+        self._ids[slot] = None
+        self._payloads[slot] = None
+        if self.centroids is not None:
+            cluster = int(self._list_of[slot])
+            self._lists[cluster].remove(slot)
+            self._list_cache.pop(cluster, None)
+        self._free.append(slot)
+        return True
+
+    def _grow(self, capacity: int):
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self._vectors)] = self._vectors
+        self._vectors = vectors
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+        self._list_of = np.concatenate([self._list_of, np.full(capacity - len(self._list_of), -1, dtype=np.int32)])
+
+    def _maybe_train(self):
+        """(Re)cluster once the index reaches flat_threshold, then each time it doubles"""
+        size = len(self)
+        if size >= self.flat_threshold and size >= 2 * self._trained_size:
+            self.train()
+
+    def train(self):
+        """Cluster the current vectors into about sqrt(n) IVF lists"""
+        with self._lock:
+            slots = np.flatnonzero(self._alive)
+            nlist = max(int(np.sqrt(len(slots))), 1)
+            rng = np.random.default_rng(self.seed)
+            sample = slots if len(slots) <= 64 * nlist else rng.choice(slots, 64 * nlist, replace=False)
+            self.centroids = spherical_kmeans(self._vectors[np.sort(sample)], nlist, seed=self.seed)
+            self._lists = [[] for _ in range(nlist)]
+            self._list_cache = {}
+            self._list_of[:] = -1
+            self._assign(slots)
+            self._trained_size = len(slots)
+
+    def _assign(self, slots: np.ndarray):
+        """Put slots in the list of their nearest centroid"""
+        for start in range(0, len(slots), 8192):
+            chunk = slots[start:start + 8192]
+            clusters = np.argmax(self._vectors[chunk] @ self.centroids.T, axis=1)
+            self._list_of[chunk] = clusters
+            for slot, cluster in zip(chunk.tolist(), clusters.tolist()):
+                self._lists[cluster].append(slot)
+                self._list_cache.pop(cluster, None)
+
+    def _list_slots(self, cluster: int) -> np.ndarray:
+        cached = self._list_cache.get(cluster)
+        if cached is None:
+            cached = self._list_cache[cluster] = np.array(self._lists[cluster], dtype=np.int64)
+        return cached
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None,
+               exclude: Iterable[str] = (), include: Optional[Iterable[str]] = None,
+               stats: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        The k items with the highest inner product with the query
+
+        Args:
+            query: Query vector (normalized here)
+            k: Number of results
+            nprobe: IVF lists to scan (default self.nprobe); ignored while flat
+            exclude: Item ids to leave out (e.g. the query item itself)
+            include: Only consider these item ids (e.g. prefiltered candidates);
+                up to flat_threshold of them are scored exactly
+            stats: Filled with 'scanned' (vectors scored) and 'mode'
+                ('flat', 'ivf' or 'subset')
+
+        Returns:
+            [(item_id, score)] by descending score (ties by internal slot)
+        """
+        query = _normalize(query)[0]
+        with self._lock:
+            if len(self) == 0 or k <= 0:
+                return []
+            included = None
+            if include is not None:
+                included = np.array([self._slot_of[item_id] for item_id in include if item_id in self._slot_of],
+                                    dtype=np.int64)
+            if included is not None and len(included) <= self.flat_threshold:
+                slots = np.sort(included)
+                mode = 'subset'
+            elif self.centroids is not None and len(self) >= self.flat_threshold:
+                probe = min(nprobe or self.nprobe, len(self.centroids))
+                closest = np.argpartition(-(self.centroids @ query), probe - 1)[:probe]
+                slots = np.concatenate([self._list_slots(int(cluster)) for cluster in closest])
+                mode = 'ivf'
+            else:
+                slots = np.flatnonzero(self._alive)
+                mode = 'flat'
+            if included is not None and mode != 'subset':
+                slots = slots[np.isin(slots, included)]
+            excluded = [self._slot_of[item_id] for item_id in exclude if item_id in self._slot_of]
+            if excluded:
+                slots = slots[~np.isin(slots, excluded)]
+
+            scores = self._vectors[slots] @ query
+            if stats is not None:
+                stats['scanned'] = len(slots)
+                stats['mode'] = mode
+            if len(slots) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                slots, scores = slots[top], scores[top]
+            order = np.lexsort((slots, -scores))
+            return [(self._ids[slot], float(score)) for slot, score in zip(slots[order].tolist(), scores[order].tolist())]
+
+    def items(self) -> List[Tuple[str, Optional[Dict]]]:
+        """(item_id, payload) of every indexed item"""
+        with self._lock:
+            return [(item_id, self._payloads[slot]) for item_id, slot in self._slot_of.items()]
+
+    def get(self, item_id: str) -> Optional[Tuple[np.ndarray, Optional[Dict]]]:
+        """(normalized vector, payload) of an item, or None"""
+        with self._lock:
+            slot = self._slot_of.get(item_id)
+            if slot is None:
+                return None
+            return self._vectors[slot].copy(), self._payloads[slot]
+
+    def get_many(self, item_ids: List[str]) -> Tuple[np.ndarray, np.ndarray, List[Optional[Dict]]]:
+        """
+        Vectors of several items
+
+        Returns:
+            (vectors, found, payloads): len(item_ids) x dim vectors (zero rows
+            for ids not indexed), a bool mask of the ids found, and payloads
+        """
+        with self._lock:
+            slots = np.array([self._slot_of.get(item_id, -1) for item_id in item_ids], dtype=np.int64)
+            found = slots >= 0
+            vectors = np.zeros((len(item_ids), self.dim or 0), dtype=np.float32)
+            vectors[found] = self._vectors[slots[found]]
+            payloads = [self._payloads[slot] if slot >= 0 else None for slot in slots.tolist()]
+            return vectors, found, payloads
+
+    def stats(self) -> Dict:
+        with self._lock:
+            mode = 'ivf' if self.centroids is not None and len(self) >= self.flat_threshold else 'flat'
+            return {
+                'size': len(self),
+                'dim': self.dim,
+                'mode': mode,
+                'nlist': len(self.centroids) if self.centroids is not None else 0,
+                'nprobe': self.nprobe,
+                'log_records': self._log_records
+            }
+
+    def _paths(self) -> Tuple[str, str]:
+        return os.path.join(self.directory, 'index.npz'), os.path.join(self.directory, 'index.jsonl')
+
+    def _append(self, record: Dict):
+        if self.directory is None:
+            return
+        if self._log is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._log = open(self._paths()[1], 'a', encoding='utf-8')
+        self._log.write(json.dumps(record) + '\n')
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+        self._log_records += 1
+
+    def _maybe_save(self):
+        if self.directory is not None and self._log_records >= self.max_log_records:
+            self.save()
+
+    def save(self):
+        """Write a snapshot of the index and start an empty log"""
+        if self.directory is None:
+            return
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            snapshot_path, log_path = self._paths()
+            slots = np.flatnonzero(self._alive)
+            tmp_path = snapshot_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    dim=self.dim or 0,
+                    vectors=self._vectors[slots],
+                    ids=_encode_json([self._ids[slot] for slot in slots.tolist()]),
+                    payloads=_encode_json([self._payloads[slot] for slot in slots.tolist()]),
+                    centroids=self.centroids if self.centroids is not None else np.zeros((0, self.dim or 0), dtype=np.float32),
+                    list_of=self._list_of[slots],
+                    trained_size=self._trained_size
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, snapshot_path)
+
+            # The snapshot covers the log; replaying it again would be harmless
+            if self._log is not None:
+                self._log.close()
+            self._log = open(log_path, 'w', encoding='utf-8')
+            self._log_records = 0
+
+    def load(self) -> Dict:
+        """
+        Load the snapshot and replay the log after it
+
+        Returns:
+            Dict with snapshot_items and replayed_records
+        """
+        if self.directory is None:
+            return {'snapshot_items': 0, 'replayed_records': 0}
+        with self._lock:
+            snapshot_path, log_path = self._paths()
+            self._clear()
+            snapshot_items = 0
+            if os.path.exists(snapshot_path):
+                with np.load(snapshot_path, allow_pickle=False) as snapshot:
+                    dim = int(snapshot['dim'])
+                    ids = _decode_json(snapshot['ids'])
+                    if dim:
+                        self._clear(dim)
+                        self._grow(max(len(ids), 64))
+                        self._vectors[:len(ids)] = snapshot['vectors']
+                        self._alive[:len(ids)] = True
+                        self._ids = list(ids)
+                        self._payloads = _decode_json(snapshot['payloads'])
+                        self._slot_of = {item_id: slot for slot, item_id in enumerate(ids)}
+                        if len(snapshot['centroids']):
+                            self.centroids = snapshot['centroids'].copy()
+                            self._list_of[:len(ids)] = snapshot['list_of']
+                            self._lists = [[] for _ in range(len(self.centroids))]
+                            for slot, cluster in enumerate(snapshot['list_of'].tolist()):
+                                self._lists[cluster].append(slot)
+                            self._trained_size = int(snapshot['trained_size'])
+                    snapshot_items = len(ids)
+
+            replayed = 0
+            if os.path.exists(log_path):
+                valid_bytes = 0
+                with open(log_path, 'rb') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            break  # Torn final write
+                        if record['op'] == 'add':
+                            self._add(record['id'], np.asarray(record['vector'], dtype=np.float32), record['payload'])
+                            self._maybe_train()
+                        else:
+                            self._remove(record['id'])
+                        valid_bytes += len(line)
+                        replayed += 1
+                # Drop a torn tail so new records are not appended after it
+                if valid_bytes < os.path.getsize(log_path):
+                    with open(log_path, 'r+b') as f:
+                        f.truncate(valid_bytes)
+            self._log_records = replayed
+            return {'snapshot_items': snapshot_items, 'replayed_records': replayed}
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
@@ -143,6 +143,8 @@ builder.Services.AddScoped<IServiceTransferService, ServiceTransferService>();
 builder.Services.AddScoped<INotificationService, NotificationService>();
 // Background service for automatic service expiry
 builder.Services.AddHostedService<ServConnect.BackgroundServices.ServiceExpiryBackgroundService>();
+// Background service for daily trust score recovery of penalized users
+builder.Services.AddHostedService<ServConnect.BackgroundServices.TrustRecoveryBackgroundService>();
 
 // Orders & payments
 builder.Services.AddScoped<IOrderService, OrderService>();
@@ -275,6 +275,11 @@ namespace ServConnect.Services
             var post = await GetPostByIdAsync(postId);
             if (post != null && post.AuthorId != userId)
             {
+                if (_trustPropagation != null)
+                {
+                    await _trustPropagation.AddInteractionAsync(userId, post.AuthorId, "like");
+                }
+
                 await CreateNotificationAsync(new CommunityNotification
                 {
                     UserId = post.AuthorId,
@@ -351,6 +356,11 @@ namespace ServConnect.Services
             var post = await GetPostByIdAsync(comment.PostId);
             if (post != null && post.AuthorId != comment.AuthorId)
             {
+                if (_trustPropagation != null)
+                {
+                    await _trustPropagation.AddInteractionAsync(comment.AuthorId, post.AuthorId, "comment");
+                }
+
                 await CreateNotificationAsync(new CommunityNotification
                 {
                     UserId = post.AuthorId,
@@ -502,6 +512,12 @@ namespace ServConnect.Services
             await UpdateProfileStatsAsync(followerId, followingIncrement: 1);
             await UpdateProfileStatsAsync(followingId, followersIncrement: 1);
 
+            // Keep the trust propagation graph current without a rebuild
+            if (_trustPropagation != null)
+            {
+                await _trustPropagation.AddFollowAsync(followerId, followingId);
+            }
+
             // Create notification
             await CreateNotificationAsync(new CommunityNotification
             {
@@ -523,6 +539,10 @@ namespace ServConnect.Services
             {
                 await UpdateProfileStatsAsync(followerId, followingIncrement: -1);
                 await UpdateProfileStatsAsync(followingId, followersIncrement: -1);
+                if (_trustPropagation != null)
+                {
+                    await _trustPropagation.RemoveFollowAsync(followerId, followingId);
+                }
                 return true;
             }
             return false;
@@ -1,3 +1,4 @@
+using System.Globalization;
 using System.Text;
 using System.Text.Json;
 using System.Text.Json.Serialization;
@@ -66,7 +67,8 @@ namespace ServConnect.Services
                     title = foundItem.Title,
                     category = foundItem.Category,
                     description = foundItem.Description,
-                    location = foundItem.FoundLocation
+                    location = foundItem.FoundLocation,
+                    date = foundItem.FoundDate.ToString("yyyy-MM-dd", CultureInfo.InvariantCulture)
                 };
 
                 var candidateItems = lostReports.Select(r => new
@@ -76,7 +78,8 @@ namespace ServConnect.Services
                     title = r.Title,
                     category = r.Category,
                     description = r.Description,
-                    location = r.LostLocation
+                    location = r.LostLocation,
+                    date = r.LostDate.ToString("yyyy-MM-dd", CultureInfo.InvariantCulture)
                 }).ToList();
 
                 var requestBody = new
@@ -156,7 +159,8 @@ namespace ServConnect.Services
                     title = lostReport.Title,
                     category = lostReport.Category,
                     description = lostReport.Description,
-                    location = lostReport.LostLocation
+                    location = lostReport.LostLocation,
+                    date = lostReport.LostDate.ToString("yyyy-MM-dd", CultureInfo.InvariantCulture)
                 };
 
                 var candidateItems = foundItems.Select(f => new
@@ -166,7 +170,8 @@ namespace ServConnect.Services
                     title = f.Title,
                     category = f.Category,
                     description = f.Description,
-                    location = f.FoundLocation
+                    location = f.FoundLocation,
+                    date = f.FoundDate.ToString("yyyy-MM-dd", CultureInfo.InvariantCulture)
                 }).ToList();
 
                 var requestBody = new
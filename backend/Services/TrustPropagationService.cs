@@ -12,8 +12,14 @@ namespace ServConnect.Services
     public interface ITrustPropagationService
     {
         Task<TrustPropagationResult> PropagateBanPenaltyAsync(Guid bannedUserId, int maxHops = 2, double basePenalty = 0.15);
+        Task<TrustPropagationResult> PropagateBanPenaltiesAsync(IEnumerable<Guid> bannedUserIds, int maxHops = 2, double basePenalty = 0.15, string aggregation = "max");
         Task UpdateUserTrustScoresAsync(Dictionary<string, TrustScoreUpdate> updates);
         Task<bool> BuildSocialGraphAsync();
+        Task<bool> EnsureSocialGraphAsync();
+        Task<bool> AddFollowAsync(Guid followerId, Guid followingId);
+        Task<bool> RemoveFollowAsync(Guid followerId, Guid followingId);
+        Task<bool> AddInteractionAsync(Guid userId, Guid targetUserId, string type);
+        Task<TrustRecoveryResult> RunTrustRecoveryAsync(double recoveryRate = 0.01, bool apply = true);
     }
 
     public class TrustPropagationService : ITrustPropagationService
@@ -27,6 +33,10 @@ namespace ServConnect.Services
         private readonly ILogger<TrustPropagationService> _logger;
         private readonly string _apiBaseUrl;
 
+        // Weight of a single like/comment; BuildSocialGraphAsync raises it for repeated ones
+        private const double LikeWeight = 0.55;
+        private const double CommentWeight = 0.65;
+
         public TrustPropagationService(
             IConfiguration configuration,
             ILogger<TrustPropagationService> logger)
@@ -83,7 +93,7 @@ namespace ServConnect.Services
 
                 foreach (var group in likesByUser)
                 {
-                    var likeWeight = Math.Min(1.0, 0.55 + (group.Count() - 1) * 0.05);
+                    var likeWeight = Math.Min(1.0, LikeWeight + (group.Count() - 1) * 0.05);
                     interactions.Add(new
                     {
                         user_id = group.Key.UserId.ToString(),
@@ -105,7 +115,7 @@ namespace ServConnect.Services
 
                 foreach (var group in commentsByUser)
                 {
-                    var commentWeight = Math.Min(1.0, 0.65 + (group.Count() - 1) * 0.06);
+                    var commentWeight = Math.Min(1.0, CommentWeight + (group.Count() - 1) * 0.06);
                     interactions.Add(new
                     {
                         user_id = group.Key.AuthorId.ToString(),
@@ -146,6 +156,96 @@ namespace ServConnect.Services
             }
         }
 
+        /// <summary>
+        /// Build the social graph only if the ML API holds none (first use, reset or a new
+        /// process without saved state). Afterwards the graph is kept current through deltas.
+        /// </summary>
+        public async Task<bool> EnsureSocialGraphAsync()
+        {
+            try
+            {
+                var response = await _httpClient.GetAsync($"{_apiBaseUrl}/graph-stats");
+                response.EnsureSuccessStatusCode();
+
+                using var stats = JsonDocument.Parse(await response.Content.ReadAsStringAsync());
+                if (stats.RootElement.TryGetProperty("graph_built", out var built) && built.GetBoolean())
+                {
+                    return true;
+                }
+            }
+            catch (Exception ex)
+            {
+                _logger.LogError(ex, "Error checking the social graph");
+                return false;
+            }
+
+            return await BuildSocialGraphAsync();
+        }
+
+        public Task<bool> AddFollowAsync(Guid followerId, Guid followingId)
+        {
+            return PostDeltaAsync("add-follows", new
+            {
+                followers = new[] { new { follower_id = followerId.ToString(), following_id = followingId.ToString() } }
+            });
+        }
+
+        /// <summary>
+        /// Remove a follow from the graph. The ML API drops the whole connection between the two
+        /// users, including interaction weight; the next full build restores that weight.
+        /// </summary>
+        public Task<bool> RemoveFollowAsync(Guid followerId, Guid followingId)
+        {
+            return PostDeltaAsync("remove-follows", new
+            {
+                followers = new[] { new { follower_id = followerId.ToString(), following_id = followingId.ToString() } }
+            });
+        }
+
+        /// <summary>
+        /// Add one "like" or "comment" from a user to a post author. The graph keeps the maximum
+        /// weight per connection, so this never exceeds what a full build would compute.
+        /// </summary>
+        public Task<bool> AddInteractionAsync(Guid userId, Guid targetUserId, string type)
+        {
+            return PostDeltaAsync("add-interactions", new
+            {
+                interactions = new[]
+                {
+                    new
+                    {
+                        user_id = userId.ToString(),
+                        target_user_id = targetUserId.ToString(),
+                        type = type,
+                        weight = type == "comment" ? CommentWeight : LikeWeight
+                    }
+                }
+            });
+        }
+
+        private async Task<bool> PostDeltaAsync(string endpoint, object request)
+        {
+            try
+            {
+                var json = JsonSerializer.Serialize(request);
+                var content = new StringContent(json, System.Text.Encoding.UTF8, "application/json");
+
+                var response = await _httpClient.PostAsync($"{_apiBaseUrl}/{endpoint}", content);
+                if (!response.IsSuccessStatusCode)
+                {
+                    var responseJson = await response.Content.ReadAsStringAsync();
+                    _logger.LogWarning($"Trust graph delta {endpoint} returned {(int)response.StatusCode} {response.StatusCode}. Body: {responseJson}");
+                    return false;
+                }
+                return true;
+            }
+            catch (Exception ex)
+            {
+                _logger.LogError(ex, $"Error sending trust graph delta {endpoint}");
+                return false;
+            }
+        }
+
         public async Task<TrustPropagationResult> PropagateBanPenaltyAsync(
             Guid bannedUserId, 
             int maxHops = 2, 
@@ -155,8 +255,8 @@ namespace ServConnect.Services
             {
                 _logger.LogInformation($"Propagating ban penalty for user {bannedUserId}");
 
-                // First, ensure graph is built
-                var graphBuilt = await BuildSocialGraphAsync();
+                // Build the graph only if the API has none; deltas keep it current
+                var graphBuilt = await EnsureSocialGraphAsync();
                 if (!graphBuilt)
                 {
                     return new TrustPropagationResult
@@ -174,56 +274,169 @@ namespace ServConnect.Services
                     base_penalty = basePenalty
                 };
 
+                return await PostPropagationAsync("propagate-ban", request);
+            }
+            catch (Exception ex)
+            {
+                _logger.LogError(ex, "Error propagating ban penalty");
+                return new TrustPropagationResult 
+                { 
+                    Success = false, 
+                    ErrorMessage = ex.Message 
+                };
+            }
+        }
+
+        /// <summary>
+        /// Propagate penalties for several banned users (e.g. a ring of accounts) in one pass.
+        /// Each affected user receives one combined penalty ("max", "sum" or "prob_or").
+        /// </summary>
+        public async Task<TrustPropagationResult> PropagateBanPenaltiesAsync(
+            IEnumerable<Guid> bannedUserIds,
+            int maxHops = 2,
+            double basePenalty = 0.15,
+            string aggregation = "max")
+        {
+            try
+            {
+                var bannedIds = bannedUserIds.Select(id => id.ToString()).Distinct().ToList();
+                _logger.LogInformation($"Propagating ban penalties for {bannedIds.Count} users");
+
+                var graphBuilt = await EnsureSocialGraphAsync();
+                if (!graphBuilt)
+                {
+                    return new TrustPropagationResult
+                    {
+                        Success = false,
+                        ErrorMessage = "Failed to build social graph before propagation."
+                    };
+                }
+
+                var request = new
+                {
+                    banned_user_ids = bannedIds,
+                    max_hops = maxHops,
+                    base_penalty = basePenalty,
+                    aggregation = aggregation
+                };
+
+                return await PostPropagationAsync("propagate-bans", request);
+            }
+            catch (Exception ex)
+            {
+                _logger.LogError(ex, "Error propagating ban penalties");
+                return new TrustPropagationResult
+                {
+                    Success = false,
+                    ErrorMessage = ex.Message
+                };
+            }
+        }
+
+        private async Task<TrustPropagationResult> PostPropagationAsync(string endpoint, object request)
+        {
+            var json = JsonSerializer.Serialize(request);
+            var content = new StringContent(json, System.Text.Encoding.UTF8, "application/json");
+
+            var response = await _httpClient.PostAsync($"{_apiBaseUrl}/{endpoint}", content);
+            var responseJson = await response.Content.ReadAsStringAsync();
+            if (!response.IsSuccessStatusCode)
+            {
+                var errorMessage = $"Trust propagation API returned {(int)response.StatusCode} {response.StatusCode}. Body: {responseJson}";
+                _logger.LogWarning(errorMessage);
+                return new TrustPropagationResult
+                {
+                    Success = false,
+                    ErrorMessage = errorMessage
+                };
+            }
+
+            var result = JsonSerializer.Deserialize<TrustPropagationApiResponse>(responseJson, new JsonSerializerOptions
+            {
+                PropertyNameCaseInsensitive = true
+            });
+
+            if (result?.Success == true && result.AffectedUsers != null)
+            {
+                // Update trust scores in database
+                await UpdateUserTrustScoresAsync(result.AffectedUsers);
+
+                _logger.LogInformation($"Trust propagation completed. Affected {result.AffectedUsers.Count} users");
+
+                return new TrustPropagationResult
+                {
+                    Success = true,
+                    AffectedUserCount = result.AffectedUsers.Count,
+                    AffectedUsers = result.AffectedUsers,
+                    Summary = result.Summary
+                };
+            }
+
+            return new TrustPropagationResult
+            {
+                Success = false,
+                ErrorMessage = $"Unexpected trust propagation API response: {responseJson}"
+            };
+        }
+
+        /// <summary>
+        /// Recover trust for every penalized user in one call. The ML API keeps a ledger of
+        /// applied penalties, so each run only returns what recovered since the previous one.
+        /// </summary>
+        public async Task<TrustRecoveryResult> RunTrustRecoveryAsync(double recoveryRate = 0.01, bool apply = true)
+        {
+            try
+            {
+                var request = new
+                {
+                    recovery_rate = recoveryRate,
+                    apply = apply
+                };
+
                 var json = JsonSerializer.Serialize(request);
                 var content = new StringContent(json, System.Text.Encoding.UTF8, "application/json");
 
-                var response = await _httpClient.PostAsync($"{_apiBaseUrl}/propagate-ban", content);
+                var response = await _httpClient.PostAsync($"{_apiBaseUrl}/run-recovery", content);
                 var responseJson = await response.Content.ReadAsStringAsync();
                 if (!response.IsSuccessStatusCode)
                 {
-                    var errorMessage = $"Trust propagation API returned {(int)response.StatusCode} {response.StatusCode}. Body: {responseJson}";
+                    var errorMessage = $"Trust recovery API returned {(int)response.StatusCode} {response.StatusCode}. Body: {responseJson}";
                     _logger.LogWarning(errorMessage);
-                    return new TrustPropagationResult
+                    return new TrustRecoveryResult
                     {
                         Success = false,
                         ErrorMessage = errorMessage
                     };
                 }
 
-                var result = JsonSerializer.Deserialize<TrustPropagationApiResponse>(responseJson, new JsonSerializerOptions
+                var result = JsonSerializer.Deserialize<TrustRecoveryApiResponse>(responseJson, new JsonSerializerOptions
                 {
                     PropertyNameCaseInsensitive = true
                 });
 
-                if (result?.Success == true && result.AffectedUsers != null)
+                var recoveredUsers = result?.RecoveredUsers ?? new Dictionary<string, TrustScoreUpdate>();
+                if (apply && recoveredUsers.Any())
                 {
-                    // Update trust scores in database
-                    await UpdateUserTrustScoresAsync(result.AffectedUsers);
-
-                    _logger.LogInformation($"Trust propagation completed. Affected {result.AffectedUsers.Count} users");
-
-                    return new TrustPropagationResult
-                    {
-                        Success = true,
-                        AffectedUserCount = result.AffectedUsers.Count,
-                        AffectedUsers = result.AffectedUsers,
-                        Summary = result.Summary
-                    };
+                    await UpdateUserTrustScoresAsync(recoveredUsers);
                 }
 
-                return new TrustPropagationResult
+                _logger.LogInformation($"Trust recovery completed. Recovered {recoveredUsers.Count} users");
+
+                return new TrustRecoveryResult
                 {
-                    Success = false,
-                    ErrorMessage = $"Unexpected trust propagation API response: {responseJson}"
+                    Success = result?.Success == true,
+                    RecoveredUserCount = recoveredUsers.Count,
+                    RecoveredUsers = recoveredUsers,
+                    Summary = result?.Summary
                 };
             }
             catch (Exception ex)
             {
-                _logger.LogError(ex, "Error propagating ban penalty");
-                return new TrustPropagationResult 
-                { 
-                    Success = false, 
-                    ErrorMessage = ex.Message 
+                _logger.LogError(ex, "Error running trust recovery");
+                return new TrustRecoveryResult
+                {
+                    Success = false,
+                    ErrorMessage = ex.Message
                 };
             }
         }
@@ -291,6 +504,12 @@ namespace ServConnect.Services
 
         [JsonPropertyName("connection_weight")]
         public double ConnectionWeight { get; set; }
+
+        [JsonPropertyName("banned_connections")]
+        public int? BannedConnections { get; set; }
+
+        [JsonPropertyName("recovery_applied")]
+        public double? RecoveryApplied { get; set; }
     }
 
     public class TrustPropagationApiResponse
@@ -304,4 +523,25 @@ namespace ServConnect.Services
         [JsonPropertyName("summary")]
         public Dictionary<string, object>? Summary { get; set; }
     }
+
+    public class TrustRecoveryResult
+    {
+        public bool Success { get; set; }
+        public int RecoveredUserCount { get; set; }
+        public Dictionary<string, TrustScoreUpdate>? RecoveredUsers { get; set; }
+        public Dictionary<string, object>? Summary { get; set; }
+        public string? ErrorMessage { get; set; }
+    }
+
+    public class TrustRecoveryApiResponse
+    {
+        [JsonPropertyName("success")]
+        public bool Success { get; set; }
+
+        [JsonPropertyName("recovered_users")]
+        public Dictionary<string, TrustScoreUpdate>? RecoveredUsers { get; set; }
+
+        [JsonPropertyName("summary")]
+        public Dictionary<string, object>? Summary { get; set; }
+    }
 }
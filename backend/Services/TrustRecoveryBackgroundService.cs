@@ -0,0 +1,54 @@
+using ServConnect.Services;
+
+namespace ServConnect.BackgroundServices
+{
+    /// <summary>
+    /// Runs the ML trust recovery job once a day and writes the recovered scores back in bulk
+    /// </summary>
+    public class TrustRecoveryBackgroundService : BackgroundService
+    {
+        private readonly IConfiguration _configuration;
+        private readonly ILogger<TrustPropagationService> _trustLogger;
+        private readonly ILogger<TrustRecoveryBackgroundService> _logger;
+        private readonly TimeSpan _runInterval = TimeSpan.FromDays(1); // Run daily
+
+        public TrustRecoveryBackgroundService(
+            IConfiguration configuration,
+            ILogger<TrustPropagationService> trustLogger,
+            ILogger<TrustRecoveryBackgroundService> logger)
+        {
+            _configuration = configuration;
+            _trustLogger = trustLogger;
+            _logger = logger;
+        }
+
+        protected override async Task ExecuteAsync(CancellationToken stoppingToken)
+        {
+            _logger.LogInformation("Trust Recovery Background Service started");
+            var trustService = new TrustPropagationService(_configuration, _trustLogger);
+            var recoveryRate = _configuration.GetValue("MLServices:TrustRecoveryRate", 0.01);
+
+            while (!stoppingToken.IsCancellationRequested)
+            {
+                try
+                {
+                    var result = await trustService.RunTrustRecoveryAsync(recoveryRate);
+                    if (result.Success)
+                    {
+                        _logger.LogInformation("Recovered trust for {Count} users at {Time}", result.RecoveredUserCount, DateTime.UtcNow);
+                    }
+                    else
+                    {
+                        _logger.LogWarning("Trust recovery failed: {Error}", result.ErrorMessage);
+                    }
+                }
+                catch (Exception ex)
+                {
+                    _logger.LogError(ex, "Error occurred while running trust recovery");
+                }
+
+                await Task.Delay(_runInterval, stoppingToken);
+            }
+        }
+    }
+}